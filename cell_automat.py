@@ -0,0 +1,357 @@
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from itertools import product
+
+import numpy as np
+from scipy.optimize import OptimizeResult
+
+# Cells are 0/1 values in uint8 arrays whose last axis is the (periodic) row. The neighbourhood
+# (left, center, right) of a cell is read as the 3-bit number v = 4 left + 2 center + right, and the
+# new state is bit v of the rule number (Wolfram's numbering, as in `cell_automat.ipynb`).
+
+WORD_BITS = 64
+
+
+def rule_table(rule_number):
+    """
+    Lookup table of a rule: table[v] is the new state for neighbourhood v.
+
+    Args:
+        rule_number (int or array_like): Rule 0-255, or an array of rules (B,).
+
+    Returns:
+        np.ndarray: (8,) or (B, 8) uint8 table.
+    """
+    rules = np.asarray(rule_number, dtype=np.uint16)
+    if np.any(rules > 255):
+        raise ValueError("Rule numbers must be between 0 and 255")
+    return ((rules[..., None] >> np.arange(8, dtype=np.uint16)) & 1).astype(np.uint8)
+
+
+def initial_row(size, simulate_homogenous=False, rng=None, n_rows=None):
+    """
+    Initial row(s): a single live cell in the middle, or uniformly random cells.
+
+    Args:
+        size (int): Number of cells.
+        simulate_homogenous (bool): Single live cell instead of random cells.
+        rng (np.random.Generator or int, optional): Random generator or seed.
+        n_rows (int, optional): Number of rows; None gives one row (size,), otherwise (n_rows, size).
+
+    Returns:
+        np.ndarray: uint8 row(s).
+    """
+    shape = (size,) if n_rows is None else (n_rows, size)
+    if simulate_homogenous:
+        row = np.zeros(shape, dtype=np.uint8)
+        row[..., size // 2] = 1
+        return row
+    return np.random.default_rng(rng).integers(0, 2, size=shape, dtype=np.uint8)
+
+
+def _batch(initial, rule_number):
+    """Broadcasts initial rows and rules to a common batch; returns rows (B, size), tables (B, 8), batched."""
+    initial = np.asarray(initial, dtype=np.uint8)
+    rules = np.asarray(rule_number)
+    batched = initial.ndim == 2 or rules.ndim == 1
+    n = np.broadcast_shapes(initial.shape[:-1], rules.shape)
+    rows = np.array(np.broadcast_to(initial, n + initial.shape[-1:])).reshape(-1, initial.shape[-1])
+    tables = np.broadcast_to(rule_table(rules), n + (8,)).reshape(-1, 8)
+    return rows, tables, batched
+
+
+# --- Whole-row engine ------------------------------------------------------------------------
+
+def step(rows, tables):
+    """
+    One generation of every row at once: rolled neighbours -> 3-bit index -> table gather.
+
+    Args:
+        rows (np.ndarray): uint8 cells (B, size).
+        tables (np.ndarray): Rule tables (B, 8), or (8,) for a rule shared by all rows.
+
+    Returns:
+        np.ndarray: Next generation (B, size).
+    """
+    index = (np.roll(rows, 1, axis=-1) << 2) | (rows << 1) | np.roll(rows, -1, axis=-1)
+    if tables.ndim == 1:
+        return tables[index]
+    return np.take_along_axis(tables, index, axis=-1)
+
+
+def evolve(initial, rule_number, steps):
+    """
+    Space-time grid of one or many automata.
+
+    Rows and rules broadcast against each other: one row with an array of rules runs all the
+    rules from the same start, many rows with one rule runs that rule from many starts, and
+    matching arrays pair them up. The whole batch advances with a few array operations per step.
+
+    Args:
+        initial (array_like): Initial row (size,) or rows (B, size) of 0/1 cells.
+        rule_number (int or array_like): Rule, or rules (B,).
+        steps (int): Number of rows of the grid, including the initial one.
+
+    Returns:
+        np.ndarray: uint8 grid (steps, size), or (B, steps, size) for a batch.
+    """
+    rows, tables, batched = _batch(initial, rule_number)
+    if np.all(tables == tables[0]):
+        tables = tables[0]
+    grid = np.empty((rows.shape[0], steps, rows.shape[1]), dtype=np.uint8)
+    grid[:, 0] = rows
+    for t in range(1, steps):
+        grid[:, t] = step(grid[:, t - 1], tables)
+    return grid if batched else grid[0]
+
+
+def simulate_meca(size, steps, rule_number, simulate_homogenous=False, seed=None):
+    """
+    Grid (steps, size) of one automaton from a single live cell or a random row, as in
+    `cell_automat.ipynb`, computed generation by generation with whole-row operations.
+    """
+    return evolve(initial_row(size, simulate_homogenous, seed), rule_number, steps)
+
+
+def simulate_all_rules(size, steps, simulate_homogenous=False, seed=None, rules=range(256)):
+    """Grids (256, steps, size) of all rules from the same initial row, evolved as one batch."""
+    return evolve(initial_row(size, simulate_homogenous, seed), np.asarray(rules), steps)
+
+
+# --- Bit-packed engine ---------------------------------------------------------------------------
+#
+# 64 cells per uint64 word, cell i in bit i % 64 of word i // 64. The left and right neighbours of
+# all cells are then two word shifts (with the carry from the adjacent word), and the rule is a
+# Boolean function of the three neighbour planes: the OR of the minterms of the neighbourhoods
+# that the rule maps to 1. One step costs a few dozen operations on size / 64 words.
+
+def pack(rows):
+    """uint8 rows (..., size) -> uint64 words (..., ceil(size / 64)); padding bits are 0."""
+    rows = np.asarray(rows, dtype=np.uint8)
+    size = rows.shape[-1]
+    n_words = -(-size // WORD_BITS)
+    padded = np.zeros(rows.shape[:-1] + (n_words * WORD_BITS,), dtype=np.uint8)
+    padded[..., :size] = rows
+    return np.packbits(padded, axis=-1, bitorder="little").view("<u8").astype(np.uint64)
+
+
+def unpack(words, size):
+    """uint64 words (..., W) -> uint8 rows (..., size)."""
+    words = np.ascontiguousarray(words, dtype="<u8")
+    return np.unpackbits(words.view(np.uint8), axis=-1, bitorder="little")[..., :size]
+
+
+def _minterm_masks(tables):
+    """(B, 8) tables -> (B, 8, 1) uint64 masks, all ones where the rule maps the neighbourhood to 1."""
+    return np.where(tables.astype(bool), ~np.uint64(0), np.uint64(0))[..., None]
+
+
+def _step_packed(words, size, masks, tail):
+    """One generation of packed rows (B, W)."""
+    one, top = np.uint64(1), np.uint64(WORD_BITS - 1)
+    last_word, last_bit = (size - 1) // WORD_BITS, np.uint64((size - 1) % WORD_BITS)
+
+    # Left neighbour of cell i is cell i - 1: shift up, carrying the top bit of the previous word.
+    left = words << one
+    left[:, 1:] |= words[:, :-1] >> top
+    left[:, 0] |= (words[:, last_word] >> last_bit) & one
+    # Right neighbour of cell i is cell i + 1 (the padding bits are 0).
+    right = words >> one
+    right[:, :-1] |= words[:, 1:] << top
+    right[:, last_word] &= ~(one << last_bit)
+    right[:, last_word] |= (words[:, 0] & one) << last_bit
+
+    planes = ((~left, left), (~words, words), (~right, right))
+    new = np.zeros_like(words)
+    for v in range(8):
+        new |= masks[:, v] & planes[0][v >> 2] & planes[1][(v >> 1) & 1] & planes[2][v & 1]
+    new[:, -1] &= tail
+    return new
+
+
+def evolve_packed(initial, rule_number, steps, unpacked=False):
+    """
+    Bit-packed version of `evolve`, for large grids: a 10^5-cell row is 1563 words, and a grid
+    of 10^4 generations takes 125 MB instead of 1 GB.
+
+    Args:
+        initial (array_like): Initial row (size,) or rows (B, size) of 0/1 cells.
+        rule_number (int or array_like): Rule, or rules (B,).
+        steps (int): Number of rows of the grid, including the initial one.
+        unpacked (bool): Return uint8 cells (as `evolve`) instead of the packed words.
+
+    Returns:
+        np.ndarray: uint64 words (steps, W) or (B, steps, W); with `unpacked`, uint8 cells.
+    """
+    rows, tables, batched = _batch(initial, rule_number)
+    size = rows.shape[1]
+    masks = _minterm_masks(tables)
+    rem = size % WORD_BITS
+    tail = ~np.uint64(0) if rem == 0 else np.uint64((1 << rem) - 1)
+
+    words = pack(rows)
+    grid = np.empty((words.shape[0], steps, words.shape[1]), dtype=np.uint64)
+    grid[:, 0] = words
+    for t in range(1, steps):
+        grid[:, t] = _step_packed(grid[:, t - 1], size, masks, tail)
+    if unpacked:
+        grid = unpack(grid, size)
+    return grid if batched else grid[0]
+
+
+# --- Classification of the rule space ------------------------------------------------------------
+#
+# Every generation is hashed as soon as it is computed (two independent 64-bit hashes of the packed
+# words, so a false match is practically impossible). When a row hashes like an earlier one the
+# automaton has entered a cycle: its period and transient are known, the rest of the grid is a
+# repetition of the cycle, and the rule leaves the batch. The number of distinct rows and the
+# entropy of the whole grid follow from the live-cell count of every row, so the result is the
+# same as classifying the full grid.
+
+BEHAVIORS = ("constant", "periodic", "chaotic", "complex")
+
+_HASH_KEYS = np.random.default_rng(2024).integers(1, 2**63, size=(2, 1 << 16), dtype=np.uint64) | np.uint64(1)
+
+
+def _row_hashes(words):
+    """Two 64-bit hashes (B,) of packed rows (B, W): every word is mixed with its own odd key, then summed."""
+    keys = _HASH_KEYS[:, :words.shape[1]] if words.shape[1] <= _HASH_KEYS.shape[1] else \
+        np.resize(_HASH_KEYS, (2, words.shape[1]))
+    x = (words[None] ^ (words[None] >> np.uint64(29))) * keys[:, None]
+    x ^= x >> np.uint64(32)
+    return x.sum(axis=-1, dtype=np.uint64)
+
+
+def _popcount(words):
+    """Live cells per packed row (B, W) -> (B,)."""
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(words).sum(axis=-1, dtype=np.int64)
+    return np.unpackbits(np.ascontiguousarray(words).view(np.uint8), axis=-1).sum(axis=-1, dtype=np.int64)
+
+
+def _grid_entropy(ones, n_cells):
+    """Shannon entropy (nats) of the 0/1 cell distribution, as `scipy.stats.entropy` of the bincount."""
+    p = np.stack([n_cells - ones, ones], axis=-1) / n_cells
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return -np.sum(np.where(p > 0, p * np.log(p), 0.0), axis=-1)
+
+
+def _behavior(unique_rows, entropy):
+    """The classes of `classify_behavior` in `cell_automat.ipynb`."""
+    if unique_rows == 1:
+        return "constant"
+    if unique_rows < 10:
+        return "periodic"
+    if unique_rows > 50 and entropy > 0.5:
+        return "chaotic"
+    return "complex"
+
+
+def classify_rules(size=100, steps=100, rules=range(256), simulate_homogenous=False, seed=None, initial=None):
+    """
+    Classifies rules from one initial row, stopping each rule as soon as its grid repeats a row.
+
+    Args:
+        size (int): Number of cells. Ignored when `initial` is given.
+        steps (int): Rows of the (virtual) grid, including the initial one.
+        rules (array_like): Rules to classify. Defaults to all 256.
+        simulate_homogenous (bool): Single live cell instead of a random initial row.
+        seed (int, optional): Seed of the random initial row.
+        initial (array_like, optional): Initial row (size,).
+
+    Returns:
+        OptimizeResult: Table with one entry per rule: `rule`, `behavior` (see `BEHAVIORS`),
+                        `period` and `transient` of the cycle (0 and `steps` when no row repeats
+                        within `steps`), `unique_rows`, `entropy` of the whole grid, `density` of
+                        live cells and `n_rows` (rows actually computed); `counts` maps
+                        each behavior to its number of rules.
+    """
+    row = initial_row(size, simulate_homogenous, seed) if initial is None else np.asarray(initial, np.uint8)
+    size = row.shape[-1]
+    rules = np.atleast_1d(np.asarray(rules))
+    n_rules = rules.size
+    masks = _minterm_masks(rule_table(rules))
+    rem = size % WORD_BITS
+    tail = ~np.uint64(0) if rem == 0 else np.uint64((1 << rem) - 1)
+
+    words = np.repeat(pack(row)[None], n_rules, axis=0)
+    ones = np.zeros((n_rules, steps), dtype=np.int64)
+    period = np.zeros(n_rules, dtype=int)
+    transient = np.full(n_rules, steps)
+    unique_rows = np.full(n_rules, steps)
+    seen = [{} for _ in range(n_rules)]
+    active = np.arange(n_rules)
+
+    for t in range(steps):
+        if t > 0:
+            words = _step_packed(words, size, masks[active], tail)
+        ones[active, t] = _popcount(words)
+        h1, h2 = _row_hashes(words)
+        done = []
+        for j, (b, key) in enumerate(zip(active.tolist(), zip(h1.tolist(), h2.tolist()))):
+            first = seen[b].setdefault(key, t)
+            if first != t:
+                period[b], transient[b], unique_rows[b] = t - first, first, t
+                done.append(j)
+        if done:
+            keep = np.ones(active.size, dtype=bool)
+            keep[done] = False
+            active, words = active[keep], words[keep]
+            if active.size == 0:
+                break
+
+    # Live cells of the whole grid: rows after the first repeat run through the cycle again.
+    total = np.empty(n_rules, dtype=np.int64)
+    for b in range(n_rules):
+        n = unique_rows[b]
+        total[b] = ones[b, :n].sum()
+        if period[b]:
+            later = transient[b] + (np.arange(n, steps) - transient[b]) % period[b]
+            total[b] += ones[b, later].sum()
+    entropy = _grid_entropy(total, steps * size)
+    behavior = np.array([_behavior(u, e) for u, e in zip(unique_rows, entropy)])
+
+    return OptimizeResult(rule=rules, behavior=behavior, period=period, transient=transient,
+                          unique_rows=unique_rows, entropy=entropy, density=total / (steps * size),
+                          n_rows=unique_rows + (period > 0),
+                          counts={name: int(np.sum(behavior == name)) for name in BEHAVIORS})
+
+
+def format_table(result):
+    """Per-rule table of `classify_rules` as text."""
+    lines = [f"{'rule':>4}  {'behavior':<9} {'period':>6} {'transient':>9} {'entropy':>7}"]
+    for i in range(result.rule.size):
+        lines.append(f"{result.rule[i]:>4}  {result.behavior[i]:<9} {result.period[i]:>6} "
+                     f"{result.transient[i]:>9} {result.entropy[i]:>7.3f}")
+    return "\n".join(lines)
+
+
+def _classify_case(case, steps, rules, simulate_homogenous):
+    size, seed = case
+    return classify_rules(size, steps, rules, simulate_homogenous, seed)
+
+
+def classify_sweep(sizes, seeds, steps=100, rules=range(256), simulate_homogenous=False, n_workers=1):
+    """
+    `classify_rules` for every combination of row size and seed of the random initial row; the
+    cases run on `n_workers` processes (None = all cores).
+
+    Returns:
+        OptimizeResult: `sizes`, `seeds`, `rule` and arrays (n_sizes, n_seeds, n_rules) of
+                        `behavior`, `period`, `transient`, `unique_rows`, `entropy` and `density`;
+                        `counts` maps each behavior to an (n_sizes, n_seeds) array of rule counts.
+    """
+    sizes, seeds = list(sizes), list(seeds)
+    cases = list(product(sizes, seeds))
+    task = partial(_classify_case, steps=steps, rules=rules, simulate_homogenous=simulate_homogenous)
+    if n_workers == 1 or len(cases) == 1:
+        results = [task(case) for case in cases]
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as pool:
+            results = list(pool.map(task, cases))
+
+    shape = (len(sizes), len(seeds), -1)
+    fields = ("behavior", "period", "transient", "unique_rows", "entropy", "density")
+    table = {name: np.stack([r[name] for r in results]).reshape(shape) for name in fields}
+    return OptimizeResult(sizes=np.array(sizes), seeds=np.array(seeds), rule=results[0].rule, **table,
+                          counts={name: (table["behavior"] == name).sum(axis=-1) for name in BEHAVIORS})
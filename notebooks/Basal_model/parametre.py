@@ -1,22 +1,32 @@
 #parametre.py
+import os
+import sys
 
-class Parameters:
-    def __init__(self):
-        # UNIFIED PARAMETER NAMES
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "common"))
+from parameter_set import ParameterSet
 
+
+class Parameters(ParameterSet):
+    """Parameters of the basal model, array-backed (see `ParameterSet`)."""
+
+    # UNIFIED PARAMETER NAMES
+    DEFAULTS = {
         # Association / Dissociation
-        self.a1 = 200.0      
-        self.a2 = 3.0        
+        "a1": 200.0,
+        "a2": 3.0,
         # Degradation
-        self.d1 = 9.0        
-        self.d2 = 0.2        
-        self.d3 = 0.24       
-        self.d4 = 0.2        
-        self.d5 = 2.7        
-        self.d6 = 0.15       
+        "d1": 9.0,
+        "d2": 0.2,
+        "d3": 0.24,
+        "d4": 0.2,
+        "d5": 2.7,
+        "d6": 0.15,
 
         # Transcription / Translation
-        self.t1 = 7.5        
-        self.t2 = 15.0       
-        self.t3 = 2.5        
-        self.t4 = 16.0       
\ No newline at end of file
+        "t1": 7.5,
+        "t2": 15.0,
+        "t3": 2.5,
+        "t4": 16.0,
+    }
+
+    __slots__ = tuple(DEFAULTS)
@@ -1,9 +1,60 @@
+import os
+import sys
+
+import numpy as np
+
 from parametre import Parameters
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "common"))
+from model_compiler import ModelSpec
+
+# Reaction scheme of the basal model (state [K, N, I, R, G]); N and G are free fractions.
+MODEL = (
+    ModelSpec("Basal", species=("K", "N", "I", "R", "G"), parameters=Parameters.NAMES)
+    .reaction("d6 * K", {"K": -1})
+    # Release of NF-kB from the complex: dissociation, basal and IKK-induced IkB degradation.
+    .reaction("a2 * (1 - N)", {"N": +1, "I": +1})
+    .reaction("d4 * d3 * (1 - N)", {"N": +1})
+    .reaction("d1 * K * (1 - N)", {"N": +1})
+    .reaction("a1 * N * I", {"N": -1, "I": -1})
+    # IkB: IKK-induced and basal degradation, translation.
+    .reaction("d2 * d1 * K * I", {"I": -1})
+    .reaction("t4 * R", {"I": +1})
+    .reaction("d3 * I", {"I": -1})
+    # mRNA IkB and the active fraction of its gene.
+    .reaction("t3 * G", {"R": +1})
+    .reaction("d5 * R", {"R": -1})
+    .reaction("t1 * N * (1 - G)", {"G": +1})
+    .reaction("t2 * I * G", {"G": -1})
+)
+
 
 class BasalSystem:
+    # Nonzero structure of the Jacobian (rows: dK, dN, dI, dR, dG; columns: K, N, I, R, G).
+    JAC_SPARSITY = MODEL.jac_sparsity
+
+    # Hand-written equations; `MODEL` has to agree with them.
+    _EQUATIONS = ("dK", "dN", "dI", "dR", "dG", "jacobian")
+
     def __init__(self, params=None):
-        self.parameters = params if params else Parameters()
+        self.parameters = params if params is not None else Parameters()
+
+    def compiled(self):
+        """
+        Generated `rhs(t, y)` / `jac(t, y)` (`MODEL.compile`) for the current parameter values.
+        A subclass that overrides one of the equations gets itself back, so that its `rhs`/`jac`
+        (built from the methods below) are integrated instead.
+        """
+        if any(getattr(type(self), name) is not getattr(BasalSystem, name) for name in self._EQUATIONS):
+            return self
+        return MODEL.compile(self.parameters)
+
+    def rhs(self, t, y):
+        K, N, I, R, G = y
+        return [self.dK(K), self.dN(N, K, I), self.dI(N, K, I, R), self.dR(R, G), self.dG(N, G, I)]
+
+    def jac(self, t, y):
+        return self.jacobian(*y)
 
     def dK(self, K):
         return -self.parameters.d6 * K
@@ -23,4 +74,29 @@ class BasalSystem:
         return self.parameters.t3 * G - self.parameters.d5 * R
 
     def dG(self, N, G, I):
-        return self.parameters.t1 * N * (1 - G) - self.parameters.t2 * I * G
\ No newline at end of file
+        return self.parameters.t1 * N * (1 - G) - self.parameters.t2 * I * G
+
+    def jacobian(self, K, N, I, R, G):
+        """Exact analytic Jacobian of [dK, dN, dI, dR, dG] with respect to [K, N, I, R, G]."""
+        p = self.parameters
+        J = np.zeros((5, 5) + np.shape(K * N * I * G))
+
+        J[0, 0] = -p.d6
+
+        J[1, 0] = p.d1 * (1 - N)
+        J[1, 1] = -p.a2 - p.d4 * p.d3 - p.d1 * K - p.a1 * I
+        J[1, 2] = -p.a1 * N
+
+        J[2, 0] = -p.d2 * p.d1 * I
+        J[2, 1] = -p.a2 - p.a1 * I
+        J[2, 2] = -p.d2 * p.d1 * K - p.a1 * N - p.d3
+        J[2, 3] = p.t4
+
+        J[3, 3] = -p.d5
+        J[3, 4] = p.t3
+
+        J[4, 1] = p.t1 * (1 - G)
+        J[4, 2] = -p.t2 * G
+        J[4, 4] = -p.t1 * N - p.t2 * I
+
+        return J
@@ -1,9 +1,17 @@
+import os
+import sys
+
 import numpy as np
 from scipy.integrate import solve_ivp
 import matplotlib.pyplot as plt
-from rovnice import BasalSystem
+from rovnice import MODEL, BasalSystem
 from parametre import Parameters
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "common"))
+from simulation_cache import make_key, source_fingerprint, resolve_cache, load_ode_result, store_ode_result
+from solver_stats import RunStats, probed_method, emit
+from model_reduction import as_reduced
+
 
 class BasalSystemSimulator:
     def __init__(self, system: BasalSystem):
@@ -38,7 +46,22 @@ class BasalSystemSimulator:
         
         return [dK_dt, dN_dt, dI_dt, dR_dt, dG_dt]
 
-    def simulate(self, t_span=(0, 5.0), y0=None, t_eval=None):
+    def _jac(self, t, y):
+        """
+        Analytic Jacobian of the right-hand side, in the call signature solve_ivp expects.
+        
+        Args:
+            t (float): Time (not used in this autonomous system but required by solve_ivp).
+            y (list or np.ndarray): The current state vector [K, N, I, R, G].
+        
+        Returns:
+            np.ndarray: The 5x5 matrix d(rhs)/dy.
+        """
+        K, N, I, R, G = y
+        return self.system.jacobian(K, N, I, R, G)
+
+    def simulate(self, t_span=(0, 5.0), y0=None, t_eval=None, method="LSODA", use_jac=True,
+                 rtol=1e-3, atol=1e-6, cache=True, reduced=None):
         """
         Runs the simulation using scipy's solve_ivp.
         
@@ -48,9 +71,27 @@ class BasalSystemSimulator:
                                             If None, defaults are used.
             t_eval (np.ndarray, optional): Time points where the solution is stored. 
                                         If None, solve_ivp determines them.
+            method (str, optional): Integrator, one of "LSODA", "BDF" or "Radau". Defaults to "LSODA".
+            use_jac (bool, optional): Pass the analytic Jacobian to the solver. If False, the
+                                      implicit methods fall back to finite differences restricted
+                                      to the known sparsity pattern. Defaults to True.
+            rtol (float, optional): Relative tolerance. Defaults to 1e-3.
+            atol (float, optional): Absolute tolerance. Defaults to 1e-6.
+            cache (bool or SimulationCache, optional): Where to look up and store the result.
+                                      True uses the default `simulation_cache` store, False
+                                      always integrates. Defaults to True.
+            reduced (ReducedModel or dict, optional): Integrate the model with its fast part
+                                      eliminated instead, e.g. {"fast_reactions": ["a1 * N * I"]}
+                                      for the fast binding (see `model_reduction.ReducedModel`);
+                                      the result is checked a posteriori and replaced by the
+                                      full solution when the check fails. Not cached. The reduced
+                                      right-hand side is generated code, but a run still costs
+                                      about as much as LSODA on the full model (5-6 ms vs 4 ms).
         
         Returns:
-            OdeResult: The solution object from solve_ivp.
+            OdeResult: The solution object from solve_ivp, with the run's `solver_stats.RunStats`
+                       as `stats` (read-only arrays when served from the cache); with `reduced`
+                       the result of `ReducedModel.simulate`.
         """
         if y0 is None:
             y0 = [1.0, 0.0, 0.65, 0.0, 0.0]  # K0, N0, I0, R0, G0
@@ -58,13 +99,46 @@ class BasalSystemSimulator:
         if t_eval is None:
             t_eval = np.linspace(t_span[0], t_span[1], 500)
 
+        if reduced is not None:
+            model = as_reduced(MODEL, self.system.parameters, reduced)
+            return model.simulate(t_span, y0, t_eval=t_eval, rtol=rtol, atol=atol, fallback=True)
+
+        store = resolve_cache(cache)
+        if store is not None:
+            key = make_key("BasalSystemSimulator.simulate", source_fingerprint(type(self.system)),
+                           MODEL.fingerprint, self.system.parameters, y0, t_span, t_eval, method, use_jac, rtol, atol)
+            sol = load_ode_result(store, key)
+            if sol is not None:
+                sol.stats = RunStats("BasalSystemSimulator.simulate", method)
+                sol.stats.cached = True
+                emit(sol.stats.finish(sol.success, sol.message, sol.nfev, sol.njev, sol.nlu))
+                return sol
+
+        # Generated code with the current parameter values bound as constants; it gives the same
+        # values as `_rhs`/`_jac` at a fraction of the per-call cost.
+        model = self.system.compiled()
+        options = {}
+        if use_jac:
+            options["jac"] = model.jac
+        elif method in ("BDF", "Radau"):
+            options["jac_sparsity"] = self.system.JAC_SPARSITY
+
+        stats = RunStats("BasalSystemSimulator.simulate", method).start()
         sol = solve_ivp(
-            fun=self._rhs,
+            fun=model.rhs,
             t_span=t_span,
             y0=y0,
             t_eval=t_eval,
-            method="LSODA"  
+            method=probed_method(method),
+            rtol=rtol,
+            atol=atol,
+            stats=stats,
+            **options
         )
+        sol.stats = stats.finish(sol.success, sol.message, sol.nfev, sol.njev, sol.nlu)
+        emit(stats)
+        if store is not None:
+            store_ode_result(store, key, sol)
         return sol
 
     def plot_results(self, sol):
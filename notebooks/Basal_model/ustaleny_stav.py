@@ -0,0 +1,149 @@
+import numpy as np
+from scipy.integrate import solve_ivp
+from scipy.optimize import OptimizeResult, root
+
+from rovnice import BasalSystem
+from parametre import Parameters
+
+# Initial state used for the integration fallback, same as BasalSystemSimulator.simulate.
+_Y_START = np.array([1.0, 0.0, 0.65, 0.0, 0.0])
+# Interior starting point for Newton (K, N, I, R, G); K is always 0 at equilibrium.
+_Y_GUESS = np.array([0.0, 0.5, 0.5, 0.5, 0.5])
+
+
+def _batch_parameters(params):
+    """
+    Merges parameter input into one batch `Parameters` whose attributes are (M,) arrays.
+
+    Returns:
+        tuple: (parameters, n_members, single).
+    """
+    if params is None:
+        params = Parameters()
+    if isinstance(params, Parameters):
+        single = not params.is_batch
+        merged = Parameters.from_matrix(params.to_matrix())
+    else:
+        single = False
+        merged = Parameters.stack(list(params))
+    return merged, len(merged), single
+
+
+def _residual(system, Y):
+    K, N, I, R, G = Y
+    return np.array([system.dK(K), system.dN(N, K, I), system.dI(N, K, I, R), system.dR(R, G),
+                     system.dG(N, G, I)], dtype=float)
+
+
+def _jacobian(system, Y):
+    return np.moveaxis(system.jacobian(*Y), -1, 0)
+
+
+def _is_physical(Y, tol):
+    """Concentrations are non-negative, N and G are fractions in [0, 1]."""
+    return (np.all(np.isfinite(Y), axis=0) & np.all(Y >= -tol, axis=0)
+            & (Y[1] <= 1 + tol) & (Y[4] <= 1 + tol))
+
+
+def _newton(system, Y, tol, max_iter):
+    """
+    Damped Newton iteration on all members at once (each member backtracks its own step).
+
+    Returns:
+        tuple: (Y, residual_norm, converged, iterations).
+    """
+    Y = Y.copy()
+    F = _residual(system, Y)
+    norm = np.linalg.norm(F, axis=0)
+    converged = norm <= tol
+    iterations = np.zeros(Y.shape[1], dtype=int)
+
+    for _ in range(max_iter):
+        active = ~converged & np.isfinite(norm)
+        if not np.any(active):
+            break
+        try:
+            dY = np.linalg.solve(_jacobian(system, Y), -F.T[..., None])[..., 0].T
+        except np.linalg.LinAlgError:
+            J = _jacobian(system, Y)
+            dY = np.array([np.linalg.lstsq(J[m], -F[:, m], rcond=None)[0] for m in range(Y.shape[1])]).T
+
+        lam = np.ones(Y.shape[1])
+        for _ in range(20):
+            Y_try = Y + lam * dY
+            F_try = _residual(system, Y_try)
+            norm_try = np.linalg.norm(F_try, axis=0)
+            accepted = norm_try < (1.0 - 1e-4 * lam) * norm
+            if np.all(accepted | ~active):
+                break
+            lam = np.where(accepted, lam, 0.5 * lam)
+
+        move = active & np.isfinite(norm_try)
+        Y[:, move] = Y_try[:, move]
+        F[:, move] = F_try[:, move]
+        norm[move] = norm_try[move]
+        iterations[active] += 1
+        converged |= active & (norm <= tol)
+
+    return Y, norm, converged, iterations
+
+
+def find_steady_state(params=None, y_guess=None, tol=1e-10, max_iter=50, t_settle=50.0):
+    """
+    Computes the equilibrium of the basal model directly, without integrating to long times.
+
+    IKK decays exponentially, so every equilibrium has K = 0; the remaining states are found by
+    a damped Newton method with the analytic Jacobian, vectorized over all parameter sets.
+    Members for which Newton fails or lands outside the physical region (negative
+    concentrations, N or G above 1) are retried with a trust-region solver, first from the
+    initial guess and then from the end of a short integration (`t_settle`) started at the
+    default initial conditions.
+
+    Args:
+        params (Parameters or list of Parameters, optional): One parameter set, a list of them
+                                                             or a batch `Parameters`.
+                                                             Defaults to `Parameters()`.
+        y_guess (array_like, optional): Starting point [K, N, I, R, G], shape (5,) or (5, M).
+        tol (float, optional): Tolerance on the residual norm. Defaults to 1e-10.
+        max_iter (int, optional): Newton iterations. Defaults to 50.
+        t_settle (float, optional): Length of the fallback integration. Defaults to 50.
+
+    Returns:
+        OptimizeResult: Fields `y` (5,) or (M, 5), `eigenvalues` (5,) or (M, 5) of the Jacobian
+                        at the equilibrium, `stable` (all real parts negative), `success`,
+                        `residual`, `nit`, `fallback` (True where Newton alone did not
+                        suffice) and `message`. For a single parameter set the per-member
+                        fields are scalars.
+    """
+    parameters, n_members, single = _batch_parameters(params)
+    system = BasalSystem(parameters)
+
+    Y0 = np.asarray(_Y_GUESS if y_guess is None else y_guess, dtype=float)
+    Y0 = np.repeat(Y0[:, None], n_members, axis=1) if Y0.ndim == 1 else Y0.copy()
+
+    Y, norm, converged, nit = _newton(system, Y0, tol, max_iter)
+    success = converged & _is_physical(Y, np.sqrt(tol))
+    fallback = ~success
+
+    for m in np.flatnonzero(~success):
+        member = BasalSystem(parameters[m])
+        settled = solve_ivp(lambda t, y: _residual(member, y), (0.0, t_settle), _Y_START, method="LSODA",
+                            jac=lambda t, y: member.jacobian(*y))
+        for start in (Y0[:, m], settled.y[:, -1]):
+            sol = root(lambda y: _residual(member, y), start, jac=lambda y: member.jacobian(*y), tol=tol)
+            if sol.success and _is_physical(sol.x[:, None], np.sqrt(tol))[0]:
+                Y[:, m], norm[m], success[m] = sol.x, np.linalg.norm(_residual(member, sol.x)), True
+                break
+
+    eigenvalues = np.linalg.eigvals(_jacobian(system, Y))
+    stable = success & np.all(eigenvalues.real < 0, axis=-1)
+
+    n_failed = np.count_nonzero(~success)
+    message = "Steady state found." if n_failed == 0 else f"{n_failed} of {n_members} steady states not found."
+
+    if single:
+        return OptimizeResult(y=Y[:, 0], eigenvalues=eigenvalues[0], stable=bool(stable[0]),
+                              success=bool(success[0]), residual=float(norm[0]), nit=int(nit[0]),
+                              fallback=bool(fallback[0]), message=message)
+    return OptimizeResult(y=Y.T, eigenvalues=eigenvalues, stable=stable, success=success, residual=norm,
+                          nit=nit, fallback=fallback, message=message)
@@ -0,0 +1,376 @@
+"""
+Declarative, resumable batch runs of the compartment model.
+
+    python CytoNuc_batch.py run job.toml                     # -> results/<job name>/ next to the spec
+    python CytoNuc_batch.py run job.json --out /scratch/t3 --workers 8
+    python CytoNuc_batch.py run job.toml --shard 0/4         # this process takes every 4th chunk
+    python CytoNuc_batch.py status results/t3_ikk
+    python CytoNuc_batch.py export results/t3_ikk t3_ikk.npz
+
+A job spec (JSON or TOML) describes the parameter points, the simulation and the outputs:
+
+    name = "t3_ikk"
+
+    [params]                      # values of the parameters that are not varied
+    k1 = 5.4
+
+    [design.grid]                 # full grid; or [design.sample] / [design.points], see below
+    t3 = {start = 0.5, stop = 2.0, num = 40, scale = "log"}
+    IKK = [0.1, 0.25, 0.5, 1.0]
+
+    [simulation]
+    t_span = [0, 1000]
+    n_points = 1001
+    rtol = 1e-6
+    atol = 1e-9
+
+    [outputs]
+    metrics = ["peak:Nn", "auc:Nn + NIn", "final:Nn"]  # or a table {name = "kind:quantity"}
+    trajectories = ["Nn", "Im"]   # species kept on the output grid (optional)
+    oscillations = "Nn"           # period, amplitude, decay and regime of one species (optional)
+
+    [execution]
+    chunk_size = 256              # points per chunk (one ensemble integration, one file)
+    n_workers = 4
+
+`[design.sample]` takes `method` ("sobol", "lhs", "random"), `n`, `seed`, `bounds` {name: [low,
+high]} and `log_scale` [names]; `[design.points]` lists the values of every varied parameter
+point by point. Metric kinds are those of `CytoNuc_metrics` (peak, time_to_peak, auc, mean,
+final, tail_min, tail_max) of any `Quantity` expression.
+
+The results go to a `ChunkedStore`: every chunk of points is computed as one ensemble, sent
+back from the worker and written as one compressed file, so finished chunks survive a crash
+or a kill and rerunning the same command only computes the missing ones. A store created from
+a different spec is never resumed.
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+from functools import partial
+
+import numpy as np
+
+from CytoNuc_rovnice import MODEL, VARIABLES
+from CytoNuc_params import CytoNucParamsExact, PARAM_NAMES
+from CytoNuc_metrics import (Peak, TimeToPeak, AUC, Mean, Final, TailMin, TailMax, Quantity,
+                             evaluate_metrics_ensemble)
+from CytoNuc_oscillations import analyze_oscillations
+from CytoNuc_global_sensitivity import ParameterSpace, sample
+from CytoNuc_parallel import parallel_map, PointFailure
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "common"))
+from result_store import ChunkedStore
+
+try:
+    import tomllib
+except ModuleNotFoundError:  # Python < 3.11
+    tomllib = None
+
+METRIC_KINDS = {"peak": Peak, "time_to_peak": TimeToPeak, "auc": AUC, "mean": Mean, "final": Final,
+                "tail_min": TailMin, "tail_max": TailMax}
+
+# Per-point outputs of the oscillation analysis, see `analyze_oscillations`.
+OSCILLATION_OUTPUTS = ("period", "amplitude", "decay_rate", "regime")
+
+_DEFAULTS = {
+    "model": "CytoNuc",
+    "params": {},
+    "simulation": {"t_span": [0, 1000], "n_points": 1001, "rtol": 1e-6, "atol": 1e-9, "y0": None},
+    "outputs": {"metrics": [], "trajectories": [], "oscillations": None, "decimate": 1, "dtype": "float32"},
+    "execution": {"chunk_size": 256, "n_workers": 1},
+}
+
+
+# --- Job spec ------------------------------------------------------------------------------------
+
+def load_spec(path):
+    """Reads a job spec from a .json or .toml file."""
+    if path.endswith(".toml"):
+        if tomllib is None:
+            raise RuntimeError("TOML job specs need Python 3.11 (tomllib); use JSON instead.")
+        with open(path, "rb") as f:
+            return tomllib.load(f)
+    with open(path) as f:
+        return json.load(f)
+
+
+def normalize_spec(spec):
+    """Spec with all defaults filled in and every entry checked; raises ValueError on errors."""
+    spec = json.loads(json.dumps(spec))
+    for section, defaults in _DEFAULTS.items():
+        if isinstance(defaults, dict):
+            unknown = set(spec.get(section, {})) - set(defaults) if section != "params" else set()
+            if unknown:
+                raise ValueError(f"Unknown entries {sorted(unknown)} in [{section}]")
+            spec[section] = {**defaults, **spec.get(section, {})}
+        else:
+            spec.setdefault(section, defaults)
+    spec.setdefault("name", "job")
+    if spec["model"] != "CytoNuc":
+        raise ValueError(f"Unknown model '{spec['model']}'; batch jobs support 'CytoNuc'.")
+    unknown = set(spec["params"]) - set(PARAM_NAMES)
+    if unknown:
+        raise ValueError(f"Unknown parameters {sorted(unknown)} in [params]")
+
+    design = spec.get("design", {})
+    if len(design) != 1 or next(iter(design)) not in ("grid", "sample", "points"):
+        raise ValueError("[design] needs exactly one of 'grid', 'sample' or 'points'.")
+
+    outputs = spec["outputs"]
+    if isinstance(outputs["metrics"], list):
+        outputs["metrics"] = {re.sub(r"\W+", "_", entry).strip("_"): entry for entry in outputs["metrics"]}
+    for name, entry in outputs["metrics"].items():
+        kind = entry.split(":", 1)[0]
+        if kind not in METRIC_KINDS or ":" not in entry:
+            raise ValueError(f"Metric '{name}' = '{entry}' must be 'kind:quantity', kind one of {list(METRIC_KINDS)}")
+    for species in outputs["trajectories"] + ([outputs["oscillations"]] if outputs["oscillations"] else []):
+        if species not in VARIABLES:
+            raise ValueError(f"Unknown species '{species}'. Available: {list(VARIABLES)}")
+    if not (outputs["metrics"] or outputs["trajectories"] or outputs["oscillations"]):
+        raise ValueError("[outputs] requests nothing.")
+    return spec
+
+
+def _axis_values(entry):
+    if isinstance(entry, dict):
+        if entry.get("scale", "linear") == "log":
+            return np.geomspace(entry["start"], entry["stop"], entry["num"])
+        return np.linspace(entry["start"], entry["stop"], entry["num"])
+    return np.asarray(entry, dtype=float)
+
+
+def design_points(spec):
+    """
+    Varied parameters and their values at every point of the design.
+
+    Returns:
+        tuple: (names, X) with X of shape (n, len(names)); grid points run fastest along the
+               last parameter.
+    """
+    (kind, design), = spec["design"].items()
+    if kind == "grid":
+        names = list(design)
+        axes = np.meshgrid(*[_axis_values(design[name]) for name in names], indexing="ij")
+        X = np.column_stack([axis.ravel() for axis in axes])
+    elif kind == "points":
+        names = list(design)
+        X = np.column_stack([np.asarray(design[name], dtype=float) for name in names])
+    else:
+        space = ParameterSpace(design["bounds"], log_scale=design.get("log_scale", ()))
+        names = list(space.names)
+        X = sample(space, design["n"], method=design.get("method", "sobol"), seed=design.get("seed"))
+    unknown = set(names) - set(PARAM_NAMES)
+    if unknown:
+        raise ValueError(f"Unknown parameters {sorted(unknown)} in [design]")
+    return names, X
+
+
+def fingerprint(spec):
+    """Hash of everything that determines the results (not of the execution settings), model included."""
+    content = {key: value for key, value in spec.items() if key not in ("execution", "name")}
+    content["model"] = MODEL.fingerprint
+    return hashlib.sha256(json.dumps(content, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def _output_arrays(spec, n_params, t_out):
+    outputs = spec["outputs"]
+    arrays = {"X": ((n_params,), np.float64), "success": ((), np.bool_)}
+    for name, entry in outputs["metrics"].items():
+        channels = len(Quantity(_metric_quantity(entry)))
+        arrays[name] = (() if channels == 1 else (channels,), np.float64)
+    if outputs["trajectories"]:
+        arrays["trajectories"] = ((len(outputs["trajectories"]), t_out.size), np.dtype(outputs["dtype"]))
+    if outputs["oscillations"]:
+        arrays.update({name: ((), np.int8 if name == "regime" else np.float64) for name in OSCILLATION_OUTPUTS})
+    return arrays
+
+
+def _metric_quantity(entry):
+    quantity = entry.split(":", 1)[1].strip()
+    return [item.strip() for item in quantity.split(",")] if "," in quantity else quantity
+
+
+# --- Work ----------------------------------------------------------------------------------------
+
+def _compute_chunk(item, spec, names, X):
+    """Integrates the points of one chunk (k, rows) as an ensemble; returns (k, {array: rows})."""
+    k, rows = item
+    X = X[rows]
+    params = dict(spec["params"])
+    base = CytoNucParamsExact(IKK_stimulation=params.pop("IKK", 0.5), **params)
+    batch = CytoNucParamsExact.sweep(names[0], X[:, 0], base)
+    for j, name in enumerate(names[1:], start=1):
+        batch.set(name, X[:, j])
+
+    sim, outputs = spec["simulation"], spec["outputs"]
+    y0 = np.array([1.0, 0, 0, 0, 0, 0, 0]) if sim["y0"] is None else np.asarray(sim["y0"], dtype=float)
+    metrics = [METRIC_KINDS[entry.split(":", 1)[0]](_metric_quantity(entry), name=name)
+               for name, entry in outputs["metrics"].items()]
+    result = {"X": X}
+
+    # The metrics always come from the step interpolants, whether or not trajectories are kept.
+    t_eval = None
+    if outputs["trajectories"] or outputs["oscillations"]:
+        t_eval = np.linspace(sim["t_span"][0], sim["t_span"][1], sim["n_points"])
+    sol = evaluate_metrics_ensemble(batch, metrics, sim["t_span"], y0, rtol=sim["rtol"], atol=sim["atol"],
+                                    t_eval=t_eval)
+    result["success"] = sol.success
+    for name, value in sol.metrics.items():
+        result[name] = np.asarray(value).T
+    if t_eval is not None:
+        if outputs["trajectories"]:
+            idx = [VARIABLES.index(species) for species in outputs["trajectories"]]
+            result["trajectories"] = sol.y[:, idx, ::outputs["decimate"]]
+        if outputs["oscillations"]:
+            species = outputs["oscillations"]
+            osc = analyze_oscillations(sol.t, sol.y[:, [VARIABLES.index(species)]], species=(species,),
+                                       lag_pair=None)
+            for name in OSCILLATION_OUTPUTS:
+                result[name] = np.where(sol.success, osc[name][:, 0], -1 if name == "regime" else np.nan)
+    return k, result
+
+
+def open_store(spec, directory, overwrite=False):
+    """
+    The store of a job: created on the first run, reopened (for resuming) when it was created
+    from the same spec; a store of a different spec raises unless `overwrite`.
+    """
+    spec = normalize_spec(spec)
+    names, X = design_points(spec)
+    key = fingerprint(spec)
+    if os.path.exists(os.path.join(directory, ChunkedStore.MANIFEST)) and not overwrite:
+        store = ChunkedStore(directory)
+        if store.attrs.get("fingerprint") != key:
+            raise ValueError(f"{directory} holds the results of a different job spec; use another "
+                             f"directory or overwrite it.")
+        return store
+    t_eval = np.linspace(spec["simulation"]["t_span"][0], spec["simulation"]["t_span"][1],
+                         spec["simulation"]["n_points"])
+    t_out = t_eval[::spec["outputs"]["decimate"]]
+    constants = {"parameters": np.array(names), "t": t_out,
+                 "trajectory_species": np.array(spec["outputs"]["trajectories"], dtype=str)}
+    return ChunkedStore.create(directory, len(X), spec["execution"]["chunk_size"],
+                               _output_arrays(spec, len(names), t_out), constants=constants,
+                               attrs={"spec": spec, "fingerprint": key}, overwrite=overwrite)
+
+
+def run_job(spec, directory, n_workers=None, shard=(0, 1), overwrite=False, progress=True):
+    """
+    Runs (or resumes) a batch job and returns its store.
+
+    Missing chunks are computed on `n_workers` processes (default: `[execution] n_workers`);
+    each finished chunk is written by this process as soon as it arrives, so at most the
+    chunks in flight are lost when the run is interrupted. With `shard=(i, n)` only the
+    chunks k with k % n == i are run, so n independent processes or machines sharing the
+    directory can split one job.
+
+    Args:
+        spec (dict or str): Job spec or the path of a .json/.toml file.
+        directory (str): Store directory.
+        n_workers (int, optional): Number of processes; None takes the spec's value.
+        shard (tuple): (index, count) of this process's share of the chunks.
+        overwrite (bool): Discard an existing store instead of resuming it.
+        progress (bool): Show a progress bar.
+
+    Returns:
+        ChunkedStore: The job's results (complete unless some chunks failed or belong to
+                      other shards).
+    """
+    spec = normalize_spec(load_spec(spec) if isinstance(spec, str) else spec)
+    store = open_store(spec, directory, overwrite)
+    names, X = design_points(spec)
+    index, count = shard
+    todo = [k for k in store.missing() if k % count == index]
+    if not todo:
+        return store
+    n_workers = spec["execution"]["n_workers"] if n_workers is None else n_workers
+    failures = []
+
+    def write(_, result):
+        if isinstance(result, PointFailure):
+            failures.append(result)
+            return
+        k, arrays = result
+        store.write_chunk(k, **arrays)
+
+    compute = partial(_compute_chunk, spec=spec, names=names, X=X)
+    parallel_map(compute, [(k, store.rows(k)) for k in todo], n_workers=n_workers,
+                 chunksize=1, desc=f"{spec['name']} ({len(todo)} chunks)" if progress else None, callback=write)
+    for failure in failures:
+        print(f"  Warning: chunk {failure.item[0]} failed, it will be retried on the next run: "
+              f"{failure.message}")
+    return store
+
+
+def status(directory):
+    """Progress summary of a store."""
+    store = ChunkedStore(directory)
+    done = store.done()
+    rows = store.available()
+    spec = store.attrs.get("spec", {})
+    lines = [f"{spec.get('name', '?')}: {len(done)} of {store.n_chunks} chunks "
+             f"({rows.sum()} of {store.n_rows} points)"]
+    if done:
+        success = store.read("success")[rows]
+        lines.append(f"  {np.count_nonzero(~success)} of {success.size} computed points failed to integrate")
+    lines.append(f"  arrays: {', '.join(f'{name} {shape}' for name, (shape, _) in store.arrays.items())}")
+    return "\n".join(lines)
+
+
+def export(directory, path):
+    """Writes the whole store (available rows, constants and the spec) into one .npz file."""
+    store = ChunkedStore(directory)
+    arrays = {name: store.read(name) for name in store.arrays}
+    arrays.update(store.constants())
+    np.savez_compressed(path, available=store.available(), spec=json.dumps(store.attrs.get("spec", {})),
+                        **arrays)
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="run or resume a job")
+    run.add_argument("spec", help="job spec (.json or .toml)")
+    run.add_argument("--out", help="store directory (default: results/<name> next to the spec)")
+    run.add_argument("--workers", type=int, help="worker processes (default: [execution] n_workers; 0 = all cores)")
+    run.add_argument("--shard", default="0/1", help="i/n: run only the chunks k with k %% n == i")
+    run.add_argument("--overwrite", action="store_true", help="discard an existing store instead of resuming")
+
+    stat = commands.add_parser("status", help="show the progress of a store")
+    stat.add_argument("store")
+
+    exp = commands.add_parser("export", help="write a store into one .npz file")
+    exp.add_argument("store")
+    exp.add_argument("path")
+
+    args = parser.parse_args(argv)
+    if args.command == "status":
+        print(status(args.store))
+        return 0
+    if args.command == "export":
+        print(f"Exported to {export(args.store, args.path)}")
+        return 0
+
+    try:
+        spec = normalize_spec(load_spec(args.spec))
+    except ValueError as exc:
+        parser.error(f"{args.spec}: {exc}")
+    directory = args.out or os.path.join(os.path.dirname(os.path.abspath(args.spec)), "results", spec["name"])
+    index, count = (int(part) for part in args.shard.split("/"))
+    start = time.perf_counter()
+    try:
+        store = run_job(spec, directory, n_workers=args.workers, shard=(index, count), overwrite=args.overwrite)
+    except ValueError as exc:
+        parser.error(str(exc))
+    print(f"{status(directory)}\n  stored in {store.directory} ({time.perf_counter() - start:.1f} s)")
+    return 0 if store.complete or count > 1 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,57 @@
+import time
+
+import numpy as np
+
+from CytoNuc_rovnice import NFkBSystemExact
+from CytoNuc_params import CytoNucParamsExact
+from CytoNuc_simulacia import NFkBSimulatorExact
+
+
+def benchmark_jacobian(t_span=(0, 5000), ikk_stim=0.5, repeats=3,
+                       configurations=(("LSODA", False), ("LSODA", True),
+                                       ("BDF", False), ("BDF", True),
+                                       ("Radau", False), ("Radau", True))):
+    """
+    Porovná počet vyhodnotení pravej strany a čas behu simulácie s numericky odhadnutým
+    a s analytickým Jakobiánom (predvolene 5000-minútový beh z `01_model.ipynb`).
+
+    Args:
+        t_span (tuple): Časový interval simulácie.
+        ikk_stim (float): Stimulácia IKK.
+        repeats (int): Počet opakovaní; reportuje sa najlepší čas.
+        configurations (tuple): Dvojice (metóda, use_jac), ktoré sa majú porovnať.
+
+    Returns:
+        list: Zoznam slovníkov s kľúčmi method, use_jac, nfev, njev, nlu, wall_time, Nn_final.
+    """
+    simulator = NFkBSimulatorExact(NFkBSystemExact(CytoNucParamsExact(IKK_stimulation=ikk_stim)))
+
+    results = []
+    for method, use_jac in configurations:
+        best = np.inf
+        for _ in range(repeats):
+            start = time.perf_counter()
+            sol = simulator.simulate(t_span=t_span, method=method, use_jac=use_jac, cache=False)
+            best = min(best, time.perf_counter() - start)
+
+        results.append({
+            "method": method,
+            "use_jac": use_jac,
+            "nfev": sol.nfev,
+            "njev": sol.njev,
+            "nlu": sol.nlu,
+            "wall_time": best,
+            "Nn_final": sol.y[1, -1],
+        })
+
+    print(f"{'method':<7} {'jac':<9} {'nfev':>7} {'njev':>6} {'nlu':>6} {'time [ms]':>10} {'Nn(T)':>10}")
+    for r in results:
+        jac = "analytic" if r["use_jac"] else "numeric"
+        print(f"{r['method']:<7} {jac:<9} {r['nfev']:>7} {r['njev']:>6} {r['nlu']:>6} "
+              f"{1e3 * r['wall_time']:>10.1f} {r['Nn_final']:>10.4f}")
+
+    return results
+
+
+if __name__ == "__main__":
+    benchmark_jacobian()
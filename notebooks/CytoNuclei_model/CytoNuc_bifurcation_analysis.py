@@ -1,12 +1,295 @@
+import os
+import sys
+import time
+from functools import partial
+
 import numpy as np
-import matplotlib.pyplot as plt
 from tqdm import tqdm
-from scipy.integrate import solve_ivp
+from scipy.integrate import LSODA
+
+from CytoNuc_rovnice import MODEL, NFkBSystemExact, VARIABLES
+from CytoNuc_params import CytoNucParamsExact, PARAM_NAMES
+from CytoNuc_metrics import TailMin, TailMax, evaluate_metrics, evaluate_metrics_ensemble
+from CytoNuc_parallel import parallel_map, PointFailure
+from CytoNuc_plots import plot_bifurcation
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "common"))
+from simulation_cache import make_key, source_fingerprint, resolve_cache
+from solver_stats import RunStats, SweepProfile, emit
+
+
+def _tail_metrics(tail_fraction):
+    """Minimum a maximum každej premennej v koncovej časti intervalu."""
+    return [TailMin(VARIABLES, tail_fraction, name="min"), TailMax(VARIABLES, tail_fraction, name="max")]
+
+
+def _point_params(params, bifurcation_param, p_val):
+    """Kópia parametrov (predvolených, ak `params` je None) s novou hodnotou bifurkačného parametra."""
+    params = CytoNucParamsExact() if params is None else params.copy()
+    params.set(bifurcation_param, p_val)
+    return params
+
+
+def _tail_extrema_point(p_val, bifurcation_param, y0, t_span, tail_fraction=0.5, params=None):
+    """
+    Vyrieši jeden bod bifurkačnej analýzy. Funkcia je na úrovni modulu, aby sa dala
+    poslať do pracovných procesov. Extrémy sa počítajú pre všetky premenné naraz priamo
+    počas integrácie zo spojitého riešenia (`CytoNuc_metrics`), takže uložený výsledok
+    poslúži aj pri sledovaní inej premennej.
+
+    Returns:
+        tuple: (success, message, min_vals, max_vals, y_final, stats); min_vals a max_vals majú
+               tvar (7,), pri neúspechu sú NaN; stats je `solver_stats.RunStats` integrácie.
+    """
+    params = _point_params(params, bifurcation_param, p_val)
+    system = NFkBSystemExact(params)
+
+    result = evaluate_metrics(system, _tail_metrics(tail_fraction), t_span, y0)
+    return (result.success, result.message, result.metrics["min"], result.metrics["max"],
+            result.y_final if result.success else None, result.stats)
+
+
+def _repeating_lag(values, tol, max_lag=4):
+    """
+    Najmenšia perióda k (v počte maxím), pre ktorú sa posledných k maxím zhoduje s k maximami
+    o periódu skôr. Umožňuje rozpoznať aj cykly s viacerými lokálnymi maximami. Vráti 0,
+    ak sa cyklus zatiaľ neustálil.
+    """
+    values = np.asarray(values)
+    for k in range(1, max_lag + 1):
+        if len(values) < 2 * k:
+            break
+        recent, previous = values[-k:], values[-2 * k:-k]
+        if np.all(np.abs(recent - previous) <= tol * (np.abs(recent) + 1e-9)):
+            return k
+    return 0
 
-from CytoNuc_rovnice import NFkBSystemExact
-from CytoNuc_params import CytoNucParamsExact
 
-def run_bifurcation_analysis(observed_variable, bifurcation_param, param_range, y0, t_span, t_eval):
+def _geometric_limit(values, tol):
+    """
+    Limita postupnosti extrémov, ktorá sa k limitnému cyklu (alebo tlmene k ustálenému stavu)
+    blíži geometricky: Aitkenova Δ² extrapolácia z posledných troch hodnôt, ak sa pomer
+    posledných dvoch rozdielov ustálil (v rámci 10 %) a odhad zvyšnej chyby |d r / (1 - r)|
+    je nanajvýš `tol` (absolútne). Vráti None, ak postupnosť ešte nekonverguje.
+    """
+    if len(values) < 4:
+        return None
+    d = np.diff(values[-4:])
+    if np.all(np.abs(d[1:]) <= tol):
+        return values[-1]
+    if d[0] == 0 or d[1] == 0:
+        return None
+    r, r_prev = d[2] / d[1], d[1] / d[0]
+    if not abs(r) < 1 or abs(r - r_prev) > 0.1 * abs(r):
+        return None
+    remaining = d[2] * r / (1 - r)
+    return values[-1] + remaining if abs(remaining) <= tol else None
+
+
+def _attractor_extrema(system, y0, observed_idx, t_max, cycle_tol=1e-3, ss_tol=1e-8, prominence=1e-4,
+                       tail_fraction=0.5, rtol=1e-4, atol=1e-9, stats=None):
+    """
+    Integruje len dovtedy, kým trajektória nedosiahne atraktor.
+
+    Riešič sa krokuje ručne. Pri zmene znamienka d(premenná)/dt (prechod Poincarého rezom)
+    sa extrém sledovanej premennej spresní z hustého výstupu kroku. Extrém sa uzná, až keď
+    sa premenná od neho vzdiali aspoň o `prominence` násobok svojej doterajšej maximálnej
+    hodnoty, takže numerický šum v minimách nevytvára falošné maximá. Maximá aj minimá sa
+    k limitnému cyklu blížia geometricky (pomer rozdielov 0,2 – 0,8 pri t3), takže sa ich
+    limity odhadnú Aitkenovou extrapoláciou (`_geometric_limit`), len čo je odhad zvyšnej
+    chyby pod `cycle_tol` násobkom doterajšieho maxima premennej. Cykly s viacerými maximami
+    za periódu sa uznajú, keď sa postupnosť maxím zopakuje s relatívnou presnosťou
+    `cycle_tol`, a min/max sa vezmú z poslednej periódy. Ustálený stav sa rozpozná, keď
+    max |dy/dt| klesne pod `ss_tol`. Ak sa atraktor do `t_max` neustáli, použijú sa extrémy z koncovej časti
+    intervalu (ako pri pôvodnej analýze). Ak je zadaný `stats` (`solver_stats.RunStats`),
+    zaznamená sa doň každý krok riešiča.
+
+    Returns:
+        tuple: (success, message, min_val, max_val, y_final, t_used).
+    """
+    system = system.compiled()
+    solver = LSODA(system.rhs, 0.0, np.asarray(y0, dtype=float), t_max, jac=system.jac, rtol=rtol, atol=atol)
+    slope = system.rhs(0.0, solver.y)[observed_idx]
+    scale = abs(solver.y[observed_idx])
+
+    max_t, max_v, min_t, min_v = [], [], [], []
+    # Kandidát na extrém, ktorý ešte nebol potvrdený dostatočným poklesom/nárastom.
+    pending = None      # (typ, čas, hodnota); typ +1 = maximum, -1 = minimum
+
+    while solver.status == "running":
+        t_old = solver.t
+        message = solver.step()
+        if solver.status == "failed":
+            return False, message, np.nan, np.nan, solver.y, solver.t
+        if stats is not None:
+            stats.observe(solver)
+
+        y = solver.y
+        f = np.asarray(system.rhs(solver.t, y))
+        scale = max(scale, abs(y[observed_idx]))
+        if np.max(np.abs(f)) < ss_tol:
+            return True, "Ustálený stav.", y[observed_idx], y[observed_idx], y, solver.t
+
+        new_slope = f[observed_idx]
+        if slope * new_slope <= 0 and slope != new_slope:
+            kind = 1 if slope > 0 else -1
+            ts = np.linspace(t_old, solver.t, 9)
+            values = solver.dense_output()(ts)[observed_idx]
+            i = np.argmax(values) if kind > 0 else np.argmin(values)
+            candidate = (kind, ts[i], values[i])
+            threshold = prominence * scale
+
+            if pending is None or pending[0] == kind:
+                # Rovnaký typ: ponechá sa výraznejší z kandidátov.
+                if pending is None or kind * (candidate[2] - pending[2]) > 0:
+                    pending = candidate
+            elif abs(candidate[2] - pending[2]) > threshold:
+                # Opačný typ dostatočne ďaleko: predchádzajúci kandidát sa potvrdí.
+                if pending[0] > 0:
+                    max_t.append(pending[1])
+                    max_v.append(pending[2])
+                else:
+                    min_t.append(pending[1])
+                    min_v.append(pending[2])
+                pending = candidate
+
+                # Tolerancia je relatívna k veľkosti premennej, aj pre minimá blízko nuly.
+                tol = cycle_tol * scale
+                low, high = _geometric_limit(min_v, tol), _geometric_limit(max_v, tol)
+                if low is not None and high is not None:
+                    return True, "Limitný cyklus (extrapolovaný).", low, high, y, solver.t
+                # Jedno maximum za periódu rieši extrapolácia vyššie, tu len cykly s viacerými.
+                lag = _repeating_lag(max_v, cycle_tol) if kind < 0 else 0
+                if lag > 1 and len(max_t) > lag:
+                    window_start = max_t[-1 - lag]
+                    cycle_min = [v for tm, v in zip(min_t, min_v) if tm >= window_start] + [candidate[2]]
+                    return (True, f"Limitný cyklus ({lag} max. za periódu).", min(cycle_min),
+                            max(max_v[-lag:]), y, solver.t)
+        slope = new_slope
+
+    # Extrémy v koncovej časti intervalu spolu s koncovým bodom.
+    y = solver.y
+    t_tail = t_max * (1 - tail_fraction)
+    extrema = list(zip(max_t + min_t, max_v + min_v))
+    if pending is not None:
+        extrema.append(pending[1:])
+    tail = [v for tm, v in extrema if tm >= t_tail] + [y[observed_idx]]
+    return True, "Atraktor sa do konca intervalu neustálil.", min(tail), max(tail), y, solver.t
+
+
+def _attractor_point(p_val, observed_idx, bifurcation_param, y0, t_span, params=None):
+    """
+    Bod bifurkačnej analýzy s predčasným ukončením (pozri `_attractor_extrema`). Ukončenie
+    závisí od sledovanej premennej, preto sú extrémy ostatných premenných NaN.
+    """
+    params = _point_params(params, bifurcation_param, p_val)
+    system = NFkBSystemExact(params)
+    stats = RunStats("_attractor_extrema", "LSODA").start()
+    success, message, min_val, max_val, y_final, _ = _attractor_extrema(
+        system, y0, observed_idx, t_span[1] - t_span[0], stats=stats)
+    min_vals, max_vals = np.full(7, np.nan), np.full(7, np.nan)
+    min_vals[observed_idx], max_vals[observed_idx] = min_val, max_val
+    return success, message, min_vals, max_vals, y_final, stats.finish(success, message)
+
+
+def _collect(results):
+    """
+    Zloží výsledky bodov do tabuľky (success, min_values, max_values, messages, stats), kde
+    min_values a max_values majú tvar (M, 7), stats je zoznam `RunStats` a poradie bodov
+    zodpovedá `param_range`.
+    """
+    success, min_values, max_values, messages, stats = [], [], [], [], []
+    for result in results:
+        if isinstance(result, PointFailure):
+            failure = RunStats("bifurcation point").finish(False, result.message)
+            result = (False, result.message, np.full(7, np.nan), np.full(7, np.nan), None, failure)
+        ok, message, min_vals, max_vals, _, run = result
+        success.append(bool(ok))
+        messages.append(str(message))
+        min_values.append(min_vals)
+        max_values.append(max_vals)
+        stats.append(run)
+
+    return np.array(success, dtype=bool), np.array(min_values), np.array(max_values), messages, stats
+
+
+def _tail_extrema_pool(observed_idx, bifurcation_param, param_range, y0, t_span,
+                       n_workers=1, chunksize=None, early_stop=False, params=None):
+    """
+    Vyhodnotí body bifurkačnej analýzy samostatnými integráciami, sériovo alebo v `n_workers`
+    procesoch. Poradie výsledkov zodpovedá poradiu `param_range`.
+
+    Returns:
+        tuple: Tabuľka (success, min_values, max_values, messages, stats), pozri `_collect`.
+    """
+    if early_stop:
+        point = partial(_attractor_point, observed_idx=observed_idx, bifurcation_param=bifurcation_param,
+                        y0=y0, t_span=t_span, params=params)
+    else:
+        point = partial(_tail_extrema_point, bifurcation_param=bifurcation_param,
+                        y0=y0, t_span=t_span, params=params)
+    results = parallel_map(point, param_range, n_workers=n_workers, chunksize=chunksize,
+                           desc=f"Analyzujem {bifurcation_param}")
+
+    return _collect(results)
+
+
+def _tail_extrema_warm(observed_idx, bifurcation_param, param_range, y0, t_span, early_stop=False,
+                       params=None):
+    """
+    Sériová analýza, v ktorej každý bod štartuje z koncového stavu predchádzajúceho bodu
+    (warm start). Pri hladkej zmene parametra je trajektória hneď blízko atraktora, takže
+    s `early_stop=True` stačí zlomok pôvodného času integrácie.
+    """
+    results = []
+    y_start = y0
+    for p_val in tqdm(param_range, desc=f"Analyzujem {bifurcation_param}"):
+        if early_stop:
+            result = _attractor_point(p_val, observed_idx, bifurcation_param, y_start, t_span, params)
+        else:
+            result = _tail_extrema_point(p_val, bifurcation_param, y_start, t_span, params=params)
+        results.append(result)
+        y_start = result[4] if result[0] else y0
+
+    return _collect(results)
+
+
+def _tail_extrema_ensemble(bifurcation_param, param_range, y0, t_span, tail_fraction=0.5, params=None):
+    """
+    Vyhodnotí všetky body bifurkačnej analýzy naraz ako jeden súbor (ensemble).
+
+    Returns:
+        tuple: Tabuľka (success, min_values, max_values, messages, stats), pozri `_collect`.
+    """
+    batch = CytoNucParamsExact.sweep(bifurcation_param, param_range, params)
+    result = evaluate_metrics_ensemble(batch, _tail_metrics(tail_fraction), t_span, y0)
+    min_values, max_values = result.metrics["min"].T, result.metrics["max"].T
+
+    messages = ["" if ok else "Člen súboru nedosiahol koniec intervalu integrácie." for ok in result.success]
+    return result.success, min_values, max_values, messages, result.stats
+
+
+def _sweep_key(mode, observed_idx, bifurcation_param, param_range, y0, t_span, params=None):
+    """Kľúč vyrovnávacej pamäte pre celý sken; sledovaná premenná ho ovplyvní len pri early_stop."""
+    base = params if params is not None else CytoNucParamsExact()
+    return make_key("run_bifurcation_analysis", "continuous-tail", source_fingerprint(NFkBSystemExact),
+                    MODEL.fingerprint, base, mode, observed_idx if "early_stop" in mode else None,
+                    bifurcation_param, param_range, y0, t_span)
+
+
+def _report_failed(bifurcation_param, failed):
+    """Vypíše body, ktoré sa nepodarilo vyriešiť, namiesto ich tichého vynechania."""
+    if not failed:
+        return
+    print(f"Upozornenie: {len(failed)} bodov parametra '{bifurcation_param}' sa nepodarilo vyriešiť:")
+    for p_val, message in failed:
+        print(f"  {bifurcation_param} = {p_val:.6g}: {message}")
+
+
+def run_bifurcation_analysis(observed_variable, bifurcation_param, param_range, y0, t_span, t_eval,
+                             ensemble=False, n_workers=1, chunksize=None, return_failed=False,
+                             warm_start=False, early_stop=False, cache=True, params=None, return_stats=False,
+                             plot=True, plot_path=None):
     """
     Vykoná všeobecnú bifurkačnú analýzu pre kompartmentalizovaný model.
 
@@ -16,51 +299,100 @@ def run_bifurcation_analysis(observed_variable, bifurcation_param, param_range,
         param_range (np.ndarray): Pole hodnôt pre bifurkačný parameter.
         y0 (list): Počiatočné podmienky pre systém.
         t_span (tuple): Časový interval simulácie.
-        t_eval (np.ndarray): Časové body pre vyhodnotenie riešenia.
+        t_eval (np.ndarray): Ponechané kvôli kompatibilite volaní; extrémy sa vyhodnocujú zo
+            spojitého riešenia v poslednej polovici intervalu `t_span`, nie na mriežke.
+        ensemble (bool): Ak True, všetky hodnoty parametra sa integrujú naraz jedným
+            vektorizovaným riešičom (`CytoNuc_ensemble.EnsembleSolver`) namiesto
+            samostatnej integrácie pre každý bod.
+        n_workers (int): Počet pracovných procesov pre samostatné integrácie (None = všetky jadrá).
+        chunksize (int): Počet bodov v jednej dávke posielanej procesu (predvolene automaticky).
+        return_failed (bool): Ak True, vráti aj zoznam nevyriešených bodov.
+        warm_start (bool): Ak True, každý bod štartuje z koncového stavu susedného bodu
+            namiesto `y0` (body sa potom počítajú sériovo).
+        early_stop (bool): Ak True, integrácia bodu skončí, keď sa dosiahne ustálený stav
+            alebo ustálený limitný cyklus, a min/max sa určia z detegovaného cyklu
+            (extrapoláciou, pozri `_attractor_extrema`). Zrýchlenie je obmedzené dĺžkou
+            prechodového deja: extrémy sa k cyklu blížia s pomerom 0,2 – 0,8 za periódu
+            (45 – 190 min pri t3), takže aj pri warm starte treba aspoň štyri periódy. Pri
+            skene Nn vs t3 (200 bodov, (0, 2000)) trvá predvolený režim ~28 s, early_stop
+            12 – 14 s (2x) a warm_start s early_stop 8,5 – 10 s (~3x); medián relatívnej chyby
+            min/max voči dlhej integrácii je 3e-5, resp. 5e-5 (predvolený režim 2e-4).
+        cache (bool or SimulationCache): Vyrovnávacia pamäť výsledkov (True = predvolená).
+            Ukladajú sa extrémy všetkých premenných, takže opakovaný sken alebo sken
+            sledujúci inú premennú nepotrebuje žiadnu integráciu.
+        params (CytoNucParamsExact): Hodnoty ostatných parametrov (predvolene
+            `CytoNucParamsExact()`); nemení sa. Odvodené parametre sledujú zmenu
+            bifurkačného parametra (pri 'IKK' aj d1).
+        return_stats (bool): Ak True, vráti na konci aj `solver_stats.SweepProfile` so
+            štatistikami riešiča všetkých bodov (volania pravej strany a Jakobiánu, kroky,
+            prepnutia LSODA, čas, dôvod zlyhania). Profil dostanú vždy aj háčiky `solver_stats`.
+        plot (bool): Ak False, diagram sa nekreslí (dávkové úlohy bez displeja).
+        plot_path (str, optional): Súbor, do ktorého sa diagram zapíše namiesto zobrazenia
+            (`CytoNuc_plots.plot_bifurcation`).
     
     Returns:
-        tuple: Vráti dáta (param_values, min_values, max_values) pre prípadné ďalšie spracovanie.
+        tuple: Vráti dáta (param_values, min_values, max_values) pre prípadné ďalšie spracovanie,
+               pri `return_failed=True` navyše zoznam `failed` dvojíc (hodnota parametra, dôvod),
+               pri `return_stats=True` navyše profil skenu.
     """
     print(f"Spúšťam bifurkačnú analýzu pre parameter '{bifurcation_param}', sledujem premennú '{observed_variable}'...")
 
-    variable_map = {'N': 0, 'Nn': 1, 'I': 2, 'In': 3, 'Im': 4, 'NI': 5, 'NIn': 6}
-    
-    if observed_variable not in variable_map:
-        raise ValueError(f"Neznáma premenná '{observed_variable}'. Dostupné možnosti: {list(variable_map.keys())}")
+    if observed_variable not in VARIABLES:
+        raise ValueError(f"Neznáma premenná '{observed_variable}'. Dostupné možnosti: {list(VARIABLES)}")
     
-    observed_idx = variable_map[observed_variable]
+    observed_idx = VARIABLES.index(observed_variable)
 
-    param_values, min_values, max_values = [], [], []
+    if ensemble and (warm_start or early_stop):
+        raise ValueError("Režim ensemble nepodporuje warm_start ani early_stop.")
+    if bifurcation_param not in PARAM_NAMES:
+        raise ValueError(f"Neznámy parameter '{bifurcation_param}'. Dostupné možnosti: {list(PARAM_NAMES)}")
 
-    for p_val in tqdm(param_range, desc=f"Analyzujem {bifurcation_param}"):
-        params = CytoNucParamsExact()
-        setattr(params, bifurcation_param, p_val)
-        system = NFkBSystemExact(params)
-        
-        sol = solve_ivp(fun=system.rhs, t_span=t_span, y0=y0, t_eval=t_eval, method="LSODA")
-        
-        if not sol.success:
-            continue
-
-        tail_fraction = 0.5
-        num_points_in_tail = int(len(sol.t) * tail_fraction)
-        variable_tail = sol.y[observed_idx, -num_points_in_tail:]
-        
-        min_val = np.min(variable_tail)
-        max_val = np.max(variable_tail)
-        
-        param_values.append(p_val)
-        min_values.append(min_val)
-        max_values.append(max_val)
-
-    plt.figure(figsize=(12, 7))
-    plt.plot(param_values, min_values, 'k.', markersize=2)
-    plt.plot(param_values, max_values, 'k.', markersize=2)
-    
-    plt.title(f'Bifurkačný Diagram: Vplyv "{bifurcation_param}" na "{observed_variable}"', fontsize=16)
-    plt.xlabel(f'Hodnota parametra "{bifurcation_param}"')
-    plt.ylabel(f'Ustálená koncentrácia {observed_variable} [μM]')
-    plt.grid(True)
-    plt.show()
+    mode = "ensemble" if ensemble else ("warm" if warm_start else "pool") + ("+early_stop" if early_stop else "")
+    start = time.perf_counter()
+    store = resolve_cache(cache)
+    entry = None
+    if store is not None:
+        key = _sweep_key(mode, observed_idx, bifurcation_param, param_range, y0, t_span, params)
+        entry = store.get(key)
+
+    if entry is not None:
+        arrays, meta = entry
+        success, all_min, all_max, messages = arrays["success"], arrays["min"], arrays["max"], meta["messages"]
+        runs = [RunStats.from_dict(record) for record in meta.get("stats", [])] or \
+            [RunStats("bifurcation point").finish(ok, message) for ok, message in zip(success, messages)]
+        for run in runs:
+            run.cached = True
+    else:
+        if ensemble:
+            table = _tail_extrema_ensemble(bifurcation_param, param_range, y0, t_span, params=params)
+        elif warm_start:
+            table = _tail_extrema_warm(observed_idx, bifurcation_param, param_range, y0, t_span, early_stop,
+                                       params)
+        else:
+            table = _tail_extrema_pool(observed_idx, bifurcation_param, param_range, y0, t_span,
+                                       n_workers, chunksize, early_stop, params)
+        success, all_min, all_max, messages, runs = table
+        if store is not None:
+            store.put(key, {"success": success, "min": all_min, "max": all_max},
+                      {"messages": messages, "stats": [run.as_dict() for run in runs]})
+
+    profile = SweepProfile("run_bifurcation_analysis", bifurcation_param, param_range, runs,
+                           time.perf_counter() - start, mode=mode, observed_variable=observed_variable)
+    emit(profile)
+
+    param_values = [p_val for p_val, ok in zip(param_range, success) if ok]
+    min_values = list(all_min[success, observed_idx])
+    max_values = list(all_max[success, observed_idx])
+    failed = [(p_val, message) for p_val, ok, message in zip(param_range, success, messages) if not ok]
+
+    _report_failed(bifurcation_param, failed)
+
+    if plot:
+        plot_bifurcation(param_values, min_values, max_values, bifurcation_param, observed_variable, plot_path)
 
-    return param_values, min_values, max_values
\ No newline at end of file
+    output = (param_values, min_values, max_values)
+    if return_failed:
+        output += (failed,)
+    if return_stats:
+        output += (profile,)
+    return output
\ No newline at end of file
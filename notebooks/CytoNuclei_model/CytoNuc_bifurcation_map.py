@@ -0,0 +1,227 @@
+import time
+from functools import partial
+
+import contourpy
+import numpy as np
+from scipy.optimize import OptimizeResult
+
+from CytoNuc_rovnice import VARIABLES
+from CytoNuc_params import CytoNucParamsExact, PARAM_NAMES
+from CytoNuc_ensemble import integrate_ensemble
+from CytoNuc_oscillations import CLASSES, analyze_oscillations
+from CytoNuc_parallel import parallel_map, PointFailure
+
+# Regime code of points whose integration failed (the codes of `CLASSES` are 0, 1, 2).
+FAILED = -1
+
+
+def _axis(bounds, n_cells, scale):
+    if scale == "log":
+        return np.geomspace(bounds[0], bounds[1], n_cells + 1)
+    if scale == "linear":
+        return np.linspace(bounds[0], bounds[1], n_cells + 1)
+    raise ValueError(f"Unknown axis scale '{scale}', use 'linear' or 'log'.")
+
+
+def _evaluate_points(points, param_x, param_y, params, y0, t_span, n_points, observed_idx, rtol, atol,
+                     analysis):
+    """
+    Integrates a block of (x, y) parameter points as one ensemble and classifies the
+    oscillation of the observed variable.
+
+    Returns:
+        tuple: (regime, amplitude, period, success), arrays of length len(points).
+    """
+    batch = CytoNucParamsExact.sweep(param_x, points[:, 0], params)
+    batch.set(param_y, points[:, 1])
+    t_eval = np.linspace(t_span[0], t_span[1], n_points)
+    sol = integrate_ensemble(batch, y0, t_span, t_eval=t_eval, rtol=rtol, atol=atol)
+    res = analyze_oscillations(sol.t, sol.y[:, [observed_idx]], species=(VARIABLES[observed_idx],),
+                               lag_pair=None, **analysis)
+    regime = np.where(sol.success, res.regime[:, 0], FAILED)
+    return regime, res.amplitude[:, 0], res.period[:, 0], sol.success
+
+
+class _Lattice:
+    """
+    Evaluated vertices of the quadtree, addressed by their (i, j) index on the finest lattice.
+    New vertices are evaluated level by level, each level as ensemble blocks of `batch_size`
+    points spread over the workers.
+    """
+
+    def __init__(self, x, y, evaluate, batch_size, n_workers):
+        self.x, self.y = x, y
+        self.evaluate = evaluate
+        self.batch_size = batch_size
+        self.n_workers = n_workers
+        self.index = {}
+        self.nodes, self.regime, self.amplitude, self.period, self.success = [], [], [], [], []
+        self.levels = []
+
+    def add(self, nodes):
+        nodes = sorted(set(nodes) - self.index.keys())
+        if not nodes:
+            return
+        ij = np.array(nodes)
+        points = np.column_stack([self.x[ij[:, 0]], self.y[ij[:, 1]]])
+        blocks = [points[k:k + self.batch_size] for k in range(0, len(points), self.batch_size)]
+        for block, result in zip(blocks, parallel_map(self.evaluate, blocks, n_workers=self.n_workers)):
+            if isinstance(result, PointFailure):
+                print(f"  Warning: block of {len(block)} points failed: {result.message}")
+                nan = np.full(len(block), np.nan)
+                result = (np.full(len(block), FAILED), nan, nan, np.zeros(len(block), dtype=bool))
+            for store, values in zip((self.regime, self.amplitude, self.period, self.success), result):
+                store.extend(values)
+        for node in nodes:
+            self.index[node] = len(self.nodes)
+            self.nodes.append(node)
+        self.levels.append(len(nodes))
+
+    def regimes_on_boundary(self, cell):
+        """Regimes of all evaluated vertices on the boundary of a cell (corners and edges)."""
+        i, j, s = cell
+        found = set()
+        for k in range(s + 1):
+            for node in ((i + k, j), (i + k, j + s), (i, j + k), (i + s, j + k)):
+                n = self.index.get(node)
+                if n is not None:
+                    found.add(self.regime[n])
+        return found
+
+
+def _split(cell):
+    i, j, s = cell
+    h = s // 2
+    return [(i, j, h), (i + h, j, h), (i, j + h, h), (i + h, j + h, h)]
+
+
+def _new_vertices(cell):
+    i, j, s = cell
+    h = s // 2
+    return [(i + h, j), (i, j + h), (i + h, j + h), (i + s, j + h), (i + h, j + s)]
+
+
+def _fill(lattice, leaves, shape):
+    """
+    Regime, amplitude and period on the finest lattice. Leaves whose boundary is uniform are
+    filled with their regime and a bilinear interpolation of the corner values; evaluated
+    vertices keep their own values.
+    """
+    regime = np.full(shape, FAILED, dtype=int)
+    amplitude = np.full(shape, np.nan)
+    period = np.full(shape, np.nan)
+    weights = {}
+    for i, j, s in leaves:
+        corners = [lattice.index[(i + a, j + b)] for b in (0, s) for a in (0, s)]
+        regime[j:j + s + 1, i:i + s + 1] = lattice.regime[corners[0]]
+        if s not in weights:
+            u = np.linspace(0.0, 1.0, s + 1)
+            weights[s] = [np.outer(1 - u, 1 - u), np.outer(1 - u, u), np.outer(u, 1 - u), np.outer(u, u)]
+        for field, values in ((amplitude, lattice.amplitude), (period, lattice.period)):
+            field[j:j + s + 1, i:i + s + 1] = sum(w * values[c] for w, c in zip(weights[s], corners))
+
+    ij = np.array(lattice.nodes)
+    regime[ij[:, 1], ij[:, 0]] = lattice.regime
+    amplitude[ij[:, 1], ij[:, 0]] = lattice.amplitude
+    period[ij[:, 1], ij[:, 0]] = lattice.period
+    evaluated = np.zeros(shape, dtype=bool)
+    evaluated[ij[:, 1], ij[:, 0]] = True
+    return regime, amplitude, period, evaluated
+
+
+def _boundaries(x, y, regime):
+    """Polylines (n, 2) in parameter coordinates around the region of every regime."""
+    boundaries = {}
+    for code, name in list(enumerate(CLASSES)) + [(FAILED, "failed")]:
+        inside = (regime == code).astype(float)
+        if inside.all() or not inside.any():
+            boundaries[name] = []
+            continue
+        lines = contourpy.contour_generator(x, y, inside, line_type="Separate").lines(0.5)
+        boundaries[name] = [np.asarray(line) for line in lines]
+    return boundaries
+
+
+def bifurcation_map(param_x, range_x, param_y, range_y, observed_variable="Nn", coarse=(8, 8), max_depth=4,
+                    params=None, y0=None, t_span=(0, 2000), n_points=2001, scale=("linear", "linear"),
+                    rtol=1e-6, atol=1e-9, batch_size=256, n_workers=1, **analysis):
+    """
+    Two-parameter regime map (steady / damped / sustained oscillation) with quadtree refinement.
+
+    The plane is first covered by a coarse grid of `coarse` cells. A cell is split into four
+    whenever the regimes of the evaluated vertices on its boundary disagree, until the cells
+    reach the finest lattice of `coarse * 2**max_depth` cells; cells with a uniform boundary are
+    never refined, so the number of simulations grows with the length of the regime boundaries
+    instead of the area. Features smaller than a coarse cell that do not touch its boundary
+    (an island of oscillations inside a steady cell) are not found: the coarse grid has to
+    resolve them.
+
+    Every refinement level integrates its new points together (`integrate_ensemble`, blocks of
+    `batch_size` members spread over `n_workers` processes) and classifies them with
+    `CytoNuc_oscillations.analyze_oscillations`.
+
+    Args:
+        param_x, param_y (str): Mapped parameters, e.g. 't3' and 'IKK'.
+        range_x, range_y (tuple): Their (min, max).
+        observed_variable (str): Variable whose oscillation is classified.
+        coarse (tuple): Coarse cells along x and y.
+        max_depth (int): Refinement levels; the finest cell is 2**-max_depth of a coarse cell.
+        params (CytoNucParamsExact, optional): Values of the other parameters.
+        y0 (array_like, optional): Initial state; defaults to all NF-κB free in the cytoplasm.
+        t_span (tuple): Simulation interval; the classification uses its second half by default.
+        n_points (int): Points of the uniform output grid of every simulation.
+        scale (tuple): 'linear' or 'log' spacing along x and y.
+        rtol, atol (float): Integration tolerances.
+        batch_size (int): Points per ensemble integration.
+        n_workers (int, optional): Number of processes; None uses all cores.
+        **analysis: Passed on to `analyze_oscillations` (tail_fraction, rel_height, atol, ...).
+
+    Returns:
+        OptimizeResult: `x` (nx,), `y` (ny,) finest-lattice coordinates; `regime` (ny, nx)
+                        codes into `CLASSES` (`FAILED` = -1), `amplitude` and `period` (ny, nx),
+                        `evaluated` (ny, nx) mask of the simulated vertices; `boundaries`
+                        {regime name: list of (n, 2) polylines}; `points` (K, 2) with
+                        `point_regime`, `point_amplitude`, `point_period`, `point_success` (K,);
+                        `n_simulations`, `n_uniform` (simulations of the full lattice), `levels`
+                        (new points per refinement round), `wall_time` and the inputs.
+    """
+    for name in (param_x, param_y):
+        if name not in PARAM_NAMES:
+            raise ValueError(f"Unknown parameter '{name}'. Available: {list(PARAM_NAMES)}")
+    if param_x == param_y:
+        raise ValueError("The two mapped parameters must differ.")
+    if observed_variable not in VARIABLES:
+        raise ValueError(f"Unknown variable '{observed_variable}'. Available: {list(VARIABLES)}")
+    start = time.perf_counter()
+    params = CytoNucParamsExact() if params is None else params
+    y0 = np.array([1, 0, 0, 0, 0, 0, 0], dtype=float) if y0 is None else np.asarray(y0, dtype=float)
+    step = 2 ** int(max_depth)
+    nx, ny = coarse[0] * step, coarse[1] * step
+    x, y = _axis(range_x, nx, scale[0]), _axis(range_y, ny, scale[1])
+
+    evaluate = partial(_evaluate_points, param_x=param_x, param_y=param_y, params=params, y0=y0,
+                       t_span=t_span, n_points=n_points, observed_idx=VARIABLES.index(observed_variable),
+                       rtol=rtol, atol=atol, analysis=analysis)
+    lattice = _Lattice(x, y, evaluate, batch_size, n_workers)
+    lattice.add([(i, j) for i in range(0, nx + 1, step) for j in range(0, ny + 1, step)])
+
+    cells = [(i, j, step) for i in range(0, nx, step) for j in range(0, ny, step)]
+    while True:
+        split = [cell for cell in cells if cell[2] > 1 and len(lattice.regimes_on_boundary(cell)) > 1]
+        if not split:
+            break
+        print(f"  refining {len(split)} cells...")
+        lattice.add([node for cell in split for node in _new_vertices(cell)])
+        split = set(split)
+        cells = [child for cell in cells for child in (_split(cell) if cell in split else [cell])]
+
+    regime, amplitude, period, evaluated = _fill(lattice, cells, (ny + 1, nx + 1))
+    ij = np.array(lattice.nodes)
+    return OptimizeResult(x=x, y=y, regime=regime, amplitude=amplitude, period=period, evaluated=evaluated,
+                          boundaries=_boundaries(x, y, regime),
+                          points=np.column_stack([x[ij[:, 0]], y[ij[:, 1]]]),
+                          point_regime=np.array(lattice.regime), point_amplitude=np.array(lattice.amplitude),
+                          point_period=np.array(lattice.period), point_success=np.array(lattice.success),
+                          n_simulations=len(lattice.nodes), n_uniform=(nx + 1) * (ny + 1), levels=lattice.levels,
+                          wall_time=time.perf_counter() - start, param_x=param_x, param_y=param_y,
+                          observed_variable=observed_variable, classes=CLASSES, scale=tuple(scale))
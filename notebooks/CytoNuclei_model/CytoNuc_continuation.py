@@ -0,0 +1,408 @@
+import copy
+import os
+import sys
+
+import numpy as np
+import matplotlib.pyplot as plt
+from scipy.integrate import solve_ivp
+from scipy.optimize import OptimizeResult
+
+from CytoNuc_rovnice import NFkBSystemExact, VARIABLES
+from CytoNuc_params import CytoNucParamsExact, set_param
+from CytoNuc_steady_state import find_steady_state
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "common"))
+from rendering import finish
+
+_CONSERVATION = NFkBSystemExact.CONSERVATION
+
+
+# --- Equilibrium equations --------------------------------------------------------------
+#
+# Because total NF-κB is conserved, equilibria of rhs(y) = 0 are not isolated. The first
+# equation (dN) is therefore replaced by the conservation constraint
+# N + Nn + NI + NIn = total, which makes the 7x7 system regular.
+
+def _residual(system, y, total):
+    F = np.array(system.rhs(0.0, y), dtype=float)
+    F[0] = _CONSERVATION @ y - total
+    return F
+
+
+def _residual_jac(system, y):
+    J = system.jac(0.0, y)
+    J[0] = _CONSERVATION
+    return J
+
+
+def _param_derivative(system, param_name, y, total):
+    value = getattr(system.p, param_name)
+    h = 1e-6 * max(1.0, abs(value))
+    set_param(system.p, param_name, value + h)
+    F_plus = _residual(system, y, total)
+    set_param(system.p, param_name, value - h)
+    F_minus = _residual(system, y, total)
+    set_param(system.p, param_name, value)
+    return (F_plus - F_minus) / (2 * h)
+
+
+def _extended_jac(system, param_name, x, total):
+    """Jacobian (7, 8) of the equilibrium equations with respect to (y, parameter)."""
+    set_param(system.p, param_name, x[-1])
+    A = np.empty((7, 8))
+    A[:, :7] = _residual_jac(system, x[:7])
+    A[:, 7] = _param_derivative(system, param_name, x[:7], total)
+    return A
+
+
+def _tangent(A, reference):
+    """Unit tangent of the branch, oriented so that it points the same way as `reference`."""
+    rhs = np.zeros(8)
+    rhs[-1] = 1.0
+    t = np.linalg.solve(np.vstack([A, reference]), rhs)
+    return t / np.linalg.norm(t)
+
+
+def _correct(system, param_name, x_pred, direction, total, tol, max_iter):
+    """
+    Newton corrector on the hyperplane through `x_pred` orthogonal to `direction`.
+
+    Returns:
+        tuple: (x, iterations, converged).
+    """
+    x = x_pred.copy()
+    for iteration in range(1, max_iter + 1):
+        set_param(system.p, param_name, x[-1])
+        G = np.append(_residual(system, x[:7], total), direction @ (x - x_pred))
+        A = _extended_jac(system, param_name, x, total)
+        try:
+            dx = np.linalg.solve(np.vstack([A, direction]), -G)
+        except np.linalg.LinAlgError:
+            return x, iteration, False
+        x = x + dx
+        if not np.all(np.isfinite(x)):
+            return x, iteration, False
+        if np.linalg.norm(dx) <= tol * (1.0 + np.linalg.norm(x)):
+            return x, iteration, True
+    return x, max_iter, False
+
+
+def _initial_equilibrium(system, y_guess, total):
+    result = find_steady_state(system.p, y_guess, total)
+    if not result.success:
+        raise RuntimeError(f"Počiatočný rovnovážny stav sa nepodarilo nájsť: {result.message}")
+    return result.y
+
+
+# --- Test functions for special points --------------------------------------------------
+
+def _hopf_test(eigenvalues):
+    """Product of real parts over complex-conjugate pairs; changes sign when a pair crosses."""
+    pairs = eigenvalues[eigenvalues.imag > 1e-9 * (1.0 + np.abs(eigenvalues))]
+    return float(np.prod(pairs.real)) if pairs.size else 1.0
+
+
+def _locate(system, param_name, x_a, x_b, t_a, test, total, tol, max_newton, max_bisections=40):
+    """Bisection along the branch between two points where `test(x, t)` changes sign."""
+    psi_a = test(x_a, t_a)
+    x_mid, t_mid = x_b, t_a
+    for _ in range(max_bisections):
+        chord = x_b - x_a
+        length = np.linalg.norm(chord)
+        if length < 1e-10 * (1.0 + np.linalg.norm(x_a)):
+            break
+        x_mid, _, converged = _correct(system, param_name, x_a + 0.5 * chord, chord / length,
+                                       total, tol, max_newton)
+        if not converged:
+            break
+        t_mid = _tangent(_extended_jac(system, param_name, x_mid, total), t_a)
+        psi_mid = test(x_mid, t_mid)
+        if np.sign(psi_mid) == np.sign(psi_a):
+            x_a, t_a, psi_a = x_mid, t_mid, psi_mid
+        else:
+            x_b = x_mid
+    return x_mid
+
+
+def continue_equilibria(param_name, param_start, param_bounds, params=None, y_guess=None,
+                        total_nfkb=1.0, ds=0.01, ds_min=1e-6, ds_max=0.1, direction=1,
+                        max_points=2000, tol=1e-10, max_newton=8):
+    """
+    Pseudo-arclength continuation of the equilibrium branch of the CytoNuc model.
+
+    Traces the steady state as `param_name` (any attribute of `CytoNucParamsExact`) varies,
+    computes its stability from the Jacobian eigenvalues and locates Hopf points (a complex
+    pair crossing the imaginary axis) and folds (turning points of the parameter along the
+    branch) by bisection.
+
+    Args:
+        param_name (str): Continuation parameter, e.g. 't3'.
+        param_start (float): Parameter value where the branch starts.
+        param_bounds (tuple): (min, max); continuation stops when the branch leaves them.
+        params (CytoNucParamsExact, optional): Remaining parameters (copied, not modified).
+        y_guess (array_like, optional): Guess of the starting equilibrium; by default the end
+            state of a short simulation.
+        total_nfkb (float): Conserved total N + Nn + NI + NIn. Defaults to 1.0 (the default y0).
+        ds, ds_min, ds_max (float): Initial, minimal and maximal arclength step.
+        direction (int): +1 to start towards larger parameter values, -1 towards smaller.
+        max_points (int): Maximum number of branch points.
+        tol (float): Newton tolerance.
+        max_newton (int): Maximum Newton iterations per corrector.
+
+    Returns:
+        OptimizeResult: `param` (n,), `y` (n, 7), `eigenvalues` (n, 6), `stable` (n,),
+                        `special_points` (list of dicts with keys type, param, y, eigenvalues
+                        and, for Hopf points, period) and `message`.
+    """
+    params = copy.copy(params) if params is not None else CytoNucParamsExact()
+    set_param(params, param_name, param_start)
+    system = NFkBSystemExact(params)
+    lo, hi = param_bounds
+
+    def eigenvalues_at(x):
+        set_param(system.p, param_name, x[-1])
+        return system.stability_eigenvalues(x[:7])
+
+    def hopf_test(x, t):
+        return _hopf_test(eigenvalues_at(x))
+
+    def fold_test(x, t):
+        return t[-1]
+
+    x = np.append(_initial_equilibrium(system, y_guess, total_nfkb), param_start)
+    reference = np.zeros(8)
+    reference[-1] = np.sign(direction) or 1.0
+    t = _tangent(_extended_jac(system, param_name, x, total_nfkb), reference)
+
+    points, spectra = [x], [eigenvalues_at(x)]
+    special_points = []
+    message = "Dosiahnutý maximálny počet bodov."
+
+    while len(points) < max_points:
+        x_new, iterations, converged = _correct(system, param_name, x + ds * t, t, total_nfkb,
+                                                tol, max_newton)
+        t_new = None
+        if converged:
+            t_new = _tangent(_extended_jac(system, param_name, x_new, total_nfkb), t)
+        if not converged or t @ t_new < 0.9:
+            ds *= 0.5
+            if ds < ds_min:
+                message = "Krok pokračovania klesol pod ds_min."
+                break
+            continue
+
+        ev_new = eigenvalues_at(x_new)
+        if np.sign(t_new[-1]) != np.sign(t[-1]):
+            x_fold = _locate(system, param_name, x, x_new, t, fold_test, total_nfkb, tol, max_newton)
+            special_points.append({"type": "fold", "param": x_fold[-1], "y": x_fold[:7],
+                                   "eigenvalues": eigenvalues_at(x_fold)})
+        elif np.sign(_hopf_test(ev_new)) != np.sign(_hopf_test(spectra[-1])):
+            x_hopf = _locate(system, param_name, x, x_new, t, hopf_test, total_nfkb, tol, max_newton)
+            ev_hopf = eigenvalues_at(x_hopf)
+            critical = ev_hopf[ev_hopf.imag > 0]
+            omega = critical[np.argmin(np.abs(critical.real))].imag if critical.size else np.nan
+            special_points.append({"type": "hopf", "param": x_hopf[-1], "y": x_hopf[:7],
+                                   "eigenvalues": ev_hopf, "period": 2 * np.pi / omega})
+
+        points.append(x_new)
+        spectra.append(ev_new)
+        x, t = x_new, t_new
+        if iterations <= 3:
+            ds = min(1.5 * ds, ds_max)
+
+        if not lo <= x[-1] <= hi:
+            message = "Vetva opustila zadaný interval parametra."
+            break
+
+    points = np.array(points)
+    spectra = np.array(spectra)
+    for point in special_points:
+        print(f"{point['type'].capitalize()} bod: {param_name} = {point['param']:.6g}")
+
+    return OptimizeResult(param=points[:, -1], y=points[:, :7], eigenvalues=spectra,
+                          stable=np.all(spectra.real < 0, axis=1), special_points=special_points,
+                          param_name=param_name, message=message)
+
+
+# --- Limit cycles -----------------------------------------------------------------------
+
+def _variational_rhs(system):
+    def rhs(t, z):
+        y = z[:7]
+        Phi = z[7:].reshape(7, 7)
+        dy = system.rhs(t, y)
+        dPhi = system.jac(t, y) @ Phi
+        return np.concatenate([dy, dPhi.ravel()])
+    return rhs
+
+
+def _flow_with_monodromy(system, y0, period, rtol=1e-9, atol=1e-11):
+    z0 = np.concatenate([y0, np.eye(7).ravel()])
+    sol = solve_ivp(_variational_rhs(system), (0.0, period), z0, method="LSODA", rtol=rtol, atol=atol)
+    ok = sol.success and np.all(np.isfinite(sol.y[:, -1]))
+    return sol.y[:7, -1], sol.y[7:, -1].reshape(7, 7), ok
+
+
+def _cycle_guess(system, y_start, t_transient=1500.0, t_window=1000.0):
+    """Initial orbit (state at a maximum of Nn and period) from a direct simulation."""
+    sol = solve_ivp(system.rhs, (0.0, t_transient), y_start, method="LSODA", jac=system.jac,
+                    rtol=1e-8, atol=1e-10)
+
+    def nn_maximum(t, y):
+        return system.rhs(t, y)[1]
+    nn_maximum.direction = -1
+
+    sol = solve_ivp(system.rhs, (0.0, t_window), sol.y[:, -1], method="LSODA", jac=system.jac,
+                    events=nn_maximum, rtol=1e-8, atol=1e-10)
+    t_max, y_max = sol.t_events[0], sol.y_events[0]
+    if len(t_max) < 3:
+        return None, None
+
+    # Only the main peaks; shoulders in the trough would halve the period.
+    peaks = y_max[:, 1]
+    main = peaks >= 0.5 * (sol.y[1].min() + peaks.max())
+    t_max, y_max = t_max[main], y_max[main]
+    if len(t_max) < 2:
+        return None, None
+    return y_max[-1], t_max[-1] - t_max[-2]
+
+
+def _shoot(system, y0, period, total, tol=1e-9, max_iter=15):
+    """
+    Newton shooting for a periodic orbit: y(T) = y0 with phase condition dNn/dt(0) = 0.
+
+    One periodicity equation is replaced by the conservation constraint, which removes the
+    trivial Floquet multiplier caused by conservation of total NF-κB.
+    """
+    z = np.append(y0, period)
+    for _ in range(max_iter):
+        y0, period = z[:7], z[7]
+        y_T, monodromy, ok = _flow_with_monodromy(system, y0, period)
+        if not ok:
+            return None
+        f0 = np.asarray(system.rhs(0.0, y0))
+        f_T = np.asarray(system.rhs(0.0, y_T))
+
+        R = np.empty(8)
+        R[0] = _CONSERVATION @ y0 - total
+        R[1:7] = (y_T - y0)[1:7]
+        R[7] = f0[1]
+
+        D = np.zeros((8, 8))
+        D[0, :7] = _CONSERVATION
+        D[1:7, :7] = (monodromy - np.eye(7))[1:7]
+        D[1:7, 7] = f_T[1:7]
+        D[7, :7] = system.jac(0.0, y0)[1]
+
+        try:
+            dz = np.linalg.solve(D, -R)
+        except np.linalg.LinAlgError:
+            return None
+        z = z + dz
+        if not np.all(np.isfinite(z)) or z[7] <= 0:
+            return None
+        if np.linalg.norm(dz) <= tol * (1.0 + np.linalg.norm(z)):
+            return z[:7], z[7], monodromy
+    return None
+
+
+def continue_limit_cycle(param_name, param_values, params=None, y_start=None, total_nfkb=1.0,
+                         n_samples=400, min_amplitude=1e-6):
+    """
+    Natural-parameter continuation of the stable limit cycle (e.g. past a Hopf point).
+
+    Each orbit is computed by Newton shooting with the exact monodromy matrix from the
+    variational equations, starting from the orbit of the previous parameter value. Only
+    the first value (or one where shooting fails) needs a direct simulation for the guess.
+
+    Args:
+        param_name (str): Continuation parameter.
+        param_values (array_like): Parameter values, ordered away from the Hopf point.
+        params (CytoNucParamsExact, optional): Remaining parameters (copied, not modified).
+        y_start (array_like, optional): Initial state for the guessing simulation.
+        total_nfkb (float): Conserved total N + Nn + NI + NIn.
+        n_samples (int): Samples per orbit used for the min/max of each species.
+        min_amplitude (float): Orbits whose Nn amplitude is below this are rejected as
+            the equilibrium (which solves the shooting equations for any period).
+
+    Returns:
+        OptimizeResult: `param` (n,), `period` (n,), `y0` (n, 7), `y_min`, `y_max` (n, 7),
+                        `multipliers` (n, 7) Floquet multipliers and `success` (n,);
+                        failed points hold NaN.
+    """
+    params = copy.copy(params) if params is not None else CytoNucParamsExact()
+    system = NFkBSystemExact(params)
+    if y_start is None:
+        y_start = np.zeros(7)
+        y_start[0] = total_nfkb
+
+    param_values = np.asarray(param_values, dtype=float)
+    n = param_values.size
+    period = np.full(n, np.nan)
+    y0 = np.full((n, 7), np.nan)
+    y_min = np.full((n, 7), np.nan)
+    y_max = np.full((n, 7), np.nan)
+    multipliers = np.full((n, 7), np.nan, dtype=complex)
+
+    guess = None
+    for i, value in enumerate(param_values):
+        set_param(system.p, param_name, value)
+        orbit = None
+        if guess is not None:
+            orbit = _shoot(system, guess[0], guess[1], total_nfkb)
+        if orbit is None:
+            # No previous orbit, or the step was too large for it: fall back to simulation.
+            guess = _cycle_guess(system, y_start)
+            if guess[0] is not None:
+                orbit = _shoot(system, guess[0], guess[1], total_nfkb)
+        if orbit is None:
+            guess = None
+            continue
+
+        t_samples = np.linspace(0.0, orbit[1], n_samples)
+        sol = solve_ivp(system.rhs, (0.0, orbit[1]), orbit[0], t_eval=t_samples, method="LSODA",
+                        jac=system.jac, rtol=1e-8, atol=1e-10)
+        if np.ptp(sol.y[1]) < min_amplitude:
+            # Shooting also accepts the equilibrium as a "cycle" of any period.
+            guess = None
+            continue
+
+        y0[i], period[i], monodromy = orbit
+        multipliers[i] = np.linalg.eigvals(monodromy)
+        y_min[i] = sol.y.min(axis=1)
+        y_max[i] = sol.y.max(axis=1)
+        guess = (y0[i], period[i])
+
+    return OptimizeResult(param=param_values, period=period, y0=y0, y_min=y_min, y_max=y_max,
+                          multipliers=multipliers, success=np.isfinite(period), param_name=param_name)
+
+
+def plot_continuation(branch, observed_variable='Nn', cycles=None, path=None):
+    """Bifurcation diagram from continuation: stable (solid) / unstable (dashed) equilibria,
+    special points and, if given, the min/max envelope of the limit cycle; shown or written to `path`."""
+    idx = VARIABLES.index(observed_variable)
+    param, values = branch.param, branch.y[:, idx]
+
+    fig = plt.figure(figsize=(12, 7))
+    stable = np.where(branch.stable, values, np.nan)
+    unstable = np.where(~branch.stable, values, np.nan)
+    plt.plot(param, stable, 'k-', label='Stabilný rovnovážny stav')
+    plt.plot(param, unstable, 'k--', label='Nestabilný rovnovážny stav')
+
+    markers = {"hopf": ('ro', 'Hopf'), "fold": ('bs', 'Fold')}
+    for kind, (style, label) in markers.items():
+        found = [p for p in branch.special_points if p["type"] == kind]
+        if found:
+            plt.plot([p["param"] for p in found], [p["y"][idx] for p in found], style, label=label)
+
+    if cycles is not None:
+        ok = cycles.success
+        plt.plot(cycles.param[ok], cycles.y_min[ok, idx], 'g.', markersize=3, label='Limitný cyklus (min/max)')
+        plt.plot(cycles.param[ok], cycles.y_max[ok, idx], 'g.', markersize=3)
+
+    plt.title(f'Pokračovanie rovnovážnych stavov: "{branch.param_name}" vs. "{observed_variable}"', fontsize=16)
+    plt.xlabel(f'Hodnota parametra "{branch.param_name}"')
+    plt.ylabel(f'Koncentrácia {observed_variable} [μM]')
+    plt.legend()
+    plt.grid(True)
+    return finish(fig, path)
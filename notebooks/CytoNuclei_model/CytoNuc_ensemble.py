@@ -0,0 +1,308 @@
+import numpy as np
+from scipy.optimize import OptimizeResult
+
+from CytoNuc_rovnice import NFkBSystemExact
+from CytoNuc_params import params_from_matrix
+
+# Coefficients of the L-stable Rosenbrock pair used by MATLAB's ode23s.
+_D = 1.0 / (2.0 + np.sqrt(2.0))
+_E32 = 6.0 + np.sqrt(2.0)
+
+
+def _default_system(param_matrix):
+    return NFkBSystemExact(params_from_matrix(param_matrix))
+
+
+def hermite_interpolate(t_old, t_new, y_old, y_new, f_old, f_new, t):
+    """
+    Cubic Hermite interpolation inside one step, vectorized over members.
+
+    All time arguments have shape (m,), states and derivatives shape (n, m).
+    """
+    h = t_new - t_old
+    s = (t - t_old) / h
+    s2, s3 = s * s, s * s * s
+    h00 = 2 * s3 - 3 * s2 + 1
+    h10 = s3 - 2 * s2 + s
+    h01 = -2 * s3 + 3 * s2
+    h11 = s3 - s2
+    return h00 * y_old + h10 * h * f_old + h01 * y_new + h11 * h * f_new
+
+
+class EnsembleSolver:
+    """
+    Integrates M independent copies of the CytoNuc model at once.
+
+    The state is a (7, M) block and the parameters a (P, M) matrix (see `PARAM_NAMES`).
+    Every member keeps its own time, step size and error estimate (second-order
+    Rosenbrock method with an embedded third-order error estimate, as in ode23s), so a stiff
+    or oscillating member does not force small steps on the others. Right-hand side and
+    Jacobian are evaluated for all active members in a single vectorized call; members that
+    reach `t_bound` or fail are masked out of further work.
+
+    `tstops` (M, K) lists per-member times (padded with inf) where the right-hand side may be
+    discontinuous, e.g. the edges of a stimulus pulse. Steps are shortened to end exactly on
+    them, `on_stop(solver, members)` may then change the members' columns of `param_matrix`,
+    and the derivative is re-evaluated there, so the error controller never straddles an edge.
+
+    `first_step` may be one value or one per member (e.g. the step sizes a previous run ended
+    with, when a long integration is continued in pieces). Such a piecewise integration can
+    also reuse one solver: `restart` begins the next piece from new states (and parameters)
+    with the step sizes the members would have taken next.
+    """
+
+    def __init__(self, param_matrix, y0, t0, t_bound, rtol=1e-3, atol=1e-6, first_step=None,
+                 max_step=np.inf, max_steps=100000, system_factory=_default_system, tstops=None, on_stop=None):
+        self.param_matrix = np.asarray(param_matrix, dtype=float)
+        self.rtol, self.atol = rtol, atol
+        self.max_step = max_step
+        self.max_steps = max_steps
+        self.system_factory = system_factory
+        self.on_stop = on_stop
+        self._all_tstops = None if tstops is None else np.asarray(tstops, dtype=float)
+        self.nfev = 0
+        self.njev = 0
+        # Step size every member would take next, not shortened to t_bound or a stop.
+        self.h_unbounded = None
+        self.restart(y0, t0, t_bound, first_step=first_step)
+
+    def restart(self, y0, t0, t_bound, param_matrix=None, first_step=None):
+        """
+        Starts a new integration of the members from `y0` over [t0, t_bound], e.g. the next
+        piece of a long run whose inputs change between pieces. Every member begins with the
+        step size it would have taken next in the previous integration (or `first_step`; a
+        fresh estimate for members that failed). Per-member counters start again from zero,
+        `nfev` and `njev` keep counting.
+
+        Args:
+            y0 (array_like): Initial state, (n,) shared by all members or (n, M).
+            t0, t_bound (float): Integration interval.
+            param_matrix (np.ndarray, optional): New (P, M) parameters; None keeps the current ones.
+            first_step (float or np.ndarray, optional): Initial step, one value or one per member.
+        """
+        if param_matrix is not None:
+            self.param_matrix = np.asarray(param_matrix, dtype=float)
+        n_members = self.param_matrix.shape[1]
+
+        y0 = np.asarray(y0, dtype=float)
+        if y0.ndim == 1:
+            y0 = np.repeat(y0[:, None], n_members, axis=1)
+        self.y = y0.copy()
+        self.n = self.y.shape[0]
+
+        self.t = np.full(n_members, float(t0))
+        self.t_bound = float(t_bound)
+
+        # Stops at or beyond t_bound are never reached; an inf column ends every member's list.
+        tstops = np.empty((n_members, 0)) if self._all_tstops is None else self._all_tstops
+        tstops = np.where((tstops > t0) & (tstops < t_bound), tstops, np.inf)
+        self.tstops = np.column_stack([np.sort(tstops, axis=1), np.full(n_members, np.inf)])
+        self.stop_index = np.zeros(n_members, dtype=int)   # stops passed by every member
+
+        failed = None if self.h_unbounded is None else self.status == -1
+        self.status = np.zeros(n_members, dtype=int)   # 0 running, 1 finished, -1 failed
+        self.nsteps = np.zeros(n_members, dtype=int)
+        self.nrejected = np.zeros(n_members, dtype=int)
+
+        self._set_active(np.arange(n_members))
+        self.f = np.empty_like(self.y)
+        self.f[:] = self._rhs(self.t, self.y)
+
+        if first_step is not None:
+            h = np.array(np.broadcast_to(np.asarray(first_step, dtype=float), (n_members,)))
+        elif failed is None:
+            h = self._initial_step()
+        else:
+            h = np.where(failed, self._initial_step(), self.h_unbounded)
+        self.h_unbounded = np.minimum(h, self.max_step)
+        self.h = np.minimum(self.h_unbounded, self.t_bound - self.t)
+
+    @property
+    def active(self):
+        """Indices of members that are still being integrated."""
+        return self._active
+
+    def _set_active(self, idx):
+        self._active = idx
+        self._system = self.system_factory(self.param_matrix[:, idx])
+
+    def _rhs(self, t, y):
+        self.nfev += 1
+        return np.asarray(self._system.rhs(t, y))
+
+    def _jac(self, t, y):
+        self.njev += 1
+        return np.moveaxis(self._system.jac(t, y), -1, 0)
+
+    def _pass_stops(self, members):
+        """Members that just landed on a stop: update their parameters and derivative."""
+        self.stop_index[members] += 1
+        if self.on_stop is None:
+            return
+        self.on_stop(self, members)
+        self._system = self.system_factory(self.param_matrix[:, self._active])
+        self.nfev += 1
+        self.f[:, members] = self.system_factory(self.param_matrix[:, members]).rhs(self.t[members],
+                                                                                   self.y[:, members])
+
+    def _initial_step(self):
+        scale = self.atol + self.rtol * np.abs(self.y)
+        d0 = np.sqrt(np.mean((self.y / scale) ** 2, axis=0))
+        d1 = np.sqrt(np.mean((self.f / scale) ** 2, axis=0))
+        h = np.where((d0 < 1e-5) | (d1 < 1e-5), 1e-6, 0.01 * d0 / np.maximum(d1, 1e-300))
+        return np.minimum(h, 0.01 * (self.t_bound - self.t) + 1e-12)
+
+    def step(self):
+        """
+        Attempts one step for every active member.
+
+        Returns:
+            tuple: (members, t_old, t_new, y_old, y_new, f_old, f_new) for the members whose
+                   step was accepted. States and derivatives have shape (n, m).
+        """
+        idx = self._active
+        t, y, f, h_proposed = self.t[idx], self.y[:, idx], self.f[:, idx], self.h[idx]
+        stop = self.tstops[idx, self.stop_index[idx]]
+        clipped = t + h_proposed >= stop
+        h = np.where(clipped, stop - t, h_proposed)
+
+        W = np.eye(self.n) - (h * _D)[:, None, None] * self._jac(t, y)
+        W_inv = np.linalg.inv(W)
+
+        def solve(v):
+            return np.einsum("mij,jm->im", W_inv, v)
+
+        # Non-autonomous systems (time-dependent inputs) provide df/dt, which the Rosenbrock
+        # stages need to keep their order; autonomous ones omit it.
+        dfdt = getattr(self._system, "dfdt", None)
+        hdT = 0.0 if dfdt is None else (h * _D) * dfdt(t, y)
+        k1 = solve(f + hdT)
+        f1 = self._rhs(t + 0.5 * h, y + 0.5 * h * k1)
+        k2 = solve(f1 - k1) + k1
+        y_new = y + h * k2
+        f_new = self._rhs(t + h, y_new)
+        k3 = solve(f_new - _E32 * (k2 - f1) - 2.0 * (k1 - f) + hdT)
+
+        scale = self.atol + self.rtol * np.maximum(np.abs(y), np.abs(y_new))
+        err = (h / 6.0) * (k1 - 2.0 * k2 + k3) / scale
+        with np.errstate(invalid="ignore", over="ignore"):
+            err_norm = np.sqrt(np.mean(err ** 2, axis=0))
+        finite = np.isfinite(err_norm) & np.all(np.isfinite(y_new), axis=0)
+        accepted = finite & (err_norm <= 1.0)
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            factor = 0.9 * err_norm ** (-1.0 / 3.0)
+        factor = np.where(finite, np.clip(np.nan_to_num(factor, nan=0.2, posinf=5.0), 0.2, 5.0), 0.2)
+        factor = np.where(accepted, factor, np.minimum(factor, 1.0))
+
+        t_new = np.where(clipped, stop, t + h)
+        acc = idx[accepted]
+        result = (acc, t[accepted], t_new[accepted], y[:, accepted], y_new[:, accepted],
+                  f[:, accepted], f_new[:, accepted])
+
+        self.nrejected[idx[~accepted]] += 1
+        self.nsteps[acc] += 1
+        self.t[acc] = t_new[accepted]
+        self.y[:, acc] = y_new[:, accepted]
+        self.f[:, acc] = f_new[:, accepted]
+
+        hit = accepted & clipped
+        if np.any(hit):
+            self._pass_stops(idx[hit])
+        remaining = self.t_bound - self.t[idx]
+        # A step shortened to hit a stop says little about the step size after it.
+        self.h_unbounded[idx] = np.minimum(np.where(hit, h_proposed, h * factor), self.max_step)
+        h_next = np.minimum(self.h_unbounded[idx], remaining)
+        self.h[idx] = h_next
+
+        done = remaining <= 1e-12 * max(1.0, abs(self.t_bound))
+        min_step = 10 * np.finfo(float).eps * np.maximum(np.abs(self.t[idx]), 1.0)
+        failed = ~done & ((h_next < min_step) | (self.nsteps[idx] >= self.max_steps))
+        self.status[idx[done]] = 1
+        self.status[idx[failed]] = -1
+
+        if np.any(done | failed):
+            self._set_active(idx[~(done | failed)])
+        return result
+
+
+class GridSampler:
+    """
+    Samples the steps of an `EnsembleSolver` on a fixed output grid: every output time crossed
+    by a step is filled from that step's Hermite interpolant.
+
+    Args:
+        t_eval (np.ndarray): Output times (T,).
+        y_start (np.ndarray): States (n, M) at `t_start`, e.g. `solver.y`.
+        t_start (float): Start of the integration interval.
+        out (array_like, optional): Preallocated (M, n, T) array; filled in place.
+    """
+
+    def __init__(self, t_eval, y_start, t_start, out=None):
+        self.t_eval = np.asarray(t_eval, dtype=float)
+        n, n_members = y_start.shape
+        self.out = np.empty((n_members, n, self.t_eval.size)) if out is None else out
+        self.out[...] = np.nan
+        self.next_idx = np.full(n_members, np.searchsorted(self.t_eval, t_start, side="right"))
+        self.out[:, :, self.t_eval == t_start] = y_start.T[:, :, None]
+
+    def record(self, members, t_old, t_new, y_old, y_new, f_old, f_new):
+        """Fills the output times crossed by one `EnsembleSolver.step`."""
+        if members.size == 0:
+            return
+        stop_idx = np.searchsorted(self.t_eval, t_new, side="right")
+        counts = stop_idx - self.next_idx[members]
+        total = counts.sum()
+        if total:
+            # One flat interpolation for every (member, output time) pair crossed by this step.
+            sel = np.repeat(np.arange(members.size), counts)
+            offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+            j = self.next_idx[members][sel] + offsets
+            values = hermite_interpolate(t_old[sel], t_new[sel], y_old[:, sel], y_new[:, sel],
+                                         f_old[:, sel], f_new[:, sel], self.t_eval[j])
+            self.out[members[sel], :, j] = values.T
+        self.next_idx[members] = stop_idx
+
+
+def integrate_ensemble(param_matrix, y0, t_span, t_eval=None, rtol=1e-3, atol=1e-6, out=None, **options):
+    """
+    Integrates a whole ensemble of parameter sets together.
+
+    Args:
+        param_matrix (np.ndarray): Parameters of shape (P, M), rows ordered by `PARAM_NAMES`
+                                   (build it with `stack_params`), or a batch
+                                   `CytoNucParamsExact` (e.g. from `CytoNucParamsExact.sweep`).
+        y0 (array_like): Initial state, either (7,) shared by all members or (7, M).
+        t_span (tuple): Integration interval (t0, tf).
+        t_eval (np.ndarray, optional): Output times. If None, only the final states are returned.
+        rtol, atol (float): Per-member tolerances, same meaning as in solve_ivp.
+        out (array_like, optional): Preallocated (M, 7, T) array for the trajectories, e.g. an
+                                    `np.memmap`; filled in place and returned as `y`.
+        **options: Passed on to `EnsembleSolver` (first_step, max_step, max_steps, system_factory,
+                   tstops, on_stop).
+
+    Returns:
+        OptimizeResult: Fields `t` (T,), `y` (M, 7, T) or None, `y_final` (M, 7), `success` (M,),
+                        `status` (M,), `nsteps`, `nrejected` (M,), `nfev`, `njev` (number of
+                        batched RHS/Jacobian evaluations) and `message`.
+    """
+    solver = EnsembleSolver(param_matrix, y0, t_span[0], t_span[1], rtol=rtol, atol=atol, **options)
+    n_members = solver.t.size
+    sampler = None if t_eval is None else GridSampler(t_eval, solver.y, t_span[0], out)
+
+    while solver.active.size:
+        step = solver.step()
+        if sampler is not None:
+            sampler.record(*step)
+
+    success = solver.status == 1
+    if np.all(success):
+        message = "All members reached the end of the integration interval."
+    else:
+        message = f"{np.count_nonzero(~success)} of {n_members} members failed."
+
+    t_out, y_out = (None, None) if sampler is None else (sampler.t_eval, sampler.out)
+    return OptimizeResult(t=t_out, y=y_out, y_final=solver.y.T.copy(), success=success,
+                          status=solver.status.copy(), nsteps=solver.nsteps.copy(),
+                          nrejected=solver.nrejected.copy(), nfev=solver.nfev, njev=solver.njev,
+                          message=message)
@@ -0,0 +1,327 @@
+import time
+from functools import partial
+
+import numpy as np
+from scipy.integrate import solve_ivp
+from scipy.optimize import OptimizeResult, least_squares
+from scipy.stats import qmc
+
+from CytoNuc_rovnice import MODEL, VARIABLES
+from CytoNuc_params import CytoNucParamsExact, PARAM_NAMES
+from CytoNuc_parallel import parallel_map, PointFailure
+
+# d(rhs)/d(parameters), shape (7, P), generated from the reaction scheme.
+_PJAC = MODEL.compile_param_jac()
+
+_N = len(VARIABLES)
+
+
+class Experiment:
+    """
+    One measured time course.
+
+    Args:
+        t (array_like): Measurement times (T,), increasing, at or after `t0`.
+        data (array_like): Measured values, (T,) for one observable or (T, K) for K.
+        observables (str, dict or sequence): What was measured: a species name ('Nn'), a
+            linear combination {species: weight} (e.g. {'Nn': 1, 'NIn': 1} for total nuclear
+            NF-κB), or a sequence of these, one per column of `data`.
+        IKK_stimulation (float, optional): IKK level of the experiment; None keeps the value of
+            the fitted parameter set.
+        sigma (float or array_like): Standard deviation of the measurements (broadcast to
+            `data`); the residuals are (model - data) / sigma. NaN data points are ignored.
+        y0 (array_like, optional): Initial state; defaults to all NF-κB free in the cytoplasm.
+        t0 (float): Start of the simulation (the stimulation).
+        name (str, optional): Label used in the reports.
+    """
+
+    def __init__(self, t, data, observables="Nn", IKK_stimulation=None, sigma=1.0, y0=None, t0=0.0, name=None):
+        self.t = np.asarray(t, dtype=float)
+        data = np.asarray(data, dtype=float)
+        self.data = data.reshape(self.t.size, -1)
+        single = isinstance(observables, (str, dict))
+        self.observables = [observables] if single else list(observables)
+        if len(self.observables) != self.data.shape[1]:
+            raise ValueError(f"{len(self.observables)} observables for {self.data.shape[1]} data columns.")
+        self.weights = np.array([_observable_row(obs) for obs in self.observables])
+        self.sigma = np.broadcast_to(np.asarray(sigma, dtype=float), self.data.shape)
+        self.mask = np.isfinite(self.data)
+        self.IKK_stimulation = IKK_stimulation
+        self.y0 = np.array([1.0, 0, 0, 0, 0, 0, 0]) if y0 is None else np.asarray(y0, dtype=float)
+        self.t0 = float(t0)
+        if self.t[0] < self.t0 or np.any(np.diff(self.t) <= 0):
+            raise ValueError("Measurement times must increase and start at or after t0.")
+        self.name = name or (f"IKK={IKK_stimulation:g}" if IKK_stimulation is not None else "experiment")
+
+    @property
+    def n_points(self):
+        return int(self.mask.sum())
+
+    def __repr__(self):
+        return f"Experiment({self.name}, {self.t.size} times, {len(self.observables)} observables)"
+
+
+def _observable_row(observable):
+    row = np.zeros(_N)
+    items = {observable: 1.0} if isinstance(observable, str) else observable
+    for name, weight in items.items():
+        if name not in VARIABLES:
+            raise ValueError(f"Unknown species '{name}'. Available: {list(VARIABLES)}")
+        row[VARIABLES.index(name)] = weight
+    return row
+
+
+def _directions(params, names):
+    """
+    (P, q) derivatives of the whole parameter vector with respect to the fitted parameters,
+    derived parameters included (fitting IKK moves d1 = 1.05 * IKK as well).
+    """
+    D = np.zeros((len(PARAM_NAMES), len(names)))
+    for k, name in enumerate(names):
+        value = params.get(name)
+        h = 1e-6 * max(abs(value), 1.0)
+        plus, minus = params.copy(), params.copy()
+        plus.set(name, value + h)
+        minus.set(name, value - h)
+        D[:, k] = (plus.values - minus.values) / (2 * h)
+    return D
+
+
+def simulate_sensitivities(params, names, t_eval, y0=None, t0=0.0, method="LSODA", rtol=1e-7, atol=1e-10):
+    """
+    Integrates the model together with its forward sensitivity equations
+
+        dS/dt = J(y) S + (∂f/∂p) D,    S(t0) = 0,
+
+    where S = ∂y/∂θ (7 x q) for the parameters θ = `names`, J the analytic Jacobian and ∂f/∂p
+    the generated parameter derivatives of the reaction scheme (`ModelSpec.param_jac_source`);
+    D maps θ to the full parameter vector, including derived parameters. The solver gets the
+    block-diagonal Jacobian diag(J, ..., J), which ignores only the weak coupling of S back
+    into the Jacobian and keeps the Newton iterations as cheap as q + 1 copies of the model.
+
+    Args:
+        params (CytoNucParamsExact): Parameter values.
+        names (sequence of str): Parameters θ to differentiate by.
+        t_eval (array_like): Output times.
+        y0 (array_like, optional): Initial state; defaults to all NF-κB free in the cytoplasm.
+        t0 (float): Start time.
+        method (str): Implicit solve_ivp method ('LSODA', 'BDF' or 'Radau').
+        rtol, atol (float): Tolerances, applied to the states and the sensitivities alike.
+
+    Returns:
+        OptimizeResult: `t` (T,), `y` (7, T), `S` (7, q, T), `success`, `message`, `nfev`, `njev`.
+    """
+    names = list(names)
+    q = len(names)
+    t_eval = np.asarray(t_eval, dtype=float)
+    y0 = np.array([1.0, 0, 0, 0, 0, 0, 0]) if y0 is None else np.asarray(y0, dtype=float)
+    system = MODEL.compile(params)
+    p = params.values.tolist()
+    D = _directions(params, names)
+    blocks = np.eye(q + 1)
+
+    def rhs(t, z):
+        y = z[:_N]
+        S = z[_N:].reshape(q, _N)
+        dS = S @ system.jac(t, y).T + (_PJAC(t, y.tolist(), p) @ D).T
+        return np.concatenate([system.rhs(t, y), dS.ravel()])
+
+    def jac(t, z):
+        return np.kron(blocks, system.jac(t, z[:_N]))
+
+    z0 = np.concatenate([y0, np.zeros(_N * q)])
+    t_span = (t0, max(t_eval[-1], t0))
+    sol = solve_ivp(rhs, t_span, z0, method=method, t_eval=t_eval, jac=jac, rtol=rtol, atol=atol)
+    T = sol.t.size
+    S = sol.y[_N:].reshape(q, _N, T).transpose(1, 0, 2) if T else np.zeros((_N, q, 0))
+    return OptimizeResult(t=sol.t, y=sol.y[:_N], S=S, success=sol.success and T == t_eval.size,
+                          message=sol.message, nfev=sol.nfev, njev=sol.njev)
+
+
+class _Problem:
+    """
+    Joint least-squares problem over all experiments, in (optionally log-transformed)
+    coordinates x of the fitted parameters. Residuals and their Jacobian come from one
+    sensitivity integration per experiment, cached for the last x (least_squares asks for
+    both at the same point).
+    """
+
+    def __init__(self, experiments, names, lower, upper, params, log, method, rtol, atol):
+        self.experiments = experiments
+        self.names = names
+        self.lower, self.upper = lower, upper
+        self.params = params
+        self.log = log
+        self.method, self.rtol, self.atol = method, rtol, atol
+        self.n_residuals = sum(e.n_points for e in experiments)
+        self.n_integrations = 0
+        self._x = None
+        self._cache = None
+
+    def to_x(self, theta):
+        return np.log(theta) if self.log else np.asarray(theta, dtype=float)
+
+    def to_theta(self, x):
+        return np.exp(x) if self.log else np.asarray(x, dtype=float)
+
+    def experiment_params(self, theta, experiment):
+        params = self.params.copy()
+        if experiment.IKK_stimulation is not None:
+            params.set("IKK", experiment.IKK_stimulation)
+        for name, value in zip(self.names, theta):
+            params.set(name, value)
+        return params
+
+    def _evaluate(self, x):
+        if self._x is not None and np.array_equal(x, self._x):
+            return self._cache
+        theta = self.to_theta(x)
+        residuals, jacobian = [], []
+        for experiment in self.experiments:
+            sol = simulate_sensitivities(self.experiment_params(theta, experiment), self.names, experiment.t,
+                                         experiment.y0, experiment.t0, self.method, self.rtol, self.atol)
+            self.n_integrations += 1
+            if not sol.success:
+                # A failed trial point: a huge cost makes the trust region reject the step.
+                residuals.append(np.full(experiment.n_points, 1e6))
+                jacobian.append(np.zeros((experiment.n_points, len(theta))))
+                continue
+            model = (experiment.weights @ sol.y).T                          # (T, K)
+            dmodel = np.einsum("kn,nqt->tkq", experiment.weights, sol.S)     # (T, K, q)
+            mask = experiment.mask
+            residuals.append(((model - experiment.data) / experiment.sigma)[mask])
+            jacobian.append((dmodel / experiment.sigma[..., None])[mask])
+        J = np.concatenate(jacobian)
+        if self.log:
+            J = J * theta
+        self._x, self._cache = np.array(x), (np.concatenate(residuals), J)
+        return self._cache
+
+    def residuals(self, x):
+        return self._evaluate(x)[0]
+
+    def jacobian(self, x):
+        return self._evaluate(x)[1]
+
+
+def _fit_start(theta0, problem, max_nfev, ftol, xtol):
+    """One bounded least-squares run (trust region reflective) from `theta0`."""
+    start = time.perf_counter()
+    problem.n_integrations = 0
+    res = least_squares(problem.residuals, problem.to_x(theta0), jac=problem.jacobian,
+                        bounds=(problem.to_x(problem.lower), problem.to_x(problem.upper)), method="trf",
+                        x_scale="jac", max_nfev=max_nfev, ftol=ftol, xtol=xtol)
+    return OptimizeResult(theta0=np.asarray(theta0), theta=problem.to_theta(res.x), cost=float(res.cost),
+                          success=bool(res.success), status=res.status, message=res.message, nfev=res.nfev,
+                          njev=res.njev, n_integrations=problem.n_integrations,
+                          wall_time=time.perf_counter() - start, x=res.x, fun=res.fun, jac=res.jac)
+
+
+def _starting_points(theta0, lower, upper, n_starts, log, seed):
+    """`theta0` followed by a Latin hypercube over the bounds (log-uniform when `log`)."""
+    starts = [np.clip(theta0, lower, upper)]
+    if n_starts > 1:
+        sample = qmc.LatinHypercube(d=len(theta0), seed=seed).random(n_starts - 1)
+        if log:
+            starts += list(np.exp(qmc.scale(sample, np.log(lower), np.log(upper))))
+        else:
+            starts += list(qmc.scale(sample, lower, upper))
+    return starts
+
+
+def fit_parameters(experiments, names, bounds=None, params=None, n_starts=8, n_workers=1, seed=None, log=True,
+                   max_nfev=100, ftol=1e-8, xtol=1e-8, method="LSODA", rtol=1e-7, atol=1e-10):
+    """
+    Fits parameters of `CytoNucParamsExact` to measured time courses of one or more experiments.
+
+    The weighted residuals of all experiments form one bounded nonlinear least-squares
+    problem, solved by scipy's trust region reflective method. Its Jacobian is exact: it comes
+    from the forward sensitivity equations integrated alongside the model
+    (`simulate_sensitivities`), one integration per experiment and iteration, instead of
+    len(names) + 1 finite-difference simulations. The fit is repeated from `n_starts`
+    starting points (the current values and a Latin hypercube over the bounds) in parallel
+    worker processes, and the best local optimum is returned.
+
+    Experiments with different `IKK_stimulation` share all fitted parameters, so one dataset
+    with several stimulation levels constrains the parameters jointly.
+
+    Args:
+        experiments (Experiment or list of Experiment): Data to fit.
+        names (sequence of str): Fitted parameters, e.g. ('t3', 'k1', 'a1').
+        bounds (dict, optional): {name: (lower, upper)}; the default is a factor of 10 around
+                                 the current value.
+        params (CytoNucParamsExact, optional): Values of all other parameters and the first
+                                               starting point.
+        n_starts (int): Number of starting points.
+        n_workers (int, optional): Number of processes; None uses all cores.
+        seed (int, optional): Seed of the Latin hypercube.
+        log (bool): Fit the logarithms of the parameters (they span orders of magnitude and
+                    must stay positive).
+        max_nfev (int): Maximal number of iterations (residual evaluations) per start.
+        ftol, xtol (float): Convergence tolerances of `least_squares`.
+        method, rtol, atol: Solver of the sensitivity integration.
+
+    Returns:
+        OptimizeResult: `x` {name: value} and `params` (the fitted `CytoNucParamsExact`) of the
+                        best start, `cost` (half the sum of squared weighted residuals),
+                        `std` {name: standard error} and `correlation` (q, q) from the
+                        Gauss-Newton covariance at the optimum, `residuals` {experiment name:
+                        weighted residuals}, `starts` (all runs sorted by cost, failed ones as
+                        `PointFailure`), `n_integrations` and `wall_time`.
+    """
+    start = time.perf_counter()
+    experiments = [experiments] if isinstance(experiments, Experiment) else list(experiments)
+    names = list(names)
+    params = CytoNucParamsExact() if params is None else params.copy()
+    for name in names:
+        if name not in PARAM_NAMES:
+            raise ValueError(f"Unknown parameter '{name}'. Available: {list(PARAM_NAMES)}")
+    if "IKK" in names and any(e.IKK_stimulation is not None for e in experiments):
+        raise ValueError("IKK cannot be fitted when the experiments fix their IKK_stimulation.")
+    theta0 = np.array([params.get(name) for name in names])
+    bounds = bounds or {}
+    lower = np.array([bounds.get(name, (value / 10, value * 10))[0] for name, value in zip(names, theta0)])
+    upper = np.array([bounds.get(name, (value / 10, value * 10))[1] for name, value in zip(names, theta0)])
+    if log and np.any(lower <= 0):
+        raise ValueError("Log-transformed fitting needs positive lower bounds.")
+
+    problem = _Problem(experiments, names, lower, upper, params, log, method, rtol, atol)
+    starts = _starting_points(theta0, lower, upper, n_starts, log, seed)
+    runs = parallel_map(partial(_fit_start, problem=problem, max_nfev=max_nfev, ftol=ftol, xtol=xtol), starts,
+                        n_workers=n_workers, desc="Multistart fit" if n_starts > 1 else None)
+    good = sorted((run for run in runs if not isinstance(run, PointFailure)), key=lambda run: run.cost)
+    failed = [run for run in runs if isinstance(run, PointFailure)]
+    if not good:
+        raise RuntimeError(f"All {len(runs)} starts failed, e.g.: {failed[0].message}")
+    best = good[0]
+
+    # Gauss-Newton covariance in the parameter units (the Jacobian is in x = log θ when `log`).
+    J = best.jac / best.theta if log else best.jac
+    covariance = np.linalg.pinv(J.T @ J)
+    std = np.sqrt(np.clip(np.diag(covariance), 0, None))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        correlation = covariance / np.outer(std, std)
+
+    fitted = params.copy()
+    for name, value in zip(names, best.theta):
+        fitted.set(name, value)
+    offsets = np.cumsum([0] + [e.n_points for e in experiments])
+    return OptimizeResult(x=dict(zip(names, best.theta)), params=fitted, cost=best.cost, success=best.success,
+                          message=best.message, std=dict(zip(names, std)), covariance=covariance,
+                          correlation=correlation,
+                          residuals={e.name: best.fun[a:b] for e, a, b in zip(experiments, offsets, offsets[1:])},
+                          starts=good + failed, names=names, n_residuals=problem.n_residuals,
+                          n_integrations=sum(run.n_integrations for run in good),
+                          wall_time=time.perf_counter() - start)
+
+
+def predict(params, experiment, t=None, rtol=1e-7, atol=1e-10):
+    """Model values of the experiment's observables at `t` (its measurement times by default), shape (T, K)."""
+    t = experiment.t if t is None else np.asarray(t, dtype=float)
+    if experiment.IKK_stimulation is not None:
+        params = params.copy()
+        params.set("IKK", experiment.IKK_stimulation)
+    system = MODEL.compile(params)
+    sol = solve_ivp(system.rhs, (experiment.t0, t[-1]), experiment.y0, method="LSODA", t_eval=t,
+                    jac=system.jac, rtol=rtol, atol=atol)
+    return (experiment.weights @ sol.y).T
@@ -0,0 +1,337 @@
+import os
+import sys
+from functools import partial
+
+import numpy as np
+import matplotlib.pyplot as plt
+from scipy.optimize import OptimizeResult
+from scipy.stats import qmc
+
+from CytoNuc_params import CytoNucParamsExact, PARAM_NAMES
+from CytoNuc_metrics import Peak, AUC, Final, evaluate_metrics_ensemble
+from CytoNuc_parallel import parallel_map, PointFailure
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "common"))
+from rendering import finish
+
+# Outputs of every model run, in the column order of `Y`.
+OUTPUTS = ("peak", "auc", "final")
+
+
+def _output_metrics():
+    return [Peak('Nn', name='peak'), AUC('Nn', name='auc'), Final('Nn', name='final')]
+
+
+class ParameterSpace:
+    """
+    Box of parameter values explored by the global analysis.
+
+    Args:
+        bounds (dict): {name: (low, high)} for every varied parameter of `CytoNucParamsExact`.
+        base (CytoNucParamsExact, optional): Values of the parameters that are not varied.
+        log_scale (iterable of str): Parameters sampled uniformly in log10 instead of linearly
+                                     (useful for rate constants spanning decades).
+
+    Parameters that are not varied keep their `base` value; derived ones follow their sources
+    (d1 = 1.05 * IKK) unless they are varied themselves.
+    """
+
+    def __init__(self, bounds, base=None, log_scale=()):
+        unknown = set(bounds) - set(PARAM_NAMES)
+        if unknown:
+            raise ValueError(f"Unknown parameters {sorted(unknown)}; available: {list(PARAM_NAMES)}")
+        # Storage order, so that a varied d1 is set after IKK and overrides the derived value.
+        self.names = tuple(name for name in PARAM_NAMES if name in bounds)
+        self.bounds = np.array([bounds[name] for name in self.names], dtype=float)
+        if np.any(self.bounds[:, 1] <= self.bounds[:, 0]):
+            raise ValueError("Every range must satisfy low < high")
+        self.log = np.array([name in log_scale for name in self.names])
+        if np.any(self.log & (self.bounds[:, 0] <= 0)):
+            raise ValueError("Log-scaled parameters need positive bounds")
+        self.base = CytoNucParamsExact() if base is None else base.copy()
+
+    def __len__(self):
+        return len(self.names)
+
+    def __repr__(self):
+        return f"ParameterSpace({', '.join(self.names)})"
+
+    def scale(self, unit):
+        """Maps points of the unit cube (n, D) to parameter values (n, D)."""
+        low, high = self.bounds.T
+        low = np.where(self.log, np.log10(np.where(self.log, low, 1.0)), low)
+        high = np.where(self.log, np.log10(np.where(self.log, high, 1.0)), high)
+        values = low + np.asarray(unit, dtype=float) * (high - low)
+        return np.where(self.log, 10.0 ** values, values)
+
+    def to_params(self, X):
+        """Batch `CytoNucParamsExact` for the parameter values X (n, D)."""
+        X = np.asarray(X, dtype=float)
+        params = CytoNucParamsExact.sweep(self.names[0], X[:, 0], self.base)
+        for j, name in enumerate(self.names[1:], start=1):
+            params.set(name, X[:, j])
+        return params
+
+
+def default_bounds(spread=0.5, base=None, exclude=("d1",)):
+    """
+    Ranges base * (1 - spread) .. base * (1 + spread) for every parameter except `exclude`
+    (by default the derived d1, which then follows IKK).
+    """
+    base = CytoNucParamsExact() if base is None else base
+    return {name: (value * (1 - spread), value * (1 + spread))
+            for name, value in base.as_dict().items() if name not in exclude}
+
+
+# --- Sampling ---------------------------------------------------------------------------------
+
+def sample(space, n, method="sobol", seed=None):
+    """
+    Space-filling sample of n parameter sets.
+
+    Args:
+        space (ParameterSpace): Parameter box.
+        n (int): Number of points (a power of two keeps the Sobol sequence balanced).
+        method (str): "sobol" (scrambled Sobol sequence), "lhs" (Latin hypercube) or "random".
+        seed (int, optional): Seed of the scrambling / random generator.
+
+    Returns:
+        np.ndarray: Parameter values (n, D), columns ordered as `space.names`.
+    """
+    d = len(space)
+    if method == "sobol":
+        unit = qmc.Sobol(d, scramble=True, seed=seed).random(n)
+    elif method == "lhs":
+        unit = qmc.LatinHypercube(d, seed=seed).random(n)
+    elif method == "random":
+        unit = np.random.default_rng(seed).random((n, d))
+    else:
+        raise ValueError(f"Unknown sampling method '{method}'")
+    return space.scale(unit)
+
+
+# --- Batched, parallel, checkpointed evaluation -----------------------------------------------
+
+def _evaluate_batch(X, space, t_span, rtol, atol):
+    """Runs one batch of parameter sets as a single ensemble; returns Y (n, len(OUTPUTS))."""
+    result = evaluate_metrics_ensemble(space.to_params(X), _output_metrics(), t_span, rtol=rtol, atol=atol)
+    return np.column_stack([result.metrics[name] for name in OUTPUTS])
+
+
+def _load_checkpoint(path, X, n_batches):
+    if path is None or not os.path.exists(path):
+        return np.full((X.shape[0], len(OUTPUTS)), np.nan), np.zeros(n_batches, dtype=bool)
+    with np.load(path) as data:
+        if data["X"].shape != X.shape or not np.array_equal(data["X"], X) or data["done"].size != n_batches:
+            raise ValueError(f"Checkpoint {path} belongs to a different sample or batch size")
+        return data["Y"].copy(), data["done"].copy()
+
+
+def _save_checkpoint(path, X, Y, done):
+    staging = path + ".tmp.npz"
+    np.savez(staging, X=X, Y=Y, done=done)
+    os.replace(staging, path)
+
+
+def evaluate_samples(space, X, t_span=(0, 1000), batch_size=1024, n_workers=1, checkpoint=None,
+                     rtol=1e-3, atol=1e-6, desc="Global sensitivity"):
+    """
+    Peak, AUC and final Nn for every row of X.
+
+    The rows are split into batches of `batch_size` members, each integrated as one ensemble
+    (`evaluate_metrics_ensemble`), and the batches are spread over `n_workers` processes. With
+    `checkpoint` (an .npz path) the finished batches are saved as they complete, and a later
+    call with the same X and batch size only runs the batches still missing, so an interrupted
+    analysis resumes where it stopped.
+
+    Returns:
+        OptimizeResult: `X` (n, D), `Y` (n, 3) with columns `OUTPUTS` (NaN where the
+                        integration failed), `success` (n,) and `message`.
+    """
+    X = np.asarray(X, dtype=float)
+    starts = list(range(0, X.shape[0], batch_size))
+    Y, done = _load_checkpoint(checkpoint, X, len(starts))
+    todo = [k for k in range(len(starts)) if not done[k]]
+    failures = []
+
+    def store(index, result):
+        k = todo[index]
+        rows = slice(starts[k], starts[k] + batch_size)
+        if isinstance(result, PointFailure):
+            failures.append(result.message)
+            return
+        Y[rows] = result
+        done[k] = True
+        if checkpoint is not None:
+            _save_checkpoint(checkpoint, X, Y, done)
+
+    batch = partial(_evaluate_batch, space=space, t_span=t_span, rtol=rtol, atol=atol)
+    parallel_map(batch, [X[starts[k]:starts[k] + batch_size] for k in todo], n_workers=n_workers,
+                 chunksize=1, desc=desc, callback=store)
+
+    success = np.all(np.isfinite(Y), axis=1)
+    message = f"{np.count_nonzero(success)} of {X.shape[0]} runs succeeded."
+    if failures:
+        message += f" {len(failures)} batches raised: {failures[0]}"
+    return OptimizeResult(X=X, Y=Y, success=success, message=message)
+
+
+# --- Morris elementary effects ----------------------------------------------------------------
+
+def morris_trajectories(d, r, levels=4, seed=None):
+    """
+    r one-at-a-time trajectories through a `levels`-level grid of the unit cube (d + 1 points
+    each, every factor moved once by delta = levels / (2 (levels - 1)) in random order and
+    direction).
+
+    Returns:
+        tuple: (unit points (r * (d + 1), d), signed steps (r, d) in trajectory order, order (r, d)).
+    """
+    rng = np.random.default_rng(seed)
+    delta = levels / (2.0 * (levels - 1))
+    grid = np.arange(levels) / (levels - 1)
+    points = np.empty((r, d + 1, d))
+    steps = np.empty((r, d))
+    orders = np.empty((r, d), dtype=int)
+    for k in range(r):
+        sign = rng.choice([-1.0, 1.0], d)
+        start = np.where(sign > 0, rng.choice(grid[grid <= 1 - delta + 1e-12], d),
+                         rng.choice(grid[grid >= delta - 1e-12], d))
+        order = rng.permutation(d)
+        points[k, 0] = start
+        for step, j in enumerate(order, start=1):
+            points[k, step] = points[k, step - 1]
+            points[k, step, j] += sign[j] * delta
+        steps[k] = sign[order] * delta
+        orders[k] = order
+    return points.reshape(-1, d), steps, orders
+
+
+def morris_screening(space, r=20, levels=4, seed=None, **options):
+    """
+    Morris screening: elementary effects of every varied parameter on peak/AUC/final Nn.
+
+    Costs r * (D + 1) model runs. `mu_star` (mean absolute effect) ranks the influence of a
+    parameter, `sigma` indicates non-linearity or interactions. Effects are per unit of the
+    normalized range, so they are comparable across parameters.
+
+    Args:
+        space (ParameterSpace): Parameter box.
+        r (int): Number of trajectories. Defaults to 20.
+        levels (int): Grid levels (even). Defaults to 4.
+        seed (int, optional): Seed of the trajectory generator.
+        **options: Passed on to `evaluate_samples` (batch_size, n_workers, checkpoint, ...).
+
+    Returns:
+        OptimizeResult: `names`, `mu`, `mu_star`, `sigma` (output name -> (D,)), `n_valid`
+                        (trajectories without failures), `X`, `Y` and `message`.
+    """
+    d = len(space)
+    unit, steps, orders = morris_trajectories(d, r, levels, seed)
+    runs = evaluate_samples(space, space.scale(unit), **options)
+    Y = runs.Y.reshape(r, d + 1, len(OUTPUTS))
+
+    effects = np.empty((r, d, len(OUTPUTS)))
+    rows = np.arange(r)[:, None]
+    effects[rows, orders] = np.diff(Y, axis=1) / steps[..., None]
+    valid = np.all(np.isfinite(effects), axis=(1, 2))
+    effects = effects[valid]
+
+    result = OptimizeResult(names=space.names, mu={}, mu_star={}, sigma={}, n_valid=int(valid.sum()),
+                            X=runs.X, Y=runs.Y, message=runs.message)
+    for k, name in enumerate(OUTPUTS):
+        result.mu[name] = effects[..., k].mean(axis=0)
+        result.mu_star[name] = np.abs(effects[..., k]).mean(axis=0)
+        result.sigma[name] = effects[..., k].std(axis=0, ddof=1) if len(effects) > 1 else np.full(d, np.nan)
+    return result
+
+
+# --- Sobol indices (Saltelli sampling) ----------------------------------------------------------
+
+def saltelli_sample(space, n, seed=None):
+    """
+    Matrices A, B (n, D) from one scrambled Sobol sequence of dimension 2D and the D matrices
+    AB_i (A with column i taken from B), stacked as [A; B; AB_1; ...; AB_D].
+
+    Returns:
+        np.ndarray: Parameter values (n * (D + 2), D).
+    """
+    d = len(space)
+    unit = qmc.Sobol(2 * d, scramble=True, seed=seed).random(n)
+    A, B = unit[:, :d], unit[:, d:]
+    AB = np.repeat(A[None], d, axis=0)
+    AB[np.arange(d), :, np.arange(d)] = B.T
+    return space.scale(np.concatenate([A, B, AB.reshape(-1, d)]))
+
+
+def _sobol_estimates(fA, fB, fAB):
+    """
+    First-order (Saltelli 2010) and total (Jansen) indices. fA, fB have shape (..., n) and
+    fAB shape (..., D, n); leading dimensions (bootstrap resamples) are kept.
+    """
+    var = np.var(np.concatenate([fA, fB], axis=-1), axis=-1, ddof=1)[..., None]
+    fA, fB = fA[..., None, :], fB[..., None, :]
+    first = np.mean(fB * (fAB - fA), axis=-1) / var
+    total = 0.5 * np.mean((fA - fAB) ** 2, axis=-1) / var
+    return first, total
+
+
+def sobol_indices(space, n=1024, seed=None, n_bootstrap=200, **options):
+    """
+    First-order and total Sobol indices of every varied parameter on peak/AUC/final Nn.
+
+    Uses Saltelli's sampling scheme, n * (D + 2) model runs (n = 1024 and all 12 independent
+    parameters: 14336 runs). Base samples with a failed run in any of their matrices are left
+    out. Confidence half-widths (95 %) come from bootstrapping the base samples.
+
+    Args:
+        space (ParameterSpace): Parameter box.
+        n (int): Base sample size, a power of two. Defaults to 1024.
+        seed (int, optional): Seed of the Sobol scrambling and of the bootstrap.
+        n_bootstrap (int): Bootstrap resamples for the confidence intervals; 0 skips them.
+        **options: Passed on to `evaluate_samples` (batch_size, n_workers, checkpoint, ...).
+
+    Returns:
+        OptimizeResult: `names`, `S1`, `ST`, `S1_conf`, `ST_conf` (output name -> (D,)),
+                        `n_valid` (output name -> used base samples), `X`, `Y` and `message`.
+    """
+    d = len(space)
+    runs = evaluate_samples(space, saltelli_sample(space, n, seed), **options)
+    blocks = runs.Y.reshape(d + 2, n, len(OUTPUTS))
+    rng = np.random.default_rng(seed)
+
+    result = OptimizeResult(names=space.names, S1={}, ST={}, S1_conf={}, ST_conf={}, n_valid={},
+                            X=runs.X, Y=runs.Y, message=runs.message)
+    for k, name in enumerate(OUTPUTS):
+        fA, fB, fAB = blocks[0, :, k], blocks[1, :, k], blocks[2:, :, k]
+        valid = np.isfinite(fA) & np.isfinite(fB) & np.all(np.isfinite(fAB), axis=0)
+        fA, fB, fAB = fA[valid], fB[valid], fAB[:, valid]
+        result.n_valid[name] = int(valid.sum())
+        result.S1[name], result.ST[name] = _sobol_estimates(fA, fB, fAB)
+
+        if n_bootstrap:
+            idx = rng.integers(0, fA.size, (n_bootstrap, fA.size))
+            first, total = _sobol_estimates(fA[idx], fB[idx], np.moveaxis(fAB[:, idx], 0, 1))
+            result.S1_conf[name] = 1.96 * first.std(axis=0, ddof=1)
+            result.ST_conf[name] = 1.96 * total.std(axis=0, ddof=1)
+        else:
+            result.S1_conf[name] = result.ST_conf[name] = np.full(d, np.nan)
+    return result
+
+
+def plot_sobol_indices(result, output="auc", path=None):
+    """
+    Bar chart of first-order and total indices for one output ('peak', 'auc' or 'final'),
+    shown or written to `path`.
+    """
+    x = np.arange(len(result.names))
+    width = 0.4
+    fig = plt.figure(figsize=(12, 5))
+    plt.bar(x - width / 2, result.S1[output], width, yerr=result.S1_conf[output], label="first order $S_i$")
+    plt.bar(x + width / 2, result.ST[output], width, yerr=result.ST_conf[output], label="total $S_{Ti}$")
+    plt.xticks(x, result.names)
+    plt.ylabel("Sobol index")
+    plt.title(f"Global sensitivity of {output} Nn")
+    plt.legend()
+    plt.grid(True, axis="y")
+    return finish(fig, path)
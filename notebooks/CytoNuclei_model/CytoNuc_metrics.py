@@ -0,0 +1,359 @@
+import os
+import sys
+from abc import ABC, abstractmethod
+
+import numpy as np
+import scipy.integrate
+from numpy.polynomial import legendre
+from scipy.optimize import OptimizeResult
+
+from CytoNuc_rovnice import VARIABLES
+from CytoNuc_ensemble import EnsembleSolver, GridSampler, hermite_interpolate
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "common"))
+from solver_stats import RunStats, ensemble_stats
+
+
+def _lobatto(n):
+    """Gauss-Lobatto nodes and weights on [0, 1] (endpoints included, exact to degree 2n - 3)."""
+    interior = legendre.legroots(legendre.legder([0] * (n - 1) + [1]))
+    x = np.concatenate([[-1.0], np.sort(interior), [1.0]])
+    w = 2.0 / (n * (n - 1) * legendre.legval(x, [0] * (n - 1) + [1]) ** 2)
+    return 0.5 * (x + 1.0), 0.5 * w
+
+
+# Sample points inside every accepted step. They include both step ends, and the weights
+# integrate the step's interpolant (a cubic for the ensemble solver) exactly.
+NODES, WEIGHTS = _lobatto(7)
+
+
+class Quantity:
+    """
+    Observed quantity: a species name ('Nn'), an expression over species ('N + NI',
+    'Nn / (N + Nn)', NumPy available as `np`), a callable taking the state block, or a list of
+    these. A list is evaluated as one stacked quantity, so a single reducer can follow several
+    species at the cost of one update per step.
+    """
+
+    def __init__(self, spec):
+        self.spec = spec
+        self.scalar = not isinstance(spec, (list, tuple))
+        specs = [spec] if self.scalar else list(spec)
+        if all(isinstance(item, str) and item in VARIABLES for item in specs):
+            idx = [VARIABLES.index(item) for item in specs]
+            self._evaluate = lambda y: y[idx]
+        else:
+            functions = [self._compile(item) for item in specs]
+            self._evaluate = lambda y: np.stack([np.broadcast_to(f(y), np.shape(y[0])) for f in functions])
+
+    @staticmethod
+    def _compile(spec):
+        if callable(spec):
+            return spec
+        if spec in VARIABLES:
+            idx = VARIABLES.index(spec)
+            return lambda y: y[idx]
+        code = compile(spec, f"<quantity {spec!r}>", "eval")
+        return lambda y: eval(code, {"__builtins__": {}, "np": np}, dict(zip(VARIABLES, y)))
+
+    @property
+    def key(self):
+        """Quantities with equal keys are evaluated only once per step."""
+        specs = (self.spec,) if self.scalar else tuple(self.spec)
+        return specs if all(isinstance(item, str) for item in specs) else id(self)
+
+    def __len__(self):
+        return 1 if self.scalar else len(self.spec)
+
+    def __call__(self, y):
+        """Values of shape (C, ...) for a state block (7, ...); C = 1 for a single quantity."""
+        return np.asarray(self._evaluate(y), dtype=float)
+
+    def __str__(self):
+        specs = [self.spec] if self.scalar else self.spec
+        return ",".join(getattr(item, "__name__", str(item)) for item in specs)
+
+
+class Reducer(ABC):
+    """
+    Metric of one (possibly stacked) quantity, updated incrementally from the samples of
+    every accepted step.
+
+    The state has shape (C, M): one value per channel of the quantity and ensemble member.
+    Subclasses implement `update`, which receives the member indices (m,), the sample times
+    and quadrature weights (m, k) and the quantity values (C, m, k).
+    """
+
+    def __init__(self, quantity, name=None):
+        self.quantity = quantity if isinstance(quantity, Quantity) else Quantity(quantity)
+        self.name = name or f"{type(self).__name__.lower()}_{self.quantity}"
+
+    def start(self, n_members, t_span):
+        self.t_span = t_span
+        self.value = np.full((len(self.quantity), n_members), np.nan)
+
+    @abstractmethod
+    def update(self, members, t, values, weights):
+        pass
+
+    def _state(self):
+        return self.value
+
+    def result(self):
+        """Array (M,) for a single quantity, (C, M) for a stacked one."""
+        state = self._state()
+        return state[0] if self.quantity.scalar else state
+
+
+class Peak(Reducer):
+    """Maximum of the quantity over the whole interval."""
+
+    def start(self, n_members, t_span):
+        super().start(n_members, t_span)
+        self.value[:] = -np.inf
+        self.time = np.full_like(self.value, np.nan)
+
+    def update(self, members, t, values, weights):
+        i = np.argmax(values, axis=2)[..., None]
+        peak = np.take_along_axis(values, i, axis=2)[..., 0]
+        better = peak > self.value[:, members]
+        self.value[:, members] = np.where(better, peak, self.value[:, members])
+        self.time[:, members] = np.where(better, np.take_along_axis(np.broadcast_to(t, values.shape), i,
+                                                                    axis=2)[..., 0], self.time[:, members])
+
+
+class TimeToPeak(Peak):
+    """Time at which `Peak` is reached."""
+
+    def _state(self):
+        return self.time
+
+
+class AUC(Reducer):
+    """Integral of the quantity over the interval, by Gauss-Lobatto quadrature of each step."""
+
+    def start(self, n_members, t_span):
+        super().start(n_members, t_span)
+        self.value[:] = 0.0
+
+    def update(self, members, t, values, weights):
+        self.value[:, members] += np.sum(weights * values, axis=2)
+
+
+class Mean(AUC):
+    """Time average of the quantity over the interval."""
+
+    def _state(self):
+        return self.value / (self.t_span[1] - self.t_span[0])
+
+
+class Final(Reducer):
+    """Value at the end of the interval."""
+
+    def update(self, members, t, values, weights):
+        self.value[:, members] = values[..., -1]
+
+
+class TailMin(Reducer):
+    """Minimum over the last `tail_fraction` of the interval."""
+
+    _empty = np.inf
+    _combine = staticmethod(np.minimum)
+
+    def __init__(self, quantity, tail_fraction=0.5, name=None):
+        super().__init__(quantity, name)
+        self.tail_fraction = tail_fraction
+
+    def start(self, n_members, t_span):
+        super().start(n_members, t_span)
+        self.t_start = t_span[1] - self.tail_fraction * (t_span[1] - t_span[0])
+        self.value[:] = self._empty
+
+    def update(self, members, t, values, weights):
+        if np.max(t[:, -1]) < self.t_start:
+            return
+        if np.min(t[:, 0]) < self.t_start:
+            values = np.where(t >= self.t_start, values, self._empty)
+        reduced = self._combine.reduce(values, axis=2)
+        self.value[:, members] = self._combine(self.value[:, members], reduced)
+
+
+class TailMax(TailMin):
+    """Maximum over the last `tail_fraction` of the interval."""
+
+    _empty = -np.inf
+    _combine = staticmethod(np.maximum)
+
+
+def _update_all(metrics, members, t, y, weights, block):
+    """Updates every metric; each distinct quantity is evaluated once for all reducers using it."""
+    values = {}
+    for metric in metrics:
+        key = metric.quantity.key
+        if key not in values:
+            values[key] = block(metric.quantity(y))
+        metric.update(members, t, values[key], weights)
+
+
+def _finish(metrics, success):
+    values = {}
+    for metric in metrics:
+        result = np.array(metric.result(), dtype=float)
+        result[..., ~success] = np.nan
+        result[~np.isfinite(result)] = np.nan
+        values[metric.name] = result
+    return values
+
+
+def evaluate_metrics(system, metrics, t_span=(0, 1000), y0=None, method="LSODA", use_jac=True,
+                     rtol=1e-3, atol=1e-6, buffer_steps=64):
+    """
+    Integrates one system and evaluates `metrics` on the fly, without storing the trajectory.
+
+    Every accepted step's dense output is sampled at `NODES`; the reducers see these samples
+    only, so memory does not grow with the length of the run and AUC/mean follow the
+    continuous solution instead of a fixed output grid.
+
+    Args:
+        system (NFkBSystemExact): Model to integrate.
+        metrics (list of Reducer): E.g. `[Peak('Nn'), AUC('Nn'), Final('Nn')]`.
+        t_span (tuple): Integration interval. Defaults to (0, 1000).
+        y0 (array_like, optional): Initial state; defaults to the same state as `simulate`.
+        method (str): Name of a `scipy.integrate` solver class. Defaults to "LSODA".
+        use_jac (bool): Pass the analytic Jacobian to implicit solvers. Defaults to True.
+        rtol, atol (float): Solver tolerances.
+        buffer_steps (int): Number of steps whose samples are reduced together. Defaults to 64.
+
+    Returns:
+        OptimizeResult: `metrics` (metric name -> float, or (C,) array for a stacked quantity;
+                        NaN on failure), `y_final`, `success`,
+                        `message`, `nsteps` and `stats` (`solver_stats.RunStats`).
+    """
+    if y0 is None:
+        y0 = [1.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0]
+    stats = RunStats("evaluate_metrics", method).start()
+    system = system.compiled()
+    options = {"jac": system.jac} if use_jac and method in ("LSODA", "BDF", "Radau") else {}
+    solver = getattr(scipy.integrate, method)(system.rhs, t_span[0], np.asarray(y0, dtype=float), t_span[1],
+                                              rtol=rtol, atol=atol, **options)
+    for metric in metrics:
+        metric.start(1, t_span)
+
+    members = np.zeros(1, dtype=int)
+    nsteps = 0
+    message = "The solver successfully reached the end of the integration interval."
+    # Samples of several steps are reduced together, which keeps the per-step Python overhead low.
+    t_buffer, y_buffer, w_buffer = [], [], []
+
+    def flush():
+        if t_buffer:
+            _update_all(metrics, members, np.concatenate(t_buffer)[None, :], np.concatenate(y_buffer, axis=1),
+                        np.concatenate(w_buffer)[None, :], lambda v: v[:, None, :])
+            t_buffer.clear()
+            y_buffer.clear()
+            w_buffer.clear()
+
+    while solver.status == "running":
+        t_old = solver.t
+        step_message = solver.step()
+        if solver.status == "failed":
+            message = step_message
+            break
+        nsteps += 1
+        stats.observe(solver)
+        h = solver.t - t_old
+        t = t_old + NODES * h
+        t_buffer.append(t)
+        y_buffer.append(solver.dense_output()(t))
+        w_buffer.append(WEIGHTS * h)
+        if len(t_buffer) == buffer_steps:
+            flush()
+    flush()
+
+    success = np.array([solver.status == "finished"])
+    values = {name: value[..., 0] if value.ndim > 1 else float(value[0])
+              for name, value in _finish(metrics, success).items()}
+    stats.finish(success[0], message, solver.nfev, solver.njev, solver.nlu)
+    return OptimizeResult(metrics=values, y_final=solver.y.copy(), success=bool(success[0]),
+                          message=message, nsteps=nsteps, stats=stats)
+
+
+def evaluate_metrics_ensemble(param_matrix, metrics, t_span=(0, 1000), y0=None, rtol=1e-3, atol=1e-6,
+                              t_eval=None, **options):
+    """
+    Ensemble counterpart of `evaluate_metrics`: all members are integrated together by
+    `EnsembleSolver` and every metric is updated from the Hermite interpolant of each step.
+    With `t_eval` the same steps are also sampled on that grid, so runs that keep trajectories
+    get exactly the metrics of runs that do not.
+
+    Args:
+        param_matrix (np.ndarray): Parameters (P, M), see `integrate_ensemble`.
+        metrics (list of Reducer): Metrics to evaluate.
+        t_span (tuple): Integration interval. Defaults to (0, 1000).
+        y0 (array_like, optional): Initial state (7,) or (7, M).
+        rtol, atol (float): Per-member tolerances.
+        t_eval (np.ndarray, optional): Output times of the trajectories; None keeps none.
+        **options: Passed on to `EnsembleSolver`.
+
+    Returns:
+        OptimizeResult: `metrics` (metric name -> (M,) array, or (C, M) for a stacked quantity;
+                        NaN for failed members), `t` (T,) and `y` (M, 7, T) or None,
+                        `y_final` (M, 7), `success` (M,), `message` and `stats` (per-member
+                        `solver_stats.RunStats`).
+    """
+    if y0 is None:
+        y0 = [1.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0]
+    solver = EnsembleSolver(param_matrix, y0, t_span[0], t_span[1], rtol=rtol, atol=atol, **options)
+    n_members = solver.t.size
+    for metric in metrics:
+        metric.start(n_members, t_span)
+    sampler = None if t_eval is None else GridSampler(t_eval, solver.y, t_span[0])
+
+    while solver.active.size:
+        members, t_old, t_new, y_old, y_new, f_old, f_new = step = solver.step()
+        if sampler is not None:
+            sampler.record(*step)
+        if members.size == 0:
+            continue
+        h = (t_new - t_old)[:, None]
+        t = t_old[:, None] + NODES * h
+        y = hermite_interpolate(t_old[:, None], t_new[:, None], y_old[..., None], y_new[..., None],
+                                f_old[..., None], f_new[..., None], t)
+        _update_all(metrics, members, t, y, WEIGHTS * h, lambda v: v)
+
+    success = solver.status == 1
+    if np.all(success):
+        message = "All members reached the end of the integration interval."
+    else:
+        message = f"{np.count_nonzero(~success)} of {n_members} members failed."
+    t_out, y_out = (None, None) if sampler is None else (sampler.t_eval, sampler.out)
+    return OptimizeResult(metrics=_finish(metrics, success), t=t_out, y=y_out, y_final=solver.y.T.copy(), success=success,
+                          message=message, stats=ensemble_stats(solver, "evaluate_metrics_ensemble"))
+
+
+def evaluate_metrics_on_grid(t, y, metrics, success=None):
+    """
+    `metrics` of trajectories already sampled on an output grid (e.g. by `integrate_ensemble`),
+    for runs that keep the trajectories anyway. Integrals use the trapezoidal rule of the grid
+    and extrema are taken over the grid points, so they are only as accurate as the grid.
+
+    Args:
+        t (np.ndarray): Output times (T,).
+        y (np.ndarray): Trajectories (M, 7, T).
+        metrics (list of Reducer): Metrics to evaluate.
+        success (np.ndarray, optional): (M,) mask; failed members get NaN.
+
+    Returns:
+        dict: metric name -> (M,) array, or (C, M) for a stacked quantity.
+    """
+    t = np.asarray(t, dtype=float)
+    n_members = y.shape[0]
+    dt = np.diff(t)
+    weights = np.broadcast_to(np.concatenate([dt, [0.0]]) / 2 + np.concatenate([[0.0], dt]) / 2,
+                              (n_members, t.size))
+    for metric in metrics:
+        metric.start(n_members, (t[0], t[-1]))
+    _update_all(metrics, np.arange(n_members), np.broadcast_to(t, (n_members, t.size)),
+                np.moveaxis(y, 1, 0), weights, lambda v: v)
+    success = np.ones(n_members, dtype=bool) if success is None else np.asarray(success, dtype=bool)
+    return _finish(metrics, success)
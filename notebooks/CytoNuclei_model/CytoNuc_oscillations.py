@@ -0,0 +1,362 @@
+import numpy as np
+from scipy.optimize import OptimizeResult
+
+from CytoNuc_rovnice import VARIABLES
+from CytoNuc_params import CytoNucParamsExact
+from CytoNuc_ensemble import integrate_ensemble
+
+# Regimes in the order of the `regime` codes.
+CLASSES = ("steady", "damped", "sustained")
+
+_STEADY, _DAMPED, _SUSTAINED = range(len(CLASSES))
+
+
+def _as_batch(y):
+    """(M, S, T) view of the trajectories and whether a single (S, T) trajectory was given."""
+    y = np.asarray(y, dtype=float)
+    if y.ndim == 2:
+        return y[None], True
+    if y.ndim != 3:
+        raise ValueError(f"Expected trajectories of shape (S, T) or (M, S, T), got {y.shape}.")
+    return y, False
+
+
+def _extrema(y, rel_height, atol):
+    """
+    Prominent extrema of the rows of a (R, T) block, as a sparse list sorted by row and time.
+
+    A sample is a local maximum when the series rises into it and does not rise right after it
+    (plateaus count once), a local minimum likewise. The prominence of an extremum is
+    approximated by the smaller height difference to the neighbouring extrema of the opposite
+    kind (or to the ends of the series); extrema below `rel_height` of the row's range, or
+    below `atol`, are ripples and are dropped. Only the O(n) scan for the extrema touches
+    every sample; the rest works on the much shorter list.
+
+    Returns:
+        tuple: (rows, pos, values, is_peak), one entry per prominent extremum.
+    """
+    rise = np.diff(y, axis=1)
+    is_max = (rise[:, :-1] > 0) & (rise[:, 1:] <= 0)
+    is_min = (rise[:, :-1] < 0) & (rise[:, 1:] >= 0)
+    rows, pos = np.nonzero(is_max | is_min)
+    pos += 1
+    is_peak = is_max[rows, pos - 1]
+    values = y[rows, pos]
+
+    k = np.arange(rows.size)
+    prev = np.where(is_peak, _last_before(~is_peak, k), _last_before(is_peak, k))
+    following = np.where(is_peak, _first_after(~is_peak, k), _first_after(is_peak, k))
+    has_prev = (prev >= 0) & (rows[np.maximum(prev, 0)] == rows)
+    has_next = (following < rows.size) & (rows[np.minimum(following, rows.size - 1)] == rows)
+    before = np.where(has_prev, values[np.maximum(prev, 0)], y[rows, 0])
+    after = np.where(has_next, values[np.minimum(following, rows.size - 1)], y[rows, -1])
+    prominence = np.minimum(np.abs(values - before), np.abs(values - after))
+
+    span = np.nanmax(y, axis=1) - np.nanmin(y, axis=1)
+    keep = prominence > np.maximum(rel_height * span, atol)[rows]
+    return rows[keep], pos[keep], values[keep], is_peak[keep]
+
+
+def _last_before(mask, k):
+    """Largest index of a True entry of `mask` at or before every entry (-1 where there is none)."""
+    return np.maximum.accumulate(np.where(mask, k, -1)) if k.size else k
+
+
+def _first_after(mask, k):
+    """Smallest index of a True entry of `mask` at or after every entry (len(k) where there is none)."""
+    return np.minimum.accumulate(np.where(mask, k, k.size)[::-1])[::-1] if k.size else k
+
+
+def _row_bounds(rows, n_rows):
+    """First index and count of every row in a list sorted by row."""
+    first = np.searchsorted(rows, np.arange(n_rows), side="left")
+    return first, np.searchsorted(rows, np.arange(n_rows), side="right") - first
+
+
+def _scatter(shape, rows, pos):
+    mask = np.zeros(shape, dtype=bool)
+    mask[rows, pos] = True
+    return mask
+
+
+def find_extrema(y, rel_height=0.01, atol=1e-9):
+    """
+    Prominent local maxima and minima along the last axis.
+
+    Extrema whose approximate prominence (the smaller height difference to the neighbouring
+    extrema of the opposite kind) is below `rel_height` of the series' range, or below
+    `atol`, are ripples and are discarded.
+
+    Args:
+        y (np.ndarray): Series of shape (..., T).
+        rel_height (float): Minimal prominence relative to max(y) - min(y).
+        atol (float): Minimal absolute prominence.
+
+    Returns:
+        tuple: Boolean masks (peaks, troughs), both of the shape of `y`.
+    """
+    y = np.asarray(y, dtype=float)
+    flat = y.reshape(-1, y.shape[-1])
+    rows, pos, _, is_peak = _extrema(flat, rel_height, atol)
+    peaks = _scatter(flat.shape, rows[is_peak], pos[is_peak])
+    troughs = _scatter(flat.shape, rows[~is_peak], pos[~is_peak])
+    return peaks.reshape(y.shape), troughs.reshape(y.shape)
+
+
+def _peak_period(t, rows, pos, n_rows):
+    """Distance of the first and last peak over the number of cycles between them."""
+    first, count = _row_bounds(rows, n_rows)
+    if not rows.size:
+        return np.full(n_rows, np.nan)
+    last = np.clip(first + count - 1, 0, rows.size - 1)
+    first = np.minimum(first, rows.size - 1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        period = (t[pos[last]] - t[pos[first]]) / (count - 1)
+    return np.where(count >= 2, period, np.nan)
+
+
+def acf_period(t, y):
+    """
+    Period from the autocorrelation of the series, computed with the FFT (O(n log n)).
+
+    The period is the lag of the highest autocorrelation maximum after its first zero
+    crossing, refined by a parabola through the neighbouring lags. Needs a uniform time grid;
+    series that never decorrelate (no zero crossing within half the window) get NaN.
+
+    Args:
+        t (np.ndarray): Uniform time grid (T,).
+        y (np.ndarray): Series of shape (..., T).
+
+    Returns:
+        np.ndarray: Periods of shape y.shape[:-1].
+    """
+    dt = _uniform_step(t)
+    x = y - y.mean(axis=-1, keepdims=True)
+    n = x.shape[-1]
+    spectrum = np.fft.rfft(x, 2 * n, axis=-1)
+    acf = np.fft.irfft(spectrum.real ** 2 + spectrum.imag ** 2, 2 * n, axis=-1)[..., :n]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        acf = acf / acf[..., :1]
+
+    lag = np.arange(n)
+    half = n // 2
+    negative = (acf < 0) & (lag <= half)
+    crossing = np.where(negative.any(axis=-1), np.argmax(negative, axis=-1), n)
+    window = (lag >= crossing[..., None]) & (lag < half)
+    k = np.argmax(np.where(window, acf, -np.inf), axis=-1)
+    valid = window.any(axis=-1) & (k > 0)
+
+    k = np.clip(k, 1, n - 2)
+    a, b, c = (np.take_along_axis(acf, (k + shift)[..., None], axis=-1)[..., 0] for shift in (-1, 0, 1))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        shift = 0.5 * (a - c) / (a - 2 * b + c)
+    shift = np.where(np.isfinite(shift) & (np.abs(shift) <= 1), shift, 0.0)
+    return np.where(valid, (k + shift) * dt, np.nan)
+
+
+def _uniform_step(t):
+    dt = np.diff(t)
+    if dt.size == 0 or not np.allclose(dt, dt[0], rtol=1e-6, atol=0):
+        raise ValueError("The autocorrelation period needs a uniform time grid.")
+    return dt[0]
+
+
+def envelopes(y, peaks, troughs):
+    """
+    Upper and lower amplitude envelope: the value of the last peak / trough at or before every
+    time (NaN before the first one).
+    """
+    idx = np.arange(y.shape[-1])
+    upper = np.take_along_axis(y, np.maximum.accumulate(np.where(peaks, idx, 0), axis=-1), axis=-1)
+    lower = np.take_along_axis(y, np.maximum.accumulate(np.where(troughs, idx, 0), axis=-1), axis=-1)
+    upper[~np.maximum.accumulate(peaks, axis=-1)] = np.nan
+    lower[~np.maximum.accumulate(troughs, axis=-1)] = np.nan
+    return upper, lower
+
+
+def _decay(t, rows, pos, values, is_peak, n_rows):
+    """
+    Amplitude of the last cycle and the exponential decay rate of the amplitudes.
+
+    The amplitude of a cycle is half the drop from its peak to the preceding trough. The decay
+    rate is the least-squares slope of log(amplitude) against the peak time, with the sums
+    accumulated per row by `np.bincount`.
+    """
+    k = np.arange(rows.size)
+    trough = np.maximum(_last_before(~is_peak, k), 0)
+    amplitude = 0.5 * (values - values[trough])
+    valid = is_peak & (rows[trough] == rows) & ~is_peak[trough] & (amplitude > 0)
+    rows, tt, log_amp, amplitude = rows[valid], t[pos[valid]], np.log(amplitude[valid]), amplitude[valid]
+
+    def total(weights):
+        return np.bincount(rows, weights, minlength=n_rows)
+
+    n = total(None)
+    st, sl, stt, stl = total(tt), total(log_amp), total(tt * tt), total(tt * log_amp)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        slope = (n * stl - st * sl) / (n * stt - st * st)
+    slope = np.where(n >= 2, slope, np.nan)
+
+    first, count = _row_bounds(rows, n_rows)
+    last = np.clip(first + count - 1, 0, max(rows.size - 1, 0))
+    last_amp = amplitude[last] if rows.size else np.full(n_rows, np.nan)
+    return np.where(count >= 1, last_amp, np.nan), -slope, count
+
+
+def _peak_lag(t, rows, pos, is_peak, n_species, ia, ib, n_members):
+    """Mean delay from every peak of species a to the next peak of species b, per member."""
+    n = t.size
+    member, species = np.divmod(rows, n_species)
+    key = member * n + pos
+    a = is_peak & (species == ia)
+    b_key, b_pos = key[is_peak & (species == ib)], pos[is_peak & (species == ib)]
+    j = np.searchsorted(b_key, key[a], side="left")
+    jc = np.minimum(j, max(b_key.size - 1, 0))
+    valid = (j < b_key.size) & (b_key[jc] < (member[a] + 1) * n) if b_key.size else np.zeros(j.size, dtype=bool)
+    lag = t[b_pos[jc]] - t[pos[a]] if b_key.size else np.zeros(j.size)
+    count = np.bincount(member[a][valid], minlength=n_members)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.bincount(member[a][valid], lag[valid], minlength=n_members) / count
+    return np.where(count > 0, mean, np.nan)
+
+
+def analyze_oscillations(t, y, species=VARIABLES, tail_fraction=0.5, rel_height=0.01, atol=1e-6,
+                         damping_tol=0.02, period_method="peaks", lag_pair=("Nn", "Im"), batch_size=256,
+                         return_envelopes=False):
+    """
+    Oscillation characteristics of stacked trajectories, vectorized over members and species.
+
+    There is no loop over members: one O(n) scan of the whole block finds the extrema and the
+    period, amplitudes, decay fit and lag are computed from the (short) list of prominent
+    extrema; only the optional autocorrelation period costs O(n log n). Only the last
+    `tail_fraction` of the time window is analyzed, so the initial response to the stimulation
+    does not pass for an oscillation.
+
+    The amplitude decay rate λ (1/min) comes from a log-linear fit of the cycle amplitudes; the
+    damping ratio is ζ = λ / sqrt(λ² + ω²) with ω = 2π / period, and `cycle_ratio` = exp(-λ·period)
+    is the amplitude kept per cycle. A trajectory is
+      - 'steady'    if it has no prominent peak in the window,
+      - 'sustained' if at least two cycle amplitudes were fitted and each cycle keeps more than
+                    1 - `damping_tol` of the previous amplitude,
+      - 'damped'    otherwise (also when the window holds too few cycles for the fit, so the
+                    window should span a few periods).
+
+    Args:
+        t (np.ndarray): Time grid (T,).
+        y (np.ndarray): Trajectories (M, S, T) — e.g. `integrate_ensemble(...).y` or a memmap from
+                        `CytoNuc_streaming` — or a single trajectory (S, T).
+        species (sequence): Names of the S species, used for `lag_pair`.
+        tail_fraction (float): Analyzed fraction of the time window (1 = all of it).
+        rel_height (float): Minimal peak prominence relative to the trajectory's range in the window.
+        atol (float): Minimal absolute peak prominence; smaller ripples count as steady.
+        damping_tol (float): Relative amplitude loss per cycle still counted as sustained.
+        period_method (str): 'peaks' (mean peak distance) or 'acf' (autocorrelation via the FFT,
+                             needs a uniform grid).
+        lag_pair (tuple or None): Species (a, b) whose peak lag a -> b is reported.
+        batch_size (int): Members processed at once; bounds the temporary memory (a few arrays
+                          of the block size), keeps the blocks in cache and lets `y` be a large memmap.
+        return_envelopes (bool): Also return the upper/lower envelopes of the window.
+
+    Returns:
+        OptimizeResult: Arrays of shape (M, S) — or (S,) for a single trajectory —
+                        `n_peaks`, `period`, `amplitude` (half peak-to-trough of the last cycle),
+                        `mean`, `decay_rate`, `damping_ratio`, `cycle_ratio`, `regime` (codes into
+                        `CLASSES`) and `regime_name`; the lag `lag` (min) and phase `phase`
+                        (rad, lag relative to the period of a) of `lag_pair`, shape (M,) or scalar;
+                        `species`, `t` (the analyzed window) and optionally `upper` / `lower`.
+    """
+    t = np.asarray(t, dtype=float)
+    y, single = _as_batch(y)
+    n_members, n_species, _ = y.shape
+    if len(species) != n_species:
+        raise ValueError(f"Got {len(species)} species names for {n_species} species.")
+    if period_method not in ("peaks", "acf"):
+        raise ValueError(f"Unknown period method '{period_method}', use 'peaks' or 'acf'.")
+    start = np.searchsorted(t, t[0] + (1.0 - tail_fraction) * (t[-1] - t[0]))
+    tw = t[start:]
+    if tw.size < 3:
+        raise ValueError("The analyzed window has fewer than 3 time points.")
+    if lag_pair is not None:
+        ia, ib = (list(species).index(name) for name in lag_pair)
+
+    names = ("n_peaks", "period", "amplitude", "mean", "decay_rate", "damping_ratio", "cycle_ratio", "regime")
+    res = {name: np.empty((n_members, n_species), dtype=int if name in ("n_peaks", "regime") else float)
+           for name in names}
+    res["lag"] = np.full(n_members, np.nan)
+    if return_envelopes:
+        res["upper"] = np.empty((n_members, n_species, tw.size))
+        res["lower"] = np.empty((n_members, n_species, tw.size))
+
+    batch_size = max(int(batch_size), 1)
+    for lo in range(0, n_members, batch_size):
+        block = slice(lo, min(lo + batch_size, n_members))
+        yw = np.asarray(y[block, :, start:], dtype=float)
+        flat = yw.reshape(-1, tw.size)
+        n_rows = flat.shape[0]
+        rows, pos, values, is_peak = _extrema(flat, rel_height, atol)
+
+        if period_method == "acf":
+            period = acf_period(tw, flat)
+        else:
+            period = _peak_period(tw, rows[is_peak], pos[is_peak], n_rows)
+        amplitude, decay_rate, n_fitted = _decay(tw, rows, pos, values, is_peak, n_rows)
+        n_peaks = np.bincount(rows[is_peak], minlength=n_rows)
+        with np.errstate(invalid="ignore", over="ignore"):
+            omega = 2 * np.pi / period
+            damping_ratio = decay_rate / np.sqrt(decay_rate ** 2 + omega ** 2)
+            cycle_ratio = np.exp(-decay_rate * period)
+            sustained = (n_fitted >= 2) & (cycle_ratio > 1.0 - damping_tol)
+        regime = np.where(n_peaks == 0, _STEADY, np.where(sustained, _SUSTAINED, _DAMPED))
+
+        for name, value in (("n_peaks", n_peaks), ("period", period), ("amplitude", amplitude),
+                            ("mean", flat.mean(axis=1)), ("decay_rate", decay_rate),
+                            ("damping_ratio", damping_ratio), ("cycle_ratio", cycle_ratio), ("regime", regime)):
+            res[name][block] = value.reshape(-1, n_species)
+        if lag_pair is not None:
+            res["lag"][block] = _peak_lag(tw, rows, pos, is_peak, n_species, ia, ib, yw.shape[0])
+        if return_envelopes:
+            peaks = _scatter(flat.shape, rows[is_peak], pos[is_peak])
+            troughs = _scatter(flat.shape, rows[~is_peak], pos[~is_peak])
+            upper, lower = envelopes(flat, peaks, troughs)
+            res["upper"][block] = upper.reshape(yw.shape)
+            res["lower"][block] = lower.reshape(yw.shape)
+
+    if lag_pair is not None:
+        with np.errstate(invalid="ignore"):
+            res["phase"] = np.mod(2 * np.pi * res["lag"] / res["period"][:, ia], 2 * np.pi)
+    else:
+        res["phase"] = np.full(n_members, np.nan)
+    res["regime_name"] = np.asarray(CLASSES)[res["regime"]]
+    if single:
+        res = {name: value[0] for name, value in res.items()}
+    return OptimizeResult(species=tuple(species), t=tw, lag_pair=lag_pair, **res)
+
+
+def characterize_sweep(param_name, param_values, t_span=(0, 1000), n_points=5001, base=None, y0=None,
+                       rtol=1e-6, atol=1e-9, **options):
+    """
+    Integrates a one-parameter sweep as one ensemble and characterizes its oscillations.
+
+    Args:
+        param_name (str): Swept parameter, e.g. 'IKK'.
+        param_values (array_like): Its values (M,).
+        t_span (tuple): Simulation interval (t0, tf) in minutes.
+        n_points (int): Points of the uniform output grid.
+        base (CytoNucParamsExact, optional): Other parameters (defaults with IKK stimulation 0.5).
+        y0 (array_like, optional): Initial state (7,); defaults to all NF-κB free in the cytoplasm.
+        rtol, atol (float): Integration tolerances.
+        **options: Passed on to `analyze_oscillations`.
+
+    Returns:
+        OptimizeResult: The fields of `analyze_oscillations` (members in the order of
+                        `param_values`) plus `param_name`, `param_values`, `success` (M,) and `y`.
+    """
+    base = CytoNucParamsExact() if base is None else base
+    param_values = np.asarray(param_values, dtype=float)
+    y0 = np.array([1, 0, 0, 0, 0, 0, 0], dtype=float) if y0 is None else np.asarray(y0, dtype=float)
+    t_eval = np.linspace(t_span[0], t_span[1], n_points)
+    sol = integrate_ensemble(CytoNucParamsExact.sweep(param_name, param_values, base), y0, t_span, t_eval=t_eval,
+                             rtol=rtol, atol=atol)
+    res = analyze_oscillations(sol.t, sol.y, **options)
+    res.update(param_name=param_name, param_values=param_values, success=sol.success, y=sol.y)
+    return res
@@ -0,0 +1,90 @@
+import os
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from tqdm import tqdm
+
+
+class PointFailure:
+    """Placeholder result for a sweep point whose evaluation raised an exception."""
+
+    def __init__(self, item, message, details=""):
+        self.item = item
+        self.message = message
+        self.details = details
+
+    def __repr__(self):
+        return f"PointFailure({self.item!r}, {self.message!r})"
+
+
+def _run_chunk(func, chunk):
+    """Evaluates `func` on one chunk inside a worker; exceptions become per-item failures."""
+    results = []
+    for item in chunk:
+        try:
+            results.append(func(item))
+        except Exception as exc:
+            results.append(PointFailure(item, f"{type(exc).__name__}: {exc}", traceback.format_exc()))
+    return results
+
+
+def resolve_workers(n_workers):
+    """None or a value below 1 means 'all available cores'."""
+    if n_workers is None or n_workers < 1:
+        return os.cpu_count() or 1
+    return int(n_workers)
+
+
+def parallel_map(func, items, n_workers=1, chunksize=None, desc=None, callback=None):
+    """
+    Ordered map of `func` over `items` on a pool of worker processes.
+
+    Items are scheduled in chunks (so short evaluations do not drown in IPC overhead),
+    progress is reported per finished chunk with a single `tqdm` bar, and results are
+    returned in the order of `items` regardless of completion order. With `n_workers=1`
+    everything runs in the calling process.
+
+    `func` must be picklable, i.e. a module-level function or a `functools.partial` of one.
+    An exception raised for an item does not abort the map: its slot holds a `PointFailure`.
+
+    Args:
+        func (callable): Function of one argument.
+        items (iterable): Inputs.
+        n_workers (int, optional): Number of processes; None uses all cores. Defaults to 1.
+        chunksize (int, optional): Items per task. Defaults to about four chunks per worker.
+        desc (str, optional): Progress-bar label; None hides the bar.
+        callback (callable, optional): Called as `callback(index, result)` in the calling process
+                                       as soon as an item's result is available, e.g. to
+                                       checkpoint partial results.
+
+    Returns:
+        list: `func(item)` (or `PointFailure`) for every item, in input order.
+    """
+    items = list(items)
+    n_workers = min(resolve_workers(n_workers), max(len(items), 1))
+
+    if n_workers == 1:
+        results = []
+        for index, item in enumerate(tqdm(items, desc=desc, disable=desc is None)):
+            results.append(_run_chunk(func, [item])[0])
+            if callback is not None:
+                callback(index, results[-1])
+        return results
+
+    if chunksize is None:
+        chunksize = max(1, -(-len(items) // (4 * n_workers)))
+    chunks = [items[i:i + chunksize] for i in range(0, len(items), chunksize)]
+
+    chunk_results = [None] * len(chunks)
+    with ProcessPoolExecutor(max_workers=n_workers) as executor, \
+            tqdm(total=len(items), desc=desc, disable=desc is None) as bar:
+        futures = {executor.submit(_run_chunk, func, chunk): k for k, chunk in enumerate(chunks)}
+        for future in as_completed(futures):
+            k = futures[future]
+            chunk_results[k] = future.result()
+            bar.update(len(chunks[k]))
+            if callback is not None:
+                for offset, result in enumerate(chunk_results[k]):
+                    callback(k * chunksize + offset, result)
+
+    return [result for chunk in chunk_results for result in chunk]
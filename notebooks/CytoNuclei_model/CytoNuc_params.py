@@ -1,21 +1,78 @@
-class CytoNucParamsExact:
-    def __init__(self, IKK_stimulation=0.5):
+import os
+import sys
 
-        self.a1 = 30.0       
-        self.a2 = 0.03       
-        self.a3 = 30.0       
-        self.a4 = 0.03       
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "common"))
+from parameter_set import ParameterSet
 
-        self.IKK = IKK_stimulation
-        self.d1 = 1.05 * self.IKK
-        self.d5 = 0.017
 
-        self.t3 = 1.03
-        self.t4 = 0.24
+class CytoNucParamsExact(ParameterSet):
+    """
+    Parameters of the compartment model (see `ParameterSet`). `d1` is derived,
+    d1 = 1.05 * IKK, and follows every change of IKK.
+    """
 
-        self.k1 = 5.4        
-        self.k2 = 0.018      
-        self.k3 = 0.012      
-        self.k4 = 0.83      
+    DEFAULTS = {
+        "a1": 30.0,
+        "a2": 0.03,
+        "a3": 30.0,
+        "a4": 0.03,
 
+        "IKK": 0.5,
+        "d1": 1.05 * 0.5,
+        "d5": 0.017,
 
+        "t3": 1.03,
+        "t4": 0.24,
+
+        "k1": 5.4,
+        "k2": 0.018,
+        "k3": 0.012,
+        "k4": 0.83,
+    }
+
+    __slots__ = tuple(DEFAULTS)
+    DERIVED = {"d1": (("IKK",), lambda IKK: 1.05 * IKK)}
+
+    def __init__(self, IKK_stimulation=0.5, **overrides):
+        super().__init__(None, IKK=IKK_stimulation, **overrides)
+
+
+# Row order of (P, M) parameter matrices used by the batched (ensemble) code.
+PARAM_NAMES = CytoNucParamsExact.NAMES
+
+
+def set_param(params, name, value):
+    """Sets one parameter; derived parameters (d1 for 'IKK') are updated by the parameter set itself."""
+    params.set(name, value)
+
+
+def with_ikk(p, ikk):
+    """
+    Parameter vector/matrix `p` (rows ordered by `PARAM_NAMES`) with IKK replaced by `ikk`
+    and its derived parameters (d1) updated.
+    """
+    p = p.copy()
+    p[PARAM_NAMES.index("IKK")] = ikk
+    for name, (sources, rule) in CytoNucParamsExact.DERIVED.items():
+        p[PARAM_NAMES.index(name)] = rule(*(p[PARAM_NAMES.index(source)] for source in sources))
+    return p
+
+
+def stack_params(params_list):
+    """
+    (P, M) matrix ordered by `PARAM_NAMES` from a list of parameter sets, or from a batch
+    `CytoNucParamsExact` (see `ParameterSet.sweep`).
+    """
+    if isinstance(params_list, CytoNucParamsExact):
+        return params_list.to_matrix()
+    return CytoNucParamsExact.stack(params_list).values
+
+
+def params_from_matrix(matrix):
+    """
+    Returns a batch `CytoNucParamsExact` whose attributes are the rows of a (P, M) matrix.
+
+    Passed to `NFkBSystemExact`, it makes `rhs` and `jac` evaluate all M members
+    of the ensemble in one NumPy call.
+    """
+    return CytoNucParamsExact.from_matrix(matrix)
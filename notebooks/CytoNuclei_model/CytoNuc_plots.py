@@ -0,0 +1,308 @@
+import os
+import sys
+from functools import partial
+
+import numpy as np
+
+from CytoNuc_parallel import parallel_map
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "common"))
+from rendering import FigureTemplate, finish, headless, template, use_headless
+
+
+class DynamicsDashboard(FigureTemplate):
+    """4x2 dashboard of one trajectory; `update(t, y, ikk)` with y of shape (7, T)."""
+
+    figsize = (12, 16)
+
+    def build(self):
+        axes = self.fig.subplots(4, 2).flatten()
+        self.axes = axes
+
+        def lines(ax, specs):
+            return [ax.plot([], [], label=label, **style)[0] for label, style in specs]
+
+        wide = {"linewidth": 2}
+        self.full = lines(axes[0], [("Nn (nuclear NF-κB)", wide), ("N (cytoplasmic NF-κB)", {}),
+                                    ("I (cytoplasmic IκB)", {}), ("In (nuclear IκB)", {}), ("Im (mRNA IκB)", {}),
+                                    ("NI (cytoplasmic complex)", {}), ("NIn (nuclear complex)", {})])
+        axes[0].set_title("Full Dynamics")
+        self.totals = lines(axes[1], [("Total NF-κB", wide), ("Total IκB", wide), ("Total Complex", wide),
+                                      ("IκB mRNA", {"linestyle": "--", "linewidth": 2})])
+        axes[1].set_title("Total Concentrations")
+        self.nfkb_ikb = lines(axes[2], [("Total NF-κB", wide), ("Total IκB", wide)])
+        axes[2].set_title("NF-κB vs IκB (Totals)")
+        self.compartments = lines(axes[3], [("N (cytoplasmic)", wide), ("Nn (nuclear)", wide)])
+        axes[3].set_title("NF-κB Cytoplasmic vs Nuclear")
+
+        self.fraction = lines(axes[4], [("Fractional Nn", {"color": "orangered", "linewidth": 2})])[0]
+        axes[4].set_title("Fractional Nuclear Activation of NF-κB")
+        axes[4].set_ylabel("Fraction of Nn / (N + Nn)")
+        self.phase = axes[5].plot([], [], color="purple")[0]
+        axes[5].set_title("Phase Portrait: Activator vs. Feedback Source")
+        axes[5].set_xlabel("Nuclear NF-κB (Nn) [μM]")
+        axes[5].set_ylabel("IκB mRNA (Im) [μM]")
+
+        self.pools = lines(axes[6], [("Total Cyto NF-κB (N+NI)", wide), ("Total Nuc NF-κB (Nn+NIn)", wide)])
+        axes[6].set_title("Total NF-κB Compartmental Pools")
+        self.complexes = lines(axes[7], [("Cytoplasmic Complex (NI)", wide), ("Nuclear Complex (NIn)", wide)])
+        axes[7].set_title("Dynamics of Complex Formation")
+
+        for i in (0, 1, 2, 3, 4, 6, 7):
+            axes[i].set_xlabel("Time (min)")
+            axes[i].grid(True)
+            if i != 4:
+                axes[i].legend(fontsize=8)
+        for i in (0, 1, 2, 3, 6, 7):
+            axes[i].set_ylabel("Concentration (μM)")
+        axes[6].set_ylabel("Total Concentration (μM)")
+        axes[7].set_ylabel("Complex Concentration (μM)")
+        axes[5].grid(True)
+
+        self.title = self.fig.suptitle("", fontsize=16)
+        self.fig.tight_layout(rect=(0, 0, 1, 0.98))
+
+    def update(self, t, y, ikk):
+        N, Nn, I, In, Im, NI, NIn = y
+        for line, series in zip(self.full, (Nn, N, I, In, Im, NI, NIn)):
+            self.set_line(line, t, series)
+        for line, series in zip(self.totals, (N + Nn, I + In, NI + NIn, Im)):
+            self.set_line(line, t, series)
+        for line, series in zip(self.nfkb_ikb, (N + Nn, I + In)):
+            self.set_line(line, t, series)
+        for line, series in zip(self.compartments, (N, Nn)):
+            self.set_line(line, t, series)
+        self.set_line(self.fraction, t, Nn / (N + Nn + 1e-9))
+        self.set_curve(self.phase, Nn, Im)
+        for line, series in zip(self.pools, (N + NI, Nn + NIn)):
+            self.set_line(line, t, series)
+        for line, series in zip(self.complexes, (NI, NIn)):
+            self.set_line(line, t, series)
+        self.rescale(self.axes)
+        self.axes[4].set_ylim(0, 1.05)
+        self.title.set_text(f"NF-κB Signaling Dynamics (IKK={ikk:.2f} µM)")
+
+
+class AdvancedDynamics(FigureTemplate):
+    """2x2 phase portraits, fractional activation and conserved totals of one trajectory."""
+
+    figsize = (12, 10)
+
+    def build(self):
+        axes = self.fig.subplots(2, 2).flatten()
+        self.axes = axes
+        self.phase = axes[0].plot([], [], color="purple")[0]
+        axes[0].set_title("Phase Portrait: Activator vs. Feedback Source")
+        axes[0].set_xlabel("Nuclear NF-κB (Nn) [μM]")
+        axes[0].set_ylabel("IκB mRNA (Im) [μM]")
+        self.phase_inhibitor = axes[1].plot([], [], color="green")[0]
+        axes[1].set_title("Phase Portrait: Activator vs. Nuclear Inhibitor")
+        axes[1].set_xlabel("Nuclear NF-κB (Nn) [μM]")
+        axes[1].set_ylabel("Nuclear IκB (In) [μM]")
+        self.fraction = axes[2].plot([], [], color="orangered", linewidth=2)[0]
+        axes[2].set_title("Fractional Nuclear Activation of NF-κB")
+        axes[2].set_xlabel("Time (min)")
+        axes[2].set_ylabel("Fraction of Nn / (N + Nn)")
+        self.pools = [axes[3].plot([], [], label=label, linewidth=2)[0]
+                      for label in ("Total NF-κB Pool", "Total IκB Pool")]
+        axes[3].set_title("Conservation of Total Protein")
+        axes[3].set_xlabel("Time (min)")
+        axes[3].set_ylabel("Total Concentration (μM)")
+        axes[3].legend()
+        for ax in axes:
+            ax.grid(True)
+        self.title = self.fig.suptitle("", fontsize=16)
+        self.fig.tight_layout(rect=(0, 0, 1, 0.97))
+
+    def update(self, t, y, ikk):
+        N, Nn, I, In, Im, NI, NIn = y
+        self.set_curve(self.phase, Nn, Im)
+        self.set_curve(self.phase_inhibitor, Nn, In)
+        self.set_line(self.fraction, t, Nn / (N + Nn + 1e-9))
+        for line, series in zip(self.pools, (N + Nn + NI + NIn, I + In + NI + NIn)):
+            self.set_line(line, t, series)
+        self.rescale(self.axes)
+        self.axes[2].set_ylim(0, 1.05)
+        self.title.set_text(f"Advanced NF-κB Dynamics (IKK={ikk:.2f} µM)")
+
+
+class SweepReport(FigureTemplate):
+    """
+    Peak, AUC and final Nn of one or more one-parameter sweeps, one panel each;
+    `update(series)` with series = [(x, peak, auc, final), ...].
+
+    Options:
+        series (list): One (format, color(s), label) per sweep; a color triple colors the three
+                       panels differently. Labels add legends.
+        panels (tuple): (title, ylabel) of the three panels (defaults to `PANELS`).
+        xlabel, suptitle (str): Axis and figure labels.
+        marker_limit (int): Markers are drawn only for sweeps with at most this many points.
+    """
+
+    figsize = (18, 5)
+    PANELS = (("Peak Nuclear NF-κB (Nn)", "Peak Concentration (μM)"),
+              ("Sustained Nn Activation (AUC)", "Total Activity (μM * min)"),
+              ("Final Nn Steady-State", "Final Concentration (μM)"))
+
+    def build(self):
+        series = self.options.get("series", (("o-", ("r", "g", "b"), None),))
+        self.axes = self.fig.subplots(1, 3)
+        self.lines = []
+        for k, (ax, (title, ylabel)) in enumerate(zip(self.axes, self.options.get("panels", self.PANELS))):
+            row = []
+            for fmt, color, label in series:
+                color = color[k] if isinstance(color, (tuple, list)) else color
+                row.append(ax.plot([], [], fmt, color=color, label=label)[0])
+            self.lines.append(row)
+            ax.set_title(title)
+            ax.set_ylabel(ylabel)
+            ax.set_xlabel(self.options.get("xlabel", ""))
+            ax.grid(True)
+            if any(label for _, _, label in series):
+                ax.legend()
+        self.markers = [line.get_marker() for line in self.lines[0]]
+        self.fig.suptitle(self.options.get("suptitle", ""), fontsize=16)
+        self.fig.tight_layout(rect=(0, 0, 1, 0.95))
+
+    def update(self, series):
+        limit = self.options.get("marker_limit", 100)
+        for j, (x, *metrics) in enumerate(series):
+            for k, values in enumerate(metrics):
+                line = self.lines[k][j]
+                self.set_line(line, x, np.asarray(values, dtype=float))
+                line.set_marker(self.markers[j] if len(x) <= limit else "None")
+        self.rescale(self.axes)
+
+
+class BifurcationPlot(FigureTemplate):
+    """Tail minima and maxima against the parameter; `update(param_values, min_values, max_values)`."""
+
+    figsize = (12, 7)
+
+    def build(self):
+        self.ax = self.fig.subplots()
+        self.lines = [self.ax.plot([], [], "k.", markersize=2)[0] for _ in range(2)]
+        param, variable = self.options.get("param", ""), self.options.get("variable", "")
+        self.ax.set_title(f'Bifurkačný Diagram: Vplyv "{param}" na "{variable}"', fontsize=16)
+        self.ax.set_xlabel(f'Hodnota parametra "{param}"')
+        self.ax.set_ylabel(f'Ustálená koncentrácia {variable} [μM]')
+        self.ax.grid(True)
+        self.fig.tight_layout()
+
+    def update(self, param_values, min_values, max_values):
+        for line, values in zip(self.lines, (min_values, max_values)):
+            self.set_line(line, np.asarray(param_values, dtype=float), np.asarray(values, dtype=float))
+        self.rescale(self.ax)
+
+
+KINDS = {"dynamics": DynamicsDashboard, "advanced": AdvancedDynamics, "sweep": SweepReport,
+         "bifurcation": BifurcationPlot}
+
+
+def plot_bifurcation(param_values, min_values, max_values, bifurcation_param, observed_variable, path=None,
+                     max_points=2000):
+    """Bifurcation diagram of `run_bifurcation_analysis`, shown or written to `path`."""
+    figure = BifurcationPlot(max_points, param=bifurcation_param, variable=observed_variable)
+    return figure.render(path, close=True, param_values=param_values, min_values=min_values,
+                         max_values=max_values)
+
+
+# --- Batch rendering -----------------------------------------------------------------------------
+
+class RenderJob:
+    """
+    One figure to write: `kind` (a key of `KINDS`), the output `path`, the data passed to the
+    figure's `update` and its layout `options` (figures with equal options are reused).
+    """
+
+    def __init__(self, kind, path, data, options=None):
+        if kind not in KINDS:
+            raise ValueError(f"Unknown figure kind '{kind}', use one of {list(KINDS)}.")
+        self.kind = kind
+        self.path = path
+        self.data = data
+        self.options = options or {}
+
+    def __repr__(self):
+        return f"RenderJob({self.kind}, {self.path!r})"
+
+
+def _render_job(job, dpi, max_points):
+    """Renders one job in a worker, on the worker's cached figure of that kind and layout."""
+    use_headless()
+    key = (job.kind, repr(sorted(job.options.items())))
+    figure = template(KINDS[job.kind], key, max_points=max_points, **job.options)
+    return figure.render(job.path, dpi=dpi, **job.data)
+
+
+def render_reports(jobs, n_workers=1, dpi=100, max_points=2000, desc="Rendering"):
+    """
+    Writes many figures without a display, spread over `n_workers` processes.
+
+    Every worker switches to the Agg backend (with `n_workers=1` only while rendering) and
+    keeps one figure per kind and layout, whose lines only receive new (min/max-decimated) data
+    for each job, so the cost per report is little more than the rasterization itself.
+
+    Args:
+        jobs (list of RenderJob): Figures to write.
+        n_workers (int, optional): Number of processes; None uses all cores.
+        dpi (int): Resolution of raster outputs (the format follows the file extension).
+        max_points (int or None): Samples kept per line; None draws every sample.
+        desc (str, optional): Progress-bar label; None hides the bar.
+
+    Returns:
+        list: The written path, or a `PointFailure`, for every job.
+    """
+    render = partial(_render_job, dpi=dpi, max_points=max_points)
+    if n_workers == 1:
+        # In-process rendering: the caller's backend (e.g. a notebook's inline one) is restored afterwards.
+        with headless():
+            return parallel_map(render, jobs, n_workers=n_workers, desc=desc)
+    return parallel_map(render, jobs, n_workers=n_workers, desc=desc)
+
+
+def dynamics_jobs(t, y, ikk_values, directory, kind="dynamics", fmt="png", prefix=None):
+    """
+    One dashboard job per member of an ensemble, e.g. the output of `integrate_ensemble`.
+
+    Args:
+        t (np.ndarray): Time grid (T,).
+        y (np.ndarray): Trajectories (M, 7, T) (a memmap is read member by member).
+        ikk_values (array_like): IKK level of every member, shown in the titles.
+        directory (str): Output directory; files are named `{prefix}_{index}.{fmt}`.
+        kind (str): 'dynamics' (4x2 dashboard) or 'advanced' (2x2).
+    """
+    prefix = kind if prefix is None else prefix
+    width = len(str(max(len(ikk_values) - 1, 0)))
+    return [RenderJob(kind, os.path.join(directory, f"{prefix}_{m:0{width}d}.{fmt}"),
+                      {"t": t, "y": np.asarray(y[m]), "ikk": float(ikk)})
+            for m, ikk in enumerate(ikk_values)]
+
+
+def plot_bifurcation_map(result, path=None, show_points=True):
+    """
+    Regime map of `CytoNuc_bifurcation_map.bifurcation_map`: regimes as colored cells, the
+    boundary polylines and (optionally) the simulated points; shown or written to `path`.
+    """
+    import matplotlib.pyplot as plt
+    from matplotlib.colors import ListedColormap
+
+    colors = ["lightgray", "white", "lightskyblue", "gold"]
+    fig, ax = plt.subplots(figsize=(9, 7))
+    mesh = ax.pcolormesh(result.x, result.y, result.regime, cmap=ListedColormap(colors), vmin=-1.5, vmax=2.5,
+                         shading="nearest")
+    bar = fig.colorbar(mesh, ax=ax, ticks=range(-1, len(result.classes)))
+    bar.ax.set_yticklabels(["failed", *result.classes])
+    for name, lines in result.boundaries.items():
+        for line in lines:
+            ax.plot(line[:, 0], line[:, 1], "k-", linewidth=1)
+    if show_points:
+        ax.plot(result.points[:, 0], result.points[:, 1], "k.", markersize=1, alpha=0.4)
+    ax.set_xscale(result.scale[0])
+    ax.set_yscale(result.scale[1])
+    ax.set_xlabel(f'Parameter "{result.param_x}"')
+    ax.set_ylabel(f'Parameter "{result.param_y}"')
+    ax.set_title(f'{result.observed_variable}: {result.n_simulations} simulations '
+                 f'(uniform grid: {result.n_uniform})')
+    fig.tight_layout()
+    return finish(fig, path)
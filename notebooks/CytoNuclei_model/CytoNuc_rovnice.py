@@ -1,21 +1,102 @@
+import os
+import sys
+
+import numpy as np
+
+from CytoNuc_params import PARAM_NAMES
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "common"))
+from model_compiler import ModelSpec
+
+# Poradie stavových premenných v y.
+VARIABLES = ('N', 'Nn', 'I', 'In', 'Im', 'NI', 'NIn')
+
+# Reakčná schéma modelu; z nej sa generuje pravá strana aj Jacobiho matica (pozri `NFkBSystemExact.compiled`).
+MODEL = (
+    ModelSpec("CytoNuc", species=VARIABLES, parameters=PARAM_NAMES)
+    # Väzba NF-κB s IκB v cytoplazme, disociácia a degradácia IκB v komplexe (IKK).
+    .reaction("a1 * N * I", {"N": -1, "I": -1, "NI": +1})
+    .reaction("a2 * NI", {"NI": -1, "N": +1, "I": +1})
+    .reaction("d1 * NI", {"NI": -1, "N": +1})
+    # Import NF-κB do jadra a väzba s IκB v jadre.
+    .reaction("k1 * N", {"N": -1, "Nn": +1})
+    .reaction("a3 * Nn * In", {"Nn": -1, "In": -1, "NIn": +1})
+    .reaction("a4 * NIn", {"NIn": -1, "Nn": +1, "In": +1})
+    # Export komplexu z jadra.
+    .reaction("k4 * NIn", {"NIn": -1, "NI": +1})
+    # Transkripcia mRNA IκB, jej degradácia a translácia.
+    .reaction("t3 * Nn ** 2", {"Im": +1})
+    .reaction("d5 * Im", {"Im": -1})
+    .reaction("t4 * Im", {"I": +1})
+    # Transport voľného IκB medzi cytoplazmou a jadrom.
+    .reaction("k2 * I", {"I": -1, "In": +1})
+    .reaction("k3 * In", {"In": -1, "I": +1})
+)
+
 
 class NFkBSystemExact:
-    """NF-κB signaling dynamics."""
+    """
+    NF-κB signaling dynamics. The right-hand side, the Jacobian and their structure are
+    generated from `MODEL`; a subclass that overrides `rhs` or `jac` is integrated with its
+    own methods instead (see `compiled`).
+    """
+
+    # Nenulová štruktúra Jacobiho matice (riadky: dN, dNn, dI, dIn, dIm, dNI, dNIn;
+    # stĺpce: N, Nn, I, In, Im, NI, NIn).
+    JAC_SPARSITY = MODEL.jac_sparsity
+
+    # Celkové NF-κB (N + Nn + NI + NIn) sa zachováva: CONSERVATION · dy/dt = 0.
+    CONSERVATION = MODEL.conservation_laws()[0]
 
     def __init__(self, params):
         self.p = params
 
+    def _overridden(self):
+        cls = type(self)
+        return cls.rhs is not NFkBSystemExact.rhs or cls.jac is not NFkBSystemExact.jac
+
+    def compiled(self):
+        """
+        Generated counterpart of this system (`MODEL.compile`) with the current parameter values
+        bound as constants; its `rhs` and `jac` are equal to the methods below but cheaper per
+        call. Systems whose parameters are arrays (ensembles) and subclasses overriding `rhs`
+        or `jac` are returned unchanged.
+        """
+        if np.ndim(self.p.a1) != 0 or self._overridden():
+            return self
+        return MODEL.compile(self.p)
+
+    def _param_rows(self):
+        return [getattr(self.p, name) for name in PARAM_NAMES]
+
     def rhs(self, t, y):
-        N, Nn, I, In, Im, NI, NIn = y
-        p = self.p
+        """[dN, dNn, dI, dIn, dIm, dNI, dNIn]; parameters and states may be arrays (ensembles)."""
+        return MODEL.compile_batch().rhs(t, y, self._param_rows())
+
+    def jac(self, t, y):
+        """
+        Exact analytic Jacobian d(rhs)/dy.
+
+        Works for a single state (returns a 7x7 array) as well as for a state
+        block of shape (7, M), in which case the result has shape (7, 7, M).
+        """
+        return MODEL.compile_batch().jac(t, y, self._param_rows())
+
+    def stability_eigenvalues(self, y):
+        """
+        Eigenvalues of the Jacobian restricted to the subspace CONSERVATION · dy = 0.
 
-        dNn = p.k1 * N - p.a3 * Nn * In + p.a4 * NIn
-        dIm = p.t3 * (Nn ** 2) - p.d5 * Im
-        dI = p.t4 * Im - p.a1 * N * I + p.a2 * NI - p.k2 * I + p.k3 * In
-        dN = -p.a1 * N * I + (p.a2 + p.d1) * NI - p.k1 * N
-        dNI = p.a1 * N * I - (p.a2 + p.d1) * NI + p.k4 * NIn
-        dNIn = p.a3 * Nn * In - (p.a4 + p.k4) * NIn
-        dIn = p.k2 * I - p.k3 * In - p.a3 * Nn * In + p.a4 * NIn
+        Because total NF-κB is conserved, the full Jacobian always has one zero eigenvalue
+        that says nothing about stability; the remaining six are returned. For a state block
+        (7, M) the result has shape (M, 6).
+        """
+        J = np.moveaxis(self.jac(0.0, y), (0, 1), (-2, -1))
+        Q = _conservation_complement()
+        return np.linalg.eigvals(Q.T @ J @ Q)
 
-        return [dN, dNn, dI, dIn, dIm, dNI, dNIn]
 
+def _conservation_complement():
+    """Orthonormal basis (7, 6) of the subspace orthogonal to `NFkBSystemExact.CONSERVATION`."""
+    c = NFkBSystemExact.CONSERVATION
+    q, _ = np.linalg.qr(np.column_stack([c, np.eye(7)]))
+    return q[:, 1:7]
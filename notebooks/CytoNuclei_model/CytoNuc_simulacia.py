@@ -1,318 +1,273 @@
+import os
+import sys
+import time
+from functools import partial
+
 import numpy as np
 from scipy.integrate import solve_ivp
-import matplotlib.pyplot as plt
 
-from CytoNuc_rovnice import NFkBSystemExact
-from CytoNuc_params import CytoNucParamsExact
+from CytoNuc_rovnice import MODEL, NFkBSystemExact
+from CytoNuc_params import CytoNucParamsExact, set_param
+from CytoNuc_metrics import Peak, AUC, Final, evaluate_metrics, evaluate_metrics_ensemble
+from CytoNuc_parallel import parallel_map, PointFailure
+from CytoNuc_steady_state import find_steady_state
+from CytoNuc_streaming import simulate_chunks
+from CytoNuc_plots import DynamicsDashboard, AdvancedDynamics, SweepReport
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "common"))
+from simulation_cache import make_key, source_fingerprint, resolve_cache, load_ode_result, store_ode_result
+from solver_stats import RunStats, SweepProfile, probed_method, emit
+from model_reduction import as_reduced
+
+
+def _sweep_params(param_name, value, ikk_stim=0.5):
+    """Fresh parameter set for one sweep point (derived d1 follows a change of 'IKK')."""
+    params = CytoNucParamsExact(IKK_stimulation=ikk_stim)
+    set_param(params, param_name, value)
+    return params
+
+
+def _sensitivity_metrics():
+    return [Peak('Nn', name='peak'), AUC('Nn', name='auc'), Final('Nn', name='final')]
+
+
+def _sensitivity_point(value, param_name, ikk_stim=0.5, t_span=(0, 1000)):
+    """
+    Evaluates one sensitivity-sweep point on its own system, so that points can run in
+    separate worker processes without sharing mutable state. The metrics are accumulated
+    while integrating (`CytoNuc_metrics`), no trajectory is stored.
+
+    Returns:
+        tuple: (success, message, peak_Nn, auc_Nn, final_Nn, stats).
+    """
+    system = NFkBSystemExact(_sweep_params(param_name, value, ikk_stim))
+    result = evaluate_metrics(system, _sensitivity_metrics(), t_span)
+    metrics = result.metrics
+    return result.success, result.message, metrics['peak'], metrics['auc'], metrics['final'], result.stats
+
 
 class NFkBSimulatorExact:
     def __init__(self, system: NFkBSystemExact):
         self.system = system
-
-    def simulate(self, t_span=(0, 1000), y0=None, t_eval=None):
+        # `solver_stats.SweepProfile` of the last sensitivity sweep.
+        self.last_profile = None
+
+    def simulate(self, t_span=(0, 1000), y0=None, t_eval=None, method="LSODA", use_jac=True,
+                 rtol=1e-3, atol=1e-6, cache=True, reduced=None):
+        """
+        Integrates the system with solve_ivp.
+
+        `method` may be "LSODA" (default), "BDF" or "Radau". The right-hand side and the
+        Jacobian come from `NFkBSystemExact.compiled` (generated code with the parameters
+        bound as constants). With `use_jac=True` the analytic Jacobian is handed to the
+        solver; otherwise the implicit methods estimate it by finite differences over
+        `JAC_SPARSITY`.
+
+        Results are looked up in and stored to `cache` (True = the default
+        `simulation_cache` store, False = always integrate), keyed on the parameters,
+        y0, t_span, t_eval, solver options, the source of the system class and the
+        fingerprint of `MODEL` (reactions and the compiler that generates the code run here).
+        A result served from the cache has read-only arrays (shared with the cache); a freshly
+        integrated one is the caller's to modify.
+
+        The result also carries `stats` (`solver_stats.RunStats`: RHS/Jacobian calls, steps,
+        LSODA stiffness switches, wall time), which is handed to the `solver_stats` hooks.
+
+        With `reduced` (a `model_reduction.ReducedModel` for the current parameters, or a
+        dict of its arguments such as {"fast_species": ["N", "Nn"]}) the model with its fast
+        part eliminated is integrated instead and checked a posteriori; when the check fails
+        the full model's solution is returned (see `ReducedModel.simulate`, whose result this
+        is; not cached). With one eliminated direction (e.g. the fast binding) the reduced
+        right-hand side is generated code and a run costs about as much as LSODA on the full
+        model (0.06 s vs 0.04 s over 1000 min). This model has no clear timescale gap
+        (`model_reduction.timescale_analysis` finds none), so the check usually rejects the
+        reduction; it is meant for analysing the slow dynamics, not for speeding up sweeps.
+        """
         if y0 is None:
             y0 = [1.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0]
         if t_eval is None:
             t_eval = np.linspace(t_span[0], t_span[1], 2000)
-
+        if reduced is not None:
+            return as_reduced(MODEL, self.system.p, reduced).simulate(t_span, y0, t_eval=t_eval, rtol=rtol, atol=atol,
+                                                                      fallback=True)
+
+        store = resolve_cache(cache)
+        if store is not None:
+            key = make_key("NFkBSimulatorExact.simulate", source_fingerprint(type(self.system)), MODEL.fingerprint,
+                           self.system.p, y0, t_span, t_eval, method, use_jac, rtol, atol)
+            sol = load_ode_result(store, key)
+            if sol is not None:
+                sol.stats = RunStats("NFkBSimulatorExact.simulate", method)
+                sol.stats.cached = True
+                emit(sol.stats.finish(sol.success, sol.message, sol.nfev, sol.njev, sol.nlu))
+                return sol
+
+        model = self.system.compiled()
+        options = {}
+        if use_jac:
+            options["jac"] = model.jac
+        elif method in ("BDF", "Radau"):
+            options["jac_sparsity"] = self.system.JAC_SPARSITY
+
+        stats = RunStats("NFkBSimulatorExact.simulate", method).start()
         sol = solve_ivp(
-            fun=self.system.rhs,
+            fun=model.rhs,
             t_span=t_span,
             y0=y0,
             t_eval=t_eval,
-            method="LSODA"
+            method=probed_method(method),
+            rtol=rtol,
+            atol=atol,
+            stats=stats,
+            **options
         )
+        sol.stats = stats.finish(sol.success, sol.message, sol.nfev, sol.njev, sol.nlu)
+        emit(stats)
+        if store is not None:
+            store_ode_result(store, key, sol)
         return sol
 
-
-    def plot_dynamics(self, sol):
-        """Plots a comprehensive 4x2 dashboard of system dynamics."""
-        N, Nn, I, In, Im, NI, NIn = sol.y
-        
-        # --- CALCULATIONS ---
-        NFkB_total = N + Nn
-        IkB_total = I + In
-        NI_total = NI + NIn
-        
-        # Calculation for Fractional Activation plot
-        NFkB_total_free = N + Nn
-        fractional_Nn = Nn / (NFkB_total_free + 1e-9)
-
-        # NEW: Calculations for Compartmental Pools and Complex plots
-        NFkB_cyto_pool = N + NI
-        NFkB_nuc_pool = Nn + NIn
-        
-        # --- PLOTTING SETUP ---
-        # Changed to a 4x2 grid and increased vertical size
-        fig, axes = plt.subplots(4, 2, figsize=(12, 16)) 
-        axes = axes.flatten()
-
-        # --- ROW 1: Original Plots ---
-        # Panel 1 (axes[0]): Detailed dynamics
-        axes[0].plot(sol.t, Nn, label="Nn (nuclear NF-κB)", linewidth=2)
-        axes[0].plot(sol.t, N, label="N (cytoplasmic NF-κB)")
-        axes[0].plot(sol.t, I, label="I (cytoplasmic IκB)")
-        axes[0].plot(sol.t, In, label="In (nuclear IκB)")
-        axes[0].plot(sol.t, Im, label="Im (mRNA IκB)")
-        axes[0].plot(sol.t, NI, label="NI (cytoplasmic complex)")
-        axes[0].plot(sol.t, NIn, label="NIn (nuclear complex)")
-        axes[0].set_title("Full Dynamics")
-        
-        # Panel 2 (axes[1]): Totals
-        axes[1].plot(sol.t, NFkB_total, label="Total NF-κB", linewidth=2)
-        axes[1].plot(sol.t, IkB_total, label="Total IκB", linewidth=2)
-        axes[1].plot(sol.t, NI_total, label="Total Complex", linewidth=2)
-        axes[1].plot(sol.t, Im, label="IκB mRNA", linestyle="--", linewidth=2)
-        axes[1].set_title("Total Concentrations")
-        
-        # --- ROW 2: Original Plots ---
-        # Panel 3 (axes[2]): NF-κB vs IκB totals
-        axes[2].plot(sol.t, NFkB_total, label="Total NF-κB", linewidth=2)
-        axes[2].plot(sol.t, IkB_total, label="Total IκB", linewidth=2)
-        axes[2].set_title("NF-κB vs IκB (Totals)")
-
-        # Panel 4 (axes[3]): NF-κB compartments
-        axes[3].plot(sol.t, N, label="N (cytoplasmic)", linewidth=2)
-        axes[3].plot(sol.t, Nn, label="Nn (nuclear)", linewidth=2)
-        axes[3].set_title("NF-κB Cytoplasmic vs Nuclear")
-
-        # --- ROW 3: Advanced Plots from previous request ---
-        # Panel 5 (axes[4]): Fractional Activation of NF-κB
-        axes[4].plot(sol.t, fractional_Nn, color='orangered', linewidth=2, label='Fractional Nn')
-        axes[4].set_title("Fractional Nuclear Activation of NF-κB")
-        axes[4].set_ylabel("Fraction of Nn / (N + Nn)")
-        axes[4].set_ylim(0, 1.05)
-
-        # Panel 6 (axes[5]): Phase Portrait (Nn vs Im)
-        axes[5].plot(Nn, Im, color='purple')
-        axes[5].set_title("Phase Portrait: Activator vs. Feedback Source")
-        axes[5].set_xlabel("Nuclear NF-κB (Nn) [μM]")
-        axes[5].set_ylabel("IκB mRNA (Im) [μM]")
-
-        # --- ROW 4: NEW Mechanistic Plots ---
-        # Panel 7 (axes[6]): Total NF-κB Compartmental Pools
-        axes[6].plot(sol.t, NFkB_cyto_pool, label="Total Cyto NF-κB (N+NI)", linewidth=2)
-        axes[6].plot(sol.t, NFkB_nuc_pool, label="Total Nuc NF-κB (Nn+NIn)", linewidth=2)
-        axes[6].set_title("Total NF-κB Compartmental Pools")
-        axes[6].set_ylabel("Total Concentration (μM)")
-
-        # Panel 8 (axes[7]): Dynamics of Complex Formation
-        axes[7].plot(sol.t, NI, label="Cytoplasmic Complex (NI)", linewidth=2)
-        axes[7].plot(sol.t, NIn, label="Nuclear Complex (NIn)", linewidth=2)
-        axes[7].set_title("Dynamics of Complex Formation")
-        axes[7].set_ylabel("Complex Concentration (μM)")
-        
-        # --- FORMATTING ---
-        # Apply formatting carefully to avoid overwriting labels
-        time_series_axes_indices = [0, 1, 2, 3, 4, 6, 7]
-        concentration_axes_indices = [0, 1, 2, 3, 6, 7]
-        
-        for i in time_series_axes_indices:
-            axes[i].set_xlabel("Time (min)")
-            axes[i].grid(True)
-            if i != 4: # Don't add legend to fractional plot if it only has one line
-                axes[i].legend(fontsize=8)
-
-        for i in concentration_axes_indices:
-            axes[i].set_ylabel("Concentration (μM)")
-
-        # Specific formatting for the non-time-series plot
-        axes[5].grid(True)
-                
-        fig.suptitle(f"NF-κB Signaling Dynamics (IKK={self.system.p.IKK:.2f} µM)", fontsize=16, y=1.02)
-        fig.tight_layout()
-        plt.show()
-
-
-    def _run_sensitivity_analysis_single_param(self, param_name, param_range, ikk_stim=0.5):
-        """Generic internal method for running sensitivity analysis on one parameter."""
-        peak_Nn_values = []
-        auc_Nn_values = []
-        final_Nn_values = []
-
+    def simulate_chunks(self, t_span=(0, 1000), y0=None, t_eval=None, chunk_size=500, decimate=1,
+                        method="LSODA", use_jac=True, rtol=1e-3, atol=1e-6):
+        """
+        Streaming counterpart of `simulate` for long horizons: yields (t_chunk, y_chunk) pieces of
+        at most `chunk_size` output times instead of one (7, N) array (see
+        `CytoNuc_streaming.simulate_chunks`).
+        """
+        return simulate_chunks(self.system, t_span, y0, t_eval, chunk_size, decimate, method, use_jac,
+                               rtol, atol)
+
+
+    def plot_dynamics(self, sol, path=None, max_points=2000):
+        """
+        Plots a comprehensive 4x2 dashboard of system dynamics (`CytoNuc_plots.DynamicsDashboard`).
+        With `path` the figure is written to that file instead of being shown; long
+        trajectories are min/max-decimated to `max_points` samples per line (None keeps all).
+        """
+        return DynamicsDashboard(max_points).render(path, close=True, t=sol.t, y=sol.y, ikk=self.system.p.IKK)
+
+    def _run_sensitivity_analysis_single_param(self, param_name, param_range, ikk_stim=0.5, ensemble=False,
+                                               n_workers=1):
+        """
+        Generic internal method for running sensitivity analysis on one parameter.
+
+        With `ensemble=True` all parameter values are integrated together by
+        `CytoNuc_ensemble.EnsembleSolver`; otherwise each value gets its own integration,
+        spread over `n_workers` processes (None = all cores). Every point is simulated on a
+        fresh system, `self.system` is left untouched. Peak, AUC and final Nn are accumulated
+        from the continuous solution while integrating, so no trajectories are kept. Points
+        whose integration fails are reported and their metrics are NaN.
+
+        The solver statistics of all points are kept in `self.last_profile`
+        (`solver_stats.SweepProfile`) and handed to the `solver_stats` hooks.
+        """
         print(f"Running sensitivity analysis for {len(param_range)} '{param_name}' levels...")
-
-        for val in param_range:
-            params = CytoNucParamsExact(IKK_stimulation=ikk_stim)
-            setattr(params, param_name, val)  
-            self.system.p = params
-            
-            sol = self.simulate(t_span=(0, 1000))
-            
-            t, Nn = sol.t, sol.y[1]
-            peak_Nn_values.append(np.max(Nn))
-            auc_Nn_values.append(np.trapz(Nn, t))
-            final_Nn_values.append(Nn[-1])
-            
+        start = time.perf_counter()
+
+        if ensemble:
+            params = CytoNucParamsExact.sweep(param_name, param_range, CytoNucParamsExact(IKK_stimulation=ikk_stim))
+            result = evaluate_metrics_ensemble(params, _sensitivity_metrics(), (0, 1000))
+            peak_Nn_values = list(result.metrics['peak'])
+            auc_Nn_values = list(result.metrics['auc'])
+            final_Nn_values = list(result.metrics['final'])
+            failed = [(val, "ensemble member did not reach the end of the interval")
+                      for val, ok in zip(param_range, result.success) if not ok]
+            runs = result.stats
+        else:
+            point = partial(_sensitivity_point, param_name=param_name, ikk_stim=ikk_stim)
+            results = parallel_map(point, param_range, n_workers=n_workers, desc=f"Sensitivity '{param_name}'")
+
+            peak_Nn_values = []
+            auc_Nn_values = []
+            final_Nn_values = []
+            failed = []
+            runs = []
+
+            for val, result in zip(param_range, results):
+                if isinstance(result, PointFailure):
+                    result = (False, result.message, np.nan, np.nan, np.nan,
+                              RunStats("sensitivity point").finish(False, result.message))
+                success, message, peak, auc, final, stats = result
+                if not success:
+                    failed.append((val, message))
+                peak_Nn_values.append(peak)
+                auc_Nn_values.append(auc)
+                final_Nn_values.append(final)
+                runs.append(stats)
+
+        self.last_profile = SweepProfile("sensitivity analysis", param_name, param_range, runs,
+                                         time.perf_counter() - start, ensemble=ensemble)
+        emit(self.last_profile)
+
+        for val, message in failed:
+            print(f"  Warning: {param_name} = {val:.6g} failed: {message}")
         print(f"Analysis for '{param_name}' finished.")
         return param_range, peak_Nn_values, auc_Nn_values, final_Nn_values
 
-    def run_pathology_monitoring(self, IKK_stim_range):
-        return self._run_sensitivity_analysis_single_param('IKK', IKK_stim_range, ikk_stim=None) # Special case
+    def run_pathology_monitoring(self, IKK_stim_range, ensemble=False, n_workers=1):
+        """Runs simulations across a range of IKK stimulus values and returns metrics."""
+        return self._run_sensitivity_analysis_single_param('IKK', IKK_stim_range, ensemble=ensemble,
+                                                           n_workers=n_workers)
 
-    def run_sensitivity_analysis_t3(self, t3_range, ikk_stim=0.5):
-        return self._run_sensitivity_analysis_single_param('t3', t3_range, ikk_stim)
+    def run_sensitivity_analysis_t3(self, t3_range, ikk_stim=0.5, ensemble=False, n_workers=1):
+        return self._run_sensitivity_analysis_single_param('t3', t3_range, ikk_stim, ensemble, n_workers)
         
-    def run_sensitivity_analysis_k1(self, k1_range, ikk_stim=0.5):
+    def run_sensitivity_analysis_k1(self, k1_range, ikk_stim=0.5, ensemble=False, n_workers=1):
         """NEW: Runs sensitivity analysis for k1."""
-        return self._run_sensitivity_analysis_single_param('k1', k1_range, ikk_stim)
+        return self._run_sensitivity_analysis_single_param('k1', k1_range, ikk_stim, ensemble, n_workers)
 
-    def run_sensitivity_analysis_k2(self, k2_range, ikk_stim=0.5):
+    def run_sensitivity_analysis_k2(self, k2_range, ikk_stim=0.5, ensemble=False, n_workers=1):
         """NEW: Runs sensitivity analysis for k2."""
-        return self._run_sensitivity_analysis_single_param('k2', k2_range, ikk_stim)
+        return self._run_sensitivity_analysis_single_param('k2', k2_range, ikk_stim, ensemble, n_workers)
 
+    def run_steady_state_report(self, param_name, param_range, ikk_stim=0.5):
+        """
+        Equilibrium Nn for every value of `param_name`, computed directly by `find_steady_state`
+        instead of being read off the end of a long simulation.
 
+        Returns:
+            tuple: (param_range, steady_Nn_values, stable). `stable` says whether the equilibrium
+                   attracts nearby trajectories; where it does not, the system oscillates and the
+                   final Nn of a simulation is only a point on the limit cycle.
+        """
+        result = find_steady_state(CytoNucParamsExact.sweep(param_name, param_range,
+                                                            CytoNucParamsExact(IKK_stimulation=ikk_stim)))
+        for val, ok in zip(param_range, result.success):
+            if not ok:
+                print(f"  Warning: {param_name} = {val:.6g}: steady state not found")
+        return param_range, result.y[:, 1], result.stable
 
 
-    def plot_advanced_dynamics(self, sol):
-        """NEW: Plots more advanced visualizations of system dynamics."""
-        N, Nn, I, In, Im, NI, NIn = sol.y
-        
-        NFkB_total_pool = N + Nn + NI + NIn  
-        IkB_total_pool = I + In + NI + NIn     
-        NFkB_total_free = N + Nn              
-        fractional_Nn = Nn / (NFkB_total_free + 1e-9) 
-        
-        fig, axes = plt.subplots(2, 2, figsize=(12, 10))
-        axes = axes.flatten()
-
-        axes[0].plot(Nn, Im, color='purple')
-        axes[0].set_title("Phase Portrait: Activator vs. Feedback Source")
-        axes[0].set_xlabel("Nuclear NF-κB (Nn) [μM]")
-        axes[0].set_ylabel("IκB mRNA (Im) [μM]")
-        axes[0].grid(True)
-        
-        axes[1].plot(Nn, In, color='green')
-        axes[1].set_title("Phase Portrait: Activator vs. Nuclear Inhibitor")
-        axes[1].set_xlabel("Nuclear NF-κB (Nn) [μM]")
-        axes[1].set_ylabel("Nuclear IκB (In) [μM]")
-        axes[1].grid(True)
-        
-        axes[2].plot(sol.t, fractional_Nn, color='orangered', linewidth=2)
-        axes[2].set_title("Fractional Nuclear Activation of NF-κB")
-        axes[2].set_xlabel("Time (min)")
-        axes[2].set_ylabel("Fraction of Nn / (N + Nn)")
-        axes[2].set_ylim(0, 1.05)
-        axes[2].grid(True)
-
-        axes[3].plot(sol.t, NFkB_total_pool, label="Total NF-κB Pool", linewidth=2)
-        axes[3].plot(sol.t, IkB_total_pool, label="Total IκB Pool", linewidth=2)
-        axes[3].set_title("Conservation of Total Protein")
-        axes[3].set_xlabel("Time (min)")
-        axes[3].set_ylabel("Total Concentration (μM)")
-        axes[3].legend()
-        axes[3].grid(True)
-            
-        fig.suptitle(f"Advanced NF-κB Dynamics (IKK={self.system.p.IKK:.2f} µM)", fontsize=16, y=1.02)
-        fig.tight_layout()
-        plt.show()
-        
-    def plot_pathology_report(self, IKK_stim_range, peak_Nn_values, auc_Nn_values, final_Nn_values):
-        fig, axes = plt.subplots(1, 3, figsize=(18, 5))
-        
-        axes[0].plot(IKK_stim_range, peak_Nn_values, 'o-', color='r')
-        axes[0].set_title('Peak Nuclear NF-κB (Nn)')
-        axes[0].set_ylabel('Peak Concentration (μM)')
-        
-        axes[1].plot(IKK_stim_range, auc_Nn_values, 'o-', color='g')
-        axes[1].set_title('Sustained Nn Activation (AUC)')
-        axes[1].set_ylabel('Total Activity (μM * min)')
 
-        axes[2].plot(IKK_stim_range, final_Nn_values, 'o-', color='b')
-        axes[2].set_title('Final Nn Steady-State')
-        axes[2].set_ylabel('Final Concentration (μM)')
 
-        for ax in axes:
-            ax.grid(True)
-            ax.set_xlabel('IKK Stimulus Concentration (μM)')
-        
-        fig.suptitle("Pathological Response Monitoring Pipeline", fontsize=16, y=1.02)
-        fig.tight_layout()
-        plt.show()
+    def plot_advanced_dynamics(self, sol, path=None, max_points=2000):
+        """NEW: Plots more advanced visualizations of system dynamics (shown, or written to `path`)."""
+        return AdvancedDynamics(max_points).render(path, close=True, t=sol.t, y=sol.y, ikk=self.system.p.IKK)
 
-    def plot_sensitivity_report_t3(self, t3_range, peak_Nn_values, auc_Nn_values, final_Nn_values):
-        fig, axes = plt.subplots(1, 3, figsize=(18, 5))
-        
-        axes[0].plot(t3_range, peak_Nn_values, 'o-', color='r')
-        axes[0].set_title('Peak Nuclear NF-κB (Nn)')
-        axes[0].set_ylabel('Peak Concentration (μM)')
-        
-        axes[1].plot(t3_range, auc_Nn_values, 'o-', color='g')
-        axes[1].set_title('Sustained Nn Activation (AUC)')
-        axes[1].set_ylabel('Total Activity (μM * min)')
+    def plot_pathology_report(self, IKK_stim_range, peak_Nn_values, auc_Nn_values, final_Nn_values, path=None):
+        report = SweepReport(xlabel='IKK Stimulus Concentration (μM)',
+                             suptitle="Pathological Response Monitoring Pipeline")
+        return report.render(path, close=True, series=[(IKK_stim_range, peak_Nn_values, auc_Nn_values,
+                                                        final_Nn_values)])
 
-        axes[2].plot(t3_range, final_Nn_values, 'o-', color='b')
-        axes[2].set_title('Final Nn Steady-State')
-        axes[2].set_ylabel('Final Concentration (μM)')
+    def plot_sensitivity_report_t3(self, t3_range, peak_Nn_values, auc_Nn_values, final_Nn_values, path=None):
+        report = SweepReport(xlabel='IκB Transcription Rate (t3)',
+                             suptitle="Sensitivity Analysis: Impact of Feedback Loop Strength (t3)")
+        return report.render(path, close=True, series=[(t3_range, peak_Nn_values, auc_Nn_values, final_Nn_values)])
 
-        for ax in axes:
-            ax.grid(True)
-            ax.set_xlabel('IκB Transcription Rate (t3)')
-        
-        fig.suptitle("Sensitivity Analysis: Impact of Feedback Loop Strength (t3)", fontsize=16, y=1.02)
-        fig.tight_layout()
-        plt.show()
-        
-    def plot_sensitivity_report_transport(self, k1_results, k2_results):
+    def plot_sensitivity_report_transport(self, k1_results, k2_results, path=None):
         """NEW: Plots a comparative report for k1 and k2 sensitivity."""
-        fig, axes = plt.subplots(1, 3, figsize=(18, 5), sharey=False)
-        
         k1_range, peak_k1, auc_k1, final_k1 = k1_results
         k2_range, peak_k2, auc_k2, final_k2 = k2_results
-        
-        k1_norm = k1_range / 5.4  # Baseline k1 is 5.4
-        k2_norm = k2_range / 0.018 # Baseline k2 is 0.018
-        
-        axes[0].plot(k1_norm, peak_k1, 'o-', color='purple', label='NF-κB Import (k1)')
-        axes[0].plot(k2_norm, peak_k2, 's-', color='orange', label='IκB Import (k2)')
-        axes[0].set_title('Peak Nn Sensitivity')
-        axes[0].set_ylabel('Peak Concentration (μM)')
-        
-        axes[1].plot(k1_norm, auc_k1, 'o-', color='purple', label='NF-κB Import (k1)')
-        axes[1].plot(k2_norm, auc_k2, 's-', color='orange', label='IκB Import (k2)')
-        axes[1].set_title('Sustained Activation (AUC) Sensitivity')
-        axes[1].set_ylabel('Total Activity (μM * min)')
-
-        axes[2].plot(k1_norm, final_k1, 'o-', color='purple', label='NF-κB Import (k1)')
-        axes[2].plot(k2_norm, final_k2, 's-', color='orange', label='IκB Import (k2)')
-        axes[2].set_title('Final Steady-State Sensitivity')
-        axes[2].set_ylabel('Final Concentration (μM)')
-
-        for ax in axes:
-            ax.grid(True)
-            ax.set_xlabel('Parameter Fold Change from Baseline')
-            ax.legend()
-        
-        fig.suptitle("Sensitivity Analysis: Nuclear Import of Activator (k1) vs. Inhibitor (k2)", fontsize=16, y=1.02)
-        fig.tight_layout()
-        plt.show()
-
-
-
-    def run_pathology_monitoring(self, IKK_stim_range):
-        """Runs simulations across a range of IKK stimulus values and returns metrics."""
-        peak_Nn_values = []
-        auc_Nn_values = []
-        final_Nn_values = []
-
-        print(f"Running pathology pipeline for {len(IKK_stim_range)} stimulus levels...")
-
-        for ikk_val in IKK_stim_range:
-            self.system.p = CytoNucParamsExact(IKK_stimulation=ikk_val)
-            sol = self.simulate(t_span=(0, 1000))
-            
-            t, Nn = sol.t, sol.y[1]
-            peak_Nn_values.append(np.max(Nn))
-            auc_Nn_values.append(np.trapz(Nn, t))
-            final_Nn_values.append(Nn[-1])
-
-        print("Pipeline finished.")
-        return IKK_stim_range, peak_Nn_values, auc_Nn_values, final_Nn_values
-
-        
-
-
-
-
-
 
+        k1_norm = np.asarray(k1_range) / 5.4  # Baseline k1 is 5.4
+        k2_norm = np.asarray(k2_range) / 0.018 # Baseline k2 is 0.018
+
+        report = SweepReport(series=(('o-', 'purple', 'NF-κB Import (k1)'), ('s-', 'orange', 'IκB Import (k2)')),
+                             panels=(('Peak Nn Sensitivity', 'Peak Concentration (μM)'),
+                                     ('Sustained Activation (AUC) Sensitivity', 'Total Activity (μM * min)'),
+                                     ('Final Steady-State Sensitivity', 'Final Concentration (μM)')),
+                             xlabel='Parameter Fold Change from Baseline',
+                             suptitle="Sensitivity Analysis: Nuclear Import of Activator (k1) vs. Inhibitor (k2)")
+        return report.render(path, close=True, series=[(k1_norm, peak_k1, auc_k1, final_k1),
+                                                       (k2_norm, peak_k2, auc_k2, final_k2)])
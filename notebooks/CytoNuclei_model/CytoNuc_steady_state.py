@@ -0,0 +1,181 @@
+import numpy as np
+from scipy.optimize import OptimizeResult, root
+
+from CytoNuc_rovnice import NFkBSystemExact
+from CytoNuc_params import CytoNucParamsExact, PARAM_NAMES, stack_params, params_from_matrix
+from CytoNuc_ensemble import integrate_ensemble
+
+_CONSERVATION = NFkBSystemExact.CONSERVATION
+
+
+def _as_param_matrix(params):
+    """
+    Converts any supported parameter input to a (P, M) matrix.
+
+    Returns:
+        tuple: (matrix, single) where `single` says whether one parameter set was given.
+    """
+    if params is None:
+        params = CytoNucParamsExact()
+    if isinstance(params, CytoNucParamsExact):
+        return params.to_matrix(), not params.is_batch
+    if isinstance(params, np.ndarray):
+        return np.asarray(params, dtype=float).reshape(len(PARAM_NAMES), -1), False
+    return stack_params(list(params)), False
+
+
+def _residual(system, Y, total):
+    """Equilibrium equations for a (7, M) block; the dN row is replaced by the conservation law."""
+    F = np.array(system.rhs(0.0, Y), dtype=float)
+    F[0] = _CONSERVATION @ Y - total
+    return F
+
+
+def _residual_jac(system, Y):
+    """Jacobian of `_residual`, shape (M, 7, 7)."""
+    J = system.jac(0.0, Y)
+    J[0] = _CONSERVATION[:, None]
+    return np.moveaxis(J, -1, 0)
+
+
+def _newton_step(J, F):
+    """Batched Newton direction; members with a singular Jacobian get a least-squares step."""
+    try:
+        return np.linalg.solve(J, -F.T[..., None])[..., 0].T
+    except np.linalg.LinAlgError:
+        return np.array([np.linalg.lstsq(J[m], -F[:, m], rcond=None)[0] for m in range(F.shape[1])]).T
+
+
+def _is_physical(Y, tol):
+    return np.all(np.isfinite(Y), axis=0) & np.all(Y >= -tol, axis=0)
+
+
+def _newton(system, Y, total, tol, max_iter):
+    """
+    Damped Newton iteration on all members at once.
+
+    Every member backtracks its own step length until the residual norm decreases.
+
+    Returns:
+        tuple: (Y, residual_norm, converged, iterations).
+    """
+    Y = Y.copy()
+    F = _residual(system, Y, total)
+    norm = np.linalg.norm(F, axis=0)
+    converged = norm <= tol
+    iterations = np.zeros(Y.shape[1], dtype=int)
+
+    for _ in range(max_iter):
+        active = ~converged & np.isfinite(norm)
+        if not np.any(active):
+            break
+        dY = _newton_step(_residual_jac(system, Y), F)
+
+        lam = np.ones(Y.shape[1])
+        for _ in range(20):
+            Y_try = Y + lam * dY
+            F_try = _residual(system, Y_try, total)
+            norm_try = np.linalg.norm(F_try, axis=0)
+            accepted = norm_try < (1.0 - 1e-4 * lam) * norm
+            if np.all(accepted | ~active):
+                break
+            lam = np.where(accepted, lam, 0.5 * lam)
+
+        move = active & np.isfinite(norm_try)
+        Y[:, move] = Y_try[:, move]
+        F[:, move] = F_try[:, move]
+        norm[move] = norm_try[move]
+        iterations[active] += 1
+        step_small = np.linalg.norm(lam * dY, axis=0) <= tol * (1.0 + np.linalg.norm(Y, axis=0))
+        converged |= active & ((norm <= tol) | (step_small & (norm <= np.sqrt(tol))))
+
+    return Y, norm, converged, iterations
+
+
+def _trust_region(system, y, total, tol):
+    """Single-member fallback: MINPACK's hybrid (trust-region dogleg) method."""
+    sol = root(lambda v: _residual(system, v[:, None], total)[:, 0], y,
+               jac=lambda v: _residual_jac(system, v[:, None])[0], tol=tol)
+    return sol.x, np.linalg.norm(_residual(system, sol.x[:, None], total)[:, 0]), sol.success
+
+
+def _default_guess(total, n_members):
+    Y = np.zeros((7, n_members))
+    Y[0] = total
+    return Y
+
+
+def find_steady_state(params=None, y_guess=None, total_nfkb=1.0, tol=1e-10, max_iter=50, t_settle=500.0):
+    """
+    Computes the equilibrium of the CytoNuc model directly, without integrating to long times.
+
+    Because total NF-κB is conserved, the equilibrium is fixed by `total_nfkb` (the dN equation
+    is replaced by the conservation law). The root is found by a damped Newton method with the
+    analytic Jacobian, vectorized over all parameter sets. Members for which Newton fails or
+    lands on a non-physical root (negative concentrations) are retried with Newton from
+    N = total, and then with a trust-region solver started from the initial guess, from
+    N = total and finally from the end of a short integration (`t_settle`). Stability is
+    judged from the eigenvalues of the Jacobian restricted to the conservation subspace.
+
+    Args:
+        params: A `CytoNucParamsExact` (single set or batch), a list of them, a (P, M) matrix
+                ordered by `PARAM_NAMES`, or None for the default parameters.
+        y_guess (array_like, optional): Starting point (7,) or (7, M).
+        total_nfkb (float): Total NF-κB, N + Nn + NI + NIn. Defaults to 1.0.
+        tol (float): Tolerance on the residual norm. Defaults to 1e-10.
+        max_iter (int): Newton iterations. Defaults to 50.
+        t_settle (float): Length of the fallback integration. Defaults to 500.
+
+    Returns:
+        OptimizeResult: Fields `y` (7,) or (M, 7), `eigenvalues` (6,) or (M, 6), `stable`,
+                        `success`, `residual`, `nit` and `fallback` (True where Newton alone
+                        did not suffice), plus `message`. For a single parameter set the
+                        per-member fields are scalars.
+    """
+    matrix, single = _as_param_matrix(params)
+    n_members = matrix.shape[1]
+    system = NFkBSystemExact(params_from_matrix(matrix))
+
+    if y_guess is None:
+        Y = _default_guess(total_nfkb, n_members)
+    else:
+        Y = np.asarray(y_guess, dtype=float)
+        Y = np.repeat(Y[:, None], n_members, axis=1) if Y.ndim == 1 else Y.copy()
+
+    Y0 = Y.copy()
+    Y, norm, converged, nit = _newton(system, Y0, total_nfkb, tol, max_iter)
+    success = converged & _is_physical(Y, np.sqrt(tol))
+    fallback = ~success
+
+    if y_guess is not None and not np.all(success):
+        bad = np.flatnonzero(~success)
+        sub_system = NFkBSystemExact(params_from_matrix(matrix[:, bad]))
+        Y_bad, norm_bad, conv_bad, nit_bad = _newton(sub_system, _default_guess(total_nfkb, bad.size),
+                                                     total_nfkb, tol, max_iter)
+        ok = conv_bad & _is_physical(Y_bad, np.sqrt(tol))
+        Y[:, bad[ok]], norm[bad[ok]], success[bad[ok]] = Y_bad[:, ok], norm_bad[ok], True
+        nit[bad] += nit_bad
+
+    if not np.all(success):
+        bad = np.flatnonzero(~success)
+        settled = integrate_ensemble(matrix[:, bad], _default_guess(total_nfkb, 1)[:, 0], (0.0, t_settle))
+        for m, y_settled in zip(bad, settled.y_final):
+            member = NFkBSystemExact(params_from_matrix(matrix[:, [m]]))
+            for start in (Y0[:, m], _default_guess(total_nfkb, 1)[:, 0], y_settled):
+                y, res, ok = _trust_region(member, start, total_nfkb, tol)
+                if ok and _is_physical(y[:, None], np.sqrt(tol))[0]:
+                    Y[:, m], norm[m], success[m] = y, res, True
+                    break
+
+    eigenvalues = system.stability_eigenvalues(Y)
+    stable = success & np.all(eigenvalues.real < 0, axis=-1)
+
+    n_failed = np.count_nonzero(~success)
+    message = "Steady state found." if n_failed == 0 else f"{n_failed} of {n_members} steady states not found."
+
+    if single:
+        return OptimizeResult(y=Y[:, 0], eigenvalues=eigenvalues[0], stable=bool(stable[0]),
+                              success=bool(success[0]), residual=float(norm[0]), nit=int(nit[0]),
+                              fallback=bool(fallback[0]), message=message)
+    return OptimizeResult(y=Y.T, eigenvalues=eigenvalues, stable=stable, success=success, residual=norm,
+                          nit=nit, fallback=fallback, message=message)
@@ -0,0 +1,295 @@
+from abc import ABC, abstractmethod
+from functools import partial
+
+import numpy as np
+from scipy.integrate import solve_ivp
+from scipy.optimize import OptimizeResult
+
+from CytoNuc_rovnice import MODEL
+from CytoNuc_params import CytoNucParamsExact, with_ikk
+from CytoNuc_parallel import parallel_map, PointFailure
+
+
+class Protocol(ABC):
+    """
+    IKK stimulation as a function of time, IKK(t), made of linear pieces.
+
+    `pieces(t0, t1)` returns the pieces covering [t0, t1] as arrays (starts, levels, slopes):
+    on [starts[i], starts[i + 1]) IKK(t) = levels[i] + slopes[i] * (t - starts[i]). The starts
+    after the first are the breakpoints, where the value or the slope jumps and the
+    integration is restarted. Values at a breakpoint belong to the piece starting there.
+    """
+
+    @abstractmethod
+    def __call__(self, t):
+        pass
+
+    @abstractmethod
+    def pieces(self, t0, t1):
+        pass
+
+    def breakpoints(self, t0, t1):
+        return self.pieces(t0, t1)[0][1:]
+
+
+class PiecewiseConstant(Protocol):
+    """
+    IKK = levels[i] for times[i] <= t < times[i + 1]; levels[0] also holds before times[0]
+    and levels[-1] after times[-1].
+    """
+
+    def __init__(self, times, levels):
+        self.times = np.asarray(times, dtype=float)
+        self.levels = np.asarray(levels, dtype=float)
+        if self.times.shape != self.levels.shape or np.any(np.diff(self.times) <= 0):
+            raise ValueError("times and levels need the same length and increasing times")
+
+    def __repr__(self):
+        return f"PiecewiseConstant({len(self.times)} levels)"
+
+    def __call__(self, t):
+        return self.levels[np.clip(np.searchsorted(self.times, t, side="right") - 1, 0, None)]
+
+    def pieces(self, t0, t1):
+        starts = np.concatenate([[t0], self.times[(self.times > t0) & (self.times < t1)]])
+        levels = self(starts)
+        # Equal neighbouring levels are not a discontinuity.
+        keep = np.concatenate([[True], levels[1:] != levels[:-1]])
+        return starts[keep], levels[keep], np.zeros(np.count_nonzero(keep))
+
+
+class PiecewiseLinear(Protocol):
+    """
+    IKK interpolated linearly between (times[i], levels[i]) (a ramp), constant before the
+    first and after the last knot.
+    """
+
+    def __init__(self, times, levels):
+        self.times = np.asarray(times, dtype=float)
+        self.levels = np.asarray(levels, dtype=float)
+        if self.times.shape != self.levels.shape or np.any(np.diff(self.times) <= 0):
+            raise ValueError("times and levels need the same length and increasing times")
+
+    def __repr__(self):
+        return f"PiecewiseLinear({len(self.times)} knots)"
+
+    def __call__(self, t):
+        return np.interp(t, self.times, self.levels)
+
+    def pieces(self, t0, t1):
+        starts = np.concatenate([[t0], self.times[(self.times > t0) & (self.times < t1)]])
+        i = np.searchsorted(self.times, starts, side="right") - 1
+        inside = (i >= 0) & (i < len(self.times) - 1)
+        i = np.clip(i, 0, max(len(self.times) - 2, 0))
+        slopes = np.zeros(starts.size)
+        if len(self.times) > 1:
+            slopes = np.where(inside, np.diff(self.levels)[i] / np.diff(self.times)[i], 0.0)
+        return starts, self(starts), slopes
+
+
+class PulseTrain(Protocol):
+    """
+    Rectangular pulses: IKK = high for `duration` at the start of every `period` (from
+    `start`, `n_pulses` times or indefinitely), `low` otherwise. The duty cycle is
+    duration / period.
+    """
+
+    def __init__(self, period, duration, high, low=0.0, start=0.0, n_pulses=None):
+        if not 0 < duration <= period:
+            raise ValueError("Pulse duration must satisfy 0 < duration <= period")
+        self.period, self.duration = float(period), float(duration)
+        self.high, self.low = float(high), float(low)
+        self.start = float(start)
+        self.n_pulses = n_pulses
+
+    @property
+    def duty_cycle(self):
+        return self.duration / self.period
+
+    def __repr__(self):
+        return f"PulseTrain(period={self.period:g}, duration={self.duration:g}, high={self.high:g})"
+
+    def __call__(self, t):
+        t = np.asarray(t, dtype=float)
+        k = np.floor((t - self.start) / self.period)
+        on = (t >= self.start) & (t - self.start - k * self.period < self.duration)
+        if self.n_pulses is not None:
+            on &= k < self.n_pulses
+        return np.where(on, self.high, self.low)
+
+    def _as_piecewise(self, t0, t1):
+        first = max(0, int(np.floor((t0 - self.start) / self.period)))
+        last = int(np.ceil((t1 - self.start) / self.period))
+        if self.n_pulses is not None:
+            last = min(last, self.n_pulses)
+        onsets = self.start + self.period * np.arange(first, max(last, first))
+        if self.duration < self.period:
+            times = np.column_stack([onsets, onsets + self.duration]).ravel()
+            levels = np.tile([self.high, self.low], onsets.size)
+        else:
+            # A duty cycle of one is a single long pulse.
+            times = np.array([onsets[0], onsets[-1] + self.period]) if onsets.size else np.empty(0)
+            levels = np.array([self.high, self.low])[:times.size]
+        return PiecewiseConstant(np.concatenate([[-np.inf], times]), np.concatenate([[self.low], levels]))
+
+    def pieces(self, t0, t1):
+        return self._as_piecewise(t0, t1).pieces(t0, t1)
+
+
+def as_protocol(stimulus):
+    """A `Protocol`, or a constant IKK level turned into one."""
+    if isinstance(stimulus, Protocol):
+        return stimulus
+    return PiecewiseConstant([0.0], [float(stimulus)])
+
+
+def pulse_train_grid(periods, duty_cycles, high, low=0.0, start=0.0, n_pulses=None):
+    """
+    Pulse trains for every combination of period and duty cycle (periods vary slowest).
+
+    Returns:
+        tuple: (protocols, period, duty) with `period` and `duty` arrays of the grid shape
+               (len(periods), len(duty_cycles)) and the protocols in the same (raveled) order.
+    """
+    period, duty = np.meshgrid(np.asarray(periods, dtype=float), np.asarray(duty_cycles, dtype=float),
+                               indexing="ij")
+    protocols = [PulseTrain(T, T * d, high, low, start, n_pulses) for T, d in zip(period.ravel(), duty.ravel())]
+    return protocols, period, duty
+
+
+# --- One protocol: solve_ivp restarted at every breakpoint ---------------------------------------
+
+def simulate_protocol(protocol, params=None, t_span=(0, 1000), t_eval=None, y0=None, method="LSODA",
+                      rtol=1e-6, atol=1e-9):
+    """
+    Simulates the model under a time-varying stimulation IKK(t); d1(t) follows it.
+
+    The interval is split at the breakpoints of the protocol and every piece is integrated
+    by its own `solve_ivp` call started from the state reached by the previous one, so the
+    step-size controller never has to resolve a jump of the right-hand side. Pieces with a
+    constant level use the compiled model with IKK bound as a constant (`MODEL.compile`, cached
+    per level, so a pulse train compiles two systems); ramps evaluate the generated batch
+    model with d1(t) at every call.
+
+    Args:
+        protocol (Protocol or float): Stimulation.
+        params (CytoNucParamsExact, optional): Other parameter values (their IKK is ignored).
+        t_span (tuple): Integration interval.
+        t_eval (array_like, optional): Output times; defaults to 1001 points over `t_span`.
+        y0 (array_like, optional): Initial state; defaults to all NF-κB free in the cytoplasm.
+        method (str): solve_ivp method.
+        rtol, atol (float): Tolerances.
+
+    Returns:
+        OptimizeResult: `t` (T,), `y` (7, T), `ikk` (T,), `breakpoints`, `success`, `message`,
+                        `nfev`, `njev` (summed over the pieces) and `n_pieces`.
+    """
+    protocol = as_protocol(protocol)
+    params = CytoNucParamsExact() if params is None else params
+    t_eval = np.linspace(t_span[0], t_span[1], 1001) if t_eval is None else np.asarray(t_eval, dtype=float)
+    y = np.array([1.0, 0, 0, 0, 0, 0, 0]) if y0 is None else np.asarray(y0, dtype=float)
+    starts, levels, slopes = protocol.pieces(*t_span)
+    ends = np.append(starts[1:], t_span[1])
+    batch = MODEL.compile_batch()
+    out = np.full((y.size, t_eval.size), np.nan)
+    nfev = njev = 0
+    success = True
+    message = "The solver successfully reached the end of the integration interval."
+
+    for i, (a, b, level, slope) in enumerate(zip(starts, ends, levels, slopes)):
+        if slope == 0.0:
+            piece = params.copy()
+            piece.set("IKK", level)
+            system = MODEL.compile(piece)
+            rhs, jac = system.rhs, system.jac
+        else:
+            p = params.values
+
+            def rhs(t, y, a=a, level=level, slope=slope):
+                return batch.rhs(t, y, with_ikk(p, level + slope * (t - a)))
+
+            def jac(t, y, a=a, level=level, slope=slope):
+                return batch.jac(t, y, with_ikk(p, level + slope * (t - a)))
+
+        last = i == len(starts) - 1
+        mask = (t_eval >= a) & ((t_eval <= b) if last else (t_eval < b))
+        times = t_eval[mask]
+        # The end of the piece is always evaluated: it is the start of the next one.
+        ends_inside = times.size and times[-1] == b
+        sol = solve_ivp(rhs, (a, b), y, method=method, t_eval=times if ends_inside else np.append(times, b),
+                        jac=jac, rtol=rtol, atol=atol)
+        nfev += sol.nfev
+        njev += sol.njev
+        if not sol.success:
+            success, message = False, f"Piece {i} ({a:g}..{b:g}): {sol.message}"
+            break
+        out[:, mask] = sol.y[:, :times.size]
+        y = sol.y[:, -1]
+
+    return OptimizeResult(t=t_eval, y=out, ikk=protocol(t_eval), breakpoints=starts[1:], success=success,
+                          message=message, nfev=nfev, njev=njev, n_pieces=len(starts))
+
+
+# --- Many protocols: one solve_ivp run per protocol, on a process pool -------------------------
+
+def _simulate_member(item, t_span, t_eval, method, rtol, atol):
+    protocol, params, y0 = item
+    return simulate_protocol(protocol, params, t_span=t_span, t_eval=t_eval, y0=y0, method=method, rtol=rtol,
+                             atol=atol)
+
+
+def simulate_protocols(protocols, params=None, t_span=(0, 1000), t_eval=None, y0=None, method="LSODA", rtol=1e-6,
+                       atol=1e-9, n_workers=1, desc=None):
+    """
+    Simulates a batch of stimulation protocols (e.g. a `pulse_train_grid`).
+
+    Every protocol is integrated by `simulate_protocol` (restarted at its own breakpoints,
+    with the compiled model on constant pieces), and the protocols are spread over
+    `n_workers` processes. A pulse train costs a few hundredths of a second of LSODA, so the
+    batch scales with the number of protocols divided by the number of workers.
+
+    Args:
+        protocols (sequence of Protocol or float): Stimulations, one member each.
+        params (CytoNucParamsExact, optional): Other parameter values, shared or a batch of
+                                               len(protocols) sets (their IKK is ignored).
+        t_span (tuple): Integration interval.
+        t_eval (array_like, optional): Output times; defaults to 1001 points over `t_span`.
+        y0 (array_like, optional): Initial state (7,) or (7, M).
+        method (str): solve_ivp method.
+        rtol, atol (float): Tolerances.
+        n_workers (int, optional): Number of processes; None uses all cores. Defaults to 1.
+        desc (str, optional): Progress-bar label; None hides the bar.
+
+    Returns:
+        OptimizeResult: `t` (T,), `y` (M, 7, T; NaN after a failure), `ikk` (M, T),
+                        `n_breakpoints`, `nfev`, `njev`, `success` (M,) and `message`.
+    """
+    protocols = [as_protocol(protocol) for protocol in protocols]
+    n_members = len(protocols)
+    params = CytoNucParamsExact() if params is None else params
+    member_params = list(params) if params.is_batch else [params] * n_members
+    if len(member_params) != n_members:
+        raise ValueError(f"A parameter batch must have one set per protocol ({n_members}), got {len(member_params)}")
+    t_eval = np.linspace(t_span[0], t_span[1], 1001) if t_eval is None else np.asarray(t_eval, dtype=float)
+    y0 = np.array([1.0, 0, 0, 0, 0, 0, 0]) if y0 is None else np.asarray(y0, dtype=float)
+    member_y0 = [y0] * n_members if y0.ndim == 1 else list(y0.T)
+
+    results = parallel_map(partial(_simulate_member, t_span=t_span, t_eval=t_eval, method=method, rtol=rtol,
+                                   atol=atol),
+                           list(zip(protocols, member_params, member_y0)), n_workers=n_workers, desc=desc)
+    y = np.full((n_members, 7, t_eval.size), np.nan)
+    nfev, njev = np.zeros(n_members, dtype=int), np.zeros(n_members, dtype=int)
+    success = np.zeros(n_members, dtype=bool)
+    for m, result in enumerate(results):
+        if isinstance(result, PointFailure):
+            continue
+        y[m] = result.y
+        nfev[m], njev[m], success[m] = result.nfev, result.njev, result.success
+
+    if np.all(success):
+        message = "All protocols reached the end of the integration interval."
+    else:
+        message = f"{np.count_nonzero(~success)} of {n_members} protocols failed."
+    return OptimizeResult(t=t_eval, y=y, ikk=np.array([protocol(t_eval) for protocol in protocols]),
+                          n_breakpoints=np.array([protocol.breakpoints(*t_span).size for protocol in protocols]),
+                          nfev=nfev, njev=njev, success=success, message=message)
@@ -0,0 +1,420 @@
+from functools import partial
+
+import numpy as np
+from scipy.optimize import OptimizeResult
+from scipy.special import pdtr, pdtrik
+
+from CytoNuc_rovnice import MODEL, VARIABLES
+from CytoNuc_params import CytoNucParamsExact
+from CytoNuc_parallel import parallel_map, PointFailure
+
+_NN = VARIABLES.index('Nn')
+# Stoichiometry (7, R) of the reactions of `CytoNuc_rovnice.MODEL`.
+_S = MODEL.stoichiometry.astype(np.int64)
+_S_FLOAT = _S.astype(float)
+
+
+def _copy_numbers(y0, omega):
+    if y0 is None:
+        y0 = [1.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0]
+    return np.rint(np.asarray(y0, dtype=float) * omega)
+
+
+def _output_times(t_span, t_eval):
+    if t_eval is None:
+        t_eval = np.linspace(t_span[0], t_span[1], 1001)
+    return np.asarray(t_eval, dtype=float)
+
+
+# --- Exact SSA ----------------------------------------------------------------------------------
+
+def simulate_ssa(params=None, omega=100.0, t_span=(0, 1000), y0=None, t_eval=None, seed=None,
+                 max_events=10**8):
+    """
+    Exact stochastic simulation (Gillespie's direct method) of one cell.
+
+    The reactions of `CytoNuc_rovnice.MODEL` fire as discrete events. Molecule counts are
+    concentrations times `omega` (molecules per μM), and every propensity is `omega` times the
+    deterministic rate evaluated at the concentrations x / omega, so the deterministic model is
+    recovered as omega grows. Each event is simulated, which makes the method exact but slow
+    for large omega; use `simulate_population` (tau-leaping) for many cells.
+
+    Args:
+        params (CytoNucParamsExact, optional): Parameters. Defaults to `CytoNucParamsExact()`.
+        omega (float): Volume scaling, molecules per μM. Defaults to 100.
+        t_span (tuple): Simulated interval. Defaults to (0, 1000).
+        y0 (array_like, optional): Initial concentrations; defaults to the same state as `simulate`.
+        t_eval (np.ndarray, optional): Output times; defaults to 1001 equally spaced points.
+        seed (int, optional): Seed of the random generator.
+        max_events (int): Safety limit on the number of events.
+
+    Returns:
+        OptimizeResult: `t` (T,), `y` (7, T) concentrations, `n_events`, `success` and `message`.
+    """
+    rates = MODEL.compile_rates(CytoNucParamsExact() if params is None else params)
+    changes = [[(i, int(_S[i, j])) for i in np.flatnonzero(_S[:, j])] for j in range(_S.shape[1])]
+    t_eval = _output_times(t_span, t_eval)
+    rng = np.random.default_rng(seed)
+
+    x = _copy_numbers(y0, omega).tolist()
+    y = np.empty((len(x), t_eval.size))
+    t, k, n_events = float(t_span[0]), 0, 0
+    uniforms, u = rng.random(8192).tolist(), 0
+    message = "The simulation reached the end of the interval."
+
+    while k < t_eval.size:
+        a = [max(rate, 0.0) * omega for rate in rates([xi / omega for xi in x])]
+        a0 = sum(a)
+        if u + 2 > len(uniforms):
+            uniforms, u = rng.random(8192).tolist(), 0
+        t_next = t - np.log(1.0 - uniforms[u]) / a0 if a0 > 0 else np.inf
+        while k < t_eval.size and t_eval[k] < t_next:
+            y[:, k] = x
+            k += 1
+        if k == t_eval.size:
+            break
+        threshold, j = uniforms[u + 1] * a0, 0
+        u += 2
+        while threshold >= a[j] and j < len(a) - 1:
+            threshold -= a[j]
+            j += 1
+        for i, change in changes[j]:
+            x[i] += change
+        t = t_next
+        n_events += 1
+        if n_events >= max_events:
+            y[:, k:] = np.nan
+            message = f"Stopped after {max_events} events at t = {t:.6g}."
+            break
+
+    return OptimizeResult(t=t_eval, y=y / omega, n_events=n_events, success=n_events < max_events,
+                          message=message)
+
+
+# --- Vectorized tau-leaping ----------------------------------------------------------------------
+
+_GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+
+
+def _cell_uniforms(keys, drawn, n):
+    """
+    Uniforms (n, cells) in (0, 1): draws drawn + 1 ... drawn + n of every cell's SplitMix64
+    stream. The generator is counter-based, so the streams of any set of cells are computed at
+    once and a cell's draws depend only on its key and how many it has consumed.
+    """
+    z = keys + (drawn + np.arange(1, n + 1, dtype=np.uint64)[:, None]) * _GOLDEN
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    z ^= z >> np.uint64(31)
+    return ((z >> np.uint64(11)).astype(np.float64) + 0.5) * 2.0 ** -53
+
+
+class _Block:
+    """
+    State of one block of cells advanced together. Every cell has its own counter-based random
+    stream (see `_cell_uniforms`), so the Poisson draws of all cells stay vectorized.
+    """
+
+    # Largest mean drawn by the inversion loop (larger ones invert with `scipy.special.pdtrik`),
+    # and the number of times a rejected leap is halved before the counts are clipped at zero.
+    _MAX_INVERTED = 10.0
+    _MAX_HALVINGS = 10
+
+    def __init__(self, rates, p, omega, x, keys, eps, tau, tau_min):
+        self.rates = rates
+        self.p = p
+        self.omega = omega
+        self.x = x
+        self.keys = keys
+        self.drawn = np.zeros(keys.size, dtype=np.uint64)
+        # End time, current step and number of halvings of each cell's rejected leap.
+        self.goal = np.full(keys.size, -np.inf)
+        self.cap = np.full(keys.size, np.inf)
+        self.depth = np.zeros(keys.size, dtype=int)
+        self.eps = eps
+        self.tau = tau
+        self.tau_min = tau_min
+        self.n_clipped = 0
+        self.n_steps = 0
+
+    def poisson(self, mean, cells):
+        """
+        Reaction counts (R, cells). Every cell consumes R uniforms of its own stream per leap and
+        the counts follow by inversion of the Poisson CDF, so a cell's draws never depend on the
+        other cells of the block.
+        """
+        cells = np.arange(self.keys.size)[cells]
+        n_reactions = mean.shape[0]
+        u = _cell_uniforms(self.keys[cells], self.drawn[cells], n_reactions)
+        self.drawn[cells] += np.uint64(n_reactions)
+
+        large = mean > self._MAX_INVERTED
+        lam = np.where(large, 0.0, mean).ravel()
+        u = u.ravel()
+        count = np.zeros(lam.size)
+        term = np.exp(-lam)
+        cdf = term.copy()
+        todo = np.flatnonzero(u > cdf)
+        while todo.size:
+            count[todo] += 1.0
+            term[todo] *= lam[todo] / count[todo]
+            cdf[todo] += term[todo]
+            todo = todo[(u[todo] > cdf[todo]) & (term[todo] > 0.0)]
+        count = count.reshape(mean.shape)
+        if np.any(large):
+            # Smallest k with P(K <= k) >= u, as in scipy.stats.poisson.ppf: pdtrik inverts the
+            # CDF continuously and one check of the integer below settles the rounding.
+            u_large, mean_large = u.reshape(mean.shape)[large], mean[large]
+            k = np.ceil(pdtrik(u_large, mean_large))
+            below = np.maximum(k - 1.0, 0.0)
+            count[large] = np.where(pdtr(below, mean_large) >= u_large, below, k)
+        return count
+
+    def propensities(self, x, cells=slice(None)):
+        conc = x / self.omega
+        rates = self.rates(conc) if self.p is None else self.rates(conc, self.p[:, cells])
+        return np.maximum(np.array(np.broadcast_arrays(*rates)), 0.0) * self.omega
+
+    def leap_size(self, x, a):
+        """
+        Per-cell step bounding the expected relative change of every species (Cao, Gillespie and
+        Petzold 2006, with the conservative order g = 2 for all species).
+        """
+        mu = np.abs(_S_FLOAT @ a)
+        sigma2 = (_S_FLOAT ** 2) @ a
+        bound = np.maximum(self.eps * x / 2.0, 1.0)
+        with np.errstate(divide="ignore"):
+            tau = np.min(np.minimum(bound / mu, bound ** 2 / sigma2), axis=0)
+        return tau if self.tau_min is None else np.maximum(tau, self.tau_min)
+
+    def advance(self, t, t_target):
+        """
+        Advances every cell from its own time `t` (C,) to `t_target`; cells leap independently.
+        A leap that would turn a count negative is rejected and the cell covers the same
+        interval in leaps of half the size (halving again on a further rejection, at most
+        `_MAX_HALVINGS` times before clipping at zero) and doubling back after every accepted
+        one; all cells are handled in the same vectorized pass.
+        """
+        while True:
+            active = np.flatnonzero(t < t_target)
+            if active.size == 0:
+                return t
+            cells = slice(None) if active.size == t.size else active
+            x = self.x[:, cells]
+            a = self.propensities(x, cells)
+            tau = np.full(active.size, self.tau) if self.tau is not None else self.leap_size(x, a)
+            t_cells, goal = t[cells], self.goal[cells]
+            retry = goal > t_cells
+            tau = np.where(retry, np.minimum(self.cap[cells], goal - t_cells), tau)
+            end = np.where(retry & (t_cells + tau >= goal), goal, t_cells + tau)
+            remaining = t_target - t_cells
+            last = remaining <= tau
+            tau = np.minimum(tau, remaining)
+            end = np.where(last, t_target, end)
+
+            x_new = x + _S_FLOAT @ self.poisson(a * tau, cells)
+            bad = np.any(x_new < 0, axis=0)
+            if np.any(bad):
+                depth = self.depth[cells]
+                halve = bad & (depth < self._MAX_HALVINGS)
+                clip = bad & ~halve
+                if np.any(clip):
+                    self.n_clipped += int(np.count_nonzero(clip))
+                    x_new[:, clip] = np.maximum(x_new[:, clip], 0)
+                rejected = active[halve]
+                self.goal[rejected] = np.maximum(goal[halve], t_cells[halve] + tau[halve])
+                self.cap[rejected] = tau[halve] / 2
+                self.depth[rejected] += 1
+                x_new[:, halve] = x[:, halve]
+                end[halve] = t_cells[halve]
+            accepted = active[retry & (end > t_cells)]
+            self.cap[accepted] *= 2
+            self.depth[accepted] = np.maximum(self.depth[accepted] - 1, 0)
+            self.depth[active[end >= self.goal[cells]]] = 0
+            self.x[:, cells] = x_new
+            t[cells] = end
+            self.n_steps += 1
+
+
+class _PeakTracker:
+    """
+    Online detection of Nn peaks with hysteresis: a peak is the maximum of an excursion that
+    rises above `high` and is finished when Nn falls below `low`, so noise around one
+    maximum is not counted as several peaks.
+    """
+
+    def __init__(self, n_cells, high, low, max_peaks):
+        self.high, self.low = high, low
+        self.above = np.zeros(n_cells, dtype=bool)
+        self.run_max = np.full(n_cells, -np.inf)
+        self.run_time = np.full(n_cells, np.nan)
+        self.times = np.full((n_cells, max_peaks), np.nan)
+        self.heights = np.full((n_cells, max_peaks), np.nan)
+        self.count = np.zeros(n_cells, dtype=int)
+
+    def update(self, t, nn):
+        self.above |= nn >= self.high
+        higher = self.above & (nn > self.run_max)
+        self.run_max[higher] = nn[higher]
+        self.run_time[higher] = t
+        ended = np.flatnonzero(self.above & (nn <= self.low))
+        slot = self.count[ended]
+        keep = slot < self.times.shape[1]
+        self.times[ended[keep], slot[keep]] = self.run_time[ended[keep]]
+        self.heights[ended[keep], slot[keep]] = self.run_max[ended[keep]]
+        self.count[ended] += 1
+        self.above[ended] = False
+        self.run_max[ended] = -np.inf
+
+
+def _simulate_block(block, params, omega, y0, t_span, t_eval, tau, eps, tau_min, seed, block_size, n_cells,
+                    peak_threshold, max_peaks, n_traces):
+    """Simulates cells [block * block_size, ...) and returns their statistics (module level for workers)."""
+    start = block * block_size
+    size = min(block_size, n_cells - start)
+    keys = np.array([np.random.SeedSequence(seed, spawn_key=(cell,)).generate_state(1, np.uint64)[0]
+                     for cell in range(start, start + size)])
+
+    if params.is_batch:
+        rates, p = MODEL.compile_rates(), params.values[:, start:start + size]
+    else:
+        rates, p = MODEL.compile_rates(params), None
+    x0 = _copy_numbers(y0, omega)
+    x = np.repeat(x0[:, None], size, axis=1) if x0.ndim == 1 else x0[:, start:start + size].copy()
+    state = _Block(rates, p, omega, x, keys, eps, tau, tau_min)
+    peaks = _PeakTracker(size, *peak_threshold, max_peaks)
+
+    n_species = x.shape[0]
+    total = np.empty((n_species, t_eval.size))
+    total_sq = np.empty((n_species, t_eval.size))
+    traces = np.empty((min(n_traces, size), n_species, t_eval.size))
+
+    t = np.full(size, float(t_span[0]))
+    for k, t_out in enumerate(t_eval):
+        t = state.advance(t, t_out)
+        conc = state.x / omega
+        total[:, k] = conc.sum(axis=1)
+        total_sq[:, k] = (conc ** 2).sum(axis=1)
+        traces[:, :, k] = conc[:, :traces.shape[0]].T
+        peaks.update(t_out, conc[_NN])
+
+    return {"total": total, "total_sq": total_sq, "traces": traces, "y_final": (state.x / omega).T,
+            "peak_times": peaks.times, "peak_heights": peaks.heights, "n_peaks": peaks.count,
+            "n_clipped": state.n_clipped, "n_steps": state.n_steps}
+
+
+def phase_synchrony(t, peak_times):
+    """
+    Kuramoto order parameter R(t) = |mean exp(i theta)| of the population, with each cell's
+    phase advancing by 2 pi between consecutive Nn peaks (linearly in time). Cells count only
+    between their first and last detected peak. R = 1 means all cells peak together, values
+    near 0 mean the oscillations have dephased.
+
+    Args:
+        t (np.ndarray): Times (T,).
+        peak_times (np.ndarray): Peak times (C, K), NaN-padded.
+
+    Returns:
+        np.ndarray: R(t) (T,), NaN where fewer than two cells have a defined phase.
+    """
+    t = np.asarray(t, dtype=float)
+    phasor = np.zeros(t.size, dtype=complex)
+    count = np.zeros(t.size)
+    for k in range(peak_times.shape[1] - 1):
+        t0, t1 = peak_times[:, k, None], peak_times[:, k + 1, None]
+        inside = (t >= t0) & (t < t1)
+        if not np.any(inside):
+            continue
+        with np.errstate(invalid="ignore"):
+            theta = 2 * np.pi * (t - t0) / (t1 - t0)
+        phasor += np.where(inside, np.exp(1j * np.where(inside, theta, 0.0)), 0.0).sum(axis=0)
+        count += inside.sum(axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(count >= 2, np.abs(phasor) / count, np.nan)
+
+
+def simulate_population(params=None, n_cells=10000, omega=100.0, t_span=(0, 1000), y0=None, t_eval=None,
+                        tau=None, eps=0.03, tau_min=None, seed=None, block_size=1024, n_workers=1,
+                        peak_threshold=(0.2, 0.05), max_peaks=64, n_traces=10):
+    """
+    Stochastic simulation of a population of independent cells by tau-leaping.
+
+    All cells of a block of `block_size` are advanced together on NumPy arrays (counts of shape
+    (7, cells)); in every leap each reaction fires a Poisson number of times with mean
+    propensity x tau. Without a fixed `tau` every cell chooses its own leap so that none of its
+    propensities changes by more than about `eps` (relative), and a cell whose counts would turn
+    negative repeats the leap in halves. Blocks are independent and can run on `n_workers`
+    processes.
+
+    The fast binding of the few free NF-kB molecules to IkB limits the adaptive leap to ~1e-3
+    min at omega = 100-200, so long runs of many cells take minutes; `tau_min` (or a fixed
+    `tau`) trades that accuracy for speed, the negative-count check keeping the counts valid.
+
+    Every cell draws from its own counter-based stream keyed by `seed` and its index
+    (`np.random.SeedSequence(seed, spawn_key=(cell,))`), so a cell's trajectory depends only on the seed and
+    its index; it is reproducible whatever the `block_size`, the number of workers or the order of execution.
+    The streams of a whole block are drawn in one vectorized operation.
+
+    Population statistics are accumulated while simulating, without per-cell loops: mean and
+    variance of every species, Nn peak times and heights per cell (hysteresis between the
+    two `peak_threshold` levels) and the phase synchrony of the Nn oscillations.
+
+    Args:
+        params (CytoNucParamsExact, optional): One set for all cells, or a batch with one set per
+                                               cell (extrinsic cell-to-cell variability).
+        n_cells (int): Number of cells. Defaults to 10000.
+        omega (float): Molecules per μM (see `simulate_ssa`). Defaults to 100.
+        t_span (tuple): Simulated interval. Defaults to (0, 1000).
+        y0 (array_like, optional): Initial concentrations (7,) or (7, n_cells).
+        t_eval (np.ndarray, optional): Output times; defaults to 1001 equally spaced points.
+        tau (float, optional): Fixed leap size; None selects it adaptively.
+        eps (float): Accuracy of the adaptive leap. Defaults to 0.03.
+        tau_min (float, optional): Lower limit of the adaptive leap.
+        seed (int, optional): Root seed of the per-cell streams.
+        block_size (int): Cells advanced together. Defaults to 1024.
+        n_workers (int): Worker processes for the blocks (None = all cores). Defaults to 1.
+        peak_threshold (tuple): (high, low) Nn levels in μM for peak detection.
+        max_peaks (int): Peaks stored per cell. Defaults to 64.
+        n_traces (int): Full trajectories kept from the first cells, for plotting. Defaults to 10.
+
+    Returns:
+        OptimizeResult: `t` (T,), `mean` and `var` (7, T) over cells, `traces` (n_traces, 7, T),
+                        `y_final` (C, 7), `peak_times`, `peak_heights` (C, max_peaks; NaN-padded),
+                        `n_peaks` (C,), `synchrony` (T,), `n_steps` (leaps per block),
+                        `n_clipped`, `success` and `message`. Concentrations are in μM.
+    """
+    params = CytoNucParamsExact() if params is None else params
+    if params.is_batch and len(params) != n_cells:
+        raise ValueError(f"A parameter batch must have one set per cell ({n_cells}), got {len(params)}")
+    t_eval = _output_times(t_span, t_eval)
+    seed = np.random.SeedSequence(seed).entropy  # one root for all blocks, also when drawn from the OS
+    n_blocks = -(-n_cells // block_size)
+
+    block = partial(_simulate_block, params=params, omega=omega, y0=y0, t_span=t_span, t_eval=t_eval,
+                    tau=tau, eps=eps, tau_min=tau_min, seed=seed, block_size=block_size, n_cells=n_cells,
+                    peak_threshold=peak_threshold, max_peaks=max_peaks, n_traces=n_traces)
+    results = parallel_map(block, range(n_blocks), n_workers=n_workers, chunksize=1,
+                           desc="Tau-leaping" if n_blocks > 1 else None)
+    failed = [r for r in results if isinstance(r, PointFailure)]
+    if failed:
+        raise RuntimeError(f"{len(failed)} of {n_blocks} blocks failed: {failed[0].message}")
+
+    total = sum(r["total"] for r in results)
+    total_sq = sum(r["total_sq"] for r in results)
+    mean = total / n_cells
+    var = np.maximum(total_sq - n_cells * mean ** 2, 0.0) / max(n_cells - 1, 1)
+    peak_times = np.concatenate([r["peak_times"] for r in results])
+    n_clipped = sum(r["n_clipped"] for r in results)
+
+    message = "The simulation reached the end of the interval."
+    if n_clipped:
+        message += f" {n_clipped} cell leaps were clipped at zero; consider a smaller tau or eps."
+    return OptimizeResult(t=t_eval, mean=mean, var=var,
+                          traces=np.concatenate([r["traces"] for r in results])[:n_traces],
+                          y_final=np.concatenate([r["y_final"] for r in results]),
+                          peak_times=peak_times,
+                          peak_heights=np.concatenate([r["peak_heights"] for r in results]),
+                          n_peaks=np.concatenate([r["n_peaks"] for r in results]),
+                          synchrony=phase_synchrony(t_eval, peak_times),
+                          n_steps=np.array([r["n_steps"] for r in results]), n_clipped=n_clipped,
+                          success=True, message=message)
@@ -0,0 +1,130 @@
+import numpy as np
+import scipy.integrate
+from numpy.lib.format import open_memmap
+from scipy.optimize import OptimizeResult
+
+from CytoNuc_ensemble import integrate_ensemble
+
+
+def simulate_chunks(system, t_span=(0, 1000), y0=None, t_eval=None, chunk_size=500, decimate=1,
+                    method="LSODA", use_jac=True, rtol=1e-3, atol=1e-6):
+    """
+    Integrates one system and yields the solution in fixed-size time chunks.
+
+    The solver is stepped manually and every step's dense output is sampled at the output times
+    it covers, so at most one chunk (plus one step) is held in memory however long the run is.
+
+    Args:
+        system (NFkBSystemExact): Model to integrate.
+        t_span (tuple): Integration interval. Defaults to (0, 1000).
+        y0 (array_like, optional): Initial state; defaults to the same state as `simulate`.
+        t_eval (np.ndarray, optional): Output times; defaults to 2000 equally spaced points.
+        chunk_size (int): Number of output times per yielded chunk. Defaults to 500.
+        decimate (int): Keep only every `decimate`-th output time. Defaults to 1.
+        method (str): Name of a `scipy.integrate` solver class ("LSODA", "BDF", "Radau", ...).
+        use_jac (bool): Pass the analytic Jacobian to implicit solvers. Defaults to True.
+        rtol, atol (float): Solver tolerances.
+
+    Yields:
+        tuple: (t_chunk, y_chunk) with shapes (k,) and (7, k), k <= chunk_size.
+
+    Raises:
+        RuntimeError: If the solver fails; chunks yielded before that remain valid.
+    """
+    if y0 is None:
+        y0 = [1.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0]
+    if t_eval is None:
+        t_eval = np.linspace(t_span[0], t_span[1], 2000)
+    t_eval = np.asarray(t_eval, dtype=float)[::decimate]
+
+    system = system.compiled()
+    options = {"jac": system.jac} if use_jac and method in ("LSODA", "BDF", "Radau") else {}
+    solver = getattr(scipy.integrate, method)(system.rhs, t_span[0], np.asarray(y0, dtype=float), t_span[1],
+                                              rtol=rtol, atol=atol, **options)
+
+    t_buffer, y_buffer = [], []
+    n_buffered = 0
+    next_idx = np.searchsorted(t_eval, t_span[0], side="left")
+
+    while next_idx < t_eval.size:
+        if solver.status != "running":
+            raise RuntimeError(f"Integration stopped at t = {solver.t:.6g}: {solver.status}")
+        message = solver.step()
+        if solver.status == "failed":
+            raise RuntimeError(f"Integration failed at t = {solver.t:.6g}: {message}")
+
+        stop_idx = np.searchsorted(t_eval, solver.t, side="right")
+        if stop_idx > next_idx:
+            t_step = t_eval[next_idx:stop_idx]
+            t_buffer.append(t_step)
+            y_buffer.append(solver.dense_output()(t_step).reshape(-1, t_step.size))
+            n_buffered += t_step.size
+            next_idx = stop_idx
+
+        while n_buffered >= chunk_size or (next_idx == t_eval.size and n_buffered):
+            t_all, y_all = np.concatenate(t_buffer), np.concatenate(y_buffer, axis=1)
+            yield t_all[:chunk_size], y_all[:, :chunk_size]
+            t_buffer, y_buffer = [t_all[chunk_size:]], [y_all[:, chunk_size:]]
+            n_buffered = t_buffer[0].size
+
+
+def integrate_ensemble_to_memmap(param_matrix, y0, t_span, t_eval, path, batch_size=256, decimate=1,
+                                 dtype=np.float32, **options):
+    """
+    Integrates an ensemble and writes every trajectory straight into a disk-backed array.
+
+    The output is an .npy file of shape (M, 7, T) opened through `np.memmap`, so thousands of
+    full trajectories can be kept without holding them in RAM; it can be reopened later with
+    `np.load(path, mmap_mode='r')`. Members are integrated in batches of `batch_size`, which
+    bounds the solver's own working memory as well.
+
+    Args:
+        param_matrix (np.ndarray): Parameters (P, M), see `integrate_ensemble`.
+        y0 (array_like): Initial state (7,) or (7, M).
+        t_span (tuple): Integration interval.
+        t_eval (np.ndarray): Output times (before decimation).
+        path (str): Target .npy file; an existing file is overwritten.
+        batch_size (int): Members integrated together. Defaults to 256.
+        decimate (int): Keep only every `decimate`-th output time. Defaults to 1.
+        dtype: Storage type. Defaults to float32, which halves the file size.
+        **options: Passed on to `integrate_ensemble` (rtol, atol, max_step, ...).
+
+    Returns:
+        OptimizeResult: `t` (T,), `y` (read-only memmap, M x 7 x T), `y_final` (M, 7), `success`,
+                        `status`, `nsteps`, `nrejected` (M,), `nfev`, `njev` and `message`.
+    """
+    param_matrix = np.asarray(param_matrix, dtype=float)
+    n_members = param_matrix.shape[1]
+    t_eval = np.asarray(t_eval, dtype=float)[::decimate]
+    y0 = np.asarray(y0, dtype=float)
+
+    out = open_memmap(path, mode="w+", dtype=dtype, shape=(n_members, y0.shape[0], t_eval.size))
+    y_final = np.empty((n_members, y0.shape[0]))
+    status = np.empty(n_members, dtype=int)
+    nsteps = np.empty(n_members, dtype=int)
+    nrejected = np.empty(n_members, dtype=int)
+    nfev = njev = 0
+
+    for start in range(0, n_members, batch_size):
+        members = slice(start, min(start + batch_size, n_members))
+        y0_batch = y0 if y0.ndim == 1 else y0[:, members]
+        result = integrate_ensemble(param_matrix[:, members], y0_batch, t_span, t_eval, out=out[members],
+                                    **options)
+        y_final[members] = result.y_final
+        status[members] = result.status
+        nsteps[members] = result.nsteps
+        nrejected[members] = result.nrejected
+        nfev += result.nfev
+        njev += result.njev
+        out.flush()
+    del out
+
+    success = status == 1
+    if np.all(success):
+        message = "All members reached the end of the integration interval."
+    else:
+        message = f"{np.count_nonzero(~success)} of {n_members} members failed."
+
+    return OptimizeResult(t=t_eval, y=np.load(path, mmap_mode="r"), y_final=y_final, success=success,
+                          status=status, nsteps=nsteps, nrejected=nrejected, nfev=nfev, njev=njev,
+                          message=message)
@@ -0,0 +1,402 @@
+import hashlib
+import json
+import os
+import sys
+import time
+
+import numpy as np
+from scipy.optimize import OptimizeResult
+from tqdm import tqdm
+
+from CytoNuc_rovnice import VARIABLES
+from CytoNuc_params import CytoNucParamsExact, PARAM_NAMES, stack_params, with_ikk
+from CytoNuc_ensemble import EnsembleSolver
+from CytoNuc_steady_state import find_steady_state
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "common"))
+from result_store import ChunkedStore, atomic_savez
+
+# Cells sit on a (ny, nx) lattice; their states are kept as a (7, M) block with M = ny * nx
+# in row-major order, so the columns are the lattice flattened and a (ny, nx) field of the
+# lattice is `values.reshape(shape)`.
+
+_NN = VARIABLES.index("Nn")
+_IKK = PARAM_NAMES.index("IKK")
+
+# Basal IKK of resting cells. The resting state is stable only below IKK ~ 0.0015 (above it the
+# cells oscillate on their own), and at IKK = 0 the cells pile up ~140 units of IkB and no
+# longer respond to a stimulus; 3e-4 is stable (decay rate ~0.007 / min) and excitable.
+BASAL_IKK = 3e-4
+
+# Neighbourhoods of the secreting cells (the cell itself included: TNF acts autocrine too).
+KERNELS = {
+    "von_neumann": np.array([[0.0, 1.0, 0.0], [1.0, 1.0, 1.0], [0.0, 1.0, 0.0]]),
+    "moore": np.ones((3, 3)),
+}
+
+
+def stencil(field, kernel, periodic=False):
+    """
+    Weighted sum of the neighbourhood of every lattice site, out[i, j] = Σ kernel[a, b]
+    field[i + a - ca, j + b - cb] with (ca, cb) the centre of the kernel: one shifted copy
+    of the field per nonzero weight, as the neighbourhood rule of `simulate_meca`.
+
+    Args:
+        field (np.ndarray): Values on the lattice (ny, nx).
+        kernel (array_like): Weights (ky, kx), both odd.
+        periodic (bool): Wrap around the edges (torus); otherwise the lattice is surrounded by
+                         zeros (a closed dish).
+
+    Returns:
+        np.ndarray: (ny, nx).
+    """
+    kernel = np.asarray(kernel, dtype=float)
+    ky, kx = kernel.shape
+    if ky % 2 == 0 or kx % 2 == 0:
+        raise ValueError(f"The kernel needs odd sides, got {kernel.shape}")
+    cy, cx = ky // 2, kx // 2
+    ny, nx = field.shape
+    padded = None if periodic else np.pad(field, ((cy, cy), (cx, cx)))
+    out = np.zeros(field.shape)
+    for a, b in zip(*np.nonzero(kernel)):
+        if periodic:
+            out += kernel[a, b] * np.roll(field, (cy - a, cx - b), axis=(0, 1))
+        else:
+            out += kernel[a, b] * padded[a:a + ny, b:b + nx]
+    return out
+
+
+def disk(shape, radius, center=None):
+    """Boolean mask (ny, nx) of the sites within `radius` of `center` (default: the middle)."""
+    ny, nx = shape
+    cy, cx = (ny // 2, nx // 2) if center is None else center
+    y, x = np.ogrid[:ny, :nx]
+    return (y - cy) ** 2 + (x - cx) ** 2 <= radius ** 2
+
+
+class Paracrine:
+    """
+    TNF-mediated coupling of neighbouring cells.
+
+    A cell secretes TNF at the rate `secretion` * Nn^h / (Nn^h + threshold^h) while its
+    nuclear NF-κB is high. The secreted TNF reaches the sites given by `kernel` and decays
+    with the rate `decay`; over a coupling interval dt with the secretion held fixed the
+    field c obeys dc/dt = stencil(secretion) - decay c exactly:
+
+        c <- exp(-decay dt) c + (1 - exp(-decay dt)) / decay * stencil(secretion)
+
+    and raises the IKK activity of the cells it reaches by ikk_max c / (c + half_saturation).
+
+    Args:
+        kernel (str or array_like): "von_neumann", "moore" (see `KERNELS`) or weights (ky, kx).
+        secretion (float): Largest secretion rate.
+        threshold (float): Nn at half the largest secretion; also the level at which a cell
+                           counts as active.
+        hill (float): Steepness of the secretion switch.
+        decay (float): Decay rate of TNF (1/min).
+        ikk_max (float): Largest IKK activity added by TNF.
+        half_saturation (float): TNF level giving half of `ikk_max`.
+        periodic (bool): Lattice wrapped around (torus) instead of a closed dish.
+    """
+
+    def __init__(self, kernel="von_neumann", secretion=1.0, threshold=0.1, hill=4.0, decay=0.1, ikk_max=1.0,
+                 half_saturation=1.0, periodic=False):
+        self.kernel_name = kernel if isinstance(kernel, str) else "custom"
+        self.kernel = KERNELS[kernel] if isinstance(kernel, str) else np.asarray(kernel, dtype=float)
+        self.secretion = secretion
+        self.threshold = threshold
+        self.hill = hill
+        self.decay = decay
+        self.ikk_max = ikk_max
+        self.half_saturation = half_saturation
+        self.periodic = periodic
+
+    def __repr__(self):
+        return (f"Paracrine({self.kernel_name}, secretion={self.secretion:g}, threshold={self.threshold:g}, "
+                f"decay={self.decay:g}, ikk_max={self.ikk_max:g})")
+
+    def settings(self):
+        """JSON-serializable description (part of the fingerprint of a run)."""
+        return {"kernel": self.kernel.tolist(), "secretion": self.secretion, "threshold": self.threshold,
+                "hill": self.hill, "decay": self.decay, "ikk_max": self.ikk_max,
+                "half_saturation": self.half_saturation, "periodic": self.periodic}
+
+    def secretion_rate(self, nn):
+        nn_h = np.maximum(nn, 0.0) ** self.hill
+        return self.secretion * nn_h / (nn_h + self.threshold ** self.hill)
+
+    def update(self, field, nn, dt):
+        """TNF field after an interval dt during which the cells had nuclear NF-κB `nn` (ny, nx)."""
+        source = stencil(self.secretion_rate(nn), self.kernel, self.periodic)
+        keep = np.exp(-self.decay * dt)
+        gain = (1.0 - keep) / self.decay if self.decay > 0 else dt
+        return keep * field + gain * source
+
+    def ikk(self, field):
+        return self.ikk_max * field / (field + self.half_saturation)
+
+
+def _param_matrix(params, n_cells):
+    """(P, n_cells) matrix from one parameter set, a batch of n_cells sets or a (P, n_cells) matrix."""
+    if params is None:
+        params = CytoNucParamsExact(IKK_stimulation=BASAL_IKK)
+    matrix = np.asarray(params, dtype=float) if isinstance(params, np.ndarray) else stack_params(params)
+    if matrix.ndim == 1:
+        matrix = matrix[:, None]
+    if matrix.shape[1] not in (1, n_cells):
+        raise ValueError(f"Parameters for {matrix.shape[1]} cells given, the lattice has {n_cells}")
+    return np.array(np.broadcast_to(matrix, (matrix.shape[0], n_cells)))
+
+
+def _stimulus(stimulus, t, shape):
+    """External IKK (ny, nx) at time t: None, a number, an array (ny, nx) or a function of t (e.g. a `Protocol`)."""
+    value = 0.0 if stimulus is None else stimulus(t) if callable(stimulus) else stimulus
+    return np.broadcast_to(np.asarray(value, dtype=float), shape)
+
+
+def _advance(matrix, ikk, Y, t, dt, h, rtol, atol, block_size, max_steps, solvers):
+    """
+    Integrates every cell over [t, t + dt] with its IKK fixed, `block_size` cells at a time.
+    The solvers of the blocks are created on the first call (starting with the step sizes `h`)
+    and kept in `solvers` for the next intervals, which restart them from the new states.
+    """
+    n_cells = Y.shape[1]
+    Y_new = np.empty_like(Y)
+    h_new = np.empty_like(h)
+    n_steps = 0
+    for b, start in enumerate(range(0, n_cells, block_size)):
+        cells = slice(start, min(start + block_size, n_cells))
+        block = with_ikk(matrix[:, cells], matrix[_IKK, cells] + ikk[cells])
+        if b < len(solvers):
+            solver = solvers[b]
+            solver.restart(Y[:, cells], t, t + dt, param_matrix=block)
+        else:
+            solver = EnsembleSolver(block, Y[:, cells], t, t + dt, rtol=rtol, atol=atol, first_step=h[cells],
+                                    max_steps=max_steps)
+            solvers.append(solver)
+        while solver.active.size:
+            solver.step()
+        if np.any(solver.status != 1):
+            failed = start + np.flatnonzero(solver.status != 1)
+            raise RuntimeError(f"{failed.size} cells failed between t = {t:.6g} and {t + dt:.6g} "
+                               f"(first: cell {failed[0]}); snapshots written before remain valid.")
+        Y_new[:, cells] = solver.y
+        h_new[cells] = solver.h_unbounded
+        n_steps += int(solver.nsteps.sum())
+    return Y_new, h_new, n_steps
+
+
+def simulate_tissue(shape, params=None, coupling=None, stimulus=None, t_span=(0, 600), dt=1.0, y0=None,
+                    snapshot_every=10, path=None, chunk_snapshots=1, block_size=65536, rtol=1e-4, atol=1e-7,
+                    max_steps=10000, overwrite=False, progress=True):
+    """
+    Simulates a lattice of cells, each running the CytoNuc model, coupled by paracrine TNF.
+
+    Time is split into coupling intervals of length `dt`. Within an interval every cell's IKK
+    is fixed (its basal IKK from `params`, plus the external `stimulus`, plus the IKK induced
+    by the TNF field) and the cells are independent, so the whole lattice is one ensemble
+    integrated with `EnsembleSolver` in blocks of `block_size` cells (each cell keeps its own
+    adaptive step; the block size bounds the memory of the batched 7 x 7 Jacobians). After the
+    interval the TNF field is updated from the cells' nuclear NF-κB by `coupling.update`, a
+    stencil over the lattice. `dt` has to resolve the response of the cells (minutes).
+
+    Every `snapshot_every` intervals the state of the lattice is recorded. With `path` the
+    snapshots are streamed to a `ChunkedStore` (`chunk_snapshots` per compressed chunk, as
+    float32) together with a float64 checkpoint of the full state, and nothing but the
+    current state stays in memory; a run interrupted or failed midway is resumed from its
+    last chunk when it is called again with the same arguments (the stimulus function is not
+    part of the check). Without `path` the snapshots are returned as arrays.
+
+    A paracrine wave with the defaults: a local pulse of IKK makes the stimulated cells fire,
+    their TNF makes the neighbours fire, and the front crosses a 20 x 20 lattice in ~20 min
+    (`activation_time` grows by ~2 min per cell from the centre) before the IkB feedback
+    returns the tissue to rest:
+
+        shape = (20, 20)
+        result = simulate_tissue(shape, stimulus=lambda t: 0.5 * disk(shape, 3) * (t < 60), t_span=(0, 300))
+
+    Summaries that need no snapshots are collected at every interval: the mean nuclear
+    NF-κB, the fraction of active cells (Nn above `coupling.threshold`), the mean IKK, the
+    time every cell first became active (for wave fronts) and the synchrony
+    χ² = Var_t(mean Nn) / mean_i Var_t(Nn_i), which is 1 for cells in lockstep and ~1/M for
+    independent ones.
+
+    Args:
+        shape (tuple): Lattice size (ny, nx).
+        params: A `CytoNucParamsExact` shared by all cells, a batch of ny * nx sets, or a
+                (P, ny * nx) matrix ordered by `PARAM_NAMES` (cell-to-cell variability). Its IKK
+                is the basal IKK of the cells; defaults to resting, excitable cells at
+                `BASAL_IKK`.
+        coupling (Paracrine, optional): Coupling; defaults to `Paracrine()`.
+        stimulus: External IKK added to the cells: None, a number, an array (ny, nx) or a
+                  function of time returning either (e.g. a `Protocol`, or
+                  `lambda t: 0.5 * disk(shape, 3) * (t < 60)` for a transient local stimulus).
+        t_span (tuple): Simulated interval (min).
+        dt (float): Coupling interval (min).
+        y0 (array_like, optional): Initial state (7,), (7, ny, nx) or (7, ny * nx); defaults to
+                                   the resting state of every cell at its basal IKK.
+        snapshot_every (int): Coupling intervals between snapshots.
+        path (str, optional): Directory of the snapshot store.
+        chunk_snapshots (int): Snapshots per chunk on disk.
+        block_size (int): Cells integrated together.
+        rtol, atol (float): Tolerances of the cells' solver.
+        max_steps (int): Solver steps per cell and interval.
+        overwrite (bool): Replace a store of a different run in `path`.
+        progress (bool): Show a progress bar.
+
+    Returns:
+        OptimizeResult: `t` (K + 1,) coupling times with `mean_nn`, `active_fraction` and
+                        `mean_ikk` (K + 1,); `activation_time` (ny, nx) (NaN for cells never
+                        active), `synchrony`, `y_final` (7, ny, nx), `field` (ny, nx) TNF at
+                        the end, `snapshot_t`; `store` (ChunkedStore with arrays `y` (S, 7,
+                        ny, nx), `ikk` and `field` (S, ny, nx)) or, without `path`, `y`,
+                        `ikk` and `field` as arrays; `nsteps` (accepted solver steps of all
+                        cells), `resumed_at` and `wall_time`.
+
+    Raises:
+        RuntimeError: If cells fail to integrate; with `path` the run can be resumed (e.g.
+                      with a smaller `dt`, which then starts a new store) from the last chunk.
+    """
+    start_time = time.perf_counter()
+    ny, nx = shape
+    n_cells = ny * nx
+    coupling = Paracrine() if coupling is None else coupling
+    matrix = _param_matrix(params, n_cells)
+
+    n_intervals = int(round((t_span[1] - t_span[0]) / dt))
+    if n_intervals < 1 or not np.isclose(n_intervals * dt, t_span[1] - t_span[0]):
+        raise ValueError(f"t_span {tuple(t_span)} is not a whole number of coupling intervals dt = {dt:g}")
+    times = t_span[0] + dt * np.arange(n_intervals + 1)
+    snapshot_steps = np.arange(0, n_intervals + 1, snapshot_every)
+
+    if y0 is None:
+        unique, inverse = np.unique(matrix, axis=1, return_inverse=True)
+        rest = find_steady_state(unique)
+        Y = np.atleast_2d(rest.y)[inverse.ravel()].T.copy()
+    else:
+        Y = np.asarray(y0, dtype=float).reshape(len(VARIABLES), -1)
+        Y = np.array(np.broadcast_to(Y, (len(VARIABLES), n_cells)))
+
+    state = {
+        "k": -1, "Y": Y, "field": np.zeros(shape), "h": np.full(n_cells, 0.01 * dt),
+        "activation_time": np.full(n_cells, np.nan), "sum_nn": np.zeros(n_cells), "sum_nn2": np.zeros(n_cells),
+        "mean_nn": np.full(n_intervals + 1, np.nan), "active_fraction": np.full(n_intervals + 1, np.nan),
+        "mean_ikk": np.full(n_intervals + 1, np.nan), "nsteps": 0,
+    }
+    store = None
+    buffer = {"y": [], "ikk": [], "field": []}
+    if path is not None:
+        store, state = _open_tissue_store(path, shape, matrix, coupling, t_span, dt, Y, times[snapshot_steps],
+                                          chunk_snapshots, overwrite, state)
+    # `k` counts the finished coupling intervals; -1 means that not even t0 was recorded yet.
+    resumed_at = float(times[state["k"]]) if state["k"] >= 0 else None
+
+    def record(k, ikk):
+        nn = state["Y"][_NN]
+        active = nn > coupling.threshold
+        state["mean_nn"][k] = nn.mean()
+        state["active_fraction"][k] = active.mean()
+        state["mean_ikk"][k] = ikk.mean()
+        state["activation_time"][active & np.isnan(state["activation_time"])] = times[k]
+        state["sum_nn"] += nn
+        state["sum_nn2"] += nn * nn
+
+    def snapshot(k, ikk):
+        buffer["y"].append(state["Y"].reshape((len(VARIABLES),) + tuple(shape)).astype(np.float32))
+        buffer["ikk"].append(ikk.reshape(shape).astype(np.float32))
+        buffer["field"].append(state["field"].astype(np.float32))
+        n_snapshot = k // snapshot_every + 1
+        if store is not None and (n_snapshot % chunk_snapshots == 0 or k == snapshot_steps[-1]):
+            chunk = (n_snapshot - 1) // chunk_snapshots
+            store.write_chunk(chunk, **{name: np.stack(values) for name, values in buffer.items()})
+            for values in buffer.values():
+                values.clear()
+            _save_checkpoint(store, state, k)
+
+    def ikk_at(k):
+        return (_stimulus(stimulus, times[k], shape) + coupling.ikk(state["field"])).ravel()
+
+    if state["k"] < 0:
+        ikk = ikk_at(0)
+        record(0, ikk)
+        snapshot(0, ikk)
+        state["k"] = 0
+    k = state["k"]
+    solvers = []
+    for k in tqdm(range(k, n_intervals), desc=f"Tissue {ny}x{nx}", initial=k, total=n_intervals,
+                  disable=not progress):
+        ikk = ikk_at(k)
+        nn_start = state["Y"][_NN].reshape(shape)
+        state["Y"], state["h"], n_steps = _advance(matrix, ikk, state["Y"], times[k], dt, state["h"], rtol, atol,
+                                                   block_size, max_steps, solvers)
+        state["nsteps"] += n_steps
+        state["field"] = coupling.update(state["field"], nn_start, dt)
+        ikk = ikk_at(k + 1)
+        record(k + 1, ikk)
+        if (k + 1) % snapshot_every == 0:
+            snapshot(k + 1, ikk)
+
+    n_samples = n_intervals + 1
+    cell_var = state["sum_nn2"] / n_samples - (state["sum_nn"] / n_samples) ** 2
+    mean_var = float(np.mean(np.maximum(cell_var, 0.0)))
+    synchrony = float(np.var(state["mean_nn"]) / mean_var) if mean_var > 0 else np.nan
+
+    result = OptimizeResult(t=times, mean_nn=state["mean_nn"], active_fraction=state["active_fraction"],
+                            mean_ikk=state["mean_ikk"], activation_time=state["activation_time"].reshape(shape),
+                            synchrony=synchrony, y_final=state["Y"].reshape((len(VARIABLES),) + tuple(shape)),
+                            field=state["field"], snapshot_t=times[snapshot_steps], store=store,
+                            nsteps=state["nsteps"], resumed_at=resumed_at,
+                            wall_time=time.perf_counter() - start_time)
+    if store is None:
+        result.update({name: np.stack(values) for name, values in buffer.items()})
+    return result
+
+
+# --- Snapshot store ----------------------------------------------------------------------------
+
+_CHECKPOINT = "checkpoint.npz"
+
+
+def _open_tissue_store(path, shape, matrix, coupling, t_span, dt, Y0, snapshot_t, chunk_snapshots, overwrite,
+                       state):
+    """The snapshot store of a run and the state to continue from (the checkpoint of a resumed run)."""
+    digest = hashlib.sha256()
+    for array in (matrix, Y0):
+        digest.update(np.ascontiguousarray(array).tobytes())
+    settings = {"shape": list(shape), "coupling": coupling.settings(), "t_span": [float(t) for t in t_span],
+                "dt": float(dt), "snapshot_t": snapshot_t.tolist(), "chunk_snapshots": int(chunk_snapshots)}
+    key = hashlib.sha256((json.dumps(settings, sort_keys=True) + digest.hexdigest()).encode()).hexdigest()[:16]
+
+    if os.path.exists(os.path.join(path, ChunkedStore.MANIFEST)) and not overwrite:
+        store = ChunkedStore(path)
+        if store.attrs.get("fingerprint") != key:
+            raise ValueError(f"{path} holds a different tissue run; use another directory or overwrite it.")
+        checkpoint = os.path.join(store.directory, _CHECKPOINT)
+        if os.path.exists(checkpoint):
+            with np.load(checkpoint) as data:
+                state = {name: data[name] for name in data.files}
+            state["k"] = int(state["k"])
+            state["nsteps"] = int(state["nsteps"])
+        return store, state
+
+    checkpoint = os.path.join(path, _CHECKPOINT)
+    if os.path.exists(checkpoint):
+        os.remove(checkpoint)
+    ny, nx = shape
+    arrays = {"y": ((len(VARIABLES), ny, nx), np.float32), "ikk": ((ny, nx), np.float32),
+              "field": ((ny, nx), np.float32)}
+    settings["coupling"] = repr(coupling)
+    store = ChunkedStore.create(path, len(snapshot_t), chunk_snapshots, arrays,
+                                constants={"t": snapshot_t, "species": np.array(VARIABLES)},
+                                attrs={"settings": settings, "fingerprint": key}, overwrite=overwrite)
+    return store, state
+
+
+def _save_checkpoint(store, state, k):
+    """Full-precision state after coupling interval k, written together with the chunk that ends there."""
+    atomic_savez(os.path.join(store.directory, _CHECKPOINT), {**state, "k": k})
+
+
+def load_tissue(path):
+    """Snapshot store of a tissue run (see `simulate_tissue`), e.g. `load_tissue(path).read("y")`."""
+    return ChunkedStore(path)
@@ -0,0 +1,406 @@
+"""
+Benchmark suite of the NF-kB models and the cellular automaton, with JSON baselines.
+
+    python benchmark_suite.py list
+    python benchmark_suite.py run --save main                # -> baselines/main.json
+    python benchmark_suite.py run --cases simulate rhs       # only cases whose name contains a pattern
+    python benchmark_suite.py compare main                   # run now and compare with baselines/main.json
+    python benchmark_suite.py compare main other.json        # compare two stored results
+    python benchmark_suite.py run --cases bifurcation --no-memory   # long cases, without tracemalloc
+
+Every case is run once instrumented (RHS/Jacobian calls, LU decompositions and solver steps
+counted in the scipy and ensemble solvers, peak Python memory from `tracemalloc`) and then
+`repeats` times uninstrumented for the wall time (best of the repeats is reported). Everything
+runs in this process, offline, with the simulation cache disabled and figures going to a
+non-interactive backend, so the cases are reproducible.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from itertools import count
+
+import matplotlib
+matplotlib.use("Agg")
+import numpy as np
+import scipy
+import scipy.integrate
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+_ROOT = os.path.join(_HERE, os.pardir, os.pardir)
+for _path in (os.path.join(_HERE, os.pardir, "CytoNuclei_model"), os.path.join(_HERE, os.pardir, "Basal_model"),
+              os.path.join(_HERE, os.pardir, "common"), _ROOT):
+    sys.path.append(os.path.abspath(_path))
+
+BASELINE_DIR = os.path.join(_HERE, "baselines")
+Y0 = [1.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0]
+
+
+# --- Instrumentation -----------------------------------------------------------------------------
+
+def _solver_classes():
+    """Solver classes whose steps are counted: scipy's and the vectorized ensemble solver."""
+    from CytoNuc_ensemble import EnsembleSolver
+    return scipy.integrate.OdeSolver, EnsembleSolver
+
+
+class _SolverCounters:
+    """
+    Counts the steps of every solver (all scipy methods, also inside `solve_ivp`, and
+    `EnsembleSolver`, whose batched steps count once) while active, and sums the final
+    nfev/njev/nlu of the solvers that took them.
+    """
+
+    def __enter__(self):
+        self.steps = 0
+        self._solvers = {}
+        self._ids = count()
+        self._originals = {cls: cls.step for cls in _solver_classes()}
+        for cls, original in self._originals.items():
+            cls.step = self._counting(original)
+        return self
+
+    def _counting(self, original):
+        counters = self
+
+        def step(solver):
+            message = original(solver)
+            counters.steps += 1
+            key = solver.__dict__.setdefault("_benchmark_id", next(counters._ids))
+            counters._solvers[key] = (solver.nfev, solver.njev, getattr(solver, "nlu", 0))
+            return message
+        return step
+
+    def __exit__(self, *exc):
+        for cls, original in self._originals.items():
+            cls.step = original
+
+    def totals(self):
+        nfev, njev, nlu = (sum(values) for values in zip(*self._solvers.values())) if self._solvers else (0, 0, 0)
+        return {"rhs_calls": int(nfev), "jac_calls": int(njev), "lu_decompositions": int(nlu),
+                "solver_steps": self.steps, "solver_runs": len(self._solvers)}
+
+
+def _discard(func, *args, **kwargs):
+    """Case function calling `func` and dropping its result."""
+    def run():
+        func(*args, **kwargs)
+    return run
+
+
+class Case:
+    """
+    One benchmark: `setup()` returns the function to time (called without arguments; it may
+    return a dict of extra counters, e.g. the number of RHS calls of a micro-benchmark).
+    """
+
+    def __init__(self, name, setup, description, repeats=3):
+        self.name = name
+        self.setup = setup
+        self.description = description
+        self.repeats = repeats
+
+
+def run_case(case, repeats=None, memory=True):
+    """
+    Runs one case; returns its result record (see the module docstring). `tracemalloc` slows
+    Python-heavy cases severalfold, so the instrumented run can skip it (`memory=False`).
+    """
+    func = case.setup()
+    repeats = case.repeats if repeats is None else repeats
+
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        if memory:
+            tracemalloc.start()
+        with _SolverCounters() as counters:
+            extra = func() or {}
+        peak = tracemalloc.get_traced_memory()[1] if memory else np.nan
+        tracemalloc.stop()
+
+        times = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            func()
+            times.append(time.perf_counter() - start)
+
+    record = {"description": case.description, "wall_time": min(times), "wall_times": times,
+              "peak_memory_mb": peak / 2**20}
+    record.update(counters.totals())
+    record.update(extra)
+    return record
+
+
+# --- Cases -------------------------------------------------------------------------------------
+
+def _rhs_cytonuc(n_calls=20000):
+    from CytoNuc_rovnice import NFkBSystemExact
+    from CytoNuc_params import CytoNucParamsExact
+
+    system = NFkBSystemExact(CytoNucParamsExact())
+    y = np.array([0.3, 0.2, 0.5, 0.1, 0.05, 0.4, 0.1])
+
+    def run():
+        rhs = system.compiled().rhs  # what NFkBSimulatorExact.simulate integrates
+        for _ in range(n_calls):
+            rhs(0.0, y)
+        return {"rhs_calls": n_calls}
+    return run
+
+
+def _rhs_basal(n_calls=20000):
+    from rovnice import BasalSystem
+    from parametre import Parameters
+
+    system = BasalSystem(Parameters())
+    y = np.array([0.5, 0.2, 0.3, 0.1, 0.05])
+
+    def run():
+        rhs = system.compiled().rhs  # what BasalSystemSimulator.simulate integrates
+        for _ in range(n_calls):
+            rhs(0.0, y)
+        return {"rhs_calls": n_calls}
+    return run
+
+
+def _simulate_cytonuc(t_end):
+    def setup():
+        from CytoNuc_rovnice import NFkBSystemExact
+        from CytoNuc_params import CytoNucParamsExact
+        from CytoNuc_simulacia import NFkBSimulatorExact
+
+        simulator = NFkBSimulatorExact(NFkBSystemExact(CytoNucParamsExact(IKK_stimulation=0.5)))
+        return _discard(simulator.simulate, t_span=(0, t_end), cache=False)
+    return setup
+
+
+def _simulate_basal():
+    from rovnice import BasalSystem
+    from parametre import Parameters
+    from simulacia import BasalSystemSimulator
+
+    simulator = BasalSystemSimulator(BasalSystem(Parameters()))
+    return _discard(simulator.simulate, cache=False)
+
+
+def _bifurcation(n_points):
+    def setup():
+        import matplotlib.pyplot as plt
+        from CytoNuc_bifurcation_analysis import run_bifurcation_analysis
+
+        param_range = np.linspace(0.05, 1.5, n_points)
+        t_eval = np.linspace(0, 2000, 4000)
+
+        def run():
+            run_bifurcation_analysis("Nn", "t3", param_range, Y0, (0, 2000), t_eval, cache=False)
+            plt.close("all")
+        return run
+    return setup
+
+
+def _sensitivity(ensemble):
+    def setup():
+        import matplotlib.pyplot as plt
+        from CytoNuc_rovnice import NFkBSystemExact
+        from CytoNuc_params import CytoNucParamsExact
+        from CytoNuc_simulacia import NFkBSimulatorExact
+
+        simulator = NFkBSimulatorExact(NFkBSystemExact(CytoNucParamsExact()))
+        t3_range = np.linspace(0.05, 1.5, 50)
+
+        def run():
+            simulator.run_sensitivity_analysis_t3(t3_range, ensemble=ensemble)
+            plt.close("all")
+        return run
+    return setup
+
+
+def _morris():
+    from CytoNuc_global_sensitivity import ParameterSpace, default_bounds, morris_screening
+
+    space = ParameterSpace(default_bounds())
+    return _discard(morris_screening, space, r=4, seed=0)
+
+
+def _meca(size, steps):
+    def setup():
+        from cell_automat import simulate_meca
+        return _discard(simulate_meca, size, steps, 110, seed=0)
+    return setup
+
+
+def _meca_all_rules():
+    from cell_automat import classify_rules
+    return _discard(classify_rules, 100, 100, seed=0)
+
+
+CASES = [
+    Case("rhs.cytonuc", _rhs_cytonuc, "20000 calls of NFkBSystemExact.compiled().rhs"),
+    Case("rhs.basal", _rhs_basal, "20000 calls of BasalSystem.compiled().rhs"),
+    Case("simulate.cytonuc.1000", _simulate_cytonuc(1000), "NFkBSimulatorExact.simulate, t_span (0, 1000)"),
+    Case("simulate.cytonuc.5000", _simulate_cytonuc(5000), "NFkBSimulatorExact.simulate, t_span (0, 5000)"),
+    Case("simulate.basal", _simulate_basal, "BasalSystemSimulator.simulate, default interval"),
+    Case("bifurcation.200", _bifurcation(200), "run_bifurcation_analysis Nn vs t3, 200 points, (0, 2000)",
+         repeats=1),
+    Case("bifurcation.1000", _bifurcation(1000), "run_bifurcation_analysis Nn vs t3, 1000 points, (0, 2000)",
+         repeats=1),
+    Case("sensitivity.t3", _sensitivity(False), "run_sensitivity_analysis_t3, 50 points, one solve per point",
+         repeats=1),
+    Case("sensitivity.t3.ensemble", _sensitivity(True), "run_sensitivity_analysis_t3, 50 points, ensemble solver",
+         repeats=1),
+    Case("sensitivity.morris", _morris, "morris_screening, r = 4 trajectories over the default bounds", repeats=1),
+    Case("meca.simulate", _meca(100, 100), "simulate_meca rule 110, 100 cells x 100 steps"),
+    Case("meca.simulate.large", _meca(10**4, 10**3), "simulate_meca rule 110, 10^4 cells x 10^3 steps"),
+    Case("meca.all_rules", _meca_all_rules, "classify_rules (run_all_meca_automata), 100 cells x 100 steps"),
+]
+
+
+def select_cases(patterns=None, exact=False):
+    """Cases whose name contains (or, with `exact`, equals) one of `patterns`; all cases for None."""
+    if not patterns:
+        return list(CASES)
+    if exact:
+        return [case for case in CASES if case.name in patterns]
+    return [case for case in CASES if any(pattern in case.name for pattern in patterns)]
+
+
+# --- Results and baselines -----------------------------------------------------------------------
+
+def _environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=_HERE, capture_output=True,
+                                text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {"timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"), "commit": commit,
+            "python": platform.python_version(), "numpy": np.__version__, "scipy": scipy.__version__,
+            "platform": platform.platform(), "processor": platform.processor(), "cpu_count": os.cpu_count()}
+
+
+def run_suite(patterns=None, repeats=None, verbose=True, exact=False, memory=True):
+    """Runs the selected cases; returns {"environment": ..., "cases": {name: record}}."""
+    results = {"environment": _environment(), "cases": {}}
+    for case in select_cases(patterns, exact):
+        if verbose:
+            print(f"{case.name:<26}", end="", flush=True)
+        record = run_case(case, repeats, memory)
+        results["cases"][case.name] = record
+        if verbose:
+            print(f"{1e3 * record['wall_time']:>11.1f} ms {record['rhs_calls']:>10} rhs "
+                  f"{record['solver_steps']:>8} steps {record['peak_memory_mb']:>8.1f} MB")
+    return results
+
+
+def baseline_path(name):
+    """A name refers to baselines/<name>.json; anything ending in .json is a path."""
+    return name if name.endswith(".json") else os.path.join(BASELINE_DIR, f"{name}.json")
+
+
+def save_results(results, name):
+    path = baseline_path(name)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2)
+    return path
+
+
+def load_results(name):
+    with open(baseline_path(name)) as f:
+        return json.load(f)
+
+
+def compare(baseline, current, threshold=0.10, count_threshold=0.05):
+    """
+    Compares two result sets case by case.
+
+    A case regresses when its wall time grew by more than `threshold` (relative). Changes of the
+    RHS-call and step counts beyond `count_threshold` are reported as well: they are
+    deterministic, so they reveal algorithmic changes independently of timing noise.
+
+    Returns:
+        list: One dict per case present in both sets with `name`, `ratio` (current / baseline
+              wall time), `regression` (bool) and `notes` (list of str).
+    """
+    rows = []
+    for name, new in current["cases"].items():
+        old = baseline["cases"].get(name)
+        if old is None:
+            continue
+        ratio = new["wall_time"] / old["wall_time"] if old["wall_time"] > 0 else np.inf
+        notes = []
+        for key in ("rhs_calls", "jac_calls", "solver_steps"):
+            a, b = old.get(key, 0), new.get(key, 0)
+            if a != b and abs(b - a) > count_threshold * max(a, 1):
+                notes.append(f"{key} {a} -> {b}")
+        a, b = old.get("peak_memory_mb", 0.0), new.get("peak_memory_mb", 0.0)
+        if b > (1 + threshold) * a and b - a > 1.0:
+            notes.append(f"peak memory {a:.1f} -> {b:.1f} MB")
+        rows.append({"name": name, "ratio": ratio, "regression": bool(ratio > 1 + threshold), "notes": notes})
+    return rows
+
+
+def print_comparison(rows, baseline, current):
+    print(f"{'case':<26} {'baseline [ms]':>14} {'current [ms]':>13} {'ratio':>7}")
+    for row in rows:
+        old, new = baseline["cases"][row["name"]], current["cases"][row["name"]]
+        flag = "  REGRESSION" if row["regression"] else ""
+        print(f"{row['name']:<26} {1e3 * old['wall_time']:>14.1f} {1e3 * new['wall_time']:>13.1f} "
+              f"{row['ratio']:>7.2f}{flag}")
+        for note in row["notes"]:
+            print(f"{'':<28}{note}")
+    missing = sorted(set(baseline["cases"]) ^ set(current["cases"]))
+    if missing:
+        print(f"Only in one of the result sets: {', '.join(missing)}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="list the benchmark cases")
+
+    run = commands.add_parser("run", help="run the benchmark cases")
+    run.add_argument("--cases", nargs="*", help="run only cases whose name contains one of these")
+    run.add_argument("--repeats", type=int, help="timed repeats per case (default: per case)")
+    run.add_argument("--save", metavar="NAME", help="store the results as baselines/NAME.json (or a .json path)")
+    run.add_argument("--no-memory", action="store_true", help="skip the peak-memory measurement")
+
+    cmp = commands.add_parser("compare", help="compare with a baseline; exit status 1 on a regression")
+    cmp.add_argument("baseline", help="baseline name or .json path")
+    cmp.add_argument("current", nargs="?", help="results to compare (default: run the baseline's cases now)")
+    cmp.add_argument("--threshold", type=float, default=0.10, help="relative wall-time increase flagged (0.10)")
+    cmp.add_argument("--repeats", type=int, help="timed repeats per case when running now")
+    cmp.add_argument("--save", metavar="NAME", help="also store the new results")
+    cmp.add_argument("--no-memory", action="store_true", help="skip the peak-memory measurement")
+
+    args = parser.parse_args(argv)
+    if args.command == "list":
+        for case in CASES:
+            print(f"{case.name:<26} {case.description}")
+        return 0
+
+    if args.command == "run":
+        results = run_suite(args.cases, args.repeats, memory=not args.no_memory)
+        if args.save:
+            print(f"Saved to {save_results(results, args.save)}")
+        return 0
+
+    baseline = load_results(args.baseline)
+    if args.current:
+        current = load_results(args.current)
+    else:
+        current = run_suite(list(baseline["cases"]), args.repeats, exact=True, memory=not args.no_memory)
+        if args.save:
+            print(f"Saved to {save_results(current, args.save)}")
+    rows = compare(baseline, current, args.threshold)
+    print_comparison(rows, baseline, current)
+    return 1 if any(row["regression"] for row in rows) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
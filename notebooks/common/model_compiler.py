@@ -0,0 +1,558 @@
+import ast
+import copy
+import hashlib
+import inspect
+import sys
+from collections import OrderedDict
+from functools import lru_cache
+
+import numpy as np
+from scipy.linalg import null_space
+
+
+# --- Symbolic differentiation of rate expressions -----------------------------------------
+#
+# Rate laws are plain Python expressions over species and parameter names, e.g.
+# "a1 * N * I" or "t1 * N * (1 - G)". They are differentiated on their AST; the rules cover
+# + - * / and powers with constant exponents, which is all that mass-action and
+# free-fraction kinetics need.
+
+def _const(value):
+    return ast.Constant(value=float(value))
+
+
+def _is_const(node, value=None):
+    return isinstance(node, ast.Constant) and (value is None or node.value == value)
+
+
+def _add(a, b):
+    if _is_const(a, 0):
+        return b
+    if _is_const(b, 0):
+        return a
+    return ast.BinOp(a, ast.Add(), b)
+
+
+def _sub(a, b):
+    if _is_const(b, 0):
+        return a
+    if _is_const(a, 0):
+        return _neg(b)
+    return ast.BinOp(a, ast.Sub(), b)
+
+
+def _neg(a):
+    if _is_const(a):
+        return _const(-a.value)
+    return ast.UnaryOp(ast.USub(), a)
+
+
+def _mul(a, b):
+    if _is_const(a, 0) or _is_const(b, 0):
+        return _const(0)
+    if _is_const(a, 1):
+        return b
+    if _is_const(b, 1):
+        return a
+    if _is_const(a, -1):
+        return _neg(b)
+    if _is_const(b, -1):
+        return _neg(a)
+    return ast.BinOp(a, ast.Mult(), b)
+
+
+def _div(a, b):
+    if _is_const(a, 0):
+        return _const(0)
+    if _is_const(b, 1):
+        return a
+    return ast.BinOp(a, ast.Div(), b)
+
+
+def _pow(a, n):
+    if n == 0:
+        return _const(1)
+    if n == 1:
+        return a
+    return ast.BinOp(a, ast.Pow(), _const(n))
+
+
+def _derivative(node, var):
+    """d(node)/d(var) as a new AST."""
+    if isinstance(node, ast.Expression):
+        return _derivative(node.body, var)
+    if isinstance(node, ast.Constant):
+        return _const(0)
+    if isinstance(node, ast.Name):
+        return _const(1 if node.id == var else 0)
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+        d = _derivative(node.operand, var)
+        return _neg(d) if isinstance(node.op, ast.USub) else d
+    if isinstance(node, ast.BinOp):
+        a, b = node.left, node.right
+        if isinstance(node.op, ast.Add):
+            return _add(_derivative(a, var), _derivative(b, var))
+        if isinstance(node.op, ast.Sub):
+            return _sub(_derivative(a, var), _derivative(b, var))
+        if isinstance(node.op, ast.Mult):
+            return _add(_mul(_derivative(a, var), b), _mul(a, _derivative(b, var)))
+        if isinstance(node.op, ast.Div):
+            da, db = _derivative(a, var), _derivative(b, var)
+            return _div(_sub(_mul(da, b), _mul(a, db)), _pow(b, 2))
+        if isinstance(node.op, ast.Pow) and _is_const(b):
+            return _mul(_mul(_const(b.value), _pow(a, b.value - 1)), _derivative(a, var))
+    raise ValueError(f"Unsupported expression for differentiation: {ast.unparse(node)}")
+
+
+def _fold(node):
+    expression = ast.fix_missing_locations(ast.Expression(node))
+    return _const(eval(compile(expression, "<fold>", "eval"), {"__builtins__": {}}))
+
+
+class _Bind(ast.NodeTransformer):
+    """Replaces parameter names by their values and folds constant sub-expressions."""
+
+    def __init__(self, values):
+        self.values = values
+
+    def visit_Name(self, node):
+        if node.id in self.values:
+            return _const(self.values[node.id])
+        return node
+
+    def visit_BinOp(self, node):
+        self.generic_visit(node)
+        if _is_const(node.left) and _is_const(node.right):
+            return _fold(node)
+        right = node.right
+        if (isinstance(node.op, ast.Mult) and _is_const(node.left) and isinstance(right, ast.BinOp)
+                and isinstance(right.op, ast.Mult) and _is_const(right.left)):
+            # c1 * (c2 * x) -> (c1 * c2) * x
+            return _mul(_const(node.left.value * right.left.value), right.right)
+        return node
+
+    def visit_UnaryOp(self, node):
+        self.generic_visit(node)
+        if _is_const(node.operand):
+            return _fold(node)
+        return node
+
+
+def differentiate(node, var):
+    """d(node)/d(var) of an expression AST, with constant sub-expressions folded."""
+    return _Bind({}).visit(_derivative(node, var))
+
+
+def bind(node, values):
+    """Copy of an expression AST with the names in `values` replaced by numbers and constants folded."""
+    return _Bind(values).visit(copy.deepcopy(node))
+
+
+def _split_constant(node):
+    """Splits a product into (constant factor, remaining expression)."""
+    factors = []
+
+    def flatten(node):
+        if isinstance(node, ast.BinOp) and isinstance(node.op, ast.Mult):
+            flatten(node.left)
+            flatten(node.right)
+        else:
+            factors.append(node)
+
+    flatten(node)
+    constant, rest = 1.0, _const(1)
+    for factor in factors:
+        if _is_const(factor):
+            constant *= factor.value
+        else:
+            rest = _mul(rest, factor)
+    return constant, rest
+
+
+def _names(node):
+    return {n.id for n in ast.walk(node) if isinstance(n, ast.Name)}
+
+
+# --- Model specification ------------------------------------------------------------------
+
+class Reaction:
+    """One reaction channel: a rate law and the change of each species per unit of rate."""
+
+    def __init__(self, rate, stoichiometry, name=None):
+        self.rate = rate
+        self.stoichiometry = dict(stoichiometry)
+        self.name = name or rate
+        self.tree = ast.parse(rate, mode="eval").body
+
+    def __repr__(self):
+        return f"Reaction({self.rate!r}, {self.stoichiometry!r})"
+
+
+class ModelSpec:
+    """
+    Declarative description of a reaction network.
+
+    Species and parameters are declared once and reactions are added with `reaction`. The
+    spec derives the stoichiometry matrix, the conservation laws and the Jacobian sparsity,
+    and generates flat Python code for the right-hand side and the analytic Jacobian:
+
+    - `compile(params)` binds the parameter values as literal constants (with constant
+      folding) and returns a `CompiledModel` with `rhs(t, y)` and `jac(t, y)` for solve_ivp;
+    - `compile_batch()` keeps the parameters symbolic and returns a `BatchModel` whose
+      functions take a (P, M) parameter matrix and (n, M) state block.
+
+    Example:
+        spec = ModelSpec("decay", species=("A", "B"), parameters=("k",))
+        spec.reaction("k * A", {"A": -1, "B": +1})
+        model = spec.compile({"k": 0.5})
+    """
+
+    def __init__(self, name, species, parameters):
+        self.name = name
+        self.species = tuple(species)
+        self.parameters = tuple(parameters)
+        self.reactions = []
+        self._compiled = OrderedDict()
+        self._batch = None
+
+    def __repr__(self):
+        return (f"ModelSpec({self.name!r}, {len(self.species)} species, {len(self.parameters)} parameters, "
+                f"{len(self.reactions)} reactions)")
+
+    def reaction(self, rate, stoichiometry, name=None):
+        """Adds a reaction with rate law `rate` (expression) and species changes `stoichiometry`."""
+        reaction = Reaction(rate, stoichiometry, name)
+        unknown = _names(reaction.tree) - set(self.species) - set(self.parameters)
+        if unknown:
+            raise ValueError(f"Reaction {reaction.name!r} uses undeclared names: {sorted(unknown)}")
+        unknown = set(reaction.stoichiometry) - set(self.species)
+        if unknown:
+            raise ValueError(f"Reaction {reaction.name!r} changes undeclared species: {sorted(unknown)}")
+        self.reactions.append(reaction)
+        self._compiled.clear()
+        self._batch = None
+        return self
+
+    def extend(self, name, species=(), parameters=()):
+        """Copy of the spec with additional species and parameters, for building model variants."""
+        spec = ModelSpec(name, self.species + tuple(species), self.parameters + tuple(parameters))
+        spec.reactions = copy.deepcopy(self.reactions)
+        return spec
+
+    @property
+    def stoichiometry(self):
+        """Stoichiometry matrix (n_species, n_reactions)."""
+        S = np.zeros((len(self.species), len(self.reactions)))
+        for j, reaction in enumerate(self.reactions):
+            for name, coefficient in reaction.stoichiometry.items():
+                S[self.species.index(name), j] = coefficient
+        return S
+
+    @property
+    def fingerprint(self):
+        """
+        Hash of the network (species, parameters, rate laws and stoichiometry) and of this
+        compiler's source: it changes whenever the code generated from the spec could change,
+        so it belongs in every key of stored results.
+        """
+        h = hashlib.sha256(_compiler_source().encode())
+        h.update(repr((self.name, self.species, self.parameters)).encode())
+        for reaction in self.reactions:
+            h.update(repr((reaction.rate, sorted(reaction.stoichiometry.items()))).encode())
+        return h.hexdigest()
+
+    def conservation_laws(self, tol=1e-10):
+        """
+        Rows c with c · dy/dt = 0 for every rate, i.e. the left null space of the stoichiometry
+        matrix, in reduced row echelon form (so a single law such as total NF-κB comes out
+        as a 0/1 vector).
+        """
+        basis = null_space(self.stoichiometry.T, rcond=tol).T
+        if basis.size == 0:
+            return np.zeros((0, len(self.species)))
+        return _rref(basis, tol)
+
+    def rhs_trees(self, values=None):
+        """
+        AST of dy_i/dt for every species, with `values` bound. Reactions whose rates differ only
+        by a constant factor (e.g. 'a2 * NI' and 'd1 * NI' once a2 and d1 are bound) are merged
+        into one term, so each distinct rate expression is evaluated once per equation.
+        """
+        bind = _Bind(values or {})
+        rates = [_split_constant(bind.visit(copy.deepcopy(reaction.tree))) for reaction in self.reactions]
+        trees = []
+        for name in self.species:
+            terms = OrderedDict()
+            for reaction, (factor, rest) in zip(self.reactions, rates):
+                coefficient = reaction.stoichiometry.get(name, 0)
+                if coefficient:
+                    key = ast.unparse(rest)
+                    previous = terms.get(key, (0.0, rest))[0]
+                    terms[key] = (previous + coefficient * factor, rest)
+            total = _const(0)
+            for factor, rest in terms.values():
+                if factor > 0:
+                    total = _add(total, _mul(_const(factor), rest))
+                elif factor < 0:
+                    total = _sub(total, _mul(_const(-factor), rest))
+            trees.append(total)
+        return trees
+
+    def _jac_trees(self, values=None):
+        """{(i, k): AST of d(dy_i/dt)/d(y_k)} for the non-zero entries, with `values` bound."""
+        fold = _Bind({})
+        entries = {}
+        for i, tree in enumerate(self.rhs_trees(values)):
+            for k, name in enumerate(self.species):
+                if name in _names(tree):
+                    d = fold.visit(_derivative(tree, name))
+                    if not _is_const(d, 0):
+                        entries[(i, k)] = d
+        return entries
+
+    @property
+    def jac_sparsity(self):
+        S = np.zeros((len(self.species),) * 2, dtype=int)
+        for i, k in self._jac_trees():
+            S[i, k] = 1
+        return S
+
+    def source(self, values=None):
+        """
+        Generated module source. With `values` (parameter name -> number) parameters are
+        bound as constants; without them the functions take a parameter vector/matrix `p`.
+
+        A single state (1-D array) is unpacked into Python floats and the Jacobian is built
+        from one flat list, which is what makes the per-call cost low for solve_ivp; a state
+        block (n, M) takes the vectorized path and gives a Jacobian of shape (n, n, M).
+        """
+        n = len(self.species)
+        bound = values is not None
+        signature = "(t, y)" if bound else "(t, y, p)"
+        state = ", ".join(self.species) + ","
+        unpack = []
+        if not bound:
+            unpack.append(f"    {', '.join(self.parameters)}, = p")
+
+        def code(tree):
+            return ast.unparse(ast.fix_missing_locations(tree))
+
+        lines = [f"def rhs{signature}:", *unpack]
+        lines.append("    if type(y) is np.ndarray and y.ndim == 1:")
+        lines.append("        y = y.tolist()")
+        lines.append(f"    {state} = y")
+        lines.append("    return [" + ", ".join(code(tree) for tree in self.rhs_trees(values)) + "]")
+        lines.append("")
+
+        entries = {index: code(tree) for index, tree in self._jac_trees(values).items()}
+        lines += [f"def jac{signature}:", *unpack]
+        if bound:
+            flat = ", ".join(entries.get((i, k), "0.0") for i in range(n) for k in range(n))
+            lines.append("    if type(y) is np.ndarray and y.ndim == 1:")
+            lines.append(f"        {state} = y.tolist()")
+            lines.append(f"        return np.array([{flat}]).reshape({n}, {n})")
+        lines.append(f"    {state} = y")
+        # Unbound parameters may be rows of a (P, M) matrix: they shape the result as well.
+        shaping = self.species if bound else self.species + self.parameters
+        lines.append(f"    J = np.zeros(({n}, {n}) + np.broadcast_shapes(*map(np.shape, ({', '.join(shaping)},))))")
+        for (i, k), expression in sorted(entries.items()):
+            lines.append(f"    J[{i}, {k}] = {expression}")
+        lines.append("    return J")
+        return "\n".join(lines) + "\n"
+
+    def rates_source(self, values=None):
+        """
+        Source of `rates`, the vector of reaction rates (one per reaction, in declaration order).
+        With `values` the parameters are bound as constants (`rates(y)`); without them the
+        function takes the parameter vector/matrix as well (`rates(y, p)`).
+        """
+        bind = _Bind(values or {})
+        expressions = [ast.unparse(ast.fix_missing_locations(bind.visit(copy.deepcopy(reaction.tree))))
+                       for reaction in self.reactions]
+        lines = ["def rates(y):" if values is not None else "def rates(y, p):"]
+        if values is None:
+            lines.append(f"    {', '.join(self.parameters)}, = p")
+        lines.append(f"    {', '.join(self.species)}, = y")
+        lines.append("    return [" + ", ".join(expressions) + "]")
+        return "\n".join(lines) + "\n"
+
+    def compile_rates(self, params=None):
+        """
+        Reaction-rate function, e.g. for stochastic simulation (propensities are volume-scaled
+        rates). With `params` (object or dict) the values are bound: `rates(y)`; without them
+        the function is `rates(y, p)` with p ordered by `parameters`. Works on a single state
+        and on a state block (n, M) alike; returns a list with one entry per reaction.
+        """
+        values = None
+        if params is not None:
+            get = params.get if isinstance(params, dict) else lambda name: getattr(params, name)
+            values = {name: float(get(name)) for name in self.parameters}
+        namespace = {"np": np}
+        exec(compile(self.rates_source(values), f"<{self.name} rates>", "exec"), namespace)
+        return namespace["rates"]
+
+    def param_jac_source(self):
+        """
+        Source of `pjac(t, y, p)`: the derivatives of the right-hand side with respect to the
+        parameters, shape (n_species, n_parameters), for one state and the parameter vector `p`
+        ordered by `parameters` (the forcing term of the forward sensitivity equations).
+        """
+        n, P = len(self.species), len(self.parameters)
+        fold = _Bind({})
+        entries = {}
+        for i, tree in enumerate(self.rhs_trees()):
+            for k, name in enumerate(self.parameters):
+                if name in _names(tree):
+                    d = fold.visit(_derivative(tree, name))
+                    if not _is_const(d, 0):
+                        entries[i * P + k] = ast.unparse(ast.fix_missing_locations(d))
+        flat = ", ".join(entries.get(k, "0.0") for k in range(n * P))
+        lines = ["def pjac(t, y, p):",
+                 f"    {', '.join(self.parameters)}, = p",
+                 f"    {', '.join(self.species)}, = y",
+                 f"    return np.array([{flat}]).reshape({n}, {P})"]
+        return "\n".join(lines) + "\n"
+
+    def compile_param_jac(self):
+        """Generated `pjac(t, y, p)` of `param_jac_source`; pass `y` and `p` as lists of floats for speed."""
+        namespace = {"np": np}
+        exec(compile(self.param_jac_source(), f"<{self.name} pjac>", "exec"), namespace)
+        return namespace["pjac"]
+
+    def param_jvp_source(self):
+        """
+        Source of `pjvp(t, y, p, dp)`: the derivative of the right-hand side along a change
+        `dp` of the parameters, (∂f/∂p) dp, without forming ∂f/∂p (e.g. df/dt for parameters
+        that move in time at the rate dp). Like `compile_batch`, it works on a single state and
+        on a state block (n, M) with (P, M) parameters alike and returns one entry per species.
+        """
+        fold = _Bind({})
+        expressions = []
+        for tree in self.rhs_trees():
+            terms = []
+            for name in self.parameters:
+                if name in _names(tree):
+                    d = fold.visit(_derivative(tree, name))
+                    if not _is_const(d, 0):
+                        terms.append(f"({ast.unparse(ast.fix_missing_locations(d))}) * d_{name}")
+            # A zero row still takes the shape of the states.
+            expressions.append(" + ".join(terms) if terms else f"0.0 * {self.species[0]}")
+        lines = ["def pjvp(t, y, p, dp):",
+                 f"    {', '.join(self.parameters)}, = p",
+                 f"    {', '.join('d_' + name for name in self.parameters)}, = dp",
+                 f"    {', '.join(self.species)}, = y",
+                 "    return [" + ", ".join(expressions) + "]"]
+        return "\n".join(lines) + "\n"
+
+    def compile_param_jvp(self):
+        """Generated `pjvp(t, y, p, dp)` of `param_jvp_source`."""
+        namespace = {"np": np}
+        exec(compile(self.param_jvp_source(), f"<{self.name} pjvp>", "exec"), namespace)
+        return namespace["pjvp"]
+
+    def _exec(self, values=None):
+        namespace = {"np": np}
+        exec(compile(self.source(values), f"<{self.name}>", "exec"), namespace)
+        return namespace["rhs"], namespace["jac"]
+
+    def compile(self, params, cache_size=64):
+        """
+        Returns a `CompiledModel` with the current values of `params` (an object with one
+        attribute per parameter, or a dict) bound as constants. Compilations are cached by
+        parameter values, so calling this for every simulation is cheap.
+        """
+        get = params.get if isinstance(params, dict) else lambda name: getattr(params, name)
+        values = tuple(float(get(name)) for name in self.parameters)
+        compiled = self._compiled.get(values)
+        if compiled is None:
+            rhs, jac = self._exec(dict(zip(self.parameters, values)))
+            compiled = CompiledModel(self, rhs, jac, params)
+            self._compiled[values] = compiled
+            while len(self._compiled) > cache_size:
+                self._compiled.popitem(last=False)
+        else:
+            self._compiled.move_to_end(values)
+        return compiled
+
+    def compile_batch(self):
+        """Returns the `BatchModel` (parameters passed at call time as a (P, M) matrix)."""
+        if self._batch is None:
+            self._batch = BatchModel(self, *self._exec())
+        return self._batch
+
+
+@lru_cache(maxsize=None)
+def _compiler_source():
+    return inspect.getsource(sys.modules[__name__])
+
+
+def _rref(A, tol):
+    A = np.array(A, dtype=float)
+    row = 0
+    for col in range(A.shape[1]):
+        if row == A.shape[0]:
+            break
+        pivot = row + np.argmax(np.abs(A[row:, col]))
+        if abs(A[pivot, col]) < tol:
+            continue
+        A[[row, pivot]] = A[[pivot, row]]
+        A[row] /= A[row, col]
+        for other in range(A.shape[0]):
+            if other != row:
+                A[other] -= A[other, col] * A[row]
+        row += 1
+    A[np.abs(A) < tol] = 0.0
+    return A[:row]
+
+
+class CompiledModel:
+    """
+    Generated RHS and Jacobian of a `ModelSpec` with parameters bound as constants.
+
+    Exposes the same interface as the hand-written systems (`rhs`, `jac`, `p`, `JAC_SPARSITY`,
+    `CONSERVATION`), so it can be handed to the simulators and solvers in place of them.
+    """
+
+    def __init__(self, spec, rhs, jac, params):
+        self.spec = spec
+        self.rhs = rhs
+        self.jac = jac
+        # A copy: compilations are shared by parameter value, the caller's set may change later.
+        self.p = copy.deepcopy(params)
+        self.JAC_SPARSITY = spec.jac_sparsity
+        laws = spec.conservation_laws()
+        self.CONSERVATION = laws[0] if len(laws) == 1 else laws
+
+    def __repr__(self):
+        return f"CompiledModel({self.spec.name!r})"
+
+    def compiled(self):
+        return self
+
+
+class BatchModel:
+    """Generated `rhs(t, y, p)` and `jac(t, y, p)` taking a (P, M) parameter matrix ordered by `spec.parameters`."""
+
+    def __init__(self, spec, rhs, jac):
+        self.spec = spec
+        self.rhs = rhs
+        self.jac = jac
+
+    def bind(self, param_matrix):
+        """System-like object with `rhs(t, y)` and `jac(t, y)` for one parameter matrix."""
+        return _BoundBatch(self, np.asarray(param_matrix, dtype=float))
+
+
+class _BoundBatch:
+    def __init__(self, batch, param_matrix):
+        self._batch = batch
+        self.param_matrix = param_matrix
+
+    def rhs(self, t, y):
+        return self._batch.rhs(t, y, self.param_matrix)
+
+    def jac(self, t, y):
+        return self._batch.jac(t, y, self.param_matrix)
+
+    def compiled(self):
+        return self
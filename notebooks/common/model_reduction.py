@@ -0,0 +1,582 @@
+import ast
+import copy
+import time
+
+import numpy as np
+from scipy.integrate import solve_ivp
+from scipy.linalg import null_space, orth
+from scipy.optimize import OptimizeResult
+
+from model_compiler import bind, differentiate
+
+
+# --- Timescale analysis ------------------------------------------------------------------------
+
+def _spectrum(J, tol=1e-10):
+    """
+    Relaxation rates |Re λ| of a Jacobian in decreasing order, with the participation (n, n)
+    of every species in every mode (columns in the same order, each summing to one).
+    Conservation laws give (numerically) zero eigenvalues; their rates are set to exactly 0.
+    """
+    w, U = np.linalg.eig(J)
+    V = np.linalg.inv(U)
+    rates = np.abs(w.real)
+    rates[rates < tol * max(rates.max(), 1.0)] = 0.0
+    order = np.argsort(-rates)
+    participation = np.abs(U * V.T)[:, order]
+    participation /= np.maximum(participation.sum(axis=0), 1e-300)
+    return rates[order], participation
+
+
+def timescale_analysis(spec, params, states, min_gap=5.0):
+    """
+    Splits a model into fast and slow parts from the spectrum of its Jacobian along a set of
+    states (e.g. the output of a reference simulation).
+
+    At every state the eigenvalues are sorted by relaxation rate |Re λ|. The number of fast
+    modes r is the position of the widest gap that holds at all states: the gap is the
+    smallest ratio |λ_r| / |λ_{r+1}| over the states, and r is only accepted when it reaches
+    `min_gap`. The fast species are the r species with the largest share in the fast modes
+    (participation index |u_ik v_ki| of right and left eigenvectors, averaged over the
+    states). Reactions are ranked by their relaxation rate max_i |S_ij ∂v_j/∂y_i| (median over
+    the states); the fast reactions are the fastest ones whose stoichiometry spans r
+    independent directions.
+
+    Args:
+        spec (ModelSpec): Model.
+        params: Parameter values (object or dict, see `ModelSpec.compile`).
+        states (np.ndarray): States (n, K).
+        min_gap (float): Smallest accepted ratio between the slowest fast and the fastest
+                         slow rate.
+
+    Returns:
+        OptimizeResult: `rates` (K, n) sorted relaxation rates, `n_fast`, `gap`, `threshold`
+                        (rate in the middle of the gap), `participation` {species: mean share
+                        in the fast modes}, `fast_species`, `slow_species`, `reaction_rates`
+                        {reaction name: rate} and `fast_reactions`.
+    """
+    model = spec.compile(params)
+    states = np.atleast_2d(np.asarray(states, dtype=float).T).T
+    n, K = states.shape
+    spectra = [_spectrum(np.asarray(model.jac(0.0, states[:, k]), dtype=float)) for k in range(K)]
+    rates = np.array([rates for rates, _ in spectra])
+
+    n_active = np.count_nonzero(rates > 0, axis=1).min()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        gaps = np.min(rates[:, :n_active - 1] / rates[:, 1:n_active], axis=0) if n_active > 1 else np.zeros(0)
+    n_fast = int(np.argmax(gaps)) + 1 if gaps.size and gaps.max() >= min_gap else 0
+    gap = float(gaps[n_fast - 1]) if n_fast else (float(gaps.max()) if gaps.size else 1.0)
+    threshold = float(np.sqrt(rates[:, n_fast - 1].min() * rates[:, n_fast].max())) if n_fast else np.inf
+
+    share = np.mean([participation[:, :n_fast].sum(axis=1) for _, participation in spectra], axis=0)
+    fast = sorted(np.argsort(-share)[:n_fast])
+
+    # Relaxation rate of every reaction on its own, from finite differences of the rate laws.
+    rate_laws = spec.compile_rates(params)
+    S = spec.stoichiometry
+    per_state = []
+    for k in range(K):
+        y = states[:, k]
+        v = np.asarray(rate_laws(y), dtype=float)
+        dv = np.empty((len(spec.reactions), n))
+        for i in range(n):
+            h = 1e-7 * max(abs(y[i]), 1e-3)
+            shifted = y.copy()
+            shifted[i] += h
+            dv[:, i] = (np.asarray(rate_laws(shifted), dtype=float) - v) / h
+        per_state.append(np.max(np.abs(S.T * dv), axis=1))
+    reaction_rates = np.median(per_state, axis=0)
+    names = [reaction.name for reaction in spec.reactions]
+
+    # Fastest reactions whose stoichiometry spans exactly the n_fast fast directions.
+    fast_reactions = []
+    for j in np.argsort(-reaction_rates):
+        if len(fast_reactions) == n_fast:
+            break
+        if np.linalg.matrix_rank(S[:, fast_reactions + [j]]) > len(fast_reactions):
+            fast_reactions.append(j)
+
+    return OptimizeResult(rates=rates, n_fast=n_fast, gap=gap, threshold=threshold,
+                          participation=dict(zip(spec.species, share)),
+                          fast_species=tuple(spec.species[i] for i in fast),
+                          slow_species=tuple(name for i, name in enumerate(spec.species) if i not in fast),
+                          reaction_rates=dict(zip(names, reaction_rates)),
+                          fast_reactions=tuple(names[j] for j in sorted(fast_reactions)))
+
+
+# --- Reduced model -----------------------------------------------------------------------------
+
+def _degree(node, variables):
+    """Polynomial degree of a rate expression in `variables` (inf where it is not a polynomial in them)."""
+    if isinstance(node, ast.Name):
+        return 1 if node.id in variables else 0
+    if isinstance(node, ast.UnaryOp):
+        return _degree(node.operand, variables)
+    if isinstance(node, ast.BinOp):
+        a, b = _degree(node.left, variables), _degree(node.right, variables)
+        if a == 0 and b == 0:
+            return 0
+        if isinstance(node.op, (ast.Add, ast.Sub)):
+            return max(a, b)
+        if isinstance(node.op, ast.Mult):
+            return a + b
+        if isinstance(node.op, ast.Div) and b == 0:
+            return a
+        if (isinstance(node.op, ast.Pow) and isinstance(node.right, ast.Constant)
+                and float(node.right.value).is_integer() and node.right.value >= 0):
+            return a * int(node.right.value)
+        return np.inf
+    if isinstance(node, ast.Constant):
+        return 0
+    return np.inf if variables & {n.id for n in ast.walk(node) if isinstance(n, ast.Name)} else 0
+
+
+def _reverse_reactions(spec, indices):
+    """Indices of the reactions whose stoichiometry is opposite to that of one of `indices`."""
+    S = spec.stoichiometry
+    unit = S / np.maximum(np.linalg.norm(S, axis=0), 1e-300)
+    return [k for k in range(S.shape[1]) if any(np.allclose(unit[:, k], -unit[:, j]) for j in indices)]
+
+
+class _Substitute(ast.NodeTransformer):
+    """Replaces names by expressions."""
+
+    def __init__(self, expressions):
+        self.expressions = expressions
+
+    def visit_Name(self, node):
+        return copy.deepcopy(self.expressions.get(node.id, node))
+
+
+def _closed_form_source(spec, constraint_spec, values, L, L_pinv, P, Q):
+    """
+    Source of `manifold(z)` and `rhs(t, z)` of a reduction with one eliminated direction
+    (y = L⁺ z + p w) whose constraint c(w) = Q g(L⁺ z + p w) is at most quadratic in w.
+    Of the roots of c, the stable one is taken (c'(w) / (Q p) < 0, the fast mode decays):
+    w = 2γ / (sqrt(β² - 4αγ) - β) for c = αw² + βw + γ, which is also the root when α = 0.
+    Like the generated full model, both functions work on a single z and on a block (m, K).
+    """
+    species, p = spec.species, P[:, 0]
+    slow = [f"_z{j}" for j in range(L.shape[0])]
+
+    def linear(coefficients, names):
+        terms = [f"{float(c)!r} * {name}" for c, name in zip(coefficients, names) if abs(c) > 1e-14]
+        return " + ".join(terms) or "0.0"
+
+    # Every species is its base value plus its share of w; c(w) follows by substitution.
+    shifted = [f"_b_{name} + {float(p[i])!r} * _w" if abs(p[i]) > 1e-14 else f"_b_{name}"
+               for i, name in enumerate(species)]
+    moved = {name: ast.parse(expression, mode="eval").body for name, expression in zip(species, shifted)}
+    sign = 1.0 / float(Q[0] @ p)
+    c = ast.Constant(value=0.0)
+    for q, tree in zip(Q[0], constraint_spec.rhs_trees(values)):
+        if abs(q) > 1e-14:
+            c = ast.BinOp(c, ast.Add(), ast.BinOp(ast.Constant(value=float(q) * sign), ast.Mult(), tree))
+    c = _Substitute(moved).visit(c)
+    dc = differentiate(c, "_w")
+    gamma, beta = bind(c, {"_w": 0.0}), bind(dc, {"_w": 0.0})
+    alpha = bind(ast.BinOp(ast.Constant(value=0.5), ast.Mult(), differentiate(dc, "_w")), {"_w": 0.0})
+    if isinstance(alpha, ast.Constant) and alpha.value == 0:
+        root = "-_gamma / _beta"
+    else:
+        root = "2.0 * _gamma / (np.sqrt(_beta * _beta - 4.0 * _alpha * _gamma) - _beta)"
+
+    def code(tree):
+        return ast.unparse(ast.fix_missing_locations(tree))
+
+    prelude = ["    if type(z) is np.ndarray and z.ndim == 1:",
+               "        z = z.tolist()",
+               f"    {', '.join(slow)}, = z"]
+    prelude += [f"    _b_{name} = {linear(L_pinv[i], slow)}" for i, name in enumerate(species)]
+    prelude += [f"    _gamma = {code(gamma)}", f"    _beta = {code(beta)}", f"    _alpha = {code(alpha)}",
+                f"    _w = {root}"]
+    prelude += [f"    {name} = {expression}" for name, expression in zip(species, shifted)]
+    f = [code(tree) for tree in spec.rhs_trees(values)]
+    lines = ["def manifold(z):", *prelude, f"    return [{', '.join(species)}]", "",
+             "def rhs(t, z):", *prelude,
+             "    return [" + ", ".join(linear(row, [f"({e})" for e in f]) for row in L) + "]"]
+    return "\n".join(lines) + "\n"
+
+
+class ReducedModel:
+    """
+    Model with its fast variables eliminated.
+
+    The slow coordinates z = L y obey dz/dt = L f(y*(z)), where y*(z) is the full state on
+    the slow manifold: y* = L⁺ z + P w with P spanning the eliminated directions (L P = 0),
+    and w the root of the r algebraic constraints Q g(y) = 0. Two kinds of constraints are
+    available:
+
+    - "qss" (quasi-steady state), g = f: with fast species Q selects them and the slow
+      coordinates are the remaining species; with fast reactions Q spans their stoichiometry
+      (the extents of the fast reactions are steady) and the slow coordinates are the
+      quantities the fast reactions conserve (e.g. N + NI and I + NI for a fast binding
+      N + I -> NI). The second form is the right one when a fast mode moves several species
+      together, as a fast binding does.
+    - "equilibrium" (rapid equilibrium), g = the part of f due to the fast reactions: the
+      fast reactions are balanced on their own, so every one of them needs its reverse
+      reaction among the fast ones; same Q and L as above.
+
+    With a single eliminated direction and constraints at most quadratic along it
+    (`closed_form`, e.g. a fast binding N + I -> NI or the QSS of one species), y*(z) is the
+    stable root of the quadratic: it is substituted into the rate laws and the reduced
+    right-hand side is generated as code, as cheap per call as the full model's. When every
+    rate law in the constraints is at most linear in the species that P moves (`affine`), w
+    follows from one linear solve; otherwise by Newton's method warm-started from the
+    previous call. The reduced system has no fast timescale left, so it can be integrated
+    with an explicit method when the gap is wide. Its Jacobian is exact: dz'/dz = L J (dy*/dz), with dy*/dz from
+    the implicit function theorem.
+
+    Args:
+        spec (ModelSpec): Full model.
+        params: Parameter values (object or dict, see `ModelSpec.compile`).
+        method (str): "qss" or "equilibrium".
+        fast_species (sequence of str): Eliminated species ("qss").
+        fast_reactions (sequence of str or int): Names or indices of the fast reactions
+                                                 (instead of `fast_species`).
+        newton_tol (float): Relative tolerance of the manifold solve.
+        max_iter (int): Newton iterations per manifold solve.
+    """
+
+    def __init__(self, spec, params, method="qss", fast_species=(), fast_reactions=(), newton_tol=1e-12,
+                 max_iter=50):
+        self.spec = spec
+        self.params = copy.deepcopy(params)
+        self.method = method
+        self.full = spec.compile(params)
+        n = len(spec.species)
+        if method not in ("qss", "equilibrium"):
+            raise ValueError(f"Unknown reduction '{method}', use 'qss' or 'equilibrium'.")
+        if bool(fast_species) == bool(fast_reactions) or (method == "equilibrium" and fast_species):
+            raise ValueError("Give either fast species ('qss') or fast reactions ('qss' or 'equilibrium').")
+        constraint_spec = spec
+        if fast_species:
+            unknown = set(fast_species) - set(spec.species)
+            if unknown:
+                raise ValueError(f"Unknown species {sorted(unknown)}, the model has {list(spec.species)}")
+            fast = [spec.species.index(name) for name in fast_species]
+            slow = [i for i in range(n) if i not in fast]
+            self.L = np.eye(n)[slow]
+            self.Q = np.eye(n)[fast]
+            self.constraint = self.full
+            self.slow_variables = tuple(spec.species[i] for i in slow)
+        else:
+            names = [reaction.name for reaction in spec.reactions]
+            idx = [name if isinstance(name, int) else names.index(name) for name in fast_reactions]
+            if method == "equilibrium":
+                irreversible = [names[j] for j in idx if not set(_reverse_reactions(spec, [j])) & set(idx)]
+                if irreversible:
+                    raise ValueError(f"'equilibrium' needs reversible fast reactions; no reverse reaction for "
+                                     f"{irreversible} among them")
+            fast_part = spec.extend(f"{spec.name} (fast reactions)")
+            fast_part.reactions = [fast_part.reactions[j] for j in idx]
+            self.Q = orth(fast_part.stoichiometry).T
+            self.L = fast_part.conservation_laws()
+            if method == "qss":
+                self.constraint = self.full
+            else:
+                self.constraint = fast_part.compile(params)
+                constraint_spec = fast_part
+            self.slow_variables = tuple(_combination(row, spec.species) for row in self.L)
+        self.n_slow = self.L.shape[0]
+        self.P = null_space(self.L)
+        self.L_pinv = np.linalg.pinv(self.L)
+        moving = {name for name, row in zip(spec.species, self.P) if np.any(np.abs(row) > 1e-12)}
+        # Only the reactions that change the constrained combinations Q y enter the constraints.
+        enters = np.any(np.abs(self.Q @ constraint_spec.stoichiometry) > 1e-12, axis=0)
+        degree = max([_degree(reaction.tree, moving) for reaction, used in zip(constraint_spec.reactions, enters)
+                      if used], default=0)
+        self.affine = degree <= 1
+        # One eliminated direction and an at most quadratic constraint: y*(z) in closed form, generated.
+        self.closed_form = self.P.shape[1] == 1 and degree <= 2
+        if self.closed_form:
+            values = _parameter_values(spec, params)
+            namespace = {"np": np}
+            exec(compile(_closed_form_source(spec, constraint_spec, values, self.L, self.L_pinv, self.P, self.Q),
+                         f"<{spec.name} reduced>", "exec"), namespace)
+            self._manifold, self._rhs = namespace["manifold"], namespace["rhs"]
+        self.newton_tol = newton_tol
+        self.max_iter = max_iter
+        self._w = np.zeros(self.P.shape[1])
+        self.n_newton = 0
+
+    def __repr__(self):
+        return f"ReducedModel({self.spec.name!r}, {self.method}, slow: {', '.join(self.slow_variables)})"
+
+    def manifold(self, z, guess=None):
+        """
+        Full state y*(z) on the slow manifold (raises FloatingPointError if there is none). With
+        a closed form z may also be a block (m, K) of slow states.
+        """
+        if self.closed_form:
+            y = np.array(np.broadcast_arrays(*self._manifold(np.asarray(z, dtype=float))))
+            if not np.all(np.isfinite(y)):
+                raise FloatingPointError("No stable state on the slow manifold")
+            return y
+        base = self.L_pinv @ np.asarray(z, dtype=float)
+        w = self._w if guess is None else self.P.T @ np.asarray(guess, dtype=float)
+        for _ in range(1 if self.affine else self.max_iter):
+            self.n_newton += 1
+            y = base + self.P @ w
+            residual = self.Q @ np.asarray(self.constraint.rhs(0.0, y), dtype=float)
+            A = self.Q @ np.asarray(self.constraint.jac(0.0, y), dtype=float) @ self.P
+            with np.errstate(divide="ignore", invalid="ignore"):
+                try:
+                    dw = residual / A[0, 0] if A.shape == (1, 1) else np.linalg.solve(A, residual)
+                except np.linalg.LinAlgError:
+                    break
+            if not np.all(np.isfinite(dw)):
+                break
+            w = w - dw
+            if self.affine or np.max(np.abs(dw)) <= self.newton_tol * (1.0 + np.max(np.abs(w))):
+                self._w = w
+                return base + self.P @ w
+        raise FloatingPointError("Newton iteration for the slow manifold did not converge")
+
+    def rhs(self, t, z):
+        if self.closed_form:
+            return self._rhs(t, z)
+        try:
+            y = self.manifold(z)
+        except FloatingPointError:
+            return np.full(self.n_slow, np.nan)
+        return self.L @ np.asarray(self.full.rhs(t, y), dtype=float)
+
+    def _tangent(self, y):
+        """dy*/dz (n, m) = L⁺ + P dw/dz, with dw/dz = -(Q ∂g/∂y P)⁻¹ Q ∂g/∂y L⁺."""
+        Jg = self.Q @ np.asarray(self.constraint.jac(0.0, y), dtype=float)
+        return self.L_pinv - self.P @ np.linalg.solve(Jg @ self.P, Jg @ self.L_pinv)
+
+    def jac(self, t, z):
+        y = self.manifold(z)
+        return self.L @ np.asarray(self.full.jac(t, y), dtype=float) @ self._tangent(y)
+
+    def project(self, y0):
+        """Slow coordinates of a full state, and the state on the manifold with the same z."""
+        y0 = np.asarray(y0, dtype=float)
+        z0 = self.L @ y0
+        return z0, self.manifold(z0, guess=y0)
+
+    def error_estimate(self, y):
+        """
+        First-order estimate of the distance of a manifold state y* from the true slow
+        manifold, δ (n,): along an exact slow trajectory the constraints are not zero but equal
+        Q (dy/dt - (f - g)), so δ solves [L; Q ∂g/∂y] δ = [0; Q (dy*/dt - (f - g))(y*)]
+        with dy*/dt = (dy*/dz) dz/dt. A block of states (n, K) gives δ of shape (n, K).
+        """
+        y = np.asarray(y, dtype=float)
+        Y = y.reshape(y.shape[0], -1)
+        f = np.array(np.broadcast_arrays(*self.full.rhs(0.0, Y)), dtype=float).T
+        g = np.array(np.broadcast_arrays(*self.constraint.rhs(0.0, Y)), dtype=float).T
+        Jg = self.Q @ np.moveaxis(np.asarray(self.constraint.jac(0.0, Y), dtype=float), -1, 0)
+        tangent = self.L_pinv - self.P @ np.linalg.solve(Jg @ self.P, Jg @ self.L_pinv)
+        dy = (tangent @ (f @ self.L.T)[:, :, None])[:, :, 0]
+        rhs = np.concatenate([np.zeros((Y.shape[1], self.n_slow)), (dy - (f - g)) @ self.Q.T], axis=1)
+        A = np.concatenate([np.broadcast_to(self.L, (Y.shape[1],) + self.L.shape), Jg], axis=1)
+        return np.linalg.solve(A, rhs[:, :, None])[:, :, 0].T.reshape(y.shape)
+
+    def oscillatory(self, z, duration, n_samples=20):
+        """
+        True when the reduced dynamics oscillates along the slow coordinates z (m, T): at one
+        of `n_samples` evenly spaced states the reduced Jacobian has a complex eigenvalue
+        whose period 2π / |Im λ| fits into `duration`, damped or not.
+        """
+        z = np.atleast_2d(np.asarray(z, dtype=float).T).T
+        for k in np.unique(np.linspace(0, z.shape[1] - 1, n_samples).astype(int)):
+            try:
+                eigenvalues = np.linalg.eigvals(self.jac(0.0, z[:, k]))
+            except (FloatingPointError, np.linalg.LinAlgError):
+                continue
+            if np.any(np.abs(eigenvalues.imag) * duration >= 2 * np.pi):
+                return True
+        return False
+
+    def simulate(self, t_span, y0, t_eval=None, method="LSODA", rtol=1e-6, atol=1e-9, tolerance=0.05,
+                 verify="auto", fallback=False, full_method="LSODA"):
+        """
+        Integrates the reduced model and checks it a posteriori.
+
+        Along the output the first-order distance to the true slow manifold (`error_estimate`)
+        is evaluated and scaled by the range of every species; this check costs no
+        simulation. The estimate is local, though: on oscillating solutions the reduced model
+        can drift in phase although every state stays close to the manifold. So with
+        `verify="auto"` the full model is integrated as well whenever the reduced dynamics
+        oscillates (`oscillatory`), and the actual error (after the initial layer, in which
+        the state falls onto the manifold) is reported; `verify=True` always does it, False
+        never. The reduction is `accurate` when the estimate and, where verified, the actual
+        error stay below `tolerance`. With `fallback` the full solution is returned whenever
+        the reduction is not accurate (or y0 has no state on the manifold).
+
+        Args:
+            t_span (tuple): Integration interval.
+            y0 (array_like): Full initial state; its slow coordinates are kept.
+            t_eval (array_like, optional): Output times; defaults to 1001 points.
+            method (str): solve_ivp method of the reduced system (the exact reduced Jacobian
+                          is passed to the implicit ones). LSODA by default: eliminating the
+                          fastest mode does not always remove all the stiffness.
+            rtol, atol (float): Tolerances.
+            tolerance (float): Accepted scaled error.
+            verify (bool or "auto"): Also run the full model and check the actual error.
+            fallback (bool): Return the full model's solution when the reduction is not accurate.
+            full_method (str): Method of the full model.
+
+        Returns:
+            OptimizeResult: `t`, `y` (n, T) full state, `z` (m, T) slow coordinates,
+                            `slow_variables`, `used` ("reduced" or "full"), `success`,
+                            `message`, `nfev`, `error_estimate` {species: scaled estimate},
+                            `max_error_estimate`, `oscillatory`, `verified`, `accurate`,
+                            `wall_time`; when the full model was run also `error` {species:
+                            scaled actual error}, `max_error`, `t_layer`, `full_nfev` and
+                            `full_wall_time`.
+        """
+        start = time.perf_counter()
+        t_eval = np.linspace(t_span[0], t_span[1], 1001) if t_eval is None else np.asarray(t_eval, dtype=float)
+        y0 = np.asarray(y0, dtype=float)
+        n = len(self.spec.species)
+        y = np.full((n, t_eval.size), np.nan)
+        estimate = np.full(n, np.inf)
+        try:
+            z0, y_start = self.project(y0)
+        except FloatingPointError:
+            sol = OptimizeResult(t=np.zeros(0), y=np.zeros((self.n_slow, 0)), success=False, nfev=0,
+                                 message="The initial state has no counterpart on the slow manifold.")
+        else:
+            options = {"jac": self.jac} if method in ("LSODA", "BDF", "Radau") else {}
+            sol = solve_ivp(self.rhs, t_span, z0, method=method, t_eval=t_eval, rtol=rtol, atol=atol, **options)
+            self._w = self.P.T @ y_start
+            if self.closed_form and sol.t.size:
+                y[:, :sol.t.size] = self.manifold(sol.y)
+            else:
+                for k in range(sol.t.size):
+                    y[:, k] = self.manifold(sol.y[:, k])
+            if sol.t.size:
+                delta = self.error_estimate(y[:, :sol.t.size])
+                scale = np.maximum(np.nanmax(np.abs(y), axis=1), atol)
+                estimate = np.nanmax(np.abs(delta) / scale[:, None], axis=1)
+        max_estimate = float(np.max(estimate))
+        oscillatory = bool(sol.success and self.oscillatory(sol.y, t_span[1] - t_span[0]))
+        result = OptimizeResult(t=t_eval, y=y, z=sol.y, slow_variables=self.slow_variables, used="reduced",
+                                success=sol.success, message=sol.message, nfev=sol.nfev,
+                                error_estimate=dict(zip(self.spec.species, estimate)),
+                                max_error_estimate=max_estimate, oscillatory=oscillatory,
+                                verified=bool(verify is True or (verify == "auto" and oscillatory)),
+                                accurate=bool(sol.success and max_estimate <= tolerance),
+                                wall_time=time.perf_counter() - start)
+
+        if result.verified or (fallback and not result.accurate):
+            start = time.perf_counter()
+            full = solve_ivp(self.full.rhs, t_span, y0, method=full_method, t_eval=t_eval, jac=self.full.jac,
+                             rtol=rtol, atol=atol)
+            result.full_wall_time = time.perf_counter() - start
+            result.full_nfev = full.nfev
+            result.t_layer = self._initial_layer(y[:, 0] if sol.t.size else y0, t_span)
+            after = t_eval >= t_span[0] + result.t_layer
+            if full.success and sol.success and np.any(after):
+                scale = np.maximum(np.max(np.abs(full.y), axis=1), atol)
+                error = np.max(np.abs(y[:, after] - full.y[:, after]), axis=1) / scale
+            else:
+                error = np.full(n, np.nan)
+            result.error = dict(zip(self.spec.species, error))
+            result.max_error = float(np.max(error))
+            if result.verified:
+                result.accurate = bool(result.accurate and result.max_error <= tolerance)
+            if fallback and not result.accurate:
+                result.update(y=full.y, used="full", success=full.success, message=full.message)
+        return result
+
+    def _initial_layer(self, y, t_span):
+        """Ten times the slowest eliminated timescale at y: the time the state needs to reach the manifold."""
+        rates, _ = _spectrum(np.asarray(self.full.jac(0.0, y), dtype=float))
+        n_fast = self.Q.shape[0]
+        slowest_fast = rates[n_fast - 1] if rates[n_fast - 1] > 0 else np.inf
+        return min(10.0 / slowest_fast, 0.1 * (t_span[1] - t_span[0]))
+
+
+def _parameter_values(spec, params):
+    get = params.get if isinstance(params, dict) else lambda name: getattr(params, name)
+    return {name: float(get(name)) for name in spec.parameters}
+
+
+def as_reduced(spec, params, reduced):
+    """
+    The `ReducedModel` selected by the `reduced` option of the simulators: a `ReducedModel`
+    is used as it is, a dict of `ReducedModel` keyword arguments (e.g. {"fast_reactions":
+    ["a1 * N * I"]}) is reduced for `params`.
+
+    Raises:
+        ValueError: When a given `ReducedModel` was built for another model or other
+                    parameter values than `spec` and `params`.
+    """
+    if not isinstance(reduced, ReducedModel):
+        return ReducedModel(spec, params, **reduced)
+    if reduced.spec is not spec and reduced.spec.fingerprint != spec.fingerprint:
+        raise ValueError(f"The reduced model was built for the model {reduced.spec.name!r} "
+                         f"({', '.join(reduced.spec.species)}), not for {spec.name!r} ({', '.join(spec.species)}).")
+    current, built = _parameter_values(spec, params), _parameter_values(spec, reduced.params)
+    changed = [name for name in spec.parameters if current[name] != built[name]]
+    if changed:
+        raise ValueError(f"The reduced model was built for other values of {changed}; reduce the current system "
+                         f"again (e.g. pass the options as a dict).")
+    return reduced
+
+
+def _combination(coefficients, names):
+    """'N - I' for the row (0, 1, -1) over (K, N, I)."""
+    text = ""
+    for c, name in zip(coefficients, names):
+        if abs(c) > 1e-12:
+            sign = "-" if c < 0 else "+"
+            size = "" if np.isclose(abs(c), 1.0) else f"{abs(c):.3g}*"
+            text += f" {sign} {size}{name}" if text else f"{'-' if c < 0 else ''}{size}{name}"
+    return text
+
+
+def reduce_model(spec, params, states, method="qss", by="auto", min_gap=5.0, tolerance=0.05, **options):
+    """
+    `ReducedModel` with the fast part found by `timescale_analysis` of `states`.
+
+    A fast mode may be carried by single species (a fast turnover) or move several species
+    together (a fast binding); `by` selects the fast species ("species", "qss" only), the
+    fast reactions ("reactions") or, with "auto", whichever of the two has the smaller
+    `error_estimate` on the given states (scaled by the range of every species). For
+    "equilibrium" the reverse reactions of the fast ones are added to them. The analysis is
+    attached as `analysis`, the estimates of the candidates as `candidates`.
+
+    Raises:
+        ValueError: When the spectrum has no gap of at least `min_gap`, when an "equilibrium"
+                    reduction has irreversible fast reactions, or when even the best candidate's
+                    estimate exceeds `tolerance`.
+    """
+    analysis = timescale_analysis(spec, params, states, min_gap=min_gap)
+    if analysis.n_fast == 0:
+        raise ValueError(f"No timescale separation of at least {min_gap:g} (widest gap {analysis.gap:.3g}).")
+    if by not in ("auto", "species", "reactions"):
+        raise ValueError(f"Unknown selection '{by}', use 'auto', 'species' or 'reactions'.")
+    kinds = ["species", "reactions"] if by == "auto" and method == "qss" else [by if by != "auto" else "reactions"]
+    fast_reactions = list(analysis.fast_reactions)
+    if method == "equilibrium":
+        names = [reaction.name for reaction in spec.reactions]
+        fast = [names.index(name) for name in fast_reactions]
+        fast_reactions = [names[j] for j in sorted(set(fast) | set(_reverse_reactions(spec, fast)))]
+    states = np.atleast_2d(np.asarray(states, dtype=float).T).T
+    scale = np.maximum(np.max(np.abs(states), axis=1), 1e-12)
+    candidates = {}
+    for kind in kinds:
+        if kind == "species":
+            reduced = ReducedModel(spec, params, method, fast_species=analysis.fast_species, **options)
+        else:
+            reduced = ReducedModel(spec, params, method, fast_reactions=fast_reactions, **options)
+        try:
+            estimate = max(np.max(np.abs(reduced.error_estimate(reduced.project(y)[1])) / scale) for y in states.T)
+        except (FloatingPointError, np.linalg.LinAlgError):
+            estimate = np.inf
+        candidates[kind] = (float(estimate), reduced)
+    kind = min(candidates, key=lambda name: candidates[name][0])
+    estimate, reduced = candidates[kind]
+    summary = ", ".join(f"{name}: {value:.3g}" for name, (value, _) in candidates.items())
+    if not estimate <= tolerance:
+        raise ValueError(f"No accurate {method} reduction: smallest error estimate {estimate:.3g} exceeds the "
+                         f"tolerance {tolerance:g} ({summary}).")
+    reduced.analysis = analysis
+    reduced.candidates = {name: value for name, (value, _) in candidates.items()}
+    return reduced
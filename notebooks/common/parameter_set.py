@@ -0,0 +1,196 @@
+import numpy as np
+
+
+class ParameterSet:
+    """
+    Model parameters stored in one NumPy array, with named attribute access.
+
+    Subclasses declare the parameters and their defaults in `DEFAULTS` ({name: value}, in
+    storage order; `NAMES` is filled in from it), and derived parameters in `DERIVED` as
+    {name: (sources, function)}. Setting a source parameter recomputes everything derived
+    from it; a derived parameter can still be set directly, and keeps that value until one
+    of its sources changes.
+
+    The values have shape (P,) for one parameter set or (P, M) for a batch of M sets, in
+    which case every attribute is a row of length M. A batch is what the ensemble solver,
+    steady-state solver and sweeps take, and `sweep` builds one for a whole parameter range
+    with a single array allocation:
+
+        params = CytoNucParamsExact.sweep("IKK", np.linspace(0.1, 1.0, 1000))
+        params.IKK.shape, params.d1.shape   # (1000,), (1000,), d1 = 1.05 * IKK
+        params[10]                          # the 11th set on its own
+
+    Copies are cheap (one array copy) and equal parameter sets hash equally. The hash
+    follows the values, so a set must not be modified while it is used as a dict key.
+    """
+
+    __slots__ = ("_values",)
+
+    NAMES = ()
+    DEFAULTS = ()
+    DERIVED = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if isinstance(cls.DEFAULTS, dict):
+            cls.NAMES = tuple(cls.DEFAULTS)
+            cls.DEFAULTS = tuple(float(value) for value in cls.DEFAULTS.values())
+        missing = [name for name in cls.NAMES if not hasattr(cls, name)]
+        if missing:
+            raise TypeError(f"{cls.__name__} must declare its parameters in __slots__, missing {missing}")
+        cls._index = {name: i for i, name in enumerate(cls.NAMES)}
+        # Sources -> derived parameters that depend on them.
+        cls._dependants = {}
+        for name, (sources, _) in cls.DERIVED.items():
+            for source in sources:
+                cls._dependants.setdefault(source, []).append(name)
+
+    def __init__(self, values=None, **overrides):
+        if values is None:
+            values = self.DEFAULTS
+        self._values = values
+        if self._values.shape[0] != len(self.NAMES):
+            raise ValueError(f"{type(self).__name__} expects {len(self.NAMES)} values per set, "
+                             f"got {self._values.shape[0]}")
+        for name, value in overrides.items():
+            self.set(name, value)
+
+    # --- Named access ---------------------------------------------------------------------
+    #
+    # Every parameter is also a slot attribute, so reading `params.a1` costs no more than
+    # reading a plain attribute (the model equations read them on every call). The slots hold
+    # Python floats for a single set and row views of the array for a batch; all writes go
+    # through `set`, which keeps them in step with the array.
+
+    def __setattr__(self, name, value):
+        if name in self._index:
+            self.set(name, value)
+        elif name == "_values":
+            object.__setattr__(self, "_values", np.array(value, dtype=float))
+            for i, parameter in enumerate(self.NAMES[:self._values.shape[0]]):
+                self._refresh(parameter, i)
+        else:
+            object.__setattr__(self, name, value)
+
+    def _refresh(self, name, i):
+        values = self._values
+        object.__setattr__(self, name, values.item(i) if values.ndim == 1 else values[i])
+
+    def set(self, name, value):
+        """Sets one parameter (a number, or a row of length M for a batch) and its dependants."""
+        try:
+            i = self._index[name]
+        except KeyError:
+            raise AttributeError(f"{type(self).__name__} has no parameter '{name}'") from None
+        self._values[i] = value
+        self._refresh(name, i)
+        for derived in self._dependants.get(name, ()):
+            sources, function = self.DERIVED[derived]
+            j = self._index[derived]
+            self._values[j] = function(*(self._values[self._index[s]] for s in sources))
+            self._refresh(derived, j)
+
+    def get(self, name, default=None):
+        return self._values[self._index[name]] if name in self._index else default
+
+    def as_dict(self):
+        """{name: value}; for a batch the values are rows of length M."""
+        return dict(zip(self.NAMES, self._values))
+
+    @property
+    def values(self):
+        """The underlying (P,) or (P, M) array (not a copy)."""
+        return self._values
+
+    # --- Batches ----------------------------------------------------------------------------
+
+    @property
+    def is_batch(self):
+        return self._values.ndim == 2
+
+    def __bool__(self):
+        return True
+
+    def __len__(self):
+        """Number of sets in a batch."""
+        if not self.is_batch:
+            raise TypeError(f"A single {type(self).__name__} has no length")
+        return self._values.shape[1]
+
+    def __getitem__(self, index):
+        """Set (or sub-batch, for a slice or index array) of a batch, as a copy."""
+        if not self.is_batch:
+            raise TypeError(f"A single {type(self).__name__} cannot be indexed")
+        return self._from_values(self._values[:, index])
+
+    def __iter__(self):
+        for m in range(len(self)):
+            yield self[m]
+
+    def __array__(self, dtype=None, copy=None):
+        """Lets a batch be passed wherever a (P, M) parameter matrix is expected."""
+        return self._values if dtype is None else self._values.astype(dtype)
+
+    def to_matrix(self):
+        """The parameters as a (P, M) matrix, M = 1 for a single set."""
+        return self._values.reshape(len(self.NAMES), -1).copy()
+
+    @classmethod
+    def _from_values(cls, values):
+        params = cls.__new__(cls)
+        params._values = values
+        return params
+
+    @classmethod
+    def from_matrix(cls, matrix):
+        """Batch whose attributes are the rows of a (P, M) matrix ordered by `NAMES`."""
+        matrix = np.asarray(matrix, dtype=float)
+        if matrix.ndim != 2 or matrix.shape[0] != len(cls.NAMES):
+            raise ValueError(f"Expected a ({len(cls.NAMES)}, M) matrix, got shape {matrix.shape}")
+        return cls._from_values(matrix)
+
+    @classmethod
+    def stack(cls, params_list):
+        """Batch from a sequence of single parameter sets (any objects with the named attributes)."""
+        return cls._from_values(np.array([[getattr(p, name) for p in params_list] for name in cls.NAMES],
+                                         dtype=float))
+
+    @classmethod
+    def sweep(cls, name, values, base=None):
+        """
+        Batch of `len(values)` copies of `base` (defaults when None) in which `name` takes the
+        given values; derived parameters follow.
+        """
+        values = np.asarray(values, dtype=float)
+        base = cls() if base is None else base
+        params = cls._from_values(np.repeat(base.values.reshape(len(cls.NAMES), 1), values.size, axis=1))
+        params.set(name, values)
+        return params
+
+    # --- Copy, equality, hashing ------------------------------------------------------------
+
+    def copy(self):
+        return self._from_values(self._values)
+
+    __copy__ = copy
+
+    def __deepcopy__(self, memo):
+        return self.copy()
+
+    def __eq__(self, other):
+        return (type(other) is type(self) and other._values.shape == self._values.shape
+                and bool(np.all(other._values == self._values)))
+
+    def __hash__(self):
+        return hash((type(self).__name__, self._values.shape, self._values.tobytes()))
+
+    def __getstate__(self):
+        return self._values
+
+    def __setstate__(self, state):
+        self._values = state
+
+    def __repr__(self):
+        if self.is_batch:
+            return f"{type(self).__name__}(batch of {len(self)} sets)"
+        return f"{type(self).__name__}({', '.join(f'{n}={v:g}' for n, v in zip(self.NAMES, self._values))})"
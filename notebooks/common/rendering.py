@@ -0,0 +1,200 @@
+import os
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+
+import numpy as np
+import matplotlib
+
+
+def use_headless(backend="Agg"):
+    """
+    Switches matplotlib to a non-interactive backend, so figures are only written to files and
+    `plt.show()` never blocks. Safe to call repeatedly and in worker processes.
+    """
+    import matplotlib.pyplot as plt
+
+    if matplotlib.get_backend().lower() != backend.lower():
+        plt.switch_backend(backend)
+
+
+@contextmanager
+def headless(backend="Agg"):
+    """
+    `use_headless` for the duration of a block: the previous backend is restored afterwards,
+    so an interactive session (a notebook) keeps showing its figures. Restoring closes the
+    figures made in the block, the cached templates included.
+    """
+    previous = matplotlib.get_backend()
+    use_headless(backend)
+    try:
+        yield
+    finally:
+        if previous.lower() != matplotlib.get_backend().lower():
+            import matplotlib.pyplot as plt
+
+            clear_templates()
+            plt.switch_backend(previous)
+
+
+def is_headless():
+    return matplotlib.get_backend().lower() in ("agg", "pdf", "ps", "svg", "cairo", "template")
+
+
+# --- Decimation ----------------------------------------------------------------------------------
+
+def minmax_indices(y, max_points):
+    """
+    Indices of a min/max-preserving decimation of one or more series sharing a time axis.
+
+    The samples are split into equal buckets and every bucket keeps the position of its
+    minimum and maximum (of every series in `y`), so peaks and troughs survive any
+    decimation factor; the first and last sample are always kept. A line drawn through the
+    kept samples is indistinguishable from the full one once there are a few buckets per
+    pixel column.
+
+    Args:
+        y (np.ndarray): Series (T,) or (K, T).
+        max_points (int): Upper bound of the number of kept samples.
+
+    Returns:
+        np.ndarray: Sorted unique indices into the time axis (all of them when T is small).
+    """
+    y = np.atleast_2d(np.asarray(y, dtype=float))
+    n = y.shape[1]
+    n_bins = max_points // (2 * y.shape[0])
+    if n <= max_points or n_bins < 1:
+        return np.arange(n)
+    width = n // n_bins
+    body = y[:, :n_bins * width].reshape(y.shape[0], n_bins, width)
+    offsets = np.arange(n_bins)[None, :] * width
+    # NaN samples (failed runs) must not win the comparison.
+    lo = np.argmin(np.where(np.isnan(body), np.inf, body), axis=2) + offsets
+    hi = np.argmax(np.where(np.isnan(body), -np.inf, body), axis=2) + offsets
+    idx = [lo.ravel(), hi.ravel(), [0, n - 1]]
+    if n_bins * width < n:
+        tail = y[:, n_bins * width:]
+        idx += [np.argmin(np.where(np.isnan(tail), np.inf, tail), axis=1) + n_bins * width,
+                np.argmax(np.where(np.isnan(tail), -np.inf, tail), axis=1) + n_bins * width]
+    return np.unique(np.concatenate(idx))
+
+
+def decimate(x, y, max_points):
+    """(x, y) reduced to at most about `max_points` samples by `minmax_indices` of y."""
+    if max_points is None:
+        return np.asarray(x), np.asarray(y)
+    idx = minmax_indices(y, max_points)
+    return np.asarray(x)[idx], np.asarray(y)[..., idx]
+
+
+# --- Reusable figures ----------------------------------------------------------------------------
+
+class FigureTemplate(ABC):
+    """
+    Figure whose axes, lines, legends and labels are created once (`build`) and then only
+    receive new data (`update`) for every frame, which is much cheaper than building a new
+    figure per report. Subclasses create their artists in `build` and set their data in
+    `update(**data)`.
+
+    Args:
+        max_points (int or None): Samples kept per line (min/max decimation); None keeps all.
+    """
+
+    figsize = (12, 8)
+
+    def __init__(self, max_points=2000, **options):
+        import matplotlib.pyplot as plt
+
+        self.max_points = max_points
+        self.options = options
+        self.fig = plt.figure(figsize=self.figsize)
+        self.build()
+
+    @abstractmethod
+    def build(self):
+        pass
+
+    @abstractmethod
+    def update(self, **data):
+        pass
+
+    def set_line(self, line, x, y):
+        line.set_data(*decimate(x, y, self.max_points))
+
+    def set_curve(self, line, x, y):
+        """Parametric curve (e.g. a phase portrait), decimated on the extremes of both coordinates."""
+        x, y = np.asarray(x), np.asarray(y)
+        idx = slice(None) if self.max_points is None else minmax_indices(np.stack([x, y]), self.max_points)
+        line.set_data(x[idx], y[idx])
+
+    @staticmethod
+    def rescale(axes):
+        for ax in np.ravel(axes):
+            ax.relim()
+            ax.autoscale_view()
+
+    def render(self, path=None, dpi=100, close=False, **data):
+        """
+        Updates the figure and writes it to `path` (or shows it when `path` is None). Reused
+        figures stay open; `close=True` is for one-off figures.
+        """
+        self.update(**data)
+        if path is not None and path.lower().endswith(".png") and hasattr(self.fig.canvas, "print_png"):
+            # `savefig` lays out and draws the figure once more before rendering it; the
+            # figure's layout is fixed, so one draw straight into the PNG is enough.
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self.fig.set_dpi(dpi)
+            self.fig.canvas.print_png(path)
+            if close:
+                self.close()
+            return path
+        return finish(self.fig, path, dpi=dpi, close=close)
+
+    def close(self):
+        import matplotlib.pyplot as plt
+
+        plt.close(self.fig)
+
+
+_TEMPLATES = {}
+
+
+def template(cls, key=None, **options):
+    """
+    The figure of `cls` cached in this process (one per `key` and set of options, e.g.
+    `max_points`), created on first use, so a worker rendering many frames builds its
+    figures once.
+    """
+    cache_key = (cls, key, repr(sorted(options.items())))
+    if cache_key not in _TEMPLATES:
+        _TEMPLATES[cache_key] = cls(**options)
+    return _TEMPLATES[cache_key]
+
+
+def clear_templates():
+    for figure in _TEMPLATES.values():
+        figure.close()
+    _TEMPLATES.clear()
+
+
+def finish(fig, path=None, dpi=100, close=True):
+    """
+    Writes the figure to `path` (creating its directory) or, without a path, shows it (a
+    headless backend has nothing to show, the figure is only closed).
+
+    Returns:
+        str or None: The written path.
+    """
+    import matplotlib.pyplot as plt
+
+    if path is None:
+        if not is_headless():
+            plt.show()
+        elif close:
+            plt.close(fig)
+        return None
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fig.savefig(path, dpi=dpi)
+    if close:
+        plt.close(fig)
+    return path
@@ -0,0 +1,180 @@
+import json
+import os
+import re
+
+import numpy as np
+
+
+_CHUNK_FILE = re.compile(r"^(\d+)\.npz$")
+
+
+class ChunkedStore:
+    """
+    Directory of arrays sharing their first (row) axis, split into chunks of `chunk_rows` rows.
+
+    Every chunk holds the rows of all arrays in one compressed .npz file that is written to a
+    temporary name and renamed into place, so a chunk is either complete on disk or absent:
+    the presence of the file is the checkpoint. Several processes (or machines sharing the
+    directory) can therefore fill disjoint chunks of the same store, and an interrupted run
+    only has to compute the chunks that are still missing. Arrays without the row axis (a
+    time grid, the parameter names) are kept once as `constants`.
+
+        directory/
+            store.json          manifest: rows, chunking, shapes and dtypes, attributes
+            constants.npz
+            chunks/000000.npz   rows 0 .. chunk_rows - 1 of every array
+            ...
+
+    Open an existing store with `ChunkedStore(directory)`, create one with `create`.
+    """
+
+    MANIFEST = "store.json"
+
+    def __init__(self, directory):
+        self.directory = os.path.abspath(directory)
+        path = os.path.join(self.directory, self.MANIFEST)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"No result store in {self.directory}")
+        with open(path) as f:
+            manifest = json.load(f)
+        self.n_rows = manifest["n_rows"]
+        self.chunk_rows = manifest["chunk_rows"]
+        self.arrays = {name: (tuple(spec["shape"]), np.dtype(spec["dtype"]))
+                       for name, spec in manifest["arrays"].items()}
+        self.attrs = manifest.get("attrs", {})
+
+    @classmethod
+    def create(cls, directory, n_rows, chunk_rows, arrays, constants=None, attrs=None, overwrite=False):
+        """
+        Creates an empty store.
+
+        Args:
+            directory (str): Store directory (created).
+            n_rows (int): Length of the row axis.
+            chunk_rows (int): Rows per chunk.
+            arrays (dict): {name: (shape, dtype)}, `shape` without the row axis, e.g. () for
+                           one value per row or (7, T) for a trajectory per row.
+            constants (dict, optional): {name: array} stored once.
+            attrs (dict, optional): JSON-serializable attributes (the job spec, a fingerprint).
+            overwrite (bool): Replace an existing store (its chunks are deleted); otherwise an
+                              existing store raises FileExistsError.
+
+        Returns:
+            ChunkedStore
+        """
+        directory = os.path.abspath(directory)
+        path = os.path.join(directory, cls.MANIFEST)
+        if os.path.exists(path):
+            if not overwrite:
+                raise FileExistsError(f"A result store already exists in {directory}")
+            for name in os.listdir(os.path.join(directory, "chunks")):
+                os.remove(os.path.join(directory, "chunks", name))
+        os.makedirs(os.path.join(directory, "chunks"), exist_ok=True)
+        if constants:
+            atomic_savez(os.path.join(directory, "constants.npz"), constants)
+        manifest = {
+            "n_rows": int(n_rows),
+            "chunk_rows": int(chunk_rows),
+            "arrays": {name: {"shape": [int(n) for n in shape], "dtype": np.dtype(dtype).str}
+                       for name, (shape, dtype) in arrays.items()},
+            "attrs": attrs or {},
+        }
+        staging = path + f".{os.getpid()}.tmp"
+        with open(staging, "w") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(staging, path)
+        return cls(directory)
+
+    def __repr__(self):
+        return f"ChunkedStore({self.directory!r}, {len(self.done())}/{self.n_chunks} chunks)"
+
+    def __getitem__(self, name):
+        if name in self.arrays:
+            return self.read(name)
+        return self.constant(name)
+
+    # --- Chunks ------------------------------------------------------------------------------
+
+    @property
+    def n_chunks(self):
+        return -(-self.n_rows // self.chunk_rows)
+
+    def rows(self, k):
+        """Slice of the rows held by chunk k."""
+        return slice(k * self.chunk_rows, min((k + 1) * self.chunk_rows, self.n_rows))
+
+    def _chunk_path(self, k):
+        return os.path.join(self.directory, "chunks", f"{k:06d}.npz")
+
+    def done(self):
+        """Sorted indices of the chunks on disk."""
+        found = (_CHUNK_FILE.match(name) for name in os.listdir(os.path.join(self.directory, "chunks")))
+        return sorted(int(match.group(1)) for match in found if match)
+
+    def missing(self):
+        done = set(self.done())
+        return [k for k in range(self.n_chunks) if k not in done]
+
+    @property
+    def complete(self):
+        return len(self.done()) == self.n_chunks
+
+    def write_chunk(self, k, **arrays):
+        """Writes all arrays of chunk k at once (an existing chunk is replaced)."""
+        rows = self.rows(k)
+        n = rows.stop - rows.start
+        if set(arrays) != set(self.arrays):
+            raise ValueError(f"Chunk needs exactly the arrays {sorted(self.arrays)}, got {sorted(arrays)}")
+        data = {}
+        for name, values in arrays.items():
+            shape, dtype = self.arrays[name]
+            values = np.asarray(values, dtype=dtype)
+            if values.shape != (n,) + shape:
+                raise ValueError(f"'{name}' of chunk {k} has shape {values.shape}, expected {(n,) + shape}")
+            data[name] = values
+        atomic_savez(self._chunk_path(k), data)
+
+    def read_chunk(self, k, names=None):
+        """{name: rows of chunk k} for the given arrays (all by default)."""
+        with np.load(self._chunk_path(k)) as data:
+            return {name: data[name] for name in (names or self.arrays)}
+
+    # --- Arrays ------------------------------------------------------------------------------
+
+    def read(self, name, fill=None):
+        """
+        The whole array (n_rows, ...). Rows of missing chunks hold `fill` (NaN for floating
+        arrays, zero/False otherwise by default).
+        """
+        shape, dtype = self.arrays[name]
+        if fill is None:
+            fill = np.nan if np.issubdtype(dtype, np.floating) else 0
+        out = np.full((self.n_rows,) + shape, fill, dtype=dtype)
+        for k in self.done():
+            out[self.rows(k)] = self.read_chunk(k, [name])[name]
+        return out
+
+    def available(self):
+        """Boolean mask (n_rows,) of the rows whose chunk is on disk."""
+        mask = np.zeros(self.n_rows, dtype=bool)
+        for k in self.done():
+            mask[self.rows(k)] = True
+        return mask
+
+    def constant(self, name):
+        with np.load(os.path.join(self.directory, "constants.npz")) as data:
+            return data[name]
+
+    def constants(self):
+        path = os.path.join(self.directory, "constants.npz")
+        if not os.path.exists(path):
+            return {}
+        with np.load(path) as data:
+            return {name: data[name] for name in data.files}
+
+
+def atomic_savez(path, arrays):
+    """Saves {name: array} as a compressed .npz under a temporary name and renames it into place."""
+    staging = f"{path[:-4]}.{os.getpid()}.tmp.npz"
+    np.savez_compressed(staging, **arrays)
+    os.replace(staging, path)
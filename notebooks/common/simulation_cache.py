@@ -0,0 +1,268 @@
+import hashlib
+import inspect
+import json
+import os
+import shutil
+import tempfile
+from collections import OrderedDict
+from functools import lru_cache
+
+import numpy as np
+from scipy.optimize import OptimizeResult
+
+# Bump when the on-disk layout or the key encoding changes; old entries then simply miss.
+CACHE_FORMAT = 1
+
+
+# --- Keys ---------------------------------------------------------------------------------
+
+def _feed(h, obj):
+    """Feeds a canonical encoding of `obj` into the hash `h`."""
+    if obj is None:
+        h.update(b"N;")
+    elif isinstance(obj, (bool, np.bool_)):
+        h.update(b"B%d;" % bool(obj))
+    elif isinstance(obj, (int, float, np.integer, np.floating)):
+        # 1000 and 1000.0 describe the same simulation.
+        h.update(b"F" + repr(float(obj)).encode() + b";")
+    elif isinstance(obj, str):
+        h.update(b"S%d:" % len(obj) + obj.encode() + b";")
+    elif isinstance(obj, bytes):
+        h.update(b"Y%d:" % len(obj) + obj + b";")
+    elif isinstance(obj, (np.ndarray, list, tuple)):
+        try:
+            array = np.ascontiguousarray(obj, dtype=float)
+        except (TypeError, ValueError):
+            h.update(b"L%d:" % len(obj))
+            for item in obj:
+                _feed(h, item)
+            return
+        h.update(b"A" + repr(array.shape).encode() + b":" + array.tobytes() + b";")
+    elif isinstance(obj, dict):
+        h.update(b"D%d:" % len(obj))
+        for name in sorted(obj, key=str):
+            _feed(h, str(name))
+            _feed(h, obj[name])
+    elif callable(obj) and hasattr(obj, "__qualname__"):
+        h.update(b"C" + f"{obj.__module__}.{obj.__qualname__}".encode() + b";")
+    elif hasattr(obj, "__dict__"):
+        h.update(b"O" + type(obj).__qualname__.encode() + b":")
+        _feed(h, vars(obj))
+    elif hasattr(type(obj), "__slots__"):
+        h.update(b"O" + type(obj).__qualname__.encode() + b":")
+        _feed(h, {name: getattr(obj, name) for cls in type(obj).__mro__
+                  for name in getattr(cls, "__slots__", ())})
+    else:
+        raise TypeError(f"Cannot build a cache key from {type(obj).__name__}")
+
+
+def make_key(*parts):
+    """
+    Content hash of `parts` (numbers, strings, arrays, sequences, dicts and plain objects,
+    which are hashed through their attributes). Equal inputs give equal keys across runs.
+    """
+    h = hashlib.sha256()
+    _feed(h, CACHE_FORMAT)
+    for part in parts:
+        _feed(h, part)
+    return h.hexdigest()
+
+
+@lru_cache(maxsize=None)
+def source_fingerprint(cls):
+    """Hash of the source of `cls`, so that editing the model equations invalidates old entries."""
+    try:
+        source = inspect.getsource(cls)
+    except (OSError, TypeError):
+        source = f"{cls.__module__}.{cls.__qualname__}"
+    return hashlib.sha256(source.encode()).hexdigest()
+
+
+# --- Store --------------------------------------------------------------------------------
+
+def _entry_size(path):
+    return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+
+
+class SimulationCache:
+    """
+    Two-level store of simulation results addressed by `make_key`.
+
+    The first level is a bounded in-memory LRU. The optional second level is a directory with
+    one sub-directory per entry, evicted least-recently-used once it exceeds `max_disk_bytes`.
+    Arrays are written as plain .npy files and opened with `mmap_mode='r'`, so a hit costs
+    no copy and only the pages actually touched are read. With `compress=True` the arrays are
+    stored in a compressed .npz instead, which is smaller but has to be decompressed (and
+    therefore cannot be memory-mapped) on read.
+
+    Arrays returned by `get` are shared with the cache and read-only; copy them before
+    modifying. `put` stores copies and leaves the caller's arrays untouched.
+    """
+
+    def __init__(self, directory=None, max_items=256, max_memory_bytes=256 * 2**20,
+                 max_disk_bytes=2**30, compress=False):
+        self.directory = None if directory is None else os.path.abspath(directory)
+        self.max_items = max_items
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.compress = compress
+
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if self.directory is not None:
+            os.makedirs(self.directory, exist_ok=True)
+
+    def __repr__(self):
+        return (f"SimulationCache(directory={self.directory!r}, entries={len(self._memory)}, "
+                f"hits={self.hits}, disk_hits={self.disk_hits}, misses={self.misses})")
+
+    def get(self, key):
+        """
+        Returns:
+            tuple or None: (arrays, meta) for a stored key, None on a miss.
+        """
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            self.hits += 1
+            return self._memory[key][:2]
+
+        entry = self._read_disk(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.disk_hits += 1
+        self._remember(key, *entry)
+        return entry
+
+    def put(self, key, arrays, meta=None):
+        """
+        Stores a dict of arrays together with JSON-serializable metadata. The cache keeps
+        read-only copies, so the caller's arrays stay writable and later edits to them do not
+        reach the cache.
+        """
+        arrays = {name: np.array(value, copy=True) for name, value in arrays.items()}
+        for value in arrays.values():
+            value.flags.writeable = False
+        meta = dict(meta or {})
+        self._remember(key, arrays, meta)
+        if self.directory is not None:
+            self._write_disk(key, arrays, meta)
+
+    def clear(self, disk=False):
+        """Empties the memory level and, with `disk=True`, deletes the on-disk entries too."""
+        self._memory.clear()
+        self._memory_bytes = 0
+        if disk and self.directory is not None:
+            for entry in os.scandir(self.directory):
+                if entry.is_dir():
+                    shutil.rmtree(entry.path, ignore_errors=True)
+
+    def _remember(self, key, arrays, meta):
+        size = sum(value.nbytes for value in arrays.values())
+        if key in self._memory:
+            self._memory_bytes -= self._memory.pop(key)[2]
+        self._memory[key] = (arrays, meta, size)
+        self._memory_bytes += size
+        while self._memory and (len(self._memory) > self.max_items or
+                                self._memory_bytes > self.max_memory_bytes):
+            self._memory_bytes -= self._memory.popitem(last=False)[1][2]
+
+    def _read_disk(self, key):
+        if self.directory is None:
+            return None
+        path = os.path.join(self.directory, key)
+        try:
+            with open(os.path.join(path, "meta.json")) as f:
+                record = json.load(f)
+            if record["compressed"]:
+                with np.load(os.path.join(path, "arrays.npz")) as data:
+                    arrays = {name: data[name] for name in record["arrays"]}
+            else:
+                arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+                          for name in record["arrays"]}
+            os.utime(os.path.join(path, "meta.json"))
+        except (OSError, ValueError, KeyError):
+            return None
+        for value in arrays.values():
+            value.flags.writeable = False
+        return arrays, record["meta"]
+
+    def _write_disk(self, key, arrays, meta):
+        final = os.path.join(self.directory, key)
+        if os.path.isdir(final):
+            return
+        staging = tempfile.mkdtemp(dir=self.directory, prefix=".tmp-")
+        try:
+            if self.compress:
+                np.savez_compressed(os.path.join(staging, "arrays.npz"), **arrays)
+            else:
+                for name, value in arrays.items():
+                    np.save(os.path.join(staging, f"{name}.npy"), value)
+            with open(os.path.join(staging, "meta.json"), "w") as f:
+                json.dump({"arrays": list(arrays), "compressed": self.compress, "meta": meta}, f)
+            os.rename(staging, final)
+        except OSError:
+            # Another process stored the same key first, or the disk is full: keep going uncached.
+            shutil.rmtree(staging, ignore_errors=True)
+            return
+        self._evict_disk()
+
+    def _evict_disk(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.is_dir() and not entry.name.startswith("."):
+                try:
+                    entries.append((os.stat(os.path.join(entry.path, "meta.json")).st_mtime,
+                                    _entry_size(entry.path), entry.path))
+                except OSError:
+                    continue
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_disk_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+
+
+_default_cache = SimulationCache()
+
+
+def get_default_cache():
+    return _default_cache
+
+
+def set_default_cache(cache):
+    """Replaces the process-wide cache, e.g. by `SimulationCache(directory='.sim_cache')`."""
+    global _default_cache
+    _default_cache = cache
+
+
+def resolve_cache(cache):
+    """`True` means the default cache, `False`/`None` no caching; an instance is used as is."""
+    if cache is True:
+        return _default_cache
+    if cache is False or cache is None:
+        return None
+    return cache
+
+
+# --- solve_ivp results --------------------------------------------------------------------
+
+def store_ode_result(cache, key, sol):
+    """Stores the parts of a `solve_ivp` result that `simulate` callers use (t, y and status)."""
+    meta = {"success": bool(sol.success), "status": int(sol.status), "message": str(sol.message),
+            "nfev": int(sol.nfev), "njev": int(sol.njev), "nlu": int(sol.nlu)}
+    cache.put(key, {"t": sol.t, "y": sol.y}, meta)
+
+
+def load_ode_result(cache, key):
+    """Rebuilds a `solve_ivp`-like result from the cache, or returns None on a miss."""
+    entry = cache.get(key)
+    if entry is None:
+        return None
+    arrays, meta = entry
+    return OptimizeResult(t=arrays["t"], y=arrays["y"], sol=None, t_events=None, y_events=None, **meta)
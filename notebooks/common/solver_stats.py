@@ -0,0 +1,319 @@
+import json
+import os
+import time
+
+import numpy as np
+import scipy.integrate
+
+# Method used in the last LSODA step (iwork[18], "mused" in the ODEPACK documentation).
+_LSODA_METHODS = {1: "nonstiff", 2: "stiff"}
+
+
+class RunStats:
+    """
+    Counters, timing and outcome of one integration.
+
+    `observe(solver)` is called after every accepted step and copies the solver's counters, so
+    the record is complete even when a run fails half way. LSODA additionally reports every
+    switch between its non-stiff (Adams) and stiff (BDF) method as (t, new method).
+    `n_rejected` is known for the ensemble solver only; scipy's solvers retry rejected steps
+    internally without counting them, and it is None there.
+    """
+
+    def __init__(self, label=None, method=None, **info):
+        self.label = label
+        self.method = method
+        self.info = info
+        self.nfev = 0
+        self.njev = 0
+        self.nlu = 0
+        self.n_accepted = 0
+        self.n_rejected = None
+        self.switches = []
+        self.wall_time = np.nan
+        self.success = None
+        self.message = ""
+        self.t_final = None
+        self.cached = False
+        self.started = None
+        self.pid = None
+        self._clock = None
+        self._mused = None
+
+    def start(self):
+        self.started = time.time()
+        self.pid = os.getpid()
+        self._clock = time.perf_counter()
+        return self
+
+    def observe(self, solver):
+        """Records one accepted step of a scipy `OdeSolver`."""
+        self.n_accepted += 1
+        self.nfev, self.njev, self.nlu = solver.nfev, solver.njev, solver.nlu
+        self.t_final = solver.t
+        lsoda = getattr(solver, "_lsoda_solver", None)
+        if lsoda is not None:
+            mused = int(lsoda._integrator.iwork[18])
+            if self._mused is not None and mused != self._mused:
+                self.switches.append((float(solver.t), _LSODA_METHODS.get(mused, str(mused))))
+            self._mused = mused
+
+    def finish(self, success, message, nfev=None, njev=None, nlu=None):
+        """Stops the clock and records the outcome (and final counters, when given)."""
+        if self._clock is not None:
+            self.wall_time = time.perf_counter() - self._clock
+        self.success = bool(success)
+        self.message = str(message)
+        for name, value in (("nfev", nfev), ("njev", njev), ("nlu", nlu)):
+            if value is not None:
+                setattr(self, name, int(value))
+        return self
+
+    @property
+    def n_switches(self):
+        return len(self.switches)
+
+    def as_dict(self):
+        """JSON-serializable record."""
+        return {"label": self.label, "method": self.method, "info": _plain(self.info),
+                "nfev": int(self.nfev), "njev": int(self.njev), "nlu": int(self.nlu),
+                "n_accepted": int(self.n_accepted),
+                "n_rejected": None if self.n_rejected is None else int(self.n_rejected),
+                "switches": [[float(t), m] for t, m in self.switches], "wall_time": float(self.wall_time),
+                "success": self.success, "message": self.message,
+                "t_final": None if self.t_final is None else float(self.t_final),
+                "cached": self.cached, "started": self.started, "pid": self.pid}
+
+    @classmethod
+    def from_dict(cls, record):
+        stats = cls(record.get("label"), record.get("method"), **record.get("info", {}))
+        for name, value in record.items():
+            if name not in ("label", "method", "info"):
+                setattr(stats, name, value)
+        stats.switches = [tuple(s) for s in record.get("switches", [])]
+        return stats
+
+    def __repr__(self):
+        state = "ok" if self.success else f"failed: {self.message}"
+        return (f"RunStats({self.label}, {self.method}, nfev={self.nfev}, njev={self.njev}, "
+                f"steps={self.n_accepted}, switches={self.n_switches}, {1e3 * self.wall_time:.1f} ms, {state})")
+
+
+def _plain(value):
+    """NumPy scalars/arrays in `info` -> Python numbers/lists (for JSON)."""
+    if isinstance(value, dict):
+        return {str(k): _plain(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_plain(v) for v in value]
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+_PROBED = {}
+
+
+def probed_method(method):
+    """
+    Subclass of a scipy solver (name or class) that takes a `stats=RunStats` option and
+    observes every step, for use as `solve_ivp(..., method=probed_method("LSODA"), stats=stats)`.
+    """
+    base = getattr(scipy.integrate, method) if isinstance(method, str) else method
+    if base not in _PROBED:
+        def __init__(self, fun, t0, y0, t_bound, stats=None, **options):
+            base.__init__(self, fun, t0, y0, t_bound, **options)
+            self.stats = stats
+
+        def step(self):
+            message = base.step(self)
+            if self.stats is not None and self.status != "failed":
+                self.stats.observe(self)
+            return message
+
+        _PROBED[base] = type(f"Probed{base.__name__}", (base,), {"__init__": __init__, "step": step})
+    return _PROBED[base]
+
+
+def ensemble_stats(solver, label=None, **info):
+    """
+    Per-member `RunStats` of a finished `EnsembleSolver`. Steps and rejections are per member;
+    the RHS/Jacobian evaluations are batched over all members and reported on every member
+    as `info["batch_nfev"]` / `info["batch_njev"]` instead.
+    """
+    runs = []
+    for m in range(solver.t.size):
+        stats = RunStats(label, "ensemble", member=m, batch_nfev=int(solver.nfev), batch_njev=int(solver.njev),
+                         **info)
+        stats.n_accepted = int(solver.nsteps[m])
+        stats.n_rejected = int(solver.nrejected[m])
+        stats.t_final = float(solver.t[m])
+        ok = solver.status[m] == 1
+        stats.finish(ok, "" if ok else "The member did not reach the end of the integration interval.")
+        runs.append(stats)
+    return runs
+
+
+class SweepProfile:
+    """
+    Statistics of all runs of a sweep: an aggregate table, the totals and a report of the
+    slowest and the failed points.
+
+    Args:
+        name (str): Sweep label, e.g. "run_bifurcation_analysis".
+        param_name (str): Swept parameter.
+        param_values (array_like): Its values, one per run.
+        runs (list of RunStats): Run statistics in the order of `param_values`.
+        wall_time (float): Wall time of the whole sweep (may be shorter than the sum of the
+                           runs when they ran in parallel).
+    """
+
+    COLUMNS = ("wall_time", "nfev", "njev", "nlu", "n_accepted", "n_rejected", "n_switches")
+
+    def __init__(self, name, param_name, param_values, runs, wall_time=np.nan, **info):
+        self.name = name
+        self.param_name = param_name
+        self.param_values = np.asarray(param_values, dtype=float)
+        self.runs = list(runs)
+        self.wall_time = wall_time
+        self.info = info
+
+    def table(self):
+        """Column name -> (M,) array; the columns of `COLUMNS` plus `param`, `success`, `message`."""
+        table = {"param": self.param_values}
+        for column in self.COLUMNS:
+            values = [getattr(run, column) for run in self.runs]
+            table[column] = np.array([np.nan if v is None else v for v in values], dtype=float)
+        table["success"] = np.array([bool(run.success) for run in self.runs])
+        table["message"] = [run.message for run in self.runs]
+        return table
+
+    def totals(self):
+        table = self.table()
+        totals = {column: float(np.nansum(table[column])) for column in self.COLUMNS}
+        totals.update(n_runs=len(self.runs), n_failed=int(np.sum(~table["success"])), sweep_wall_time=self.wall_time)
+        # Ensemble members share their batched evaluations (see `ensemble_stats`).
+        for name in ("batch_nfev", "batch_njev"):
+            values = [run.info[name] for run in self.runs if name in run.info]
+            if values:
+                totals[name] = max(values)
+        return totals
+
+    def slowest(self, n=10):
+        """(param value, RunStats) of the `n` slowest runs."""
+        order = np.argsort([-run.wall_time if np.isfinite(run.wall_time) else np.inf for run in self.runs])
+        return [(self.param_values[i], self.runs[i]) for i in order[:n]]
+
+    def failed(self):
+        return [(value, run) for value, run in zip(self.param_values, self.runs) if not run.success]
+
+    def report(self, n_slowest=5):
+        totals = self.totals()
+        lines = [f"{self.name} over '{self.param_name}': {totals['n_runs']} runs, {totals['n_failed']} failed, "
+                 f"sweep {totals['sweep_wall_time']:.2f} s, runs {totals['wall_time']:.2f} s",
+                 f"  nfev {totals['nfev']:.0f}, njev {totals['njev']:.0f}, nlu {totals['nlu']:.0f}, "
+                 f"steps {totals['n_accepted']:.0f}, LSODA switches {totals['n_switches']:.0f}"]
+        if "batch_nfev" in totals:
+            lines.append(f"  batched over the ensemble: nfev {totals['batch_nfev']}, njev {totals['batch_njev']}, "
+                         f"rejected steps {totals['n_rejected']:.0f}")
+        table = self.table()
+        if np.any(np.isfinite(table["wall_time"])):
+            share = np.nansum(table["wall_time"])
+            lines.append(f"  slowest {n_slowest}:")
+            for value, run in self.slowest(n_slowest):
+                lines.append(f"    {self.param_name} = {value:<12.6g} {1e3 * run.wall_time:9.1f} ms "
+                             f"({100 * run.wall_time / share:4.1f} %)  nfev {run.nfev:>7}  "
+                             f"steps {run.n_accepted:>6}  switches {run.n_switches}")
+        failed = self.failed()
+        if failed:
+            lines.append("  failed:")
+            for value, run in failed:
+                lines.append(f"    {self.param_name} = {value:.6g}: {run.message}")
+        return "\n".join(lines)
+
+    def as_dict(self):
+        return {"name": self.name, "param_name": self.param_name, "param_values": self.param_values.tolist(),
+                "wall_time": float(self.wall_time), "info": _plain(self.info),
+                "runs": [run.as_dict() for run in self.runs]}
+
+    def __repr__(self):
+        return f"SweepProfile({self.name}, '{self.param_name}', {len(self.runs)} runs)"
+
+
+# --- Hooks ---------------------------------------------------------------------------------------
+#
+# The public simulators emit the `RunStats` of every run and the sweeps one `SweepProfile` (with
+# the stats of all their runs) to the registered hooks, always in the calling process: runs done
+# in worker processes reach the hooks with their sweep.
+
+_HOOKS = []
+
+
+def add_hook(hook):
+    """Registers `hook(record)`, called with every `RunStats` and `SweepProfile`."""
+    _HOOKS.append(hook)
+    return hook
+
+
+def remove_hook(hook):
+    if hook in _HOOKS:
+        _HOOKS.remove(hook)
+
+
+def emit(record):
+    for hook in list(_HOOKS):
+        hook(record)
+
+
+class JsonLog:
+    """Hook appending one JSON line per run or sweep to `path`."""
+
+    def __init__(self, path, runs=True, sweeps=True):
+        self.path = path
+        self.runs = runs
+        self.sweeps = sweeps
+
+    def __call__(self, record):
+        if isinstance(record, SweepProfile):
+            if not self.sweeps:
+                return
+            entry = {"type": "sweep", **record.as_dict()}
+        else:
+            if not self.runs:
+                return
+            entry = {"type": "run", **record.as_dict()}
+        with open(self.path, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+
+
+class ChromeTrace:
+    """
+    Hook collecting runs as complete events of the Chrome trace format, which profilers such as
+    chrome://tracing or Perfetto display on a timeline; `write()` saves the trace. Runs of a
+    sweep appear when the sweep is emitted (on the track of their worker process).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.events = []
+
+    def _event(self, run, tid):
+        if run.started is None or not np.isfinite(run.wall_time):
+            return
+        args = {k: v for k, v in run.as_dict().items() if k not in ("label", "started", "wall_time", "pid")}
+        self.events.append({"name": str(run.label), "cat": str(run.method), "ph": "X", "ts": 1e6 * run.started,
+                            "dur": 1e6 * run.wall_time, "pid": run.pid, "tid": tid,
+                            "args": args})
+
+    def __call__(self, record):
+        if isinstance(record, SweepProfile):
+            for run in record.runs:
+                self._event(run, record.name)
+        else:
+            self._event(record, "runs")
+
+    def write(self):
+        with open(self.path, "w") as f:
+            json.dump({"traceEvents": self.events, "displayTimeUnit": "ms"}, f)
+        return self.path